@@ -1,22 +1,83 @@
-from flask import Flask, jsonify, request, session
+from flask import Blueprint, Flask, Response, current_app, g, jsonify, request, session
 from flask_cors import CORS
-from db import get_db_connection
+from config import DEV_SECRET_KEY, load_config
+from db import PRIMARY, REPLICA, SHARD_PREFIX, backend_name, fetch_all, fetch_one, get_db_connection, has_replica, init_db, statement_cache_stats, use_replica, use_shard, warm_up_pool
+import queries
+import archive
+import directory
+import leave
+import leave_feed
+import outbox
+import snapshots
+import payroll
+import payroll_runs
+import shards
+import simulator
+import ytd
+from concurrency import get_limiter, init_limits, limit_concurrency, limiter_stats, report_flights, shed_response
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import PasswordHashingUnavailable, hash_password, hasher_stats, init_password_hasher, needs_rehash, verify_password
 import datetime
+import heapq
+import math
 import os
+import logging
+import time
+import uuid
 # --- Add specific import ---
 import mysql.connector
-# --- Add traceback for debugging ---
-import traceback
+from logging_setup import configure_logging, init_request_logging, logging_stats, sample
+from compression import compression_stats, init_compression
 
-app = Flask(__name__)
-# Use a permanent secret key
-app.secret_key = 'your_permanent_secret_key_goes_here_39u2r90'
+# All API routes live on this blueprint; create_app() builds the Flask app.
+api = Blueprint('api', __name__)
+log = logging.getLogger(__name__)
 
-# === FIX: Explicitly specify the frontend origin ===
-CORS(app, supports_credentials=True, origins="http://127.0.0.1:5500")
-# === END FIX ===
+
+# --- APPLICATION FACTORY ---
+def create_app(config=None):
+    """
+    Builds and configures the Flask application.
+    Settings come from the environment (see config.py); `config` overrides them,
+    which is handy for scripts and benchmarks.
+    """
+    start = time.perf_counter()
+
+    app = Flask(__name__)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
+    configure_logging(app.config)
+    init_request_logging(app)
+    init_compression(app)
+
+    # The session cookie carries the role: with the key from the repository anyone could sign an admin session
+    app.secret_key = app.config['SECRET_KEY']
+    if app.secret_key == DEV_SECRET_KEY and not (app.debug or app.testing):
+        raise RuntimeError("SECRET_KEY is the development key. Set SECRET_KEY to a long random string.")
+
+    # === FIX: Explicitly specify the frontend origin ===
+    CORS(app, supports_credentials=True, origins=app.config['CORS_ORIGINS'])
+    # === END FIX ===
+
+    app.register_blueprint(api)
+    init_db(app.config)
+    shards.init_shards(app.config)
+    init_password_hasher(app.config)
+    init_limits(app.config)
+    archive.init_archive(app.config)
+    snapshots.init_snapshots(app.config)
+    outbox.init_outbox(app.config)
+    directory.init_directory(app.config)
+    leave.init_leave(app.config)
+    leave_feed.init_leave_feed(app.config)
+
+    if app.config['DB_WARM_UP']:
+        warm_up_pool()
+
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - start
+    log.info("App created in %.1f ms (pid %s)", app.config['STARTUP_SECONDS'] * 1000, os.getpid())
+    return app
 
 
 # --- DECORATOR FOR AUTHENTICATION ---
@@ -24,12 +85,168 @@ def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if 'user_id' not in session:
-            print("Login required: No user_id in session") # Add log
+            log.info("Login required: No user_id in session", extra=sample('auth.unauthorized'))
             return jsonify({"error": "Unauthorized access"}), 401
-        # print(f"Login required: User {session.get('user_id')} authenticated.") # Reduce noise
+        log.debug("Login required: User %s authenticated.", session.get('user_id'))
+        return f(*args, **kwargs)
+    return decorated_function
+
+# --- READ/WRITE SPLITTING ---
+# Auth routes change the session, not the database, and the payroll simulator
+# and the POST form of the employee batch lookup only read, so they do not pin
+_NON_WRITE_ENDPOINTS = {'api.login', 'api.logout', 'api.simulate_payroll', 'api.get_employees_batch'}
+
+def _recently_wrote():
+    last_write_at = session.get('last_write_at')
+    if last_write_at is None:
+        return False
+    return time.time() - last_write_at < current_app.config['DB_REPLICA_PIN_SECONDS']
+
+# --- DECORATOR FOR READ-ONLY ROUTES ---
+def replica_read(f):
+    """Sends the route's reads to the replica, unless this session wrote recently (read-your-writes)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if _recently_wrote() or not has_replica():
+            g.db_route = PRIMARY
+            return f(*args, **kwargs)
+        g.db_route = REPLICA
+        with use_replica():
+            return f(*args, **kwargs)
+    return decorated_function
+
+# --- SHARD ROUTING (shards.py) ---
+# Without DB_SHARDS both decorators just call the route.
+def _shard_unavailable(e):
+    log.error("%s", e)
+    return jsonify({"error": "Database connection failed"}), 500
+
+def _on_shard(name, f, args, kwargs):
+    g.db_route = SHARD_PREFIX + name
+    with use_shard(name):
         return f(*args, **kwargs)
+
+def employee_shard(f):
+    """Runs the route on the shard of its employee_id (view argument, else the JSON body's)."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not shards.enabled():
+            return f(*args, **kwargs)
+        employee_id = kwargs.get('employee_id')
+        if employee_id is None:
+            employee_id = (request.get_json(silent=True) or {}).get('employee_id')
+            if employee_id is None: return f(*args, **kwargs) # the route reports the missing field
+        try:
+            name = shards.shard_for_employee(employee_id)
+        except (LookupError, TypeError, ValueError):
+            return jsonify({"error": "Employee not found"}), 404
+        return _on_shard(name, f, args, kwargs)
+    return decorated_function
+
+def row_shard(view_arg):
+    """Runs the route on the shard a Salary / LeaveRequest id (view argument `view_arg`) belongs to."""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not shards.enabled():
+                return f(*args, **kwargs)
+            try:
+                name = shards.shard_for_row(kwargs[view_arg])
+            except LookupError:
+                return jsonify({"error": "Not found"}), 404
+            return _on_shard(name, f, args, kwargs)
+        return decorated_function
+    return decorator
+
+def user_shard(f):
+    """Runs a self-service route on the shard holding the session user's employee record."""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not shards.enabled():
+            return f(*args, **kwargs)
+        try:
+            name, _ = shards.locate(queries.EMPLOYEE_ID_FOR_USER, (session.get('user_id'),))
+        except shards.ShardUnavailable as e:
+            return _shard_unavailable(e)
+        if name is None:
+            return f(*args, **kwargs) # No linked employee on any shard: the route answers 404
+        return _on_shard(name, f, args, kwargs)
     return decorated_function
 
+def _employee_entry(conn, employee_id):
+    """The employee's directory.FIELDS from the in-process directory, else read through `conn` (None = no such employee)."""
+    return directory.lookup(conn, employee_id, fill=g.get('db_route', PRIMARY) != REPLICA)
+
+def _employee_for_reader(conn, employee_id, what):
+    """
+    (employee row, None) if the session may read `what` of the employee (an
+    admin or the linked user), else (None, error response). Read from the
+    database: the directory of another worker may predate a relink or delete.
+    """
+    employee = fetch_one(conn, queries.EMPLOYEE_DIRECTORY_ROW, (employee_id,))
+    if not employee:
+        return None, (jsonify({"error": "Employee not found"}), 404)
+    is_admin = session.get('role') == 'admin'
+    is_correct_employee = employee.get('user_id') is not None and employee.get('user_id') == session.get('user_id')
+    if not (is_admin or is_correct_employee):
+        log.warning("Access DENIED for employee %s %s to user %s", employee_id, what, session.get('user_id'))
+        return None, (jsonify({"error": "Forbidden"}), 403)
+    return employee, None
+
+def _home_connection():
+    """Connection to the home database (users, rule sets, run ledger), even inside use_shard()."""
+    with use_shard(None):
+        return get_db_connection()
+
+def _attach_usernames(employees):
+    """Sharded: adds linked_username from the home users table (a shard cannot join it)."""
+    user_ids = list({employee['user_id'] for employee in employees if employee.get('user_id') is not None})
+    usernames = {}
+    if user_ids:
+        conn = _home_connection()
+        if conn is None: raise shards.ShardUnavailable('home')
+        try:
+            for chunk in queries.chunks(user_ids):
+                rows = fetch_all(conn, f"SELECT id, username FROM users WHERE id IN ({queries.placeholders(len(chunk))})", chunk)
+                usernames.update((row['id'], row['username']) for row in rows)
+        finally:
+            conn.close()
+    for employee in employees:
+        employee['linked_username'] = usernames.get(employee.get('user_id'))
+    return employees
+
+def _compile_rules(cursor, month):
+    """payroll.compile_rules(); read from the home database when sharded (PayrollRuleSet is global)."""
+    if not shards.enabled():
+        return payroll.compile_rules(cursor, month)
+    conn = _home_connection()
+    if conn is None: raise shards.ShardUnavailable('home')
+    home_cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        return payroll.compile_rules(home_cursor, month)
+    finally:
+        home_cursor.close()
+        conn.close()
+
+@api.before_app_request
+def start_outbox_consumer():
+    # No-op once this worker's consumer runs (gunicorn also starts it in post_worker_init)
+    outbox.ensure_consumer()
+
+@api.before_app_request
+def load_directory():
+    # Starts this worker's background load once; lookups go to the database until it is done
+    directory.ensure_loaded()
+
+@api.after_request
+def track_writes(response):
+    # A successful write pins this session to the primary for DB_REPLICA_PIN_SECONDS
+    if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400 \
+            and request.endpoint not in _NON_WRITE_ENDPOINTS:
+        session['last_write_at'] = time.time()
+    response.headers['X-DB-Route'] = g.get('db_route', PRIMARY)
+    return response
+
 # --- DATE FORMATTING HELPER ---
 def format_dates(records):
     """Safely formats date objects in a list of dictionaries to YYYY-MM-DD strings."""
@@ -43,7 +260,7 @@ def format_dates(records):
                 try:
                     new_record[key] = value.strftime('%Y-%m-%d')
                 except ValueError:
-                    print(f"Warning: Invalid date encountered for key '{key}': {value}")
+                    log.warning("Invalid date encountered for key '%s': %s", key, value)
                     new_record[key] = None # Or keep original, or handle differently
             else:
                 new_record[key] = value
@@ -72,11 +289,41 @@ def calculate_leave_days(start_date_str, end_date_str):
 
         return leave_days
     except Exception as e:
-        print(f"Error calculating leave days: {e}")
+        log.error("Error calculating leave days: %s", e)
         return 0
 
+# --- ADMISSION CONTROL FOR PASSWORD HASHING ---
+def _hashing_busy_response(busy):
+    # 429 when the hash queue is full, 503 when a hash job timed out
+    response = jsonify({"error": "Server is busy, please try again shortly."})
+    response.status_code = busy.status_code
+    response.headers['Retry-After'] = str(busy.retry_after)
+    return response
+
+def _rehash_password(user_id, old_hash, password):
+    """Best effort: upgrade a stored hash to the configured method/cost after a good login."""
+    try:
+        new_hash = hash_password(password)
+    except PasswordHashingUnavailable:
+        return # Try again on a later login
+    conn = get_db_connection()
+    if conn is None: return
+    cursor = conn.cursor(buffered=True)
+    try:
+        # Only replace the hash we verified, in case the password changed meanwhile
+        cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s AND password_hash = %s",
+                       (new_hash, user_id, old_hash))
+        conn.commit()
+        log.info("Rehashed password for user %s", user_id)
+    except mysql.connector.Error as db_err:
+        conn.rollback()
+        log.error("Database error rehashing password for user %s: %s", user_id, db_err)
+    finally:
+        cursor.close()
+        conn.close()
+
 # --- USER AUTHENTICATION ROUTES ---
-@app.route('/api/register', methods=['POST'])
+@api.route('/api/register', methods=['POST'])
 def register():
     data = request.get_json()
     username = data.get('username')
@@ -85,6 +332,12 @@ def register():
     if not username or not password:
         return jsonify({"error": "Username and password are required"}), 400
 
+    # Hash before taking a DB connection so the pool is not held while waiting
+    try:
+        hashed_password = hash_password(password)
+    except PasswordHashingUnavailable as busy:
+        return _hashing_busy_response(busy)
+
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True, buffered=True) # Use buffered cursor
@@ -95,7 +348,6 @@ def register():
         if cursor.fetchone():
             return jsonify({"error": "Username already exists"}), 409
 
-        hashed_password = generate_password_hash(password)
         # Add 'role' column
         cursor.execute("INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s)",
                        (username, hashed_password, 'employee')) # Default new users to 'employee'
@@ -104,18 +356,18 @@ def register():
     # Catch specific DB errors
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"Database error during registration: {db_err}")
+        log.error("Database error during registration: %s", db_err)
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error during registration: {e}")
+        log.error("Error during registration: %s", e)
         return jsonify({"error": "Registration failed"}), 500
     finally:
         cursor.close()
         conn.close()
 
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
     username = data.get('username')
@@ -132,93 +384,104 @@ def login():
         # Select 'role' as well
         cursor.execute("SELECT id, username, password_hash, role FROM users WHERE username = %s", (username,))
         user = cursor.fetchone()
-
-        if user and check_password_hash(user['password_hash'], password):
-            session['user_id'] = user['id']
-            session['username'] = user['username']
-            # Store role in session
-            session['role'] = user['role']
-            print(f"Login successful for user {user['username']}, role: {user['role']}") # Add log
-            # Return role to frontend
-            return jsonify({"message": "Login successful", "username": user['username'], "role": user['role']})
-        else:
-            print(f"Login failed for user {username}") # Add log
-            return jsonify({"error": "Invalid username or password"}), 401
     except Exception as e:
-        print(f"Error during login: {e}")
+        log.error("Error during login: %s", e)
         return jsonify({"error": "An internal error occurred during login."}), 500
     finally:
+        # Release the connection before the (slow) password check
         cursor.close()
         conn.close()
 
+    try:
+        password_ok = user is not None and verify_password(user['password_hash'], password)
+    except PasswordHashingUnavailable as busy:
+        return _hashing_busy_response(busy)
+    except Exception as e:
+        log.error("Error during login: %s", e)
+        return jsonify({"error": "An internal error occurred during login."}), 500
 
-@app.route('/api/logout', methods=['POST'])
+    if password_ok:
+        session['user_id'] = user['id']
+        session['username'] = user['username']
+        # Store role in session
+        session['role'] = user['role']
+        log.info("Login successful for user %s, role: %s", user['username'], user['role'])
+        if needs_rehash(user['password_hash']):
+            _rehash_password(user['id'], user['password_hash'], password)
+        # Return role to frontend
+        return jsonify({"message": "Login successful", "username": user['username'], "role": user['role']})
+    else:
+        log.warning("Login failed for user %s", username)
+        return jsonify({"error": "Invalid username or password"}), 401
+
+
+@api.route('/api/logout', methods=['POST'])
 def logout():
     user_id = session.get('user_id') # Get user_id before popping
     session.pop('user_id', None)
     session.pop('username', None)
     session.pop('role', None) # Clear role on logout
-    print(f"User {user_id} logged out.") # Add log
+    log.info("User %s logged out.", user_id)
     return jsonify({"message": "Logged out successfully"})
 
-@app.route('/api/check-auth', methods=['GET'])
+@api.route('/api/check-auth', methods=['GET'])
 def check_auth():
     if 'user_id' in session:
         # Return role
-        # print(f"Check-auth: User {session.get('user_id')} IS logged in, role: {session.get('role')}") # Reduce noise
+        log.debug("Check-auth: User %s IS logged in, role: %s", session.get('user_id'), session.get('role'))
         return jsonify({
             "logged_in": True,
             "username": session.get('username'),
             "role": session.get('role') # Include role
             })
     else:
-        # print("Check-auth: User is NOT logged in.") # Reduce noise
+        log.debug("Check-auth: User is NOT logged in.")
         return jsonify({"logged_in": False})
 
 # --- DASHBOARD STATS ROUTE (Admin Only) ---
-@app.route('/api/dashboard-stats', methods=['GET'])
+@api.route('/api/dashboard-stats', methods=['GET'])
 @login_required
+@replica_read
 def get_dashboard_stats():
     # Add role check
     if session.get('role') != 'admin':
         return jsonify({"error": "Forbidden"}), 403
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
-
     try:
-        cursor.execute("SELECT COUNT(*) as total_employees FROM Employee")
-        total_employees_result = cursor.fetchone()
-        total_employees = total_employees_result['total_employees'] if total_employees_result else 0
-
-
-        cursor.execute("SELECT COUNT(DISTINCT department) as total_departments FROM Employee")
-        total_departments_result = cursor.fetchone()
-        total_departments = total_departments_result['total_departments'] if total_departments_result else 0
-
-        cursor.execute("SELECT AVG(base_salary) as average_salary FROM Employee")
-        # Handle potential None if no employees exist
-        avg_salary_result = cursor.fetchone()
-        average_salary = avg_salary_result['average_salary'] if avg_salary_result else 0.0 # Default to 0.0
-        average_salary = float(average_salary or 0.0) # Ensure it's float
-
-
-        return jsonify({
-            "total_employees": total_employees,
-            "total_departments": total_departments,
-            "average_salary": average_salary
-        })
+        # Admins opening the dashboard together share one set of queries
+        stats = report_flights.do(('dashboard-stats', g.db_route), _fetch_dashboard_stats)
     except Exception as e:
-        print(f"Error in /api/dashboard-stats: {e}")
+        log.error("Error in /api/dashboard-stats: %s", e)
         return jsonify({"error": "Could not fetch dashboard stats"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    if stats is None: return jsonify({"error": "Database connection failed"}), 500
+    return jsonify(stats)
+
+def _dashboard_counts(conn):
+    # Count, sum and the department names rather than COUNT(DISTINCT) / AVG, so shards can be added up
+    totals = fetch_one(conn, "SELECT COUNT(*) AS total_employees, COALESCE(SUM(base_salary), 0) AS salary_sum FROM Employee")
+    departments = {row['department'] for row in fetch_all(conn, queries.DEPARTMENT_LIST) if row['department'] is not None}
+    return int(totals['total_employees'] or 0), float(totals['salary_sum'] or 0.0), departments
+
+def _fetch_dashboard_stats():
+    """Returns the stats dict, or None if no DB connection is available."""
+    try:
+        parts = shards.scatter(_dashboard_counts).values()
+    except shards.ShardUnavailable:
+        return None
+
+    total_employees = sum(count for count, _, _ in parts)
+    salary_sum = sum(amount for _, amount, _ in parts)
+    departments = set().union(*(names for _, _, names in parts))
+    return {
+        "total_employees": total_employees,
+        "total_departments": len(departments),
+        "average_salary": salary_sum / total_employees if total_employees else 0.0
+    }
 
 # --- EMPLOYEE MANAGEMENT ROUTES (Admin Only) ---
-@app.route('/api/employees', methods=['GET'])
+@api.route('/api/employees', methods=['GET'])
 @login_required
+@replica_read
 def get_employees():
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
@@ -228,54 +491,38 @@ def get_employees():
     include_linked_user = request.args.get('include_linked_user', 'false').lower() == 'true'
 
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
-
-    try:
-        # --- MODIFICATION: Join with users table if requested ---
-        if include_linked_user:
-             query = """
-                 SELECT e.*, u.username as linked_username
-                 FROM Employee e
-                 LEFT JOIN users u ON e.user_id = u.id
-                 WHERE e.name LIKE %s
-             """
-        else:
-             query = "SELECT e.* FROM Employee e WHERE e.name LIKE %s"
-
-        params = [f"%{search_term}%"]
-
-        if department:
-            query += " AND e.department = %s"
-            params.append(department)
+    # A shard cannot join the users table; usernames are added from the home database below
+    query, params = queries.employee_list_query(search_term, department, include_linked_user and not shards.enabled())
 
-        query += " ORDER BY e.employee_id DESC"
+    def employee_list(conn):
+        return fetch_all(conn, query, params), fetch_all(conn, queries.DEPARTMENT_LIST)
 
-        cursor.execute(query, tuple(params))
-        employees = cursor.fetchall()
-
-        cursor.execute("SELECT DISTINCT department FROM Employee ORDER BY department")
-        departments_result = cursor.fetchall()
-        departments = [row['department'] for row in departments_result if row['department']] # Filter out None/empty
+    try:
+        parts = list(shards.scatter(employee_list).values())
+        # Every shard's rows are already ordered by employee_id DESC
+        employees = list(heapq.merge(*(rows for rows, _ in parts), key=lambda row: row['employee_id'], reverse=True))
+        if include_linked_user and shards.enabled(): _attach_usernames(employees)
+        departments = list(dict.fromkeys(row['department'] for _, rows in parts for row in rows if row['department'])) # Filter out None/empty
+        if len(parts) > 1: departments.sort(key=str.casefold)
 
         return jsonify({
             "employees": format_dates(employees),
             "departments": departments
         })
+    except shards.ShardUnavailable as e:
+        return _shard_unavailable(e)
     except Exception as e:
-        print(f"Error in /api/employees: {e}")
+        log.error("Error in /api/employees: %s", e)
         return jsonify({"error": "Could not fetch employees"}), 500
-    finally:
-        cursor.close()
-        conn.close()
 
 
 # --- NEW: Route to get unlinked users (for dropdown) ---
-@app.route('/api/users/unlinked', methods=['GET'])
+@api.route('/api/users/unlinked', methods=['GET'])
 @login_required
+@replica_read
 def get_unlinked_users():
      if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+     if shards.enabled(): return _get_unlinked_users_sharded()
 
      conn = get_db_connection()
      if conn is None: return jsonify({"error": "Database connection failed"}), 500
@@ -293,15 +540,36 @@ def get_unlinked_users():
          unlinked_users = cursor.fetchall()
          return jsonify(unlinked_users)
      except Exception as e:
-         print(f"Error fetching unlinked users: {e}")
+         log.error("Error fetching unlinked users: %s", e)
          return jsonify({"error": "Could not fetch unlinked users"}), 500
      finally:
          cursor.close()
          conn.close()
 
+def _get_unlinked_users_sharded():
+    """Same list when the users live on the home database and the employees on the shards."""
+    try:
+        linked = set()
+        for rows in shards.scatter(lambda conn: fetch_all(conn, "SELECT user_id FROM Employee WHERE user_id IS NOT NULL")).values():
+            linked.update(row['user_id'] for row in rows)
+        conn = _home_connection()
+        if conn is None: return jsonify({"error": "Database connection failed"}), 500
+        try:
+            users = fetch_all(conn, "SELECT id, username FROM users WHERE role != 'admin' ORDER BY username")
+        finally:
+            conn.close()
+        return jsonify([user for user in users if user['id'] not in linked])
+    except shards.ShardUnavailable as e:
+        return _shard_unavailable(e)
+    except Exception as e:
+        log.error("Error fetching unlinked users: %s", e)
+        return jsonify({"error": "Could not fetch unlinked users"}), 500
+
 
-@app.route('/api/employees/<int:employee_id>', methods=['GET'])
+@api.route('/api/employees/<int:employee_id>', methods=['GET'])
 @login_required
+@replica_read
+@employee_shard
 def get_employee(employee_id):
     # --- MODIFIED: Allow admin or the correct employee ---
     # This check is complex. Let's fetch first, then check.
@@ -313,7 +581,7 @@ def get_employee(employee_id):
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        if include_linked_user:
+        if include_linked_user and not shards.enabled():
             query = """
                 SELECT e.*, u.username as linked_username
                 FROM Employee e
@@ -333,22 +601,114 @@ def get_employee(employee_id):
             is_correct_employee = (employee.get('user_id') is not None and employee.get('user_id') == session.get('user_id'))
 
             if not (is_admin or is_correct_employee):
-                 print(f"Access DENIED for employee {employee_id} to user {session.get('user_id')}")
+                 log.warning("Access DENIED for employee %s to user %s", employee_id, session.get('user_id'))
                  return jsonify({"error": "Forbidden"}), 403
 
             # User is authorized, return data
+            if include_linked_user and shards.enabled(): _attach_usernames([employee])
             return jsonify(format_dates([employee])[0])
         else:
             return jsonify({"error": "Employee not found"}), 404
     except Exception as e:
-        print(f"Error getting employee {employee_id}: {e}")
+        log.error("Error getting employee %s: %s", employee_id, e)
         return jsonify({"error": "Could not fetch employee data"}), 500
     finally:
         cursor.close()
         conn.close()
 
 
-@app.route('/api/employees', methods=['POST'])
+# Many employees in one call (Admin only), for tools that reconcile hundreds of
+# records. GET /api/employees/batch?ids=1,2,3&fields=name,department&include_linked_user=true
+# or POST the same as JSON {"ids": [...], "fields": [...], "include_linked_user": true}
+# for id lists too long for a URL. Ids are looked up IN_CHUNK_SIZE at a time;
+# results keep the requested order and unknown ids are listed in not_found.
+EMPLOYEE_BATCH_FIELDS = ('employee_id', 'name', 'department', 'position', 'joining_date', 'base_salary', 'user_id', 'employee_class')
+MAX_EMPLOYEE_BATCH_GET = 500
+MAX_EMPLOYEE_BATCH_POST = 50000
+
+def _batch_ids(values, limit):
+    """Validated, de-duplicated ids in request order. Raises ValueError."""
+    if not values: raise ValueError("ids is required")
+    if len(values) > limit: raise ValueError(f"At most {limit} ids per request; POST larger lists")
+    ids = []
+    for value in values:
+        if isinstance(value, bool): raise ValueError(f"Invalid employee id: {value!r}")
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid employee id: {value!r}")
+    return list(dict.fromkeys(ids))
+
+@api.route('/api/employees/batch', methods=['GET', 'POST'])
+@login_required
+@replica_read
+@limit_concurrency('exports')
+def get_employees_batch():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        raw_ids, limit = data.get('ids') or [], MAX_EMPLOYEE_BATCH_POST
+        fields = data.get('fields')
+        include_linked_user = bool(data.get('include_linked_user', False))
+        if not isinstance(raw_ids, list) or (fields is not None and not isinstance(fields, list)):
+            return jsonify({"error": "ids and fields must be lists"}), 400
+    else:
+        raw_ids = [value for value in request.args.get('ids', '').split(',') if value.strip()]
+        limit = MAX_EMPLOYEE_BATCH_GET
+        fields = [value.strip() for value in request.args['fields'].split(',') if value.strip()] if request.args.get('fields') else None
+        include_linked_user = request.args.get('include_linked_user', 'false').lower() == 'true'
+
+    try:
+        employee_ids = _batch_ids(raw_ids, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    unknown = [field for field in fields or () if field not in EMPLOYEE_BATCH_FIELDS]
+    if unknown: return jsonify({"error": f"Unknown fields: {', '.join(map(str, unknown))}", "allowed_fields": list(EMPLOYEE_BATCH_FIELDS)}), 400
+
+    # Sparse fieldsets: only the requested columns leave the database; employee_id is always included
+    columns = ['employee_id'] + [field for field in (fields or EMPLOYEE_BATCH_FIELDS) if field != 'employee_id']
+    attach_usernames = include_linked_user and shards.enabled()
+    if attach_usernames and 'user_id' not in columns: columns.append('user_id')
+    select = ", ".join(f"e.{column}" for column in columns)
+    if include_linked_user and not shards.enabled():
+        select += ", u.username AS linked_username"
+        source = "Employee e LEFT JOIN users u ON e.user_id = u.id"
+    else:
+        source = "Employee e"
+
+    def lookup(conn, ids):
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            found = {}
+            for chunk in queries.chunks(ids):
+                cursor.execute(f"SELECT {select} FROM {source} WHERE e.employee_id IN ({queries.placeholders(len(chunk))})", chunk)
+                found.update((row['employee_id'], row) for row in cursor.fetchall())
+            return found
+        finally:
+            cursor.close()
+
+    try:
+        # Sharded: each shard is asked only for its own ids, all shards at once
+        groups, _ = shards.group_by_shard(employee_ids)
+        found = {}
+        for part in shards.scatter_groups(groups, lookup).values():
+            found.update(part)
+        employees = [found[employee_id] for employee_id in employee_ids if employee_id in found]
+        if attach_usernames:
+            _attach_usernames(employees)
+            if fields and 'user_id' not in fields:
+                for employee in employees: del employee['user_id']
+        return jsonify({"employees": format_dates(employees), "count": len(employees),
+                        "not_found": [employee_id for employee_id in employee_ids if employee_id not in found]})
+    except shards.ShardUnavailable as e:
+        return _shard_unavailable(e)
+    except mysql.connector.Error as e:
+        log.exception("Error in /api/employees/batch: %s", e)
+        return jsonify({"error": "Could not fetch employee data"}), 500
+
+
+@api.route('/api/employees', methods=['POST'])
 @login_required
 def add_employee():
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
@@ -367,43 +727,91 @@ def add_employee():
         return jsonify({"error": "All fields are required and cannot be empty."}), 400
     # --- END FIX 1 ---
 
-    conn = get_db_connection()
+    # Sharded: the new employee goes to the shard of its department / id range
+    shard = None
+    if shards.enabled():
+        try:
+            shard = shards.shard_for_new_employee(new_employee_data['department'])
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 400
+
+    with use_shard(shard):
+        conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(buffered=True) # No dictionary needed for insert ID
 
     try:
         sql = """INSERT INTO Employee
-                 (name, department, position, joining_date, base_salary, user_id)
-                 VALUES (%s, %s, %s, %s, %s, %s)"""
+                 (name, department, position, joining_date, base_salary, user_id, employee_class)
+                 VALUES (%s, %s, %s, %s, %s, %s, %s)"""
 
         # --- FIX 2: No longer need to convert '' to None, as we block it ---
         joining_date = new_employee_data['joining_date']
         user_id_to_link = None # Always add as unlinked initially
+        # Payroll rule set class (payroll.py); optional
+        employee_class = new_employee_data.get('employee_class') or payroll.DEFAULT_CLASS
         values = (new_employee_data['name'], new_employee_data['department'],
                   new_employee_data['position'], joining_date,
-                  new_employee_data['base_salary'], user_id_to_link)
+                  new_employee_data['base_salary'], user_id_to_link, employee_class)
         # --- END FIX 2 ---
 
         cursor.execute(sql, values)
-        conn.commit()
         new_id = cursor.lastrowid
+        if shard is not None and shards.shard_for_employee(new_id) != shard:
+            # The node's AUTO_INCREMENT settings do not match DB_SHARDS (see sql/shard_node.sql)
+            conn.rollback()
+            log.error("Employee id %s from shard '%s' belongs to another shard; check its AUTO_INCREMENT settings", new_id, shard)
+            return jsonify({"error": "Could not add employee: shard configuration error"}), 500
+        # The leave accrued since joining this leave year; the monthly `accrue` run does the rest
+        leave.catch_up(cursor, new_id, leave.leave_year_of(datetime.date.today()))
+        outbox.record(cursor, outbox.EMPLOYEE, 'created', new_id, new_id,
+                      {'department': new_employee_data['department'], 'base_salary': new_employee_data['base_salary']})
+        conn.commit()
         return jsonify({"message": "Employee added successfully", "employee_id": new_id}), 201
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"Database error adding employee: {db_err}")
+        log.error("Database error adding employee: %s", db_err)
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error adding employee: {e}")
-        traceback.print_exc()
+        log.exception("Error adding employee: %s", e)
         return jsonify({"error": "Could not add employee due to an internal error"}), 500
     finally:
         cursor.close()
         conn.close()
 
 
-@app.route('/api/employees/<int:employee_id>', methods=['PUT'])
+def _check_sharded_update(employee_id, department, user_id):
+    """
+    What the database checked on one node and cannot across shards: the employee
+    stays on its shard, and a linked account exists (users is on the home
+    database) and is not linked on another shard. Returns an error response or None.
+    """
+    shard_map = shards.shard_map()
+    if shard_map.key == shards.DEPARTMENT:
+        try:
+            target = shards.shard_for_new_employee(department)
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 400
+        if target != shards.shard_for_employee(employee_id):
+            return jsonify({"error": "Moving an employee to a department on another shard is not supported."}), 409
+    if user_id is None:
+        return None
+    conn = _home_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    try:
+        if not fetch_one(conn, "SELECT id FROM users WHERE id = %s", (user_id,)):
+            return jsonify({"error": "Update failed. The selected user account does not exist."}), 400
+    finally:
+        conn.close()
+    _, linked = shards.locate(queries.EMPLOYEE_ID_FOR_USER, (user_id,))
+    if linked and linked['employee_id'] != employee_id:
+        return jsonify({"error": "Update failed. This user account might already be linked to another employee."}), 409
+    return None
+
+@api.route('/api/employees/<int:employee_id>', methods=['PUT'])
 @login_required
+@employee_shard
 def update_employee(employee_id):
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
@@ -440,41 +848,46 @@ def update_employee(employee_id):
         joining_date = data['joining_date']
         # --- END FIX 2 ---
 
+        if shards.enabled():
+            error = _check_sharded_update(employee_id, data['department'], user_id_to_link)
+            if error: return error
+
+        # employee_class is optional; the edit modal does not send it, so keep the stored one
         sql = """UPDATE Employee SET
                  name = %s, department = %s, position = %s,
-                 joining_date = %s, base_salary = %s, user_id = %s
+                 joining_date = %s, base_salary = %s, user_id = %s,
+                 employee_class = COALESCE(%s, employee_class)
                  WHERE employee_id = %s"""
         values = (data['name'], data['department'], data['position'],
-                  joining_date, data['base_salary'], user_id_to_link, employee_id)
+                  joining_date, data['base_salary'], user_id_to_link, data.get('employee_class') or None, employee_id)
 
-        print(f"Updating employee {employee_id} with values: {values}") # Debug log
+        log.debug("Updating employee %s with values: %s", employee_id, values)
 
         cursor.execute(sql, values)
-        conn.commit()
-
         rowcount = cursor.rowcount # Get affected rows before closing cursor
+        if rowcount:
+            outbox.record(cursor, outbox.EMPLOYEE, 'updated', employee_id, employee_id,
+                          {'department': data['department'], 'base_salary': data['base_salary'], 'user_id': user_id_to_link})
+        conn.commit()
 
         if rowcount == 0:
             # Check if employee actually exists to differentiate errors
-            check_cursor = conn.cursor(buffered=True)
-            check_cursor.execute("SELECT employee_id FROM Employee WHERE employee_id = %s", (employee_id,))
-            exists = check_cursor.fetchone()
-            check_cursor.close()
-            if not exists:
+            if not fetch_one(conn, queries.EMPLOYEE_DIRECTORY_ROW, (employee_id,)):
                 return jsonify({"error": "Employee not found"}), 404
             else:
                 # If exists but rowcount is 0, likely no data actually changed
-                 print(f"Update executed for employee {employee_id}, but rowcount is 0. Data likely unchanged.")
+                 log.debug("Update executed for employee %s, but rowcount is 0. Data likely unchanged.", employee_id)
                  # --- MODIFIED: Return success even if no change ---
                  return jsonify({"message": f"Employee {employee_id} updated successfully (no data changed)"})
+        directory.invalidate(employee_id)
 
 
-        print(f"Successfully updated employee {employee_id}. Rowcount: {rowcount}") # Debug log
+        log.debug("Successfully updated employee %s. Rowcount: %s", employee_id, rowcount)
         return jsonify({"message": f"Employee {employee_id} updated successfully"})
 
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"Database error updating employee {employee_id}: {db_err}")
+        log.error("Database error updating employee %s: %s", employee_id, db_err)
         # --- Check specific errors related to user_id linking ---
         if db_err.errno == 1062: # Duplicate entry (e.g., user_id unique constraint violation)
              return jsonify({"error": "Update failed. This user account might already be linked to another employee."}), 409
@@ -483,8 +896,7 @@ def update_employee(employee_id):
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error updating employee {employee_id}: {e}")
-        traceback.print_exc()
+        log.exception("Error updating employee %s: %s", employee_id, e)
         return jsonify({"error": "Could not update employee due to an internal error"}), 500
     finally:
         # Ensure cursor is closed even if rowcount check fails
@@ -492,8 +904,9 @@ def update_employee(employee_id):
         if conn: conn.close()
 
 
-@app.route('/api/employees/<int:employee_id>', methods=['DELETE'])
+@api.route('/api/employees/<int:employee_id>', methods=['DELETE'])
 @login_required
+@employee_shard
 def delete_employee(employee_id):
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
@@ -501,22 +914,38 @@ def delete_employee(employee_id):
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(buffered=True)
     try:
-        # Check if employee exists before deleting
-        cursor.execute("SELECT employee_id FROM Employee WHERE employee_id = %s", (employee_id,))
-        if not cursor.fetchone():
+        # Check if employee exists before deleting (on the primary, locked until the commit)
+        cursor.execute("SELECT employee_id FROM Employee WHERE employee_id = %s FOR UPDATE", (employee_id,))
+        if cursor.fetchone() is None:
+             conn.rollback()
              return jsonify({"error": "Employee not found"}), 404
 
-        # Proceed with deletion (Salary and Attendance will cascade delete)
+        # Salary and Attendance are partitioned and cannot have foreign keys,
+        # so they are deleted here (LeaveRequest still cascades). Archived
+        # rows stay in the cold archive; nothing reads them without the employee.
+        cursor.execute(queries.EMPLOYEE_SALARY_MONTHS, (employee_id,))
+        paid_months = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM Salary WHERE employee_id = %s", (employee_id,))
+        cursor.execute("DELETE FROM Attendance WHERE employee_id = %s", (employee_id,))
+        cursor.execute("DELETE FROM SalaryYTD WHERE employee_id = %s", (employee_id,))
+        cursor.execute("DELETE FROM LeaveLedger WHERE employee_id = %s", (employee_id,))
+        cursor.execute("DELETE FROM LeaveBalance WHERE employee_id = %s", (employee_id,))
         cursor.execute("DELETE FROM Employee WHERE employee_id = %s", (employee_id,))
+        # Subscribers drop the employee's salaries, attendance and leave requests too
+        outbox.record(cursor, outbox.EMPLOYEE, 'deleted', employee_id, employee_id)
         conn.commit()
+        directory.invalidate(employee_id)
+        # The reports and rankings read the snapshots of the months they were paid in
+        for month in paid_months:
+            _refresh_snapshot(conn, month)
         return jsonify({"message": f"Employee {employee_id} deleted successfully"})
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"Database error deleting employee {employee_id}: {db_err}")
+        log.error("Database error deleting employee %s: %s", employee_id, db_err)
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error deleting employee {employee_id}: {e}")
+        log.error("Error deleting employee %s: %s", employee_id, e)
         return jsonify({"error": "Could not delete employee"}), 500
     finally:
         cursor.close()
@@ -525,49 +954,75 @@ def delete_employee(employee_id):
 # --- SALARY ROUTES ---
 
 # Get salaries for a specific employee (used by Admin salary page)
-@app.route('/api/employees/<int:employee_id>/salaries', methods=['GET'])
+@api.route('/api/employees/<int:employee_id>/salaries', methods=['GET'])
 @login_required
+@replica_read
+@employee_shard
 def get_employee_salaries(employee_id):
     # --- MODIFIED: Allow admin or the correct employee ---
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        # Check if employee exists first
-        cursor.execute("SELECT employee_id, user_id FROM Employee WHERE employee_id = %s", (employee_id,))
-        employee = cursor.fetchone()
-        if not employee:
-             return jsonify({"error": "Employee not found"}), 404
-
-        # --- NEW PERMISSION CHECK ---
-        is_admin = session.get('role') == 'admin'
-        is_correct_employee = (employee.get('user_id') is not None and employee.get('user_id') == session.get('user_id'))
-
-        if not (is_admin or is_correct_employee):
-            print(f"Access DENIED for employee {employee_id} salaries to user {session.get('user_id')}")
-            return jsonify({"error": "Forbidden"}), 403
+        # Existence and permission check
+        employee, error = _employee_for_reader(conn, employee_id, 'salaries')
+        if error: return error
 
         # User is authorized, proceed
-        query = """
-            SELECT s.*, e.base_salary
-            FROM Salary s
-            JOIN Employee e ON s.employee_id = e.employee_id
-            WHERE s.employee_id = %s
-            ORDER BY s.month DESC
-        """
-        cursor.execute(query, (employee_id,))
-        salaries = cursor.fetchall()
-        return jsonify(format_dates(salaries))
+        salaries = fetch_all(conn, queries.EMPLOYEE_SALARY_HISTORY, (employee_id,))
+        archived = archive.employee_rows('Salary', employee_id, extra={'base_salary': employee['base_salary']})
+        return jsonify(format_dates(archive.merge_history(salaries, archived)))
     except Exception as e:
-        print(f"Error getting salaries for employee {employee_id}: {e}")
+        log.error("Error getting salaries for employee %s: %s", employee_id, e)
         return jsonify({"error": "Could not fetch salary history"}), 500
     finally:
-        cursor.close()
+        conn.close()
+
+# Year-to-date and annual salary statements (Admin or the employee), newest
+# fiscal year first; ?fiscal_year=2024 for one year. Read from SalaryYTD (ytd.py),
+# so the cost does not grow with the salary history.
+def _fiscal_year_arg():
+    """(?fiscal_year as int or None, error response or None)"""
+    value = request.args.get('fiscal_year')
+    if value in (None, ''):
+        return None, None
+    try:
+        return int(value), None
+    except ValueError:
+        return None, (jsonify({"error": "fiscal_year must be a year, e.g. 2024"}), 400)
+
+def _ytd_statements(conn, employee_id, fiscal_year):
+    rows = fetch_all(conn, queries.EMPLOYEE_YTD, (employee_id,))
+    if fiscal_year is not None:
+        rows = [row for row in rows if row['fiscal_year'] == fiscal_year]
+    current = archive.fiscal_year_of(datetime.date.today())
+    return jsonify({"employee_id": employee_id, "current_fiscal_year": current,
+                    "statements": [ytd.statement(row, current) for row in rows]})
+
+@api.route('/api/employees/<int:employee_id>/ytd', methods=['GET'])
+@login_required
+@replica_read
+@employee_shard
+def get_employee_ytd(employee_id):
+    fiscal_year, error = _fiscal_year_arg()
+    if error: return error
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    try:
+        _, error = _employee_for_reader(conn, employee_id, 'YTD statements')
+        if error: return error
+        return _ytd_statements(conn, employee_id, fiscal_year)
+    except mysql.connector.Error as e:
+        log.error("Error getting YTD statements for employee %s: %s", employee_id, e)
+        return jsonify({"error": "Could not fetch YTD statements"}), 500
+    finally:
         conn.close()
 
 # Get single salary record (for slip - Employee or Admin)
-@app.route('/api/salaries/<int:salary_id>', methods=['GET'])
+@api.route('/api/salaries/<int:salary_id>', methods=['GET'])
 @login_required
+@replica_read
+@row_shard('salary_id')
 def get_single_salary(salary_id):
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
@@ -582,6 +1037,14 @@ def get_single_salary(salary_id):
         cursor.execute(query, (salary_id,))
         salary_slip = cursor.fetchone()
 
+        if not salary_slip:
+            # Slips from archived fiscal years
+            salary_slip = archive.find_salary(salary_id)
+            if salary_slip:
+                cursor.execute("SELECT name, department, position, base_salary, user_id FROM Employee WHERE employee_id = %s", (salary_slip['employee_id'],))
+                employee = cursor.fetchone()
+                salary_slip = dict(salary_slip, **employee) if employee else None
+
         if not salary_slip:
             return jsonify({"error": "Salary record not found"}), 404
 
@@ -593,15 +1056,14 @@ def get_single_salary(salary_id):
         # is also linked to the currently logged-in user (and user_id is not None)
         if session.get('role') == 'admin' or \
            (session.get('role') == 'employee' and employee_linked_user_id is not None and employee_linked_user_id == logged_in_user_id):
-             # print(f"Access granted for salary slip {salary_id} to user {logged_in_user_id} (role: {session.get('role')})") # Reduce noise
+             log.debug("Access granted for salary slip %s to user %s (role: %s)", salary_id, logged_in_user_id, session.get('role'))
              return jsonify(format_dates([salary_slip])[0])
         else:
-            print(f"Access DENIED for salary slip {salary_id} to user {logged_in_user_id} (role: {session.get('role')}, linked_id: {employee_linked_user_id})") # Add log
+            log.warning("Access DENIED for salary slip %s to user %s (role: %s, linked_id: %s)", salary_id, logged_in_user_id, session.get('role'), employee_linked_user_id)
             return jsonify({"error": "Forbidden"}), 403
 
     except Exception as e:
-        print(f"Error getting single salary {salary_id}: {e}")
-        traceback.print_exc()
+        log.exception("Error getting single salary %s: %s", salary_id, e)
         return jsonify({"error": "Could not fetch salary slip data"}), 500
     finally:
         cursor.close()
@@ -609,47 +1071,63 @@ def get_single_salary(salary_id):
 
 
 # Helper function for salary calculation
-def _calculate_salary_for_employee(cursor, employee_id, base_salary, month, bonus=0.0, deductions=0.0):
-    """Calculates and inserts salary. Assumes cursor is dictionary=True, buffered=True."""
+def _calculate_salary_for_employee(conn, cursor, employee_id, base_salary, month, rules, bonus=0.0, deductions=0.0):
+    """
+    Calculates and inserts salary with `rules` (from payroll.compile_rules) through `cursor` on `conn`.
+    Returns (salary_id, None), or (None, error message).
+    """
     try:
-        cursor.execute("SELECT overtime_hours, leaves_taken FROM Attendance WHERE employee_id = %s AND month = %s", (employee_id, month))
-        attendance = cursor.fetchone()
+        attendance = fetch_one(conn, queries.ATTENDANCE_FOR_SALARY, (employee_id, month))
 
-        if not attendance: return (False, "Attendance record not found")
+        if not attendance: return (None, "Attendance record not found")
 
         overtime_hours = float(attendance.get('overtime_hours') or 0.0)
-        base_salary = float(base_salary or 0.0)
-
-        PF_RATE = 0.12; OT_MULTIPLIER = 1.5; WORKING_DAYS = 22; HOURS_PER_DAY = 8
+        overtime_pay, pf_amount, total_salary = payroll.calculate_salary(base_salary, overtime_hours, bonus, deductions, rules)
 
-        pf_amount = round(base_salary * PF_RATE, 2)
+        values = (employee_id, month, overtime_hours, overtime_pay, float(bonus or 0.0), float(deductions or 0.0),
+                  pf_amount, total_salary, rules.version)
 
-        hourly_rate = 0.0
-        if base_salary > 0 and WORKING_DAYS > 0 and HOURS_PER_DAY > 0:
-             hourly_rate = (base_salary / WORKING_DAYS) / HOURS_PER_DAY
-        overtime_pay = round(hourly_rate * overtime_hours * OT_MULTIPLIER, 2)
+        cursor.execute(queries.INSERT_SALARY, values)
+        # Before the SalaryYTD upsert replaces the cursor's lastrowid
+        salary_id = cursor.lastrowid
+        ytd.add(cursor, ytd.for_inserts([values]))
+        return (salary_id, None)
 
-        sql = """
-            INSERT INTO Salary (employee_id, month, overtime_hours, overtime_pay, bonus, deductions, pf_amount)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-        """
-        values = (employee_id, month, overtime_hours, overtime_pay, float(bonus or 0.0), float(deductions or 0.0), pf_amount)
+    except mysql.connector.Error as db_err:
+        log.error("DB Error in _calculate_salary for emp %s: %s", employee_id, db_err)
+        if db_err.errno == 1062: # uk_salary_employee_month (migration 0001): lost a race with another insert
+            return (None, "Salary record already exists")
+        return (None, f"Database error: {db_err.msg}")
+    except Exception as e:
+        log.exception("Error in _calculate_salary for emp %s: %s", employee_id, e)
+        return (None, f"Calculation error: {str(e)}")
 
-        cursor.execute(sql, values)
-        return (True, None)
 
-    except mysql.connector.Error as db_err:
-        print(f"DB Error in _calculate_salary for emp {employee_id}: {db_err}")
-        return (False, f"Database error: {db_err.msg}")
+def _refresh_snapshot(conn, month):
+    """
+    Rewrites the month's analytics snapshot. Best effort: the salaries are already committed.
+    Sharded, the rows are gathered from every shard and `conn` is not used.
+    """
+    try:
+        if shards.enabled():
+            first = snapshots.snapshot_month(month)
+            parts = shards.scatter(lambda shard_conn: fetch_all(shard_conn, queries.SNAPSHOT_MONTH, (first,)))
+            rows = snapshots.write_month(first, [row for part in parts.values() for row in part])
+        else:
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                rows = snapshots.build_snapshot(cursor, month)
+            finally:
+                cursor.close()
+        log.info("Analytics snapshot for %s written (%s rows)", month, rows)
     except Exception as e:
-        print(f"Error in _calculate_salary for emp {employee_id}: {e}")
-        traceback.print_exc()
-        return (False, f"Calculation error: {str(e)}")
+        log.exception("Could not write analytics snapshot for %s: %s", month, e)
 
 
 # Add single salary record (Admin only)
-@app.route('/api/salaries', methods=['POST'])
+@api.route('/api/salaries', methods=['POST'])
 @login_required
+@employee_shard
 def add_salary():
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
@@ -668,36 +1146,240 @@ def add_salary():
         bonus = data['bonus']
         deductions = data['deductions']
 
-        cursor.execute("SELECT base_salary FROM Employee WHERE employee_id = %s", (employee_id,))
-        employee = cursor.fetchone()
+        employee = _employee_entry(conn, employee_id)
         if not employee: return jsonify({"error": "Employee not found"}), 404
         base_salary = employee.get('base_salary')
 
-        cursor.execute("SELECT salary_id FROM Salary WHERE employee_id = %s AND month = %s", (employee_id, month))
-        if cursor.fetchone(): return jsonify({"error": "Salary record for this month already exists"}), 409
+        if fetch_one(conn, queries.SALARY_EXISTS, (employee_id, month)): return jsonify({"error": "Salary record for this month already exists"}), 409
+        if archive.is_archived_month(month): return jsonify({"error": f"{month} belongs to an archived fiscal year"}), 409
+
+        try:
+            rules = _compile_rules(cursor, month).for_class(employee['employee_class'])
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 400
 
-        success, error_message = _calculate_salary_for_employee(cursor, employee_id, base_salary, month, bonus, deductions)
+        salary_id, error_message = _calculate_salary_for_employee(conn, cursor, employee_id, base_salary, month, rules, bonus, deductions)
 
-        if success:
+        if salary_id:
+            outbox.record(cursor, outbox.SALARY, 'created', salary_id, employee_id, {'month': month})
             conn.commit()
-            return jsonify({"message": "Salary record calculated and added successfully"}), 201
+            _refresh_snapshot(conn, month)
+            return jsonify({"message": "Salary record calculated and added successfully", "salary_id": salary_id}), 201
         else:
             conn.rollback()
             return jsonify({"error": error_message or "Failed to calculate or add salary record"}), 400
 
     except Exception as e:
         conn.rollback()
-        print(f"Error in POST /api/salaries: {e}")
-        traceback.print_exc()
+        log.exception("Error in POST /api/salaries: %s", e)
         return jsonify({"error": "An internal error occurred"}), 500
     finally:
         cursor.close()
         conn.close()
 
 
+# Batched bonus / deduction adjustments for one month (Admin only)
+# Body: {"month": "2025-03-01", "mode": "set" | "add", "skip_invalid": false,
+#        "adjustments": [{"employee_id": 1, "bonus": 5000, "deductions": 250}, ...]}
+# Employees without a Salary row for the month get one computed from their
+# attendance; existing rows only get the new bonus / deductions ("add" adds to
+# the current amounts). Everything is applied in one transaction. By default
+# any invalid line rolls the whole batch back, like /api/payroll/run;
+# skip_invalid=true applies the valid lines and reports the rest (207).
+MAX_SALARY_ADJUSTMENTS = 50000
+
+def _adjustment_amount(item, field):
+    value = item.get(field)
+    if value is None: return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        raise ValueError(f"{field} must be a non-negative number")
+    return float(value)
+
+def _parse_adjustment(item):
+    """(employee_id, bonus, deductions); bonus / deductions are None when not given. Raises ValueError."""
+    if not isinstance(item, dict): raise ValueError("Adjustment must be an object")
+    employee_id = item.get('employee_id')
+    if isinstance(employee_id, bool) or not isinstance(employee_id, int): raise ValueError("employee_id must be an integer")
+    bonus, deductions = _adjustment_amount(item, 'bonus'), _adjustment_amount(item, 'deductions')
+    if bonus is None and deductions is None: raise ValueError("bonus or deductions is required")
+    return employee_id, bonus, deductions
+
+@api.route('/api/salaries/adjustments', methods=['POST'])
+@login_required
+@limit_concurrency('payroll')
+def adjust_salaries():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    month = _parse_month(str(data.get('month') or ''))
+    if month is None: return jsonify({"error": "month (YYYY-MM-01) is required"}), 400
+    mode = data.get('mode', 'set')
+    if mode not in ('set', 'add'): return jsonify({"error": "mode must be 'set' or 'add'"}), 400
+    skip_invalid = bool(data.get('skip_invalid', False))
+    items = data.get('adjustments')
+    if not isinstance(items, list) or not items: return jsonify({"error": "adjustments must be a non-empty list"}), 400
+    if len(items) > MAX_SALARY_ADJUSTMENTS: return jsonify({"error": f"At most {MAX_SALARY_ADJUSTMENTS} adjustments per request"}), 400
+    if archive.is_archived_month(month): return jsonify({"error": f"{month} belongs to an archived fiscal year"}), 409
+
+    adjustments = {}; failed_details = []
+    for item in items:
+        try:
+            employee_id, bonus, deductions = _parse_adjustment(item)
+        except ValueError as e:
+            failed_details.append({"employee_id": item.get('employee_id') if isinstance(item, dict) else None, "reason": str(e)}); continue
+        if employee_id in adjustments:
+            failed_details.append({"employee_id": employee_id, "reason": "Duplicate employee_id in batch"}); continue
+        adjustments[employee_id] = (bonus, deductions)
+
+    if shards.enabled(): return _adjust_salaries_sharded(month, mode, skip_invalid, adjustments, failed_details, len(items))
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+
+    try:
+        rows, ytd_deltas, results, row_failures = _adjustment_rows(cursor, month, mode, adjustments)
+        failed_details += row_failures
+
+        if failed_details and not skip_invalid:
+            conn.rollback()
+            log.warning("Salary adjustments for %s rejected: %s invalid of %s", month, len(failed_details), len(items))
+            return _adjustments_rejected(failed_details)
+
+        # mysql-connector sends each chunk as one multi-row INSERT ... ON DUPLICATE KEY UPDATE
+        for chunk in queries.chunks(rows):
+            cursor.executemany(queries.UPSERT_SALARY_ADJUSTMENT, chunk)
+        ytd.add(cursor, ytd_deltas)
+        _record_adjustments(cursor, month, rows)
+        conn.commit()
+        if rows: _refresh_snapshot(conn, month)
+        return _adjustments_applied(month, results, failed_details)
+
+    except mysql.connector.Error as e:
+        conn.rollback()
+        log.exception("Error in POST /api/salaries/adjustments: %s", e)
+        return jsonify({"error": "An internal error occurred; no adjustments were applied"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+def _adjustment_rows(cursor, month, mode, adjustments):
+    """
+    Reads and computes {employee_id: (bonus, deductions)} on one node:
+    (upsert rows, SalaryYTD deltas, results, failed_details).
+    """
+    # Three IN-list reads per chunk instead of two lookups per employee.
+    # FOR UPDATE keeps the current amounts stable until the commit.
+    employee_ids = list(adjustments)
+    employees = {}; existing = {}; overtime_hours = {}
+    for chunk in queries.chunks(employee_ids):
+        marks = queries.placeholders(len(chunk))
+        cursor.execute(f"SELECT employee_id, base_salary, employee_class FROM Employee WHERE employee_id IN ({marks})", chunk)
+        employees.update((row['employee_id'], row) for row in cursor.fetchall())
+        cursor.execute(f"SELECT employee_id, bonus, deductions, total_salary FROM Salary WHERE month = %s AND employee_id IN ({marks}) FOR UPDATE", (month, *chunk))
+        existing.update((row['employee_id'], row) for row in cursor.fetchall())
+    new_ids = [employee_id for employee_id in employee_ids if employee_id in employees and employee_id not in existing]
+    for chunk in queries.chunks(new_ids):
+        cursor.execute(f"SELECT employee_id, overtime_hours FROM Attendance WHERE month = %s AND employee_id IN ({queries.placeholders(len(chunk))})", (month, *chunk))
+        overtime_hours.update((row['employee_id'], float(row['overtime_hours'] or 0.0)) for row in cursor.fetchall())
+    compiled_rules = _compile_rules(cursor, month) if new_ids else None
+
+    rows = []; ytd_deltas = []; results = []; failed_details = []
+    for employee_id, (bonus, deductions) in adjustments.items():
+        employee = employees.get(employee_id)
+        if employee is None:
+            failed_details.append({"employee_id": employee_id, "reason": "Employee not found"}); continue
+        current = existing.get(employee_id)
+        if current:
+            old_bonus = float(current['bonus'] or 0.0); old_deductions = float(current['deductions'] or 0.0)
+            new_bonus = old_bonus if bonus is None else (old_bonus + bonus if mode == 'add' else bonus)
+            new_deductions = old_deductions if deductions is None else (old_deductions + deductions if mode == 'add' else deductions)
+            total_salary = float(current['total_salary'] or 0.0) - old_bonus + old_deductions + new_bonus - new_deductions
+            # Only bonus and deductions are used on the duplicate-key path
+            rows.append((employee_id, month, 0.0, 0.0, new_bonus, new_deductions, 0.0, total_salary, None))
+            ytd_deltas.append(ytd.salary_delta(employee_id, month, 0.0, 0.0, new_bonus - old_bonus, new_deductions - old_deductions,
+                                               0.0, total_salary - float(current['total_salary'] or 0.0), months=0))
+            status = "updated"
+        else:
+            if employee_id not in overtime_hours:
+                failed_details.append({"employee_id": employee_id, "reason": "Attendance record not found"}); continue
+            try:
+                rules = compiled_rules.for_class(employee['employee_class'])
+            except LookupError as e:
+                failed_details.append({"employee_id": employee_id, "reason": str(e)}); continue
+            new_bonus = bonus or 0.0; new_deductions = deductions or 0.0
+            overtime_pay, pf_amount, total_salary = payroll.calculate_salary(employee['base_salary'], overtime_hours[employee_id], new_bonus, new_deductions, rules)
+            rows.append((employee_id, month, overtime_hours[employee_id], overtime_pay, new_bonus, new_deductions, pf_amount, total_salary, rules.version))
+            ytd_deltas.append(ytd.salary_delta(*rows[-1][:8]))
+            status = "created"
+        results.append({"employee_id": employee_id, "status": status, "bonus": new_bonus, "deductions": new_deductions, "total_salary": round(total_salary, 2)})
+    return rows, ytd_deltas, results, failed_details
+
+def _record_adjustments(cursor, month, rows):
+    # One change event for the whole batch on this node
+    if rows:
+        outbox.record(cursor, outbox.SALARY, 'adjusted', payload={'month': month, 'employee_ids': [row[0] for row in rows]})
+
+def _adjustments_rejected(failed_details):
+    return jsonify({"error": "No adjustments applied; fix the failed lines or send skip_invalid=true",
+                    "created_count": 0, "updated_count": 0, "failed_count": len(failed_details), "failed_details": failed_details}), 400
+
+def _adjustments_applied(month, results, failed_details):
+    created_count = sum(1 for result in results if result['status'] == 'created')
+    log.info("Salary adjustments for %s: %s created, %s updated, %s failed", month, created_count, len(results) - created_count, len(failed_details))
+    status_code = 207 if failed_details else 200
+    if failed_details and not results: status_code = 400
+    return jsonify({"message": "Salary adjustments applied.", "month": month.isoformat(),
+                    "created_count": created_count, "updated_count": len(results) - created_count,
+                    "failed_count": len(failed_details), "results": results, "failed_details": failed_details}), status_code
+
+def _adjust_salaries_sharded(month, mode, skip_invalid, adjustments, failed_details, item_count):
+    """The same batch spread over the shards, all in one XA transaction (shards.ShardTransaction)."""
+    groups, unknown = shards.group_by_shard(list(adjustments))
+    failed_details += [{"employee_id": employee_id, "reason": "Employee not found"} for employee_id in unknown]
+    parse_failed = bool(failed_details)
+
+    def work_for(employee_ids):
+        def work(conn):
+            cursor = conn.cursor(dictionary=True, buffered=True)
+            try:
+                rows, ytd_deltas, results, row_failures = _adjustment_rows(cursor, month, mode, {employee_id: adjustments[employee_id] for employee_id in employee_ids})
+                ok = skip_invalid or not (parse_failed or row_failures)
+                if ok:
+                    for chunk in queries.chunks(rows):
+                        cursor.executemany(queries.UPSERT_SALARY_ADJUSTMENT, chunk)
+                    ytd.add(cursor, ytd_deltas)
+                    _record_adjustments(cursor, month, rows)
+                return (rows, results, row_failures), ok
+            finally:
+                cursor.close()
+        return work
+
+    transaction = shards.ShardTransaction(f"adjust-{uuid.uuid4().hex}")
+    try:
+        parts, all_ok = transaction.prepare({name: work_for(employee_ids) for name, employee_ids in groups.items()})
+    except shards.ShardUnavailable as e:
+        return _shard_unavailable(e)
+    except mysql.connector.Error as e:
+        log.exception("Error in POST /api/salaries/adjustments: %s", e)
+        return jsonify({"error": "An internal error occurred; no adjustments were applied"}), 500
+
+    order = {employee_id: i for i, employee_id in enumerate(adjustments)}
+    results = sorted((result for _, part, _ in parts.values() for result in part), key=lambda result: order[result['employee_id']])
+    failed_details += sorted((failure for _, _, part in parts.values() for failure in part), key=lambda failure: order[failure['employee_id']])
+    if not all_ok or (failed_details and not skip_invalid):
+        transaction.rollback()
+        log.warning("Salary adjustments for %s rejected: %s invalid of %s", month, len(failed_details), item_count)
+        return _adjustments_rejected(failed_details)
+    if transaction.commit():
+        return jsonify({"error": "Adjustments were not committed on every shard; see the server log"}), 500
+    if any(rows for rows, _, _ in parts.values()): _refresh_snapshot(None, month)
+    return _adjustments_applied(month, results, failed_details)
+
 # Run bulk payroll (Admin only)
-@app.route('/api/payroll/run', methods=['POST'])
+@api.route('/api/payroll/run', methods=['POST'])
 @login_required
+@limit_concurrency('payroll')
 def run_payroll():
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
@@ -706,48 +1388,55 @@ def run_payroll():
     default_bonus = float(data.get('bonus', 0.0)) # Get default bonus
 
     if not month: return jsonify({"error": "Month is required"}), 400
+    # Archived salaries are no longer in the Salary table, so the duplicate check would miss them
+    if archive.is_archived_month(month): return jsonify({"error": f"{month} belongs to an archived fiscal year"}), 409
 
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
 
-    success_count = 0; failed_count = 0; failed_details = []; run_has_errors = False
+    success_count = 0; failed_details = []; employee_count = 0
     cursor = None # Initialize cursor
+    run_id = None
+    timer = payroll_runs.PhaseTimer()
 
     try:
         cursor = conn.cursor(dictionary=True, buffered=True)
 
-        cursor.execute("SELECT employee_id, base_salary FROM Employee")
-        employees = cursor.fetchall()
-        print(f"Attempting payroll run for month {month} for {len(employees)} employees with default bonus {default_bonus}") # Add log
-
-        for emp in employees:
-            employee_id = emp['employee_id']
-            base_salary = emp.get('base_salary')
-
-            cursor.execute("SELECT salary_id FROM Salary WHERE employee_id = %s AND month = %s", (employee_id, month))
-            if cursor.fetchone():
-                failed_count += 1; failed_details.append({"employee_id": employee_id, "reason": "Salary record already exists"}); run_has_errors = True
-                print(f"Employee {employee_id}: Skipped - Salary already exists for {month}") # Add log
-                continue
-
-            # Pass default_bonus to helper
-            success, error_message = _calculate_salary_for_employee(cursor, employee_id, base_salary, month, default_bonus, 0.0)
+        # Ledger row first, committed on its own so it outlives a rollback of the run
+        run_id = payroll_runs.start_run(cursor, month, session.get('user_id'), default_bonus)
+        conn.commit()
 
-            if success:
-                success_count += 1
-                # print(f"Employee {employee_id}: Salary processed successfully for {month}") # Reduce noise
-            else:
-                failed_count += 1; failed_details.append({"employee_id": employee_id, "reason": error_message}); run_has_errors = True
-                print(f"Employee {employee_id}: FAILED - {error_message}") # Add log
+        with timer.phase('fetch'):
+            # Rule sets are resolved once for the whole run
+            compiled_rules = payroll.compile_rules(cursor, month)
 
-        # Atomic commit or rollback
-        final_success_count = 0
-        if run_has_errors:
-            print(f"Payroll run for {month} had errors. Rolling back.") # Add log
-            conn.rollback(); final_success_count = 0
+        if shards.enabled():
+            employee_count, success_count, failed_details, run_has_errors = _run_payroll_on_shards(run_id, month, default_bonus, compiled_rules, timer)
+            final_success_count = 0 if run_has_errors else success_count
         else:
-            print(f"Payroll run for {month} successful for {success_count} employees. Committing.") # Add log
-            conn.commit(); final_success_count = success_count
+            employees, rows, failed_details = _payroll_rows(cursor, month, default_bonus, compiled_rules, timer)
+            employee_count = len(employees); success_count = len(rows)
+            log.info("Attempting payroll run %s for month %s for %s employees with default bonus %s", run_id, month, employee_count, default_bonus)
+            run_has_errors = bool(failed_details)
+
+            # Atomic: nothing is written unless every employee computed cleanly
+            if not run_has_errors and not _write_payroll_rows(cursor, rows, timer, month, run_id):
+                failed_details.append({"employee_id": None, "reason": "Salary records for this month were written concurrently"})
+                run_has_errors = True
+
+            final_success_count = 0
+            with timer.phase('commit'):
+                if run_has_errors:
+                    log.warning("Payroll run %s for %s had errors. Rolling back.", run_id, month)
+                    conn.rollback(); final_success_count = 0
+                else:
+                    log.info("Payroll run %s for %s successful for %s employees. Committing.", run_id, month, success_count)
+                    conn.commit(); final_success_count = success_count
+
+        payroll_runs.finish_run(cursor, run_id, payroll_runs.ROLLED_BACK if run_has_errors else payroll_runs.COMMITTED,
+                                timer, employee_count, final_success_count, failed_details, final_success_count)
+        conn.commit()
+        if final_success_count: _refresh_snapshot(conn, month)
 
         # --- MODIFIED: Return 207 (Multi-Status) if some failed ---
         status_code = 200 # Default to 200
@@ -757,60 +1446,354 @@ def run_payroll():
             else:
                 status_code = 400 # Complete failure
 
-        return jsonify({"message": "Payroll run completed.","success_count": final_success_count,"failed_count": failed_count,"failed_details": failed_details}), status_code
+        return jsonify({"message": "Payroll run completed.","run_id": run_id,"success_count": final_success_count,"failed_count": len(failed_details),"failed_details": failed_details}), status_code
 
     except Exception as e:
         conn.rollback()
-        print(f"CRITICAL Error in /api/payroll/run: {e}")
-        traceback.print_exc()
-        return jsonify({"error": "An internal error occurred during payroll run"}), 500
+        log.critical("Error in /api/payroll/run: %s", e, exc_info=True)
+        if run_id is not None:
+            try:
+                payroll_runs.finish_run(cursor, run_id, payroll_runs.FAILED, timer, employee_count, 0, failed_details, 0, error=str(e))
+                conn.commit()
+            except mysql.connector.Error:
+                log.exception("Could not record the failure of payroll run %s", run_id)
+        return jsonify({"error": "An internal error occurred during payroll run", "run_id": run_id}), 500
     finally:
         # --- FIX: Ensure cursor is closed in finally ---
         if cursor: cursor.close()
         if conn: conn.close()
 
 
+def _payroll_rows(cursor, month, default_bonus, compiled_rules, timer):
+    """Fetch and compute phases on one node: (employees, Salary rows to insert, failed_details)."""
+    failed_details = []; rows = []
+    with timer.phase('fetch'):
+        cursor.execute(queries.PAYROLL_EMPLOYEES)
+        employees = cursor.fetchall()
+        cursor.execute(queries.SALARIED_EMPLOYEES_FOR_MONTH, (month,))
+        already_paid = {row['employee_id'] for row in cursor.fetchall()}
+        cursor.execute(queries.OVERTIME_FOR_MONTH, (month,))
+        overtime_hours = {row['employee_id']: float(row['overtime_hours'] or 0.0) for row in cursor.fetchall()}
+
+    with timer.phase('compute'):
+        for emp in employees:
+            employee_id = emp['employee_id']
+            if employee_id in already_paid:
+                failed_details.append({"employee_id": employee_id, "reason": "Salary record already exists"})
+                log.warning("Employee %s: Skipped - Salary already exists for %s", employee_id, month)
+                continue
+            if employee_id not in overtime_hours:
+                failed_details.append({"employee_id": employee_id, "reason": "Attendance record not found"})
+                log.error("Employee %s: FAILED - Attendance record not found", employee_id)
+                continue
+            try:
+                rules = compiled_rules.for_class(emp['employee_class'])
+            except LookupError as e:
+                failed_details.append({"employee_id": employee_id, "reason": str(e)})
+                continue
+            # Pass default_bonus as every employee's bonus
+            overtime_pay, pf_amount, total_salary = payroll.calculate_salary(emp.get('base_salary'), overtime_hours[employee_id], default_bonus, 0.0, rules)
+            rows.append((employee_id, month, overtime_hours[employee_id], overtime_pay, default_bonus, 0.0, pf_amount, total_salary, rules.version))
+    return employees, rows, failed_details
+
+def _write_payroll_rows(cursor, rows, timer, month, run_id):
+    """Write phase. False if another insert for the month won the race; the caller rolls back."""
+    try:
+        with timer.phase('write'):
+            for chunk in queries.chunks(rows):
+                cursor.executemany(queries.INSERT_SALARY, chunk)
+            ytd.add(cursor, ytd.for_inserts(rows))
+            if rows:
+                outbox.record(cursor, outbox.SALARY, 'payroll_run',
+                              payload={'month': month, 'run_id': run_id, 'employee_ids': [row[0] for row in rows]})
+        return True
+    except mysql.connector.Error as db_err:
+        if db_err.errno != 1062: raise
+        # uk_salary_employee_month (migration 0001): another insert for this month won the race
+        return False
+
+def _run_payroll_on_shards(run_id, month, default_bonus, compiled_rules, timer):
+    """
+    Sharded payroll run: fetch and compute on every shard in parallel, then
+    write all shards in one XA transaction, so the run stays all-or-nothing.
+    Fetch / compute times are the slowest shard's.
+    Returns (employee_count, success_count, failed_details, has_errors).
+    """
+    def compute(conn):
+        shard_timer = payroll_runs.PhaseTimer()
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            return _payroll_rows(cursor, month, default_bonus, compiled_rules, shard_timer), shard_timer
+        finally:
+            cursor.close()
+
+    parts = shards.scatter(compute)
+    timer.add_parallel(shard_timer for _, shard_timer in parts.values())
+    employee_count = sum(len(employees) for (employees, _, _), _ in parts.values())
+    rows_by_shard = {name: rows for name, ((_, rows, _), _) in parts.items() if rows}
+    failed_details = [failure for (_, _, failures), _ in parts.values() for failure in failures]
+    success_count = sum(len(rows) for rows in rows_by_shard.values())
+    log.info("Attempting payroll run %s for month %s for %s employees on %s shards with default bonus %s",
+             run_id, month, employee_count, len(parts), default_bonus)
+    if failed_details:
+        log.warning("Payroll run %s for %s had errors. Nothing written.", run_id, month)
+        return employee_count, success_count, failed_details, True
+
+    def write(rows):
+        def work(conn):
+            cursor = conn.cursor(buffered=True)
+            try:
+                return None, _write_payroll_rows(cursor, rows, payroll_runs.PhaseTimer(), month, run_id)
+            finally:
+                cursor.close()
+        return work
+
+    transaction = shards.ShardTransaction(f"payroll-{run_id}")
+    with timer.phase('write'):
+        _, all_ok = transaction.prepare({name: write(rows) for name, rows in rows_by_shard.items()})
+    with timer.phase('commit'):
+        if not all_ok:
+            log.warning("Payroll run %s for %s had errors. Rolling back.", run_id, month)
+            transaction.rollback()
+            return employee_count, success_count, [{"employee_id": None, "reason": "Salary records for this month were written concurrently"}], True
+        log.info("Payroll run %s for %s successful for %s employees. Committing on %s shards.", run_id, month, success_count, len(rows_by_shard))
+        failed_shards = transaction.commit()
+    if failed_shards:
+        raise RuntimeError(f"XA commit of payroll-{run_id} failed on shard(s) {', '.join(failed_shards)}")
+    return employee_count, success_count, [], False
+
+
+# Payroll run history (Admin only), newest first. ?month=YYYY-MM-01&limit=50
+@api.route('/api/payroll/runs', methods=['GET'])
+@login_required
+@replica_read
+def list_payroll_runs():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    month = None
+    if request.args.get('month'):
+        month = _parse_month(request.args['month'])
+        if month is None: return jsonify({"error": "month must be YYYY-MM-DD"}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute(*queries.payroll_runs_query(month, limit))
+        return jsonify([payroll_runs.run_from_row(row) for row in cursor.fetchall()])
+    except mysql.connector.Error as e:
+        log.exception("Error in GET /api/payroll/runs: %s", e)
+        return jsonify({"error": "Failed to load payroll runs"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+def _fetch_payroll_run(cursor, run_id):
+    cursor.execute(queries.PAYROLL_RUN, (run_id,))
+    row = cursor.fetchone()
+    return payroll_runs.run_from_row(row) if row else None
+
+@api.route('/api/payroll/runs/<int:run_id>', methods=['GET'])
+@login_required
+@replica_read
+def get_payroll_run(run_id):
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        run = _fetch_payroll_run(cursor, run_id)
+        if run is None: return jsonify({"error": "Payroll run not found"}), 404
+        return jsonify(run)
+    except mysql.connector.Error as e:
+        log.exception("Error in GET /api/payroll/runs/%s: %s", run_id, e)
+        return jsonify({"error": "Failed to load payroll run"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+# Side-by-side timings of two runs: /api/payroll/runs/compare?a=<run_id>&b=<run_id>
+@api.route('/api/payroll/runs/compare', methods=['GET'])
+@login_required
+@replica_read
+def compare_payroll_runs():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    run_a = request.args.get('a', type=int); run_b = request.args.get('b', type=int)
+    if run_a is None or run_b is None: return jsonify({"error": "Query parameters a and b (run ids) are required"}), 400
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        a = _fetch_payroll_run(cursor, run_a); b = _fetch_payroll_run(cursor, run_b)
+        missing = [run_id for run_id, run in ((run_a, a), (run_b, b)) if run is None]
+        if missing: return jsonify({"error": f"Payroll run {missing[0]} not found"}), 404
+        return jsonify(payroll_runs.compare(a, b))
+    except mysql.connector.Error as e:
+        log.exception("Error in GET /api/payroll/runs/compare: %s", e)
+        return jsonify({"error": "Failed to compare payroll runs"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# What-if payroll simulation (Admin only). Reads only; see simulator.py for the scenario format.
+@api.route('/api/payroll/simulate', methods=['POST'])
+@login_required
+@replica_read
+@limit_concurrency('reports')
+def simulate_payroll():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+
+    today = datetime.date.today()
+    next_month = (today.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    try:
+        scenario = simulator.parse_scenario(request.get_json(silent=True) or {}, next_month)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def load_workforce(conn):
+        cursor = conn.cursor(buffered=True)
+        try:
+            cursor.execute(queries.WORKFORCE)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    rules_cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        compiled_rules = payroll.compile_rules(rules_cursor, scenario.start_month)
+        rules_cursor.close()
+        # Sharded: the whole workforce from every shard; the rule sets stay on the home database
+        workforce = load_workforce(conn) if not shards.enabled() else \
+            [row for rows in shards.scatter(load_workforce).values() for row in rows]
+    except shards.ShardUnavailable as e:
+        return _shard_unavailable(e)
+    except mysql.connector.Error as e:
+        log.exception("Error in /api/payroll/simulate: %s", e)
+        return jsonify({"error": "Failed to load workforce"}), 500
+    finally:
+        conn.close()
+
+    # Baseline overtime is each employee's hours in the latest payroll month
+    overtime_hours, overtime_month = snapshots.latest_values('overtime_hours')
+    try:
+        result = simulator.simulate(simulator.build_segments(workforce, overtime_hours), scenario, compiled_rules)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    result['overtime_hours_from'] = overtime_month.isoformat() if overtime_month else None
+    return jsonify(result)
+
+
+# Payroll rule sets (Admin only). Versions are immutable: a change is a new
+# version with its own effective_from, so past Salary rows stay reproducible.
+@api.route('/api/payroll/rules', methods=['GET'])
+@login_required
+def get_payroll_rules():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    month = None
+    if request.args.get('month'):
+        month = _parse_month(request.args['month'])
+        if month is None: return jsonify({"error": "month must be YYYY-MM-DD"}), 400
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute(queries.PAYROLL_RULE_SETS)
+        versions = cursor.fetchall()
+        for version in versions:
+            version['pf_rate'] = float(version['pf_rate'])
+            version['ot_multiplier'] = float(version['ot_multiplier'])
+        result = {"versions": format_dates(versions)}
+        if month:
+            result["in_force"] = {"month": month.isoformat(), "rules": payroll.compile_rules(cursor, month).as_dict()}
+        return jsonify(result)
+    except mysql.connector.Error as e:
+        log.exception("Error in GET /api/payroll/rules: %s", e)
+        return jsonify({"error": "Failed to load payroll rules"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+@api.route('/api/payroll/rules', methods=['POST'])
+@login_required
+def add_payroll_rules():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    effective_from = _parse_month(str(data.get('effective_from') or ''))
+    if effective_from is None: return jsonify({"error": "effective_from (YYYY-MM-01) is required"}), 400
+    employee_class = data.get('employee_class') or payroll.DEFAULT_CLASS
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        # Fields left out keep the values of the version in force for that class
+        current = payroll.compile_rules(cursor, effective_from)
+        try:
+            base = current.for_class(employee_class)
+        except LookupError:
+            base = payroll.DEFAULT_RULES
+        try:
+            changes = {name: data[name] for name in ('pf_rate', 'ot_multiplier', 'working_days', 'hours_per_day')
+                       if data.get(name) is not None}
+            rules = base.replace(version=None, **changes).validate()
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        cursor.execute(queries.INSERT_PAYROLL_RULE_SET, (employee_class, effective_from, rules.pf_rate, rules.ot_multiplier,
+                                                         rules.working_days, rules.hours_per_day, session.get('user_id')))
+        conn.commit()
+        version = cursor.lastrowid
+        log.info("Payroll rule set version %s for class %s from %s created by user %s",
+                 version, employee_class, effective_from, session.get('user_id'))
+        return jsonify(dict(rules.replace(version=version).as_dict(), employee_class=employee_class,
+                            effective_from=effective_from.isoformat())), 201
+    except mysql.connector.Error as e:
+        conn.rollback()
+        log.exception("Error in POST /api/payroll/rules: %s", e)
+        return jsonify({"error": "Failed to save payroll rules"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # --- ATTENDANCE ROUTES ---
 
 # Get attendance for a specific employee
-@app.route('/api/employees/<int:employee_id>/attendance', methods=['GET'])
+@api.route('/api/employees/<int:employee_id>/attendance', methods=['GET'])
 @login_required
+@replica_read
+@employee_shard
 def get_employee_attendance(employee_id):
     # --- MODIFIED: Allow admin or the correct employee ---
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-         # Check if employee exists first
-        cursor.execute("SELECT employee_id, user_id FROM Employee WHERE employee_id = %s", (employee_id,))
-        employee = cursor.fetchone()
-        if not employee:
-             return jsonify({"error": "Employee not found"}), 404
-
-        # --- NEW PERMISSION CHECK ---
-        is_admin = session.get('role') == 'admin'
-        is_correct_employee = (employee.get('user_id') is not None and employee.get('user_id') == session.get('user_id'))
-
-        if not (is_admin or is_correct_employee):
-            print(f"Access DENIED for employee {employee_id} attendance to user {session.get('user_id')}")
-            return jsonify({"error": "Forbidden"}), 403
+        # Existence and permission check
+        _, error = _employee_for_reader(conn, employee_id, 'attendance')
+        if error: return error
 
         # User is authorized, proceed
-        query = "SELECT * FROM Attendance WHERE employee_id = %s ORDER BY month DESC"
-        cursor.execute(query, (employee_id,))
-        attendance = cursor.fetchall()
-        return jsonify(format_dates(attendance))
+        attendance = fetch_all(conn, queries.EMPLOYEE_ATTENDANCE_HISTORY, (employee_id,))
+        return jsonify(format_dates(archive.merge_history(attendance, archive.employee_rows('Attendance', employee_id))))
     except Exception as e:
-        print(f"Error getting attendance for employee {employee_id}: {e}")
+        log.error("Error getting attendance for employee %s: %s", employee_id, e)
         return jsonify({"error": "Could not fetch attendance history"}), 500
     finally:
-        cursor.close()
         conn.close()
 
 
 # Add attendance record
-@app.route('/api/attendance', methods=['POST'])
+@api.route('/api/attendance', methods=['POST'])
 @login_required
+@employee_shard
 def add_attendance():
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
@@ -819,12 +1802,18 @@ def add_attendance():
     # Check if keys exist and are not None
     if not all(field in data and data[field] is not None for field in required_fields):
         return jsonify({"error": "Missing required attendance fields"}), 400
+    if archive.is_archived_month(data['month'], 'Attendance'): return jsonify({"error": f"{data['month']} belongs to an archived fiscal year"}), 409
 
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(buffered=True)
 
     try:
+        # Attendance has no foreign key once partitioned (migration 0002)
+        cursor.execute("SELECT employee_id FROM Employee WHERE employee_id = %s", (data['employee_id'],))
+        if not cursor.fetchone():
+            return jsonify({"error": "Cannot add attendance: Employee ID does not exist."}), 400
+
         # --- MODIFIED: Use INSERT ... ON DUPLICATE KEY UPDATE ---
         # This allows the form to create a new record OR update an existing one
         # (e.g., one created by the leave approval process)
@@ -839,6 +1828,8 @@ def add_attendance():
         values = (data['employee_id'], data['month'], data['days_present'], data['leaves_taken'], data['overtime_hours'])
 
         cursor.execute(sql, values)
+        if cursor.rowcount:
+            outbox.record(cursor, outbox.ATTENDANCE, 'upserted', None, data['employee_id'], {'month': data['month']})
         conn.commit()
 
         # Check if a new row was inserted or an existing one was updated
@@ -851,15 +1842,14 @@ def add_attendance():
 
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"Database error adding attendance: {db_err}")
+        log.error("Database error adding attendance: %s", db_err)
         # --- FIX: Check for 1452 (Foreign key constraint fail) ---
         if db_err.errno == 1452:
              return jsonify({"error": "Cannot add attendance: Employee ID does not exist."}), 400
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error adding attendance: {e}")
-        traceback.print_exc()
+        log.exception("Error adding attendance: %s", e)
         return jsonify({"error": "Could not add attendance record"}), 500
     finally:
         cursor.close()
@@ -867,82 +1857,212 @@ def add_attendance():
 
 
 # --- REPORTING ROUTES (Admin Only) ---
-@app.route('/api/reports/department-salaries', methods=['GET'])
+@api.route('/api/reports/department-salaries', methods=['GET'])
 @login_required
+@replica_read
+@limit_concurrency('reports')
 def get_department_salaries():
     if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        query = """
-            SELECT
-                e.department,
-                COALESCE(AVG(s.total_salary), 0) AS average_salary,
-                COUNT(DISTINCT e.employee_id) AS employee_count
-            FROM Employee e
-            LEFT JOIN Salary s ON e.employee_id = s.employee_id
-            GROUP BY e.department
-            ORDER BY average_salary DESC;
-        """
-        cursor.execute(query)
-        report_data = cursor.fetchall()
-        # Ensure average_salary is float
-        for row in report_data:
-            row['average_salary'] = float(row.get('average_salary') or 0.0)
-        return jsonify(report_data)
+        # Identical concurrent report requests share one aggregation
+        report_data = report_flights.do(('department-salaries', g.db_route), _fetch_department_salaries)
     except Exception as e:
-        print(f"Error in /api/reports/department-salaries: {e}")
+        log.error("Error in /api/reports/department-salaries: %s", e)
         return jsonify({"error": "Could not generate report"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    if report_data is None: return jsonify({"error": "Database connection failed"}), 500
+    return jsonify(report_data)
+
+def _fetch_department_salaries():
+    # Served from the analytics snapshots once they cover every month in Salary
+    if snapshots.available_months():
+        try:
+            months = snapshots.salary_months(
+                lambda: [row['month'] for rows in shards.scatter(lambda conn: fetch_all(conn, queries.SALARY_MONTHS)).values() for row in rows])
+        except shards.ShardUnavailable:
+            return None
+        if snapshots.covers(months):
+            return snapshots.department_salaries(snapshots.load_snapshots())
+    with_archive = bool(archive.archived_fiscal_years('Salary'))
+
+    def department_totals(conn):
+        report_data = fetch_all(conn, queries.DEPARTMENT_SALARIES_REPORT)
+        employee_departments = fetch_all(conn, queries.EMPLOYEE_DEPARTMENTS) if with_archive else []
+        return report_data, employee_departments
+
+    try:
+        parts = list(shards.scatter(department_totals).values())
+    except shards.ShardUnavailable:
+        return None
+    # Sums and counts add up across shards; the average is computed after merging
+    report_data = shards.merge_counts((rows for rows, _ in parts), 'department', ('salary_total', 'salary_count', 'employee_count'))
+    employee_departments = None
+    if with_archive:
+        employee_departments = {row['employee_id']: row['department'] for _, rows in parts for row in rows}
+    return archive.merge_department_salaries(report_data, employee_departments)
 
 
 # --- NEW: New Hires Report Route ---
-@app.route('/api/reports/new-hires', methods=['GET'])
+@api.route('/api/reports/new-hires', methods=['GET'])
 @login_required
+@replica_read
+@limit_concurrency('reports')
 def get_new_hires_report():
     if session.get('role') != 'admin':
         return jsonify({"error": "Forbidden"}), 403
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        # Group by the first of the month for clean time-series data
-        query = """
-            SELECT
-                DATE_FORMAT(joining_date, '%%Y-%%m-01') AS hire_month,
-                COUNT(employee_id) AS hire_count
-            FROM Employee
-            WHERE joining_date IS NOT NULL  -- <<<--- This filter is correct
-            GROUP BY hire_month
-            ORDER BY hire_month ASC;
-        """
-        cursor.execute(query)
-        report_data = cursor.fetchall()
-
-        # We use format_dates to handle the hire_month which is a date object
-        # Note: Our query formats it as a string, so format_dates will just pass it through.
-        # If we selected `joining_date` directly, format_dates would be essential.
-        return jsonify(format_dates(report_data))
+        report_data = report_flights.do(('new-hires', g.db_route), _fetch_new_hires)
     except Exception as e:
-        print(f"Error in /api/reports/new-hires: {e}")
-        traceback.print_exc()
+        log.exception("Error in /api/reports/new-hires: %s", e)
         return jsonify({"error": "Could not generate new hires report"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+    if report_data is None: return jsonify({"error": "Database connection failed"}), 500
+    return jsonify(report_data)
+
+def _fetch_new_hires():
+    def new_hires(conn):
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            # Group by the first of the month for clean time-series data
+            cursor.execute(queries.NEW_HIRES_REPORT)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    try:
+        parts = list(shards.scatter(new_hires).values())
+    except shards.ShardUnavailable:
+        return None
+    report_data = parts[0] if len(parts) == 1 else \
+        sorted(shards.merge_counts(parts, 'hire_month', ('hire_count',)), key=lambda row: row['hire_month'])
+
+    # We use format_dates to handle the hire_month which is a date object
+    # Note: Our query formats it as a string, so format_dates will just pass it through.
+    # If we selected `joining_date` directly, format_dates would be essential.
+    return format_dates(report_data)
 # --- END NEW ROUTE ---
 
 
+# Company-wide YTD / annual statement for one fiscal year (default: the current
+# one): every employee's SalaryYTD row plus the company totals.
+@api.route('/api/reports/ytd', methods=['GET'])
+@login_required
+@replica_read
+@limit_concurrency('reports')
+def get_company_ytd():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    fiscal_year, error = _fiscal_year_arg()
+    if error: return error
+    if fiscal_year is None:
+        fiscal_year = archive.fiscal_year_of(datetime.date.today())
+
+    try:
+        report_data = report_flights.do(('ytd', fiscal_year, g.db_route), lambda: _fetch_company_ytd(fiscal_year))
+    except Exception as e:
+        log.error("Error in /api/reports/ytd: %s", e)
+        return jsonify({"error": "Could not generate report"}), 500
+    if report_data is None: return jsonify({"error": "Database connection failed"}), 500
+    return jsonify(report_data)
+
+def _fetch_company_ytd(fiscal_year):
+    try:
+        parts = shards.scatter(lambda conn: fetch_all(conn, queries.COMPANY_YTD, (fiscal_year,)))
+    except shards.ShardUnavailable:
+        return None
+    current = archive.fiscal_year_of(datetime.date.today())
+    # Every shard's rows are sorted by employee_id already
+    statements = [ytd.statement(row, current) for row in heapq.merge(*parts.values(), key=lambda row: row['employee_id'])]
+    start, end = archive.fiscal_year_bounds(fiscal_year)
+    return {"fiscal_year": fiscal_year, "period_start": start.isoformat(),
+            "period_end": (end - datetime.timedelta(days=1)).isoformat(), "year_to_date": fiscal_year >= current,
+            "employee_count": len(statements), "totals": ytd.totals(statements), "employees": statements}
+
+
+# --- ANALYTICS ROUTES (Admin Only, served from snapshots.py, never MySQL) ---
+def _parse_month(value):
+    """'YYYY-MM-DD' (or 'YYYY-MM') -> first of that month, or None if invalid."""
+    try:
+        return datetime.date.fromisoformat((value + '-01')[:10] if len(value) == 7 else value[:10]).replace(day=1)
+    except ValueError:
+        return None
+
+def _requested_snapshot():
+    """The snapshot for ?month=YYYY-MM-01 (default: latest) or an error response."""
+    months = snapshots.available_months()
+    if not months:
+        return None, (jsonify({"error": "No analytics snapshots yet. Run payroll or `python snapshots.py build --all`."}), 404)
+    month_arg = request.args.get('month')
+    if not month_arg:
+        return snapshots.load_snapshots([months[-1]])[0], None
+    month = _parse_month(month_arg)
+    if month is None:
+        return None, (jsonify({"error": "month must be YYYY-MM-DD"}), 400)
+    if month not in months:
+        return None, (jsonify({"error": f"No snapshot for {month:%Y-%m}"}), 404)
+    return snapshots.load_snapshots([month])[0], None
+
+@api.route('/api/reports/salary-bands', methods=['GET'])
+@login_required
+@limit_concurrency('reports')
+def get_salary_bands():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    snapshot, error = _requested_snapshot()
+    if error: return error
+    return jsonify(snapshots.salary_bands(snapshot))
+
+@api.route('/api/reports/overtime-distribution', methods=['GET'])
+@login_required
+@limit_concurrency('reports')
+def get_overtime_distribution():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    snapshot, error = _requested_snapshot()
+    if error: return error
+    return jsonify(snapshots.overtime_distribution(snapshot))
+
+# ?month=YYYY-MM-01 (default: latest) or ?from=...&to=... (sum over the range),
+# &n=5 (1-100), &department=..., &employee_id=... for one employee's rank
+@api.route('/api/reports/rankings', methods=['GET'])
+@login_required
+@limit_concurrency('reports')
+def get_rankings():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    try:
+        n = min(max(int(request.args.get('n', 5)), 1), 100)
+        employee_id = int(request.args['employee_id']) if request.args.get('employee_id') else None
+    except ValueError:
+        return jsonify({"error": "n and employee_id must be integers"}), 400
+
+    if request.args.get('from') or request.args.get('to'):
+        months = snapshots.available_months()
+        if not months: return jsonify({"error": "No analytics snapshots yet."}), 404
+        start = _parse_month(request.args['from']) if request.args.get('from') else months[0]
+        end = _parse_month(request.args['to']) if request.args.get('to') else months[-1]
+        if start is None or end is None: return jsonify({"error": "from and to must be YYYY-MM-DD"}), 400
+        selected = [month for month in months if start <= month <= end]
+        if not selected: return jsonify({"error": "No snapshots in that range"}), 404
+        ranked_snapshots = snapshots.load_snapshots(selected)
+    else:
+        snapshot, error = _requested_snapshot()
+        if error: return error
+        ranked_snapshots = [snapshot]
+
+    return jsonify(snapshots.rankings(ranked_snapshots, n, request.args.get('department') or None, employee_id))
+
+@api.route('/api/reports/headcount-trend', methods=['GET'])
+@login_required
+@limit_concurrency('reports')
+def get_headcount_trend():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    return jsonify(snapshots.headcount_trend(snapshots.load_snapshots()))
+
+
 # --- NEW: LEAVE MANAGEMENT ROUTES ---
 
 # Employee: Get their own leave requests
-@app.route('/api/my-leave-requests', methods=['GET'])
+@api.route('/api/my-leave-requests', methods=['GET'])
 @login_required
+@replica_read
+@user_shard
 def get_my_leave_requests():
     user_id = session.get('user_id')
     conn = get_db_connection()
@@ -950,26 +2070,25 @@ def get_my_leave_requests():
     cursor = conn.cursor(dictionary=True, buffered=True)
     try:
         # Find employee_id from user_id
-        cursor.execute("SELECT employee_id FROM Employee WHERE user_id = %s", (user_id,))
-        employee = cursor.fetchone()
+        employee = fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (user_id,))
         if not employee:
             return jsonify({"error": "No employee profile linked to this user."}), 404
         employee_id = employee['employee_id']
 
-        query = "SELECT * FROM LeaveRequest WHERE employee_id = %s ORDER BY requested_on DESC"
-        cursor.execute(query, (employee_id,))
+        cursor.execute(queries.MY_LEAVE_REQUESTS, (employee_id,))
         requests = cursor.fetchall()
         return jsonify(format_dates(requests))
     except Exception as e:
-        print(f"Error fetching my leave requests: {e}")
+        log.error("Error fetching my leave requests: %s", e)
         return jsonify({"error": "Could not fetch leave history"}), 500
     finally:
         cursor.close()
         conn.close()
 
 # Employee: Submit a new leave request
-@app.route('/api/my-leave-requests', methods=['POST'])
+@api.route('/api/my-leave-requests', methods=['POST'])
 @login_required
+@user_shard
 def submit_leave_request():
     user_id = session.get('user_id')
     data = request.get_json()
@@ -991,75 +2110,108 @@ def submit_leave_request():
             return jsonify({"error": "Leave requests must be within the same calendar month."}), 400
     except ValueError:
         return jsonify({"error": "Invalid date format. Use YYYY-MM-DD."}), 400
+    leave_days = calculate_leave_days(start_date, end_date)
+    if leave_days == 0:
+        return jsonify({"error": "The selected dates contain no working days."}), 400
 
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True, buffered=True)
     try:
         # Find employee_id from user_id
-        cursor.execute("SELECT employee_id FROM Employee WHERE user_id = %s", (user_id,))
-        employee = cursor.fetchone()
+        employee = fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (user_id,))
         if not employee:
             return jsonify({"error": "No employee profile linked to this user."}), 404
         employee_id = employee['employee_id']
 
+        # Checked against the maintained balance (leave.py), locked until the commit
+        leave_year = leave.leave_year_of(start_dt)
+        available = leave.available(leave.balance_for_update(cursor, employee_id, leave_year))
+        if leave.enforced() and leave_days > available:
+            conn.rollback()
+            return jsonify({"error": f"Insufficient leave balance: {leave_days} working day(s) requested, {available:g} available.",
+                            "requested_days": leave_days, "available": available}), 409
+
         sql = """
-            INSERT INTO LeaveRequest (employee_id, start_date, end_date, reason)
-            VALUES (%s, %s, %s, %s)
+            INSERT INTO LeaveRequest (employee_id, start_date, end_date, reason, leave_days)
+            VALUES (%s, %s, %s, %s, %s)
         """
-        cursor.execute(sql, (employee_id, start_date, end_date, reason))
+        cursor.execute(sql, (employee_id, start_date, end_date, reason, leave_days))
+        request_id = cursor.lastrowid
+        leave.reserve(cursor, employee_id, leave_year, leave_days)
+        employee_entry = _employee_entry(conn, employee_id) or {}
+        outbox.record(cursor, outbox.LEAVE_REQUEST, 'created', request_id, employee_id,
+                      {'start_date': start_date, 'end_date': end_date, 'status': 'pending', 'leave_days': leave_days,
+                       'reason': reason, 'employee_name': employee_entry.get('name')})
         conn.commit()
-        return jsonify({"message": "Leave request submitted successfully."}), 201
+        return jsonify({"message": "Leave request submitted successfully.", "requested_days": leave_days,
+                        "available": round(available - leave_days, 2)}), 201
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"DB error submitting leave: {db_err}")
+        log.error("DB error submitting leave: %s", db_err)
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error submitting leave: {e}")
+        log.error("Error submitting leave: %s", e)
         return jsonify({"error": "Could not submit leave request."}), 500
     finally:
         cursor.close()
         conn.close()
 
 # Admin: Get all leave requests (with filter)
-@app.route('/api/leave-requests', methods=['GET'])
+@api.route('/api/leave-requests', methods=['GET'])
 @login_required
+@replica_read
 def get_all_leave_requests():
     if session.get('role') != 'admin':
         return jsonify({"error": "Forbidden"}), 403
 
     status_filter = request.args.get('status', '') # e.g., 'pending', 'approved'
+    query, params = queries.leave_requests_query(status_filter)
 
-    conn = get_db_connection()
-    if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        query = """
-            SELECT lr.*, e.name as employee_name
-            FROM LeaveRequest lr
-            JOIN Employee e ON lr.employee_id = e.employee_id
-        """
-        params = []
-        if status_filter:
-            query += " WHERE lr.status = %s"
-            params.append(status_filter)
-
-        query += " ORDER BY lr.requested_on DESC"
-
-        cursor.execute(query, tuple(params))
-        requests = cursor.fetchall()
+        parts = list(shards.scatter(lambda conn: fetch_all(conn, query, params)).values())
+        # Every shard's rows are already ordered by requested_on DESC
+        requests = list(heapq.merge(*parts, key=lambda row: row['requested_on'], reverse=True))
         return jsonify(format_dates(requests))
+    except shards.ShardUnavailable as e:
+        return _shard_unavailable(e)
     except Exception as e:
-        print(f"Error fetching all leave requests: {e}")
+        log.error("Error fetching all leave requests: %s", e)
         return jsonify({"error": "Could not fetch leave requests"}), 500
-    finally:
-        cursor.close()
-        conn.close()
+
+# Admin: live changes to the leave requests as server-sent events (leave_feed.py).
+# The admin page loads the list once and applies the deltas; a reconnect resumes
+# after Last-Event-ID. 503 when the outbox consumer is off or still starting.
+@api.route('/api/leave-requests/stream', methods=['GET'])
+@login_required
+def stream_leave_requests():
+    if session.get('role') != 'admin':
+        return jsonify({"error": "Forbidden"}), 403
+    if not leave_feed.enabled():
+        return jsonify({"error": "Live leave updates are disabled"}), 503
+
+    limiter = get_limiter('streams')
+    if limiter is not None and not limiter.acquire():
+        return shed_response(limiter)
+    messages = leave_feed.open_stream(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    if messages is None:
+        if limiter is not None: limiter.release()
+        response = jsonify({"error": "Live leave updates are starting. Please retry shortly."})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    response = Response(messages, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if limiter is not None:
+        # Also runs when the client disconnects before the first message
+        response.call_on_close(limiter.release)
+    return response
 
 # Admin: Approve or Deny a leave request
-@app.route('/api/leave-requests/<int:request_id>', methods=['PUT'])
+@api.route('/api/leave-requests/<int:request_id>', methods=['PUT'])
 @login_required
+@row_shard('request_id')
 def update_leave_request(request_id):
     if session.get('role') != 'admin':
         return jsonify({"error": "Forbidden"}), 403
@@ -1074,8 +2226,8 @@ def update_leave_request(request_id):
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        # First, get the leave request details
-        cursor.execute("SELECT * FROM LeaveRequest WHERE request_id = %s", (request_id,))
+        # First, get the leave request details (locked, so it is decided and booked once)
+        cursor.execute("SELECT * FROM LeaveRequest WHERE request_id = %s FOR UPDATE", (request_id,))
         leave_request = cursor.fetchone()
 
         if not leave_request:
@@ -1083,10 +2235,26 @@ def update_leave_request(request_id):
 
         if leave_request['status'] != 'pending':
             return jsonify({"error": f"Request has already been {leave_request['status']}."}), 409
+        # Approving books the days into that month's Attendance row
+        if new_status == 'approved' and archive.is_archived_month(leave_request['start_date'], 'Attendance'):
+            return jsonify({"error": f"{leave_request['start_date']:%Y-%m} belongs to an archived fiscal year"}), 409
 
         # Update the leave request status
         cursor.execute("UPDATE LeaveRequest SET status = %s WHERE request_id = %s", (new_status, request_id))
 
+        # Book it in the leave ledger: approved days are taken, denied ones released.
+        # Requests from before the ledger (no leave_days) reserved nothing.
+        reserved = leave_request.get('leave_days')
+        booked_days = float(reserved) if reserved is not None else calculate_leave_days(
+            leave_request['start_date'].strftime('%Y-%m-%d'), leave_request['end_date'].strftime('%Y-%m-%d'))
+        leave_year = leave.leave_year_of(leave_request['start_date'])
+        if new_status == 'approved':
+            leave.catch_up(cursor, leave_request['employee_id'], leave_year)
+            leave.approve(cursor, leave_request['employee_id'], leave_year, booked_days, request_id,
+                          session.get('user_id'), reserved=reserved is not None)
+        elif reserved is not None:
+            leave.release(cursor, leave_request['employee_id'], leave_year, booked_days)
+
         # --- AUTOMATION LOGIC ---
         # If approved, automatically update the Attendance table
         if new_status == 'approved':
@@ -1110,30 +2278,187 @@ def update_leave_request(request_id):
                         leaves_taken = leaves_taken + VALUES(leaves_taken)
                 """
                 cursor.execute(upsert_sql, (employee_id, leave_month, leave_days_to_add))
-                print(f"Updated attendance for emp {employee_id}, month {leave_month}, added {leave_days_to_add} leave days.")
-
+                outbox.record(cursor, outbox.ATTENDANCE, 'upserted', None, employee_id, {'month': leave_month})
+                log.info("Updated attendance for emp %s, month %s, added %s leave days.", employee_id, leave_month, leave_days_to_add)
+
+        # Full row for the admin stream (leave_feed.py): another filter may show it for the first time
+        employee_entry = _employee_entry(conn, leave_request['employee_id']) or {}
+        outbox.record(cursor, outbox.LEAVE_REQUEST, new_status, request_id, leave_request['employee_id'],
+                      {'start_date': leave_request['start_date'], 'end_date': leave_request['end_date'], 'status': new_status,
+                       'leave_days': leave_request.get('leave_days'), 'reason': leave_request.get('reason'),
+                       'requested_on': leave_request.get('requested_on'), 'employee_name': employee_entry.get('name')})
         conn.commit()
         return jsonify({"message": f"Leave request {new_status}."})
 
     except mysql.connector.Error as db_err:
         conn.rollback()
-        print(f"DB error updating leave: {db_err}")
+        log.error("DB error updating leave: %s", db_err)
         return jsonify({"error": f"Database error: {db_err.msg}"}), 500
     except Exception as e:
         conn.rollback()
-        print(f"Error updating leave: {e}")
-        traceback.print_exc()
+        log.exception("Error updating leave: %s", e)
         return jsonify({"error": "Could not update leave request."}), 500
     finally:
         cursor.close()
         conn.close()
 
+# Leave balances (leave.py): one LeaveBalance read per employee. ?leave_year=2025
+# (default: the current leave year); ?entries=true adds that year's ledger entries.
+def _leave_year_arg():
+    """(?leave_year as int, default the current one; error response or None)"""
+    value = request.args.get('leave_year')
+    if value in (None, ''):
+        return leave.leave_year_of(datetime.date.today()), None
+    try:
+        leave_year = int(value)
+    except ValueError:
+        leave_year = None
+    if leave_year is None or not datetime.MINYEAR <= leave_year < datetime.MAXYEAR:
+        return None, (jsonify({"error": "leave_year must be a year, e.g. 2025"}), 400)
+    return leave_year, None
+
+def _leave_balance_response(conn, employee_id, leave_year):
+    row = fetch_one(conn, queries.LEAVE_BALANCE, (employee_id, leave_year))
+    # Only balances short of a full year's accrual to date need the joining date
+    employee = fetch_one(conn, queries.EMPLOYEE_JOINING_DATE, (employee_id,)) if leave.unbooked_accrual(row, None, leave_year) else None
+    unbooked = leave.unbooked_accrual(row, employee['joining_date'], leave_year) if employee else 0.0
+    # A read does not write: accruals still due show in the balance, the next
+    # request, decision or adjustment (or the monthly run) books them
+    result = leave.balance(row, employee_id, leave_year, unbooked)
+    if request.args.get('entries', 'false').lower() == 'true':
+        entries = fetch_all(conn, queries.LEAVE_LEDGER_ENTRIES, (employee_id, leave_year))
+        for entry in entries:
+            entry['days'] = float(entry['days'])
+        result['entries'] = format_dates(entries)
+    return jsonify(result)
+
+@api.route('/api/my-leave-balance', methods=['GET'])
+@login_required
+@replica_read
+@user_shard
+def get_my_leave_balance():
+    user_id = session.get('user_id')
+    leave_year, error = _leave_year_arg()
+    if error: return error
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    try:
+        employee = fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (user_id,))
+        if not employee:
+            return jsonify({"error": "No employee profile linked to this user."}), 404
+        return _leave_balance_response(conn, employee['employee_id'], leave_year)
+    except mysql.connector.Error as e:
+        log.error("Error fetching leave balance for user %s: %s", user_id, e)
+        return jsonify({"error": "Could not fetch leave balance"}), 500
+    finally:
+        conn.close()
+
+@api.route('/api/employees/<int:employee_id>/leave-balance', methods=['GET'])
+@login_required
+@replica_read
+@employee_shard
+def get_employee_leave_balance(employee_id):
+    leave_year, error = _leave_year_arg()
+    if error: return error
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    try:
+        _, error = _employee_for_reader(conn, employee_id, 'leave balance')
+        if error: return error
+        return _leave_balance_response(conn, employee_id, leave_year)
+    except mysql.connector.Error as e:
+        log.error("Error fetching leave balance for employee %s: %s", employee_id, e)
+        return jsonify({"error": "Could not fetch leave balance"}), 500
+    finally:
+        conn.close()
+
+# Admin: manual ledger entry, e.g. carry-over or a correction.
+# Body: {"employee_id": 1, "days": -1.5, "note": "...", "leave_year": 2025 (optional)}
+@api.route('/api/leave-balances/adjustments', methods=['POST'])
+@login_required
+@employee_shard
+def adjust_leave_balance():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+
+    data = request.get_json(silent=True) or {}
+    employee_id = data.get('employee_id')
+    days = data.get('days')
+    leave_year = data.get('leave_year')
+    if leave_year is None:
+        leave_year = leave.leave_year_of(datetime.date.today())
+    if isinstance(employee_id, bool) or not isinstance(employee_id, int):
+        return jsonify({"error": "employee_id must be an integer"}), 400
+    if isinstance(days, bool) or not isinstance(days, (int, float)) or days == 0 or not math.isfinite(days):
+        return jsonify({"error": "days must be a non-zero number"}), 400
+    if isinstance(leave_year, bool) or not isinstance(leave_year, int) or not datetime.MINYEAR <= leave_year < datetime.MAXYEAR:
+        return jsonify({"error": "leave_year must be a year, e.g. 2025"}), 400
+    note = str(data.get('note') or '')[:255] or None
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute("SELECT employee_id FROM Employee WHERE employee_id = %s", (employee_id,))
+        if not cursor.fetchone():
+            return jsonify({"error": "Employee not found"}), 404
+        leave.catch_up(cursor, employee_id, leave_year)
+        leave.adjust(cursor, employee_id, leave_year, round(float(days), 2), note, session.get('user_id'))
+        cursor.execute(queries.LEAVE_BALANCE, (employee_id, leave_year))
+        result = leave.balance(cursor.fetchone(), employee_id, leave_year)
+        conn.commit()
+        return jsonify(result), 201
+    except mysql.connector.Error as e:
+        conn.rollback()
+        log.error("Database error adjusting leave balance of employee %s: %s", employee_id, e)
+        return jsonify({"error": f"Database error: {e.msg}"}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+# Admin: every employee's balance for one leave year (employees without ledger
+# entries show zeros). ?leave_year=2025&department=Sales
+@api.route('/api/reports/leave-balances', methods=['GET'])
+@login_required
+@replica_read
+@limit_concurrency('reports')
+def get_leave_balances_report():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    leave_year, error = _leave_year_arg()
+    if error: return error
+    department = request.args.get('department') or None
+
+    try:
+        report_data = report_flights.do(('leave-balances', leave_year, g.db_route), lambda: _fetch_leave_balances(leave_year))
+    except Exception as e:
+        log.error("Error in /api/reports/leave-balances: %s", e)
+        return jsonify({"error": "Could not generate report"}), 500
+    if report_data is None: return jsonify({"error": "Database connection failed"}), 500
+    if department:
+        report_data = dict(report_data, employees=[row for row in report_data['employees'] if row['department'] == department])
+    return jsonify(report_data)
+
+def _fetch_leave_balances(leave_year):
+    try:
+        parts = shards.scatter(lambda conn: fetch_all(conn, queries.LEAVE_BALANCES_REPORT, (leave_year,)))
+    except shards.ShardUnavailable:
+        return None
+    employees = []
+    for row in heapq.merge(*parts.values(), key=lambda row: row['employee_id']):
+        employees.append({'employee_id': row['employee_id'], 'name': row['name'], 'department': row['department'], **leave.amounts(row)})
+    start, end = archive.fiscal_year_bounds(leave_year)
+    return {"leave_year": leave_year, "period_start": start.isoformat(), "period_end": (end - datetime.timedelta(days=1)).isoformat(),
+            "employee_count": len(employees), "employees": employees}
+
 # --- END NEW LEAVE ROUTES ---
 
 
 # --- EMPLOYEE DASHBOARD ROUTES ---
-@app.route('/api/my-profile', methods=['GET'])
+@api.route('/api/my-profile', methods=['GET'])
 @login_required
+@replica_read
+@user_shard
 def get_my_profile():
     user_id = session.get('user_id')
     # No role check needed here, decorator handles login check
@@ -1142,85 +2467,130 @@ def get_my_profile():
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT * FROM Employee WHERE user_id = %s", (user_id,))
+        cursor.execute(queries.MY_PROFILE, (user_id,))
         employee_profile = cursor.fetchone()
 
         if not employee_profile:
-            print(f"No employee profile found linked to user_id {user_id}") # Add log
+            log.info("No employee profile found linked to user_id %s", user_id)
             return jsonify({"error": "No employee profile linked to this user account."}), 404
 
-        # print(f"Found employee profile for user {user_id}: {employee_profile.get('employee_id')}") # Reduce noise
+        log.debug("Found employee profile for user %s: %s", user_id, employee_profile.get('employee_id'))
         return jsonify(format_dates([employee_profile])[0])
     except Exception as e:
-        print(f"Error fetching profile for user {user_id}: {e}")
+        log.error("Error fetching profile for user %s: %s", user_id, e)
         return jsonify({"error": "Could not fetch profile data"}), 500
     finally:
         cursor.close()
         conn.close()
 
 
-@app.route('/api/my-salaries', methods=['GET'])
+@api.route('/api/my-salaries', methods=['GET'])
 @login_required
+@replica_read
+@user_shard
 def get_my_salaries():
     user_id = session.get('user_id')
     # No role check needed
 
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT employee_id FROM Employee WHERE user_id = %s", (user_id,))
-        employee = cursor.fetchone()
+        employee = fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (user_id,))
 
         if not employee:
             return jsonify({"error": "No employee profile linked to this user."}), 404
 
         employee_id = employee['employee_id']
-        # print(f"Fetching salaries for employee {employee_id} (linked to user {user_id})") # Reduce noise
+        log.debug("Fetching salaries for employee %s (linked to user %s)", employee_id, user_id)
 
-        query = "SELECT salary_id, month, total_salary FROM Salary WHERE employee_id = %s ORDER BY month DESC"
-        cursor.execute(query, (employee_id,))
-        salaries = cursor.fetchall()
-        return jsonify(format_dates(salaries))
+        salaries = fetch_all(conn, queries.MY_SALARIES, (employee_id,))
+        archived = archive.employee_rows('Salary', employee_id, queries.MY_SALARIES_COLUMNS)
+        return jsonify(format_dates(archive.merge_history(salaries, archived)))
     except Exception as e:
-        print(f"Error fetching salaries for user {user_id}: {e}")
+        log.error("Error fetching salaries for user %s: %s", user_id, e)
         return jsonify({"error": "Could not fetch salary history"}), 500
     finally:
-        cursor.close()
         conn.close()
 
 
-@app.route('/api/my-attendance', methods=['GET'])
+@api.route('/api/my-ytd', methods=['GET'])
 @login_required
+@replica_read
+@user_shard
+def get_my_ytd():
+    user_id = session.get('user_id')
+    fiscal_year, error = _fiscal_year_arg()
+    if error: return error
+
+    conn = get_db_connection()
+    if conn is None: return jsonify({"error": "Database connection failed"}), 500
+    try:
+        employee = fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (user_id,))
+        if not employee:
+            return jsonify({"error": "No employee profile linked to this user."}), 404
+        return _ytd_statements(conn, employee['employee_id'], fiscal_year)
+    except mysql.connector.Error as e:
+        log.error("Error fetching YTD statements for user %s: %s", user_id, e)
+        return jsonify({"error": "Could not fetch YTD statements"}), 500
+    finally:
+        conn.close()
+
+
+@api.route('/api/my-attendance', methods=['GET'])
+@login_required
+@replica_read
+@user_shard
 def get_my_attendance():
     user_id = session.get('user_id')
     # No role check needed
 
     conn = get_db_connection()
     if conn is None: return jsonify({"error": "Database connection failed"}), 500
-    cursor = conn.cursor(dictionary=True, buffered=True)
     try:
-        cursor.execute("SELECT employee_id FROM Employee WHERE user_id = %s", (user_id,))
-        employee = cursor.fetchone()
+        employee = fetch_one(conn, queries.EMPLOYEE_ID_FOR_USER, (user_id,))
 
         if not employee:
             return jsonify({"error": "No employee profile linked to this user."}), 404
 
         employee_id = employee['employee_id']
-        # print(f"Fetching attendance for employee {employee_id} (linked to user {user_id})") # Reduce noise
+        log.debug("Fetching attendance for employee %s (linked to user %s)", employee_id, user_id)
 
-        query = "SELECT month, days_present, leaves_taken, overtime_hours FROM Attendance WHERE employee_id = %s ORDER BY month DESC"
-        cursor.execute(query, (employee_id,))
-        attendance = cursor.fetchall()
-        return jsonify(format_dates(attendance))
+        attendance = fetch_all(conn, queries.MY_ATTENDANCE, (employee_id,))
+        archived = archive.employee_rows('Attendance', employee_id, queries.MY_ATTENDANCE_COLUMNS)
+        return jsonify(format_dates(archive.merge_history(attendance, archived)))
     except Exception as e:
-        print(f"Error fetching attendance for user {user_id}: {e}")
+        log.error("Error fetching attendance for user %s: %s", user_id, e)
         return jsonify({"error": "Could not fetch attendance history"}), 500
     finally:
-        cursor.close()
         conn.close()
 
 
+# --- RUNTIME STATS (Admin Only) ---
+@api.route('/api/admin/runtime-stats', methods=['GET'])
+@login_required
+def get_runtime_stats():
+    if session.get('role') != 'admin': return jsonify({"error": "Forbidden"}), 403
+    # Per worker process: each gunicorn worker keeps its own counters
+    return jsonify({
+        "pid": os.getpid(),
+        "db_backend": backend_name(),
+        "concurrency": limiter_stats(),
+        "coalescing": {"executions": report_flights.executions, "coalesced": report_flights.coalesced},
+        "password_hashing": hasher_stats(),
+        "archive": archive.archive_stats(),
+        "snapshots": snapshots.snapshot_stats(),
+        "prepared_statements": statement_cache_stats(),
+        "compression": compression_stats(),
+        "shards": shards.shard_stats(),
+        "outbox": outbox.outbox_stats(),
+        "directory": directory.directory_stats(),
+        "leave_feed": leave_feed.feed_stats(),
+        "logging": logging_stats(),
+    })
+
+
 if __name__ == '__main__':
+    # Development server only. For production use gunicorn (see gunicorn.conf.py).
     # Use threaded=True for development server responsiveness
-    app.run(debug=True, threaded=True)
+    debug = os.environ.get('APP_DEBUG', 'true').lower() == 'true'
+    create_app({'DEBUG': debug}).run(debug=debug, threaded=True)
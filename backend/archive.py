@@ -0,0 +1,599 @@
+"""
+Cold archive for closed fiscal years of Salary and Attendance.
+
+    cd backend
+    python archive.py status                     # partitions, live rows, archive files
+    python archive.py partitions                 # add monthly partitions (run monthly, e.g. cron)
+    python archive.py run                        # archive every closed fiscal year
+    python archive.py run --fiscal-year 2023     # archive FY2023 only
+    python archive.py run --dry-run              # show what would move
+
+Both tables are range-partitioned by month (sql/migrations/0002). `run`
+copies a closed fiscal year into one compressed columnar file per table,
+ARCHIVE_DIR/<table>/fy<year>.col.gz, then deletes it from the live table and
+drops the emptied monthly partitions. Fiscal years start in
+FISCAL_YEAR_START_MONTH and are named by the year they start in (with the
+default April start, FY2024 is 2024-04-01 .. 2025-03-01).
+
+The history endpoints merge archived rows with live ones (live rows win), so
+archiving is invisible to clients. Archiving a year again (after late edits)
+merges the new live rows into the existing file.
+"""
+import argparse
+import array
+import bisect
+import datetime
+import decimal
+import functools
+import gzip
+import json
+import os
+import re
+import struct
+import sys
+
+TABLES = ('Salary', 'Attendance')
+
+# --- FILE FORMAT ---
+# gzip stream of: MAGIC, uint32 header length, JSON header, then each column in
+# header order: [null mask, one byte per row, if the column has NULLs] followed
+# by its values as little-endian arrays (i8 / f8; DECIMAL as int64 scaled by
+# 10**scale, read back as Decimal like the live rows; dates as int32 days since
+# 1970-01-01; strings as int64 offsets + UTF-8 blob). Rows are sorted by
+# (employee_id, month) so one employee's history is a contiguous slice.
+MAGIC = b'ESMSCOL1'
+_ARRAY_CODES = {'i8': 'q', 'f8': 'd', 'dec': 'q', 'date': 'i'}
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_FILE_RE = re.compile(r'^fy(\d{4})\.col\.gz$')
+
+_settings = {'dir': None, 'fiscal_year_start_month': 4}
+
+
+def init_archive(config):
+    """Stores ARCHIVE_DIR and FISCAL_YEAR_START_MONTH from the app config."""
+    start_month = config['FISCAL_YEAR_START_MONTH']
+    if not 1 <= start_month <= 12:
+        raise ValueError(f"FISCAL_YEAR_START_MONTH must be 1-12, got {start_month}")
+    _settings['dir'] = config['ARCHIVE_DIR']
+    _settings['fiscal_year_start_month'] = start_month
+
+
+def fiscal_year_of(day):
+    start_month = _settings['fiscal_year_start_month']
+    return day.year if day.month >= start_month else day.year - 1
+
+
+def fiscal_year_bounds(fiscal_year):
+    """(first month, first month of the next fiscal year)"""
+    start = datetime.date(fiscal_year, _settings['fiscal_year_start_month'], 1)
+    return start, start.replace(year=fiscal_year + 1)
+
+
+def archive_path(table, fiscal_year):
+    return os.path.join(_settings['dir'], table, f'fy{fiscal_year}.col.gz')
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _column_type(values):
+    kinds = set()
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, int):
+            kinds.add('i8')
+        elif isinstance(value, decimal.Decimal):
+            kinds.add('dec')
+        elif isinstance(value, float):
+            kinds.add('f8')
+        elif isinstance(value, datetime.datetime):
+            raise TypeError("Cannot archive DATETIME columns")
+        elif isinstance(value, datetime.date):
+            kinds.add('date')
+        elif isinstance(value, str):
+            kinds.add('str')
+        else:
+            raise TypeError(f"Cannot archive {type(value).__name__} values")
+    if kinds <= {'i8'}:
+        return 'i8'
+    if kinds <= {'i8', 'dec'}:
+        return 'dec'
+    if kinds <= {'i8', 'f8', 'dec'}:
+        return 'f8'
+    if len(kinds) == 1:
+        return kinds.pop()
+    raise TypeError(f"Column mixes {sorted(kinds)} values")
+
+
+def _decimal_scale(values):
+    """Digits after the point of the most precise value, so every value scales to an integer."""
+    return max([0] + [-value.as_tuple().exponent for value in values if isinstance(value, decimal.Decimal)])
+
+
+def _encode_column(values, column_type, scale=0):
+    nulls = bytes(value is None for value in values) if any(value is None for value in values) else None
+    if column_type == 'str':
+        blobs = [(value or '').encode('utf-8') for value in values]
+        offsets = array.array('q', [0])
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        return nulls, _little_endian(offsets).tobytes() + b''.join(blobs)
+    if column_type == 'date':
+        data = array.array('i', (0 if v is None else v.toordinal() - _EPOCH_ORDINAL for v in values))
+    elif column_type == 'f8':
+        data = array.array('d', (0.0 if v is None else float(v) for v in values))
+    elif column_type == 'dec':
+        data = array.array('q', (0 if v is None else int(decimal.Decimal(v).scaleb(scale)) for v in values))
+    else:
+        data = array.array('q', (0 if v is None else int(v) for v in values))
+    return nulls, _little_endian(data).tobytes()
+
+
+class ArchivedTable:
+    """One decoded archive file. Columns stay as typed arrays; rows are built on demand."""
+
+    def __init__(self, header, columns, nulls):
+        self.table = header['table']
+        self.fiscal_year = header['fiscal_year']
+        self.rows = header['rows']
+        self.names = [column['name'] for column in header['columns']]
+        self._dates = {column['name'] for column in header['columns'] if column['type'] == 'date'}
+        self._scales = {column['name']: column.get('scale', 0) for column in header['columns'] if column['type'] == 'dec'}
+        self._columns = columns
+        self._nulls = nulls
+
+    def value(self, name, i):
+        mask = self._nulls.get(name)
+        if mask is not None and mask[i]:
+            return None
+        value = self._columns[name][i]
+        if name in self._dates:
+            return datetime.date.fromordinal(value + _EPOCH_ORDINAL)
+        if name in self._scales:
+            return decimal.Decimal(value).scaleb(-self._scales[name])
+        return value
+
+    def row(self, i, names=None):
+        return {name: self.value(name, i) if name in self._columns else None for name in names or self.names}
+
+    def column(self, name):
+        return self._columns[name]
+
+    def is_null(self, name, i):
+        mask = self._nulls.get(name)
+        return mask is not None and bool(mask[i])
+
+    def all_rows(self):
+        return [self.row(i) for i in range(self.rows)]
+
+    def employee_rows(self, employee_id, names=None):
+        ids = self._columns['employee_id']
+        lo = bisect.bisect_left(ids, employee_id)
+        hi = bisect.bisect_right(ids, employee_id, lo)
+        return [self.row(i, names) for i in range(lo, hi) if not self.is_null('employee_id', i)]
+
+    def find(self, name, value):
+        try:
+            return self.row(self._columns[name].index(value))
+        except ValueError:
+            return None
+
+
+def write_archive(path, table, fiscal_year, columns, rows):
+    """
+    Writes `rows` (dicts, already sorted) column-major to `path`. The file is
+    written next to the target, read back and checked, then renamed into place.
+    Returns the compressed size in bytes.
+    """
+    chunks, meta = [], []
+    for name in columns:
+        values = [row.get(name) for row in rows]
+        column_type = _column_type(values)
+        scale = _decimal_scale(values) if column_type == 'dec' else 0
+        nulls, payload = _encode_column(values, column_type, scale)
+        meta.append({'name': name, 'type': column_type, 'nulls': nulls is not None, 'bytes': len(payload)})
+        if column_type == 'dec':
+            meta[-1]['scale'] = scale
+        if nulls is not None:
+            chunks.append(nulls)
+        chunks.append(payload)
+    header = json.dumps({
+        'table': table, 'fiscal_year': fiscal_year, 'rows': len(rows), 'columns': meta,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+    }).encode('utf-8')
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=9, mtime=0) as f:
+            f.write(MAGIC)
+            f.write(struct.pack('<I', len(header)))
+            f.write(header)
+            for chunk in chunks:
+                f.write(chunk)
+        raw.flush()
+        os.fsync(raw.fileno())
+    if read_archive(tmp).rows != len(rows):
+        os.remove(tmp)
+        raise IOError(f"Archive check failed for {path}")
+    os.replace(tmp, path)
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return os.path.getsize(path)
+
+
+def read_archive(path):
+    with gzip.open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a column archive")
+    (header_length,) = struct.unpack_from('<I', data, len(MAGIC))
+    pos = len(MAGIC) + 4
+    header = json.loads(data[pos:pos + header_length])
+    pos += header_length
+
+    n = header['rows']
+    view = memoryview(data)
+    columns, nulls = {}, {}
+    for column in header['columns']:
+        name = column['name']
+        nulls[name] = None
+        if column['nulls']:
+            nulls[name] = bytes(view[pos:pos + n])
+            pos += n
+        payload = view[pos:pos + column['bytes']]
+        pos += column['bytes']
+        if column['type'] == 'str':
+            offsets = array.array('q')
+            offsets.frombytes(payload[:8 * (n + 1)])
+            if sys.byteorder == 'big':
+                offsets.byteswap()
+            blob = bytes(payload[8 * (n + 1):])
+            columns[name] = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(n)]
+        else:
+            values = array.array(_ARRAY_CODES[column['type']])
+            values.frombytes(payload)
+            if sys.byteorder == 'big':
+                values.byteswap()
+            columns[name] = values
+    return ArchivedTable(header, columns, nulls)
+
+
+# --- READ SIDE (used by the history endpoints) ---
+# Decoded files are cached per worker process, keyed by path + mtime + size,
+# so a re-archived year is picked up without a restart.
+
+@functools.lru_cache(maxsize=64)
+def _load(path, mtime_ns, size):
+    return read_archive(path)
+
+
+def _archive_files(table):
+    """[(fiscal_year, DirEntry)] for `table`, oldest first."""
+    if not _settings['dir']:
+        return []
+    try:
+        entries = list(os.scandir(os.path.join(_settings['dir'], table)))
+    except FileNotFoundError:
+        return []
+    files = [(int(match.group(1)), entry) for entry in entries if (match := _FILE_RE.match(entry.name))]
+    return sorted(files, key=lambda item: item[0])
+
+
+def _archives(table):
+    tables = []
+    for _, entry in _archive_files(table):
+        stat = entry.stat()
+        tables.append(_load(entry.path, stat.st_mtime_ns, stat.st_size))
+    return tables
+
+
+def archived_fiscal_years(table='Salary'):
+    return [fiscal_year for fiscal_year, _ in _archive_files(table)]
+
+
+def is_archived_month(month, table='Salary'):
+    """True if `month` ('YYYY-MM-DD' or a date) falls in an archived fiscal year of `table`."""
+    if not isinstance(month, datetime.date):
+        try:
+            month = datetime.date.fromisoformat(str(month)[:10])
+        except ValueError:
+            return False
+    return fiscal_year_of(month) in archived_fiscal_years(table)
+
+
+def employee_rows(table, employee_id, columns=None, extra=None):
+    """Archived rows of one employee, newest month first. `extra` is merged into every row."""
+    rows = []
+    for archived in _archives(table):
+        rows.extend(archived.employee_rows(employee_id, columns))
+    if extra:
+        for row in rows:
+            row.update(extra)
+    rows.sort(key=lambda row: row['month'], reverse=True)
+    return rows
+
+
+def fiscal_year_rows(table, fiscal_year, columns=None):
+    """All archived rows of one fiscal year; empty if it is not archived."""
+    for archived in _archives(table):
+        if archived.fiscal_year == fiscal_year:
+            return [archived.row(i, columns) for i in range(archived.rows)]
+    return []
+
+
+def merge_history(live_rows, archived_rows):
+    """Live rows first; archived rows for months the live table does not have. Newest first."""
+    if not archived_rows:
+        return live_rows
+    live_months = {row['month'] for row in live_rows}
+    merged = list(live_rows) + [row for row in archived_rows if row['month'] not in live_months]
+    merged.sort(key=lambda row: row['month'], reverse=True)
+    return merged
+
+
+def find_salary(salary_id):
+    for archived in reversed(_archives('Salary')):
+        row = archived.find('salary_id', salary_id)
+        if row is not None:
+            return row
+    return None
+
+
+def _salary_totals():
+    """{employee_id: [sum of total_salary, count]} over all archived Salary rows."""
+    totals = {}
+    for archived in _archives('Salary'):
+        ids = archived.column('employee_id')
+        for i in range(archived.rows):
+            if archived.is_null('employee_id', i) or archived.is_null('total_salary', i):
+                continue
+            entry = totals.setdefault(ids[i], [0.0, 0])
+            entry[0] += float(archived.value('total_salary', i))
+            entry[1] += 1
+    return totals
+
+
+def merge_department_salaries(report_data, employee_departments=None):
+    """
+    Finishes DEPARTMENT_SALARIES_REPORT rows: adds archived salaries (when
+    `employee_departments`, {employee_id: department}, is given), recomputes
+    average_salary and drops the helper columns. Archived salaries of deleted
+    employees are ignored, like the LEFT JOIN from Employee ignores live ones.
+    """
+    by_department = {row['department']: row for row in report_data}
+    if employee_departments:
+        for employee_id, (amount, count) in _salary_totals().items():
+            row = by_department.get(employee_departments.get(employee_id))
+            if row is not None:
+                row['salary_total'] = float(row['salary_total'] or 0.0) + amount
+                row['salary_count'] = int(row['salary_count'] or 0) + count
+    for row in report_data:
+        total, count = row.pop('salary_total', 0), row.pop('salary_count', 0)
+        row['average_salary'] = float(total or 0.0) / count if count else 0.0
+    report_data.sort(key=lambda row: row['average_salary'], reverse=True)
+    return report_data
+
+
+def archive_stats():
+    cache = _load.cache_info()
+    return {table: archived_fiscal_years(table) for table in TABLES} | {
+        'cache': {'hits': cache.hits, 'misses': cache.misses, 'files': cache.currsize}}
+
+
+# --- ARCHIVAL JOB ---
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _partitions(cursor, table):
+    """[(name, upper bound date or None for MAXVALUE)] in order; [] if not partitioned."""
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """, (table,))
+    partitions = []
+    for name, description in cursor.fetchall():
+        if name is None:
+            return []
+        upper = None if description == 'MAXVALUE' else datetime.date.fromisoformat(description.strip("'"))
+        partitions.append((name, upper))
+    return partitions
+
+
+def ensure_partitions(conn, table, months_ahead):
+    """Splits the MAXVALUE partition into monthly ones up to `months_ahead` months from now."""
+    cursor = conn.cursor()
+    try:
+        partitions = _partitions(cursor, table)
+        if not partitions:
+            print(f"{table} is not partitioned (apply migration 0002)")
+            return 0
+        bounded = [upper for _, upper in partitions if upper is not None]
+        if bounded:
+            lower = max(bounded)
+        else:
+            cursor.execute(f"SELECT MIN(month) FROM {table}")
+            first = cursor.fetchone()[0] or datetime.date.today()
+            lower = first.replace(day=1)
+        last = _add_months(datetime.date.today().replace(day=1), months_ahead)
+
+        new = []
+        while lower <= last:
+            upper = _add_months(lower, 1)
+            new.append(f"PARTITION p{lower:%Y%m} VALUES LESS THAN ('{upper.isoformat()}')")
+            lower = upper
+        if not new:
+            return 0
+        catch_all = partitions[-1][0] if partitions[-1][1] is None else None
+        if catch_all:
+            new.append(f"PARTITION {catch_all} VALUES LESS THAN (MAXVALUE)")
+            cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {catch_all} INTO ({', '.join(new)})")
+            return len(new) - 1
+        cursor.execute(f"ALTER TABLE {table} ADD PARTITION ({', '.join(new)})")
+        return len(new)
+    finally:
+        cursor.close()
+
+
+def closed_fiscal_years(cursor, table):
+    """Fiscal years before the current one that still have live rows in `table`."""
+    cursor.execute(f"SELECT MIN(month) FROM {table}")
+    first = cursor.fetchone()[0]
+    if first is None:
+        return []
+    return list(range(fiscal_year_of(first), fiscal_year_of(datetime.date.today())))
+
+
+def _row_order(row):
+    return (row['employee_id'] or 0, row['month'])
+
+
+def archive_fiscal_year(conn, table, fiscal_year, dry_run=False):
+    """
+    Moves one fiscal year of `table` to its archive file. The range is locked
+    (SELECT ... FOR UPDATE) from the copy until the delete commits, so rows
+    written concurrently cannot be lost. Returns a summary dict, or None if
+    there was nothing to archive.
+    """
+    start, end = fiscal_year_bounds(fiscal_year)
+    path = archive_path(table, fiscal_year)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        conn.start_transaction()
+        cursor.execute(f"SELECT * FROM {table} WHERE month >= %s AND month < %s ORDER BY employee_id, month FOR UPDATE",
+                       (start, end))
+        live = cursor.fetchall()
+        columns = list(cursor.column_names)
+        if not live:
+            conn.rollback()
+            return None
+
+        rows, previously_archived = live, 0
+        if os.path.exists(path):
+            # Written to after it was archived: live rows replace archived ones
+            existing = read_archive(path)
+            live_keys = {(row['employee_id'], row['month']) for row in live}
+            kept = [row for row in existing.all_rows() if (row['employee_id'], row['month']) not in live_keys]
+            previously_archived = len(kept)
+            columns += [name for name in existing.names if name not in columns]
+            rows = sorted(kept + live, key=_row_order)
+
+        summary = {'table': table, 'fiscal_year': fiscal_year, 'live_rows': len(live),
+                   'previously_archived': previously_archived, 'path': path}
+        if dry_run:
+            conn.rollback()
+            return summary
+
+        summary['bytes'] = write_archive(path, table, fiscal_year, columns, rows)
+        cursor.execute(f"DELETE FROM {table} WHERE month >= %s AND month < %s", (start, end))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    summary['dropped_partitions'] = _drop_empty_partitions(conn, table, start, end)
+    return summary
+
+
+def _drop_empty_partitions(conn, table, start, end):
+    cursor = conn.cursor()
+    try:
+        partitions = _partitions(cursor, table)
+        inside, lower = [], None
+        for name, upper in partitions:
+            if lower is not None and upper is not None and lower >= start and upper <= end:
+                cursor.execute(f"SELECT 1 FROM {table} PARTITION ({name}) LIMIT 1")
+                if cursor.fetchone() is None:
+                    inside.append(name)
+            lower = upper
+        if inside:
+            cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(inside)}")
+        return inside
+    finally:
+        cursor.close()
+
+
+def status(conn):
+    cursor = conn.cursor()
+    try:
+        for table in TABLES:
+            partitions = _partitions(cursor, table)
+            cursor.execute(f"SELECT COUNT(*), MIN(month), MAX(month) FROM {table}")
+            count, first, last = cursor.fetchone()
+            print(f"{table}: {count} live rows ({first} .. {last}), "
+                  f"{len(partitions) or 'not'} partition{'s' if len(partitions) != 1 else ''}")
+            for fiscal_year, entry in _archive_files(table):
+                archived = read_archive(entry.path)
+                print(f"  archived FY{fiscal_year}: {archived.rows} rows, {entry.stat().st_size} bytes")
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'partitions', 'run'])
+    parser.add_argument('--fiscal-year', type=int, help="archive only this (closed) fiscal year")
+    parser.add_argument('--dry-run', action='store_true', help="report what would be archived")
+    parser.add_argument('--shard', help="status / partitions on this shard node (DB_SHARDS) instead of the home database")
+    args = parser.parse_args()
+
+    import mysql.connector
+    import shards
+    from config import load_config
+    from db import get_db_connection, init_db, use_shard
+
+    config = load_config()
+    init_archive(config)
+    init_db(config)
+    shards.init_shards(config)
+    if args.shard is not None and args.shard not in shards.names():
+        sys.exit(f"Unknown shard {args.shard!r}; DB_SHARDS defines: {', '.join(shards.names()) or 'none'}")
+    if args.command == 'run' and shards.enabled():
+        # The archive files hold one fiscal year of the whole company, not of one shard
+        sys.exit("Archiving is not supported with DB_SHARDS yet")
+    with use_shard(args.shard):
+        conn = get_db_connection()
+    if conn is None:
+        sys.exit("Database connection failed")
+    try:
+        if args.command == 'status':
+            status(conn)
+        elif args.command == 'partitions':
+            for table in TABLES:
+                added = ensure_partitions(conn, table, config['PARTITION_MONTHS_AHEAD'])
+                print(f"{table}: {added} partition(s) added")
+        else:
+            current = fiscal_year_of(datetime.date.today())
+            if args.fiscal_year is not None and args.fiscal_year >= current:
+                sys.exit(f"FY{args.fiscal_year} is not closed yet (current fiscal year is FY{current})")
+            for table in TABLES:
+                cursor = conn.cursor()
+                years = [args.fiscal_year] if args.fiscal_year is not None else closed_fiscal_years(cursor, table)
+                cursor.close()
+                for fiscal_year in years:
+                    summary = archive_fiscal_year(conn, table, fiscal_year, dry_run=args.dry_run)
+                    if summary:
+                        print(("Would archive " if args.dry_run else "Archived ") + json.dumps(summary, default=str))
+    except mysql.connector.Error as e:
+        sys.exit(f"Database error: {e.msg}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
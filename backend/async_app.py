@@ -0,0 +1,305 @@
+"""
+Async read path (ASGI) for the hot read endpoints.
+
+Serves the same JSON as the Flask routes for:
+    GET /api/my-profile, /api/my-salaries, /api/my-attendance, /api/my-leave-requests
+    GET /api/employees
+    GET /api/reports/department-salaries, /api/reports/new-hires
+    GET /api/leave-requests
+
+Run it next to the gunicorn app and send those GET paths here from the
+reverse proxy; everything else (login, writes, payroll) stays on wsgi:app.
+
+    pip install uvicorn
+    cd backend
+    uvicorn async_app:app --host 0.0.0.0 --port 5001
+
+Both servers must share SECRET_KEY: the Flask session cookie set by
+/api/login is verified here with the same signing serializer.
+
+Reads go to the replica when DB_REPLICA_HOST is set, except for sessions
+that wrote within DB_REPLICA_PIN_SECONDS (same rule as the Flask routes).
+
+It only reads the home database: with DB_SHARDS (shards.py) or
+DB_BACKEND=sqlite it refuses to start, so keep every path on wsgi:app then.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+import mysql.connector
+from itsdangerous import BadSignature
+
+import archive
+import db
+import queries
+import shards
+import snapshots
+from app import create_app, format_dates
+from db_async import create_async_pool, create_async_replica_pool
+from logging_setup import access_log, sample
+
+log = logging.getLogger(__name__)
+
+
+class Request:
+    def __init__(self, scope, session, pool, log_context):
+        self.scope = scope
+        self.session = session
+        self.pool = pool
+        self.log_context = log_context
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+
+
+class AsyncReadApp:
+    """Minimal ASGI application: routing, session, CORS and JSON for the read endpoints."""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.config = flask_app.config
+        self.pool = create_async_pool(flask_app.config)
+        self.replica_pool = create_async_replica_pool(flask_app.config)
+        self.session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+        self.session_cookie_name = flask_app.config['SESSION_COOKIE_NAME']
+        self.session_max_age = int(flask_app.permanent_session_lifetime.total_seconds())
+        self.routes = {
+            '/api/my-profile': (self.get_my_profile, False),
+            '/api/my-salaries': (self.get_my_salaries, False),
+            '/api/my-attendance': (self.get_my_attendance, False),
+            '/api/my-leave-requests': (self.get_my_leave_requests, False),
+            '/api/employees': (self.get_employees, True),
+            '/api/reports/department-salaries': (self.get_department_salaries, True),
+            '/api/reports/new-hires': (self.get_new_hires_report, True),
+            '/api/leave-requests': (self.get_all_leave_requests, True),
+        }
+
+    # --- ASGI PLUMBING ---
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+        origin = headers.get('origin')
+
+        if scope['method'] == 'OPTIONS':
+            await self._send(send, 204, None, origin, preflight=True)
+            return
+
+        route = self.routes.get(scope['path'])
+        if route is None:
+            await self._send(send, 404, {"error": "Not found"}, origin)
+            return
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self._send(send, 405, {"error": "Method not allowed"}, origin)
+            return
+
+        start = time.perf_counter()
+        handler, admin_only = route
+        session = self._load_session(headers.get('cookie'))
+        # No Flask request context here, so the log context is passed explicitly
+        context = {'request_id': headers.get('x-request-id') or uuid.uuid4().hex,
+                   'route': scope['path'], 'user': session.get('user_id')}
+        if 'user_id' not in session:
+            log.info("Login required: No user_id in session", extra=dict(context, **sample('auth.unauthorized')))
+            body, status = {"error": "Unauthorized access"}, 401
+        elif admin_only and session.get('role') != 'admin':
+            body, status = {"error": "Forbidden"}, 403
+        else:
+            body, status = await handler(Request(scope, session, self._pool_for(session), context))
+        await self._send(send, status, body, origin, head_only=scope['method'] == 'HEAD',
+                         request_id=context['request_id'])
+        access_log.info("%s %s %s", scope['method'], scope['path'], status,
+                        extra=dict(context, status=status, duration_ms=round((time.perf_counter() - start) * 1000, 2),
+                                   **sample('access')))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                for pool in self._pools():
+                    try:
+                        start = time.perf_counter()
+                        await pool.open(warm=self.config['DB_WARM_UP'])
+                        log.info("Async pool for %s:%s ready in %.1f ms", pool.connect_args['host'], pool.connect_args['port'], (time.perf_counter() - start) * 1000)
+                    except mysql.connector.Error as e:
+                        # Keep serving; connections are retried per request
+                        log.warning("Async pool warm-up failed: %s", e)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for pool in self._pools():
+                    await pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _pools(self):
+        return [pool for pool in (self.pool, self.replica_pool) if pool is not None]
+
+    def _pool_for(self, session):
+        if self.replica_pool is None:
+            return self.pool
+        last_write_at = session.get('last_write_at')
+        if last_write_at is not None and time.time() - last_write_at < self.config['DB_REPLICA_PIN_SECONDS']:
+            return self.pool
+        return self.replica_pool
+
+    def _load_session(self, cookie_header):
+        if not cookie_header:
+            return {}
+        cookie = SimpleCookie()
+        try:
+            cookie.load(cookie_header)
+        except Exception:
+            return {}
+        morsel = cookie.get(self.session_cookie_name)
+        if morsel is None or self.session_serializer is None:
+            return {}
+        try:
+            return self.session_serializer.loads(morsel.value, max_age=self.session_max_age)
+        except BadSignature:
+            return {}
+
+    def _cors_headers(self, origin, preflight=False):
+        if not origin or origin not in self.config['CORS_ORIGINS']:
+            return []
+        headers = [
+            (b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin'),
+        ]
+        if preflight:
+            headers.append((b'access-control-allow-methods', b'GET, HEAD, OPTIONS'))
+            headers.append((b'access-control-allow-headers', b'Content-Type'))
+        return headers
+
+    async def _send(self, send, status, body, origin, preflight=False, head_only=False, request_id=None):
+        payload = b'' if body is None else (self.flask_app.json.dumps(body) + '\n').encode('utf-8')
+        headers = self._cors_headers(origin, preflight)
+        if request_id:
+            headers.append((b'x-request-id', request_id.encode('latin-1')))
+        if body is not None:
+            headers.append((b'content-type', b'application/json'))
+        headers.append((b'content-length', str(len(payload)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if head_only else payload})
+
+    async def _employee_id_for(self, req):
+        employee = await req.pool.fetch_one(queries.EMPLOYEE_ID_FOR_USER, (req.session.get('user_id'),))
+        return employee['employee_id'] if employee else None
+
+    # --- EMPLOYEE DASHBOARD ROUTES ---
+    async def get_my_profile(self, req):
+        user_id = req.session.get('user_id')
+        try:
+            employee_profile = await req.pool.fetch_one(queries.MY_PROFILE, (user_id,))
+            if not employee_profile:
+                log.info("No employee profile found linked to user_id %s", user_id, extra=req.log_context)
+                return {"error": "No employee profile linked to this user account."}, 404
+            return format_dates([employee_profile])[0], 200
+        except Exception as e:
+            log.error("Error fetching profile for user %s: %s", user_id, e, extra=req.log_context)
+            return {"error": "Could not fetch profile data"}, 500
+
+    async def get_my_salaries(self, req):
+        try:
+            employee_id = await self._employee_id_for(req)
+            if employee_id is None:
+                return {"error": "No employee profile linked to this user."}, 404
+            salaries = await req.pool.fetch_all(queries.MY_SALARIES, (employee_id,))
+            # Archive files are read (and cached) off the event loop
+            archived = await asyncio.to_thread(archive.employee_rows, 'Salary', employee_id, queries.MY_SALARIES_COLUMNS)
+            return format_dates(archive.merge_history(salaries, archived)), 200
+        except Exception as e:
+            log.error("Error fetching salaries for user %s: %s", req.session.get('user_id'), e, extra=req.log_context)
+            return {"error": "Could not fetch salary history"}, 500
+
+    async def get_my_attendance(self, req):
+        try:
+            employee_id = await self._employee_id_for(req)
+            if employee_id is None:
+                return {"error": "No employee profile linked to this user."}, 404
+            attendance = await req.pool.fetch_all(queries.MY_ATTENDANCE, (employee_id,))
+            archived = await asyncio.to_thread(archive.employee_rows, 'Attendance', employee_id, queries.MY_ATTENDANCE_COLUMNS)
+            return format_dates(archive.merge_history(attendance, archived)), 200
+        except Exception as e:
+            log.error("Error fetching attendance for user %s: %s", req.session.get('user_id'), e, extra=req.log_context)
+            return {"error": "Could not fetch attendance history"}, 500
+
+    async def get_my_leave_requests(self, req):
+        try:
+            employee_id = await self._employee_id_for(req)
+            if employee_id is None:
+                return {"error": "No employee profile linked to this user."}, 404
+            requests = await req.pool.fetch_all(queries.MY_LEAVE_REQUESTS, (employee_id,))
+            return format_dates(requests), 200
+        except Exception as e:
+            log.error("Error fetching my leave requests: %s", e, extra=req.log_context)
+            return {"error": "Could not fetch leave history"}, 500
+
+    # --- ADMIN READ ROUTES ---
+    async def get_employees(self, req):
+        include_linked_user = req.args.get('include_linked_user', 'false').lower() == 'true'
+        query, params = queries.employee_list_query(
+            req.args.get('search', ''), req.args.get('department', ''), include_linked_user)
+        try:
+            # The two queries are independent: run them concurrently on two connections
+            employees, departments_result = await asyncio.gather(
+                req.pool.fetch_all(query, params),
+                req.pool.fetch_all(queries.DEPARTMENT_LIST),
+            )
+            departments = [row['department'] for row in departments_result if row['department']]
+            return {"employees": format_dates(employees), "departments": departments}, 200
+        except Exception as e:
+            log.error("Error in /api/employees: %s", e, extra=req.log_context)
+            return {"error": "Could not fetch employees"}, 500
+
+    async def get_department_salaries(self, req):
+        try:
+            if snapshots.available_months():
+                return await asyncio.to_thread(lambda: snapshots.department_salaries(snapshots.load_snapshots())), 200
+            report_data = await req.pool.fetch_all(queries.DEPARTMENT_SALARIES_REPORT)
+            employee_departments = None
+            if archive.archived_fiscal_years('Salary'):
+                rows = await req.pool.fetch_all(queries.EMPLOYEE_DEPARTMENTS)
+                employee_departments = {row['employee_id']: row['department'] for row in rows}
+            return await asyncio.to_thread(archive.merge_department_salaries, report_data, employee_departments), 200
+        except Exception as e:
+            log.error("Error in /api/reports/department-salaries: %s", e, extra=req.log_context)
+            return {"error": "Could not generate report"}, 500
+
+    async def get_new_hires_report(self, req):
+        try:
+            report_data = await req.pool.fetch_all(queries.NEW_HIRES_REPORT)
+            return format_dates(report_data), 200
+        except Exception as e:
+            log.error("Error in /api/reports/new-hires: %s", e, extra=req.log_context)
+            return {"error": "Could not generate new hires report"}, 500
+
+    async def get_all_leave_requests(self, req):
+        query, params = queries.leave_requests_query(req.args.get('status', ''))
+        try:
+            requests = await req.pool.fetch_all(query, params)
+            return format_dates(requests), 200
+        except Exception as e:
+            log.error("Error fetching all leave requests: %s", e, extra=req.log_context)
+            return {"error": "Could not fetch leave requests"}, 500
+
+
+def create_async_app(config=None):
+    """Builds the ASGI read app from the same configuration as create_app()."""
+    flask_app = create_app(config)
+    # Its queries go to one MySQL database; sharded or on SQLite they would return partial results
+    if shards.enabled():
+        raise RuntimeError("async_app does not support DB_SHARDS: its reads would only see the home database. "
+                           "Serve these paths from wsgi:app.")
+    if db.backend_name() != db.MYSQL:
+        raise RuntimeError(f"async_app needs DB_BACKEND=mysql (aiomysql), not {db.backend_name()!r}")
+    return AsyncReadApp(flask_app)
+
+
+app = create_async_app()
@@ -0,0 +1,468 @@
+"""
+The API end to end against the in-memory SQLite backend (DB_BACKEND=sqlite,
+db_sqlite.py): a regression check and a timing baseline in one run.
+
+    cd backend
+    python benchmarks/api_regression.py
+    python benchmarks/api_regression.py --employees 2000 --repeat 20 --save /tmp/api-baseline.json
+    python benchmarks/api_regression.py --baseline /tmp/api-baseline.json --tolerance 1.5
+
+No MySQL is needed: create_app() gets a fresh SQLite database in this
+process, synthetic employees are inserted directly, and every request goes
+through the Flask test client, so the whole suite takes seconds. The steps
+run in order as an admin and a linked employee would use the app (hire, link,
+attendance, payroll, adjustments, leave) and each checks its status code;
+the read steps are then timed --repeat times. With --baseline a step whose
+median is more than --tolerance times the saved median is reported as a
+regression. Exits 1 on a failed check or a regression.
+"""
+import argparse
+import datetime
+import decimal
+import gzip
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response  # noqa: E402
+
+import app as app_module  # noqa: E402
+import archive  # noqa: E402
+import compression  # noqa: E402
+import db  # noqa: E402
+import directory  # noqa: E402
+import leave  # noqa: E402
+import outbox  # noqa: E402
+import snapshots  # noqa: E402
+
+DEPARTMENTS = ['Engineering', 'Sales', 'HR', 'Finance', 'Operations', 'Support']
+POSITIONS = ['Engineer', 'Manager', 'Analyst', 'Associate']
+CLASSES = ['default', 'default', 'default', 'contractor']
+PASSWORD = 'regression-pass'
+
+MONTHS = ['2025-04-01', '2025-05-01']
+
+
+def build_app(data_dir):
+    return app_module.create_app({
+        'DB_BACKEND': db.SQLITE,
+        'DB_SQLITE_PATH': ':memory:',
+        'SNAPSHOT_DIR': os.path.join(data_dir, 'snapshots'),
+        'ARCHIVE_DIR': os.path.join(data_dir, 'archive'),
+        'LOG_LEVEL': 'ERROR',
+        # Cheap hashes: logins are not what this measures
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_HASH_WORKERS': 1,
+        'TESTING': True,
+    })
+
+
+def seed_employees(count):
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            "INSERT INTO Employee (name, department, position, joining_date, base_salary, employee_class) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [(f"Employee {n}", DEPARTMENTS[n % len(DEPARTMENTS)], POSITIONS[n % len(POSITIONS)],
+              datetime.date(2020 + n % 5, 1 + n % 12, 1 + n % 28), 30000 + (n * 37) % 90000, CLASSES[n % len(CLASSES)])
+             for n in range(1, count + 1)])
+        cursor.executemany(
+            "INSERT INTO Attendance (employee_id, month, days_present, leaves_taken, overtime_hours) VALUES (%s, %s, %s, %s, %s)",
+            [(n, month, 20 + n % 3, n % 2, n % 11) for month in MONTHS for n in range(1, count + 1)])
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def make_admin(username):
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("UPDATE users SET role = 'admin' WHERE username = %s", (username,))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def query_one(sql, params=()):
+    conn = db.get_db_connection()
+    try:
+        return db.fetch_one(conn, sql, params)
+    finally:
+        conn.close()
+
+
+def check_streamed_compression(suite):
+    """A streamed JSON body through the compression hook must decode completely, end-of-stream marker included."""
+    probe = Flask(__name__)
+    probe.config.update(COMPRESS_ENABLED=True, COMPRESS_MIN_BYTES=1024, COMPRESS_GZIP_LEVEL=6, COMPRESS_BROTLI_QUALITY=4)
+    compression.init_compression(probe)
+    rows = [{'employee_id': n, 'name': f"Employee {n}"} for n in range(500)]
+
+    @probe.route('/stream')
+    def stream():
+        def chunks():
+            yield '['
+            for n, row in enumerate(rows):
+                yield (',' if n else '') + json.dumps(row)
+            yield ']'
+        return Response(chunks(), mimetype='application/json')
+
+    client = probe.test_client()
+    for encoding in compression.available_encodings():
+        response = client.get('/stream', headers={'Accept-Encoding': encoding})
+        body = response.get_data()
+        try:
+            if response.headers.get('Content-Encoding') != encoding:
+                raise ValueError(f"Content-Encoding {response.headers.get('Content-Encoding')!r}")
+            decoded = gzip.decompress(body) if encoding == 'gzip' else compression.brotli.decompress(body)
+            passed, detail = json.loads(decoded) == rows, 'decoded body differs'
+        except Exception as e:  # a truncated body raises EOFError (gzip) or brotli.error
+            passed, detail = False, f"{type(e).__name__}: {e}"
+        suite.check(f'streamed {encoding} body complete', passed, detail)
+
+
+def check_archived_money(suite):
+    """DECIMAL values come back from the cold archive as the same Decimals the live rows have, not as floats."""
+    rows = [{'employee_id': 1, 'month': datetime.date(2023, 4, 1), 'total_salary': decimal.Decimal('51234.50'), 'overtime_hours': 1.5},
+            {'employee_id': 2, 'month': datetime.date(2023, 4, 1), 'total_salary': decimal.Decimal('0.05'), 'overtime_hours': None}]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'fy2023.col.gz')
+        archive.write_archive(path, 'Salary', 2023, list(rows[0]), rows)
+        archived = archive.read_archive(path).all_rows()
+    expected, found = json.dumps(rows, default=str), json.dumps(archived, default=str)
+    suite.check('archived money keeps its format', found == expected, f"{found}, expected {expected}")
+
+
+def check_dev_secret_key(suite):
+    """Outside debug and testing the app must refuse to start with the development SECRET_KEY."""
+    try:
+        app_module.create_app({'DB_BACKEND': db.SQLITE, 'LOG_LEVEL': 'ERROR', 'SECRET_KEY': app_module.DEV_SECRET_KEY})
+    except RuntimeError:
+        passed = True
+    else:
+        passed = False
+    suite.check('dev SECRET_KEY refused', passed, "create_app() started with the development SECRET_KEY")
+
+
+def check_outbox_gaps(suite):
+    """A gap in the event ids holds delivery while an open transaction may fill it, whatever its age."""
+    now = datetime.datetime.now()
+    rows = [{'event_id': event_id, 'entity': outbox.EMPLOYEE, 'entity_id': event_id, 'employee_id': event_id,
+             'action': 'updated', 'payload': None, 'created_at': now - datetime.timedelta(seconds=age)}
+            for event_id, age in ((1, 600), (3, 600), (5, 0))]
+    delivered = {label: [event.event_id for event in outbox.settled(None, rows, 0, 1, now, 60.0, writers_before)]
+                 for label, writers_before in (('rolled back', lambda created_at: False), ('open', lambda created_at: True),
+                                               ('unknown', lambda created_at: None))}
+    expected = {'rolled back': [1, 3, 5], 'open': [1], 'unknown': [1, 3]}
+    suite.check('outbox gaps follow open transactions', delivered == expected, f"delivered {delivered}, expected {expected}")
+
+
+def check_stale_directory(suite):
+    """Permission checks and deletes read the database, not a directory entry another worker has not dropped yet."""
+    employee_id, other_id = suite.ids['employee_id'], 2
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # Cached here, then changed without a change event: what another worker's directory looks like
+        user_id = directory.lookup(conn, employee_id)['user_id']
+        directory.lookup(conn, other_id)
+        cursor.execute("UPDATE Employee SET user_id = NULL WHERE employee_id = %s", (employee_id,))
+        cursor.execute("DELETE FROM Employee WHERE employee_id = %s", (other_id,))
+        conn.commit()
+        suite.step('unlinked user forbidden', suite.employee, 'GET', f'/api/employees/{employee_id}/salaries', expect=403)
+        suite.step('unlinked user no leave balance', suite.employee, 'GET', f'/api/employees/{employee_id}/leave-balance', expect=403)
+        suite.step('delete missing employee', suite.admin, 'DELETE', f'/api/employees/{other_id}', expect=404)
+        cursor.execute("UPDATE Employee SET user_id = %s WHERE employee_id = %s", (user_id, employee_id))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    directory.invalidate(employee_id)
+
+
+def check_department_report_coverage(suite):
+    """The department report stays on the live query while a month in Salary has no snapshot."""
+    month = datetime.date.fromisoformat(MONTHS[0])
+    os.remove(snapshots.snapshot_path(month))
+    try:
+        report = suite.step('department report missing snapshot', suite.admin, 'GET', '/api/reports/department-salaries') or []
+        employees = query_one("SELECT COUNT(*) AS employees FROM Employee")['employees']
+        headcount = sum(row['employee_count'] for row in report)
+        suite.check('department report live until covered', headcount == employees,
+                    f"headcount {headcount}, {employees} employees (live)")
+    finally:
+        conn = db.get_db_connection()
+        cursor = conn.cursor(dictionary=True, buffered=True)
+        try:
+            snapshots.build_snapshot(cursor, month)
+        finally:
+            cursor.close()
+            conn.close()
+
+
+def next_weekday(days_ahead):
+    day = datetime.date.today() + datetime.timedelta(days=days_ahead)
+    while day.weekday() >= 5:
+        day += datetime.timedelta(days=1)
+    return day
+
+
+class Suite:
+    def __init__(self, app):
+        self.admin = app.test_client()
+        self.employee = app.test_client()
+        self.ids = {}
+        self.results = []  # (step, expected, status, timings in ms)
+
+    def call(self, client, method, path, body=None):
+        start = time.perf_counter()
+        response = client.open(path.format(**self.ids), method=method, json=body)
+        elapsed = (time.perf_counter() - start) * 1000
+        return response, elapsed
+
+    def step(self, name, client, method, path, body=None, expect=200, repeat=1):
+        """Runs one request (then repeat - 1 more if it passed); returns its JSON."""
+        response, elapsed = self.call(client, method, path, body)
+        timings = [elapsed]
+        if response.status_code == expect:
+            for _ in range(repeat - 1):
+                timings.append(self.call(client, method, path, body)[1])
+        self.results.append((name, expect, response.status_code, timings))
+        if response.status_code != expect:
+            print(f"  FAIL {name}: {method} {path.format(**self.ids)} -> {response.status_code}, expected {expect}: "
+                  f"{response.get_data(as_text=True)[:300]}")
+        return response.get_json(silent=True)
+
+    def check(self, name, passed, detail=''):
+        """Records a check made outside a request, e.g. on the rows a request wrote."""
+        self.results.append((name, 'ok', 'ok' if passed else 'failed', [0.0]))
+        if not passed:
+            print(f"  FAIL {name}: {detail}")
+
+    def stream_step(self, name, path):
+        """Opens the SSE stream and reads its first events."""
+        start = time.perf_counter()
+        response = self.admin.get(path, buffered=False)
+        chunks = []
+        if response.status_code == 200:
+            messages = iter(response.response)
+            chunks = [next(messages), next(messages)]
+        response.close()
+        elapsed = (time.perf_counter() - start) * 1000
+        ok = response.status_code == 200 and any(b'event: ready' in chunk for chunk in chunks)
+        self.results.append((name, 200, response.status_code if ok else f"{response.status_code} (no ready event)", [elapsed]))
+        if not ok:
+            print(f"  FAIL {name}: {response.status_code} {chunks}")
+
+
+def run_suite(suite, employees, repeat):
+    s, admin, employee = suite, suite.admin, suite.employee
+
+    # --- accounts and hiring ---
+    s.step('register admin', admin, 'POST', '/api/register', {'username': 'admin', 'password': PASSWORD}, expect=201)
+    s.step('register employee', employee, 'POST', '/api/register', {'username': 'worker', 'password': PASSWORD}, expect=201)
+    make_admin('admin')
+    s.step('register duplicate', admin, 'POST', '/api/register', {'username': 'admin', 'password': PASSWORD}, expect=409)
+    s.step('login admin', admin, 'POST', '/api/login', {'username': 'admin', 'password': PASSWORD})
+    s.step('login employee', employee, 'POST', '/api/login', {'username': 'worker', 'password': PASSWORD})
+    s.step('check auth', admin, 'GET', '/api/check-auth', repeat=repeat)
+    s.step('employee forbidden', employee, 'GET', '/api/employees', expect=403)
+
+    hire = {'name': 'Regression Hire', 'department': 'Engineering', 'position': 'Engineer',
+            'joining_date': '2025-03-03', 'base_salary': 60000}
+    created = s.step('create employee', admin, 'POST', '/api/employees', hire, expect=201) or {}
+    s.ids['employee_id'] = created.get('employee_id') or created.get('id') or employees + 1
+    users = s.step('unlinked users', admin, 'GET', '/api/users/unlinked', repeat=repeat) or []
+    worker = next((user for user in users if user.get('username') == 'worker'), {})
+    s.step('link employee user', admin, 'PUT', '/api/employees/{employee_id}', dict(hire, user_id=worker.get('id')))
+    s.step('create employee invalid', admin, 'POST', '/api/employees', dict(hire, base_salary=''), expect=400)
+
+    # Leave due since joining is credited at hire and on the first balance read, before any monthly `accrue` run
+    leave_year = leave.leave_year_of(datetime.date.today())
+    due = round(len(leave.due_months(datetime.date(2025, 3, 3), leave_year)) * leave.monthly_accrual(), 2)
+    hired = query_one("SELECT accrued FROM LeaveBalance WHERE employee_id = %s AND leave_year = %s",
+                      (s.ids['employee_id'], leave_year)) or {}
+    s.check('new hire leave accrued', float(hired.get('accrued') or 0) == due, f"LeaveBalance {hired}, expected {due}")
+    seeded = s.step('seeded employee leave balance', admin, 'GET', '/api/employees/1/leave-balance') or {}
+    due = round(len(leave.due_months(datetime.date(2021, 2, 2), leave_year)) * leave.monthly_accrual(), 2)
+    s.check('seeded employee leave accrued', seeded.get('accrued') == due, f"response {seeded}, expected {due}")
+    booked = query_one("SELECT accrued FROM LeaveBalance WHERE employee_id = 1 AND leave_year = %s", (leave_year,))
+    s.check('leave balance read does not write', booked is None and seeded.get('unbooked_accrual') == due,
+            f"LeaveBalance {booked}, response {seeded}")
+
+    # --- attendance and payroll ---
+    for month in MONTHS:
+        s.step(f'attendance {month}', admin, 'POST', '/api/attendance',
+               {'employee_id': s.ids['employee_id'], 'month': month, 'days_present': 21, 'leaves_taken': 1, 'overtime_hours': 6},
+               expect=201)
+    s.step('attendance unknown employee', admin, 'POST', '/api/attendance',
+           {'employee_id': 10 ** 9, 'month': MONTHS[0], 'days_present': 1, 'leaves_taken': 0, 'overtime_hours': 0}, expect=400)
+    archive.write_archive(archive.archive_path('Attendance', 2023), 'Attendance', 2023, ['employee_id', 'month', 'days_present'],
+                          [{'employee_id': s.ids['employee_id'], 'month': datetime.date(2023, 6, 1), 'days_present': 20}])
+    s.step('attendance archived month', admin, 'POST', '/api/attendance',
+           {'employee_id': s.ids['employee_id'], 'month': '2023-06-01', 'days_present': 1, 'leaves_taken': 0, 'overtime_hours': 0},
+           expect=409)
+    s.step('payroll rules', admin, 'GET', '/api/payroll/rules', repeat=repeat)
+    s.step('new payroll rule', admin, 'POST', '/api/payroll/rules',
+           {'employee_class': 'contractor', 'effective_from': MONTHS[0], 'pf_rate': 0.0}, expect=201)
+    runs = []
+    for month in MONTHS:
+        result = s.step(f'payroll run {month}', admin, 'POST', '/api/payroll/run', {'month': month, 'bonus': 500}) or {}
+        runs.append(result.get('run_id'))
+    s.ids.update(run_a=runs[0], run_b=runs[-1])
+    s.step('payroll run repeated', admin, 'POST', '/api/payroll/run', {'month': MONTHS[-1]}, expect=400)
+    s.step('salary duplicate', admin, 'POST', '/api/salaries',
+           {'employee_id': s.ids['employee_id'], 'month': MONTHS[0], 'bonus': 0, 'deductions': 0}, expect=409)
+    s.step('attendance 2025-06-01', admin, 'POST', '/api/attendance',
+           {'employee_id': s.ids['employee_id'], 'month': '2025-06-01', 'days_present': 22, 'leaves_taken': 0, 'overtime_hours': 0},
+           expect=201)
+    salary = s.step('add salary', admin, 'POST', '/api/salaries',
+                    {'employee_id': s.ids['employee_id'], 'month': '2025-06-01', 'bonus': 100, 'deductions': 50}, expect=201) or {}
+    s.ids['salary_id'] = salary.get('salary_id') or 1
+    event = query_one("SELECT entity_id FROM ChangeEvent WHERE entity = 'Salary' AND action = 'created' "
+                      "ORDER BY event_id DESC LIMIT 1") or {}
+    inserted = query_one("SELECT salary_id FROM Salary WHERE employee_id = %s AND month = %s",
+                         (s.ids['employee_id'], '2025-06-01')) or {}
+    s.check('salary event entity_id', event.get('entity_id') == inserted.get('salary_id') == salary.get('salary_id'),
+            f"event {event}, Salary row {inserted}, response {salary}")
+    s.step('salary adjustments', admin, 'POST', '/api/salaries/adjustments',
+           {'month': MONTHS[-1], 'adjustments': [{'employee_id': n, 'bonus': 250, 'deductions': 10} for n in range(1, min(employees, 200) + 1)]})
+
+    # --- leave ---
+    s.step('leave balance adjustment', admin, 'POST', '/api/leave-balances/adjustments',
+           {'employee_id': s.ids['employee_id'], 'days': 10, 'leave_year': leave_year, 'note': 'regression'}, expect=201)
+    for bad_year in (True, 0, '2025'):
+        s.step(f'leave adjustment leave_year {bad_year!r}', admin, 'POST', '/api/leave-balances/adjustments',
+               {'employee_id': s.ids['employee_id'], 'days': 1, 'leave_year': bad_year}, expect=400)
+    start = next_weekday(7)
+    s.step('submit leave', employee, 'POST', '/api/my-leave-requests',
+           {'start_date': start.isoformat(), 'end_date': start.isoformat(), 'reason': 'regression'}, expect=201)
+    pending = s.step('leave queue', admin, 'GET', '/api/leave-requests?status=pending') or []
+    s.ids['request_id'] = pending[0]['request_id'] if pending else 0
+    s.stream_step('leave stream', '/api/leave-requests/stream')
+    # One stream per worker by default (thread budget in gunicorn.conf.py): a second one is shed
+    held = admin.get('/api/leave-requests/stream', buffered=False)
+    second = admin.get('/api/leave-requests/stream', buffered=False)
+    s.check('second leave stream shed', second.status_code == 503, f"status {second.status_code}, expected 503")
+    second.close()
+    held.close()
+    s.step('approve leave', admin, 'PUT', '/api/leave-requests/{request_id}', {'status': 'approved'})
+    s.step('approve leave again', admin, 'PUT', '/api/leave-requests/{request_id}', {'status': 'approved'}, expect=409)
+
+    # --- reads, timed ---
+    reads = [
+        (admin, 'dashboard stats', '/api/dashboard-stats'),
+        (admin, 'employee list', '/api/employees'),
+        (admin, 'employee search', '/api/employees?search=Employee 1&department=Sales'),
+        (admin, 'employee detail', '/api/employees/{employee_id}?include_linked_user=true'),
+        (admin, 'employee batch', '/api/employees/batch?ids=1,2,3,4,5,{employee_id}'),
+        (admin, 'employee salaries', '/api/employees/{employee_id}/salaries'),
+        (admin, 'employee ytd', '/api/employees/{employee_id}/ytd'),
+        (admin, 'salary detail', '/api/salaries/{salary_id}'),
+        (admin, 'employee attendance', '/api/employees/{employee_id}/attendance'),
+        (admin, 'employee leave balance', '/api/employees/{employee_id}/leave-balance'),
+        (admin, 'payroll runs', '/api/payroll/runs'),
+        (admin, 'payroll run detail', '/api/payroll/runs/{run_b}'),
+        (admin, 'payroll run compare', '/api/payroll/runs/compare?a={run_a}&b={run_b}'),
+        (admin, 'report department salaries', '/api/reports/department-salaries'),
+        (admin, 'report new hires', '/api/reports/new-hires'),
+        (admin, 'report ytd', '/api/reports/ytd?fiscal_year=2025'),
+        (admin, 'report salary bands', '/api/reports/salary-bands'),
+        (admin, 'report overtime', '/api/reports/overtime-distribution'),
+        (admin, 'report rankings', '/api/reports/rankings?n=10'),
+        (admin, 'report headcount', '/api/reports/headcount-trend'),
+        (admin, 'report leave balances', f'/api/reports/leave-balances?leave_year={leave_year}'),
+        (admin, 'leave queue all', '/api/leave-requests'),
+        (admin, 'runtime stats', '/api/admin/runtime-stats'),
+        (employee, 'my profile', '/api/my-profile'),
+        (employee, 'my salaries', '/api/my-salaries'),
+        (employee, 'my ytd', '/api/my-ytd'),
+        (employee, 'my attendance', '/api/my-attendance'),
+        (employee, 'my leave requests', '/api/my-leave-requests'),
+        (employee, 'my leave balance', '/api/my-leave-balance'),
+    ]
+    for client, name, path in reads:
+        s.step(name, client, 'GET', path, repeat=repeat)
+    s.step('payroll simulate', admin, 'POST', '/api/payroll/simulate',
+           {'months': 6, 'raises': [{'department': 'Engineering', 'percent': 5, 'from_month': 2}]}, repeat=repeat)
+    s.step('employee batch post', admin, 'POST', '/api/employees/batch', {'ids': list(range(1, 101))}, repeat=repeat)
+    s.step('other employee forbidden', employee, 'GET', '/api/employees/1/salaries', expect=403)
+
+    stats = s.step('runtime stats logging', admin, 'GET', '/api/admin/runtime-stats') or {}
+    s.check('dropped log records reported', 'dropped_records' in (stats.get('logging') or {}), f"logging: {stats.get('logging')}")
+    check_streamed_compression(s)
+    check_archived_money(s)
+    check_outbox_gaps(s)
+    check_stale_directory(s)
+    check_department_report_coverage(s)
+
+    # --- removal ---
+    s.step('delete employee', admin, 'DELETE', '/api/employees/1')
+    s.step('deleted employee gone', admin, 'GET', '/api/employees/1', expect=404)
+    ranked = s.step('deleted employee unranked', admin, 'GET', f'/api/reports/rankings?employee_id=1&from={MONTHS[0]}&to={MONTHS[-1]}') or {}
+    s.check('deleted employee out of snapshots', ranked.get('employee') is None, f"employee: {ranked.get('employee')}")
+    s.step('logout', employee, 'POST', '/api/logout')
+    s.step('logged out', employee, 'GET', '/api/my-profile', expect=401)
+    check_dev_secret_key(s)
+
+
+def report(results, baseline, tolerance):
+    failures = regressions = 0
+    print(f"\n{'step':<32} {'status':>8} {'n':>4} {'median ms':>10} {'p95 ms':>8} {'baseline':>9}")
+    for name, expect, status, timings in results:
+        median = statistics.median(timings)
+        p95 = sorted(timings)[min(len(timings) - 1, int(len(timings) * 0.95))]
+        flag = ''
+        if status != expect:
+            failures += 1
+            flag = '  FAIL'
+        base = baseline.get(name)
+        if base is not None and len(timings) > 1 and median > base * tolerance:
+            regressions += 1
+            flag += f'  SLOWER x{median / base:.2f}'
+        print(f"{name:<32} {status!s:>8} {len(timings):>4} {median:>10.2f} {p95:>8.2f} "
+              f"{f'{base:.2f}' if base is not None else '-':>9}{flag}")
+    return failures, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=10, help='timed requests per read step')
+    parser.add_argument('--baseline', help='JSON file from --save to compare the medians with')
+    parser.add_argument('--tolerance', type=float, default=2.0, help='allowed median / baseline ratio')
+    parser.add_argument('--save', help='write the medians of the timed steps to this JSON file')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as data_dir:
+        app = build_app(data_dir)
+        seed_employees(args.employees)
+        suite = Suite(app)
+        run_suite(suite, args.employees, args.repeat)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    failures, regressions = report(suite.results, baseline, args.tolerance)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({name: round(statistics.median(timings), 3) for name, _, _, timings in suite.results if len(timings) > 1},
+                      f, indent=2, sort_keys=True)
+    print(f"\n{len(suite.results)} steps, {failures} failed, {regressions} slower than the baseline, "
+          f"{args.employees:,} employees, {time.perf_counter() - started:.1f} s")
+    sys.exit(1 if failures or regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Measures backend cold start: interpreter start + `import app` + create_app().
+
+    cd backend
+    python benchmarks/cold_start.py            # 10 runs
+    python benchmarks/cold_start.py --runs 30
+
+Each run is a fresh subprocess, so import caches do not hide the real cost.
+DB_WARM_UP is forced off so the numbers do not depend on MySQL latency, and
+SECRET_KEY / DB_PASSWORD get throwaway values when they are not set.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = """
+import time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+flask_app = app_module.create_app()
+t2 = time.perf_counter()
+print(f"COLD_START {(t1 - t0) * 1000:.3f} {(t2 - t1) * 1000:.3f}")
+"""
+
+
+def run_once():
+    env = dict(os.environ, DB_WARM_UP='false')
+    env.setdefault('SECRET_KEY', 'cold-start-benchmark')
+    env.setdefault('DB_PASSWORD', '')
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-c', SNIPPET], cwd=BACKEND_DIR, env=env,
+                         capture_output=True, text=True, check=True)
+    total_ms = (time.perf_counter() - start) * 1000
+    # App logs go to stderr; still pick out the result line in case anything else prints
+    line = next(l for l in out.stdout.splitlines() if l.startswith('COLD_START '))
+    import_ms, create_ms = (float(x) for x in line.split()[1:])
+    return total_ms, import_ms, create_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    for label, idx in (('process total', 0), ('import app', 1), ('create_app()', 2)):
+        values = [r[idx] for r in results]
+        print(f"{label:>14}: median {statistics.median(values):8.1f} ms   "
+              f"min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
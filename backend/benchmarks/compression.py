@@ -0,0 +1,84 @@
+"""
+CPU cost vs bytes saved for the response compression levels (compression.py).
+
+    cd backend
+    python benchmarks/compression.py
+    python benchmarks/compression.py --employees 20000 --link-mbit 4
+
+No database is needed: the payloads are synthetic but shaped like the big
+admin responses (/api/employees?include_linked_user=true, /api/leave-requests,
+salary history), serialised with Flask's JSON encoder. For every encoding and
+level it prints the compressed size, CPU time, and the transfer time at
+--link-mbit (a slow VPN) with and without compression.
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, json  # noqa: E402
+
+import compression  # noqa: E402
+
+DEPARTMENTS = ['Engineering', 'Sales', 'HR', 'Finance', 'Operations', 'Support']
+POSITIONS = ['Junior Developer', 'Senior Developer', 'Sales Manager', 'HR Specialist', 'Accountant', 'Team Lead']
+
+
+def payloads(employees, seed=7):
+    rng = random.Random(seed)
+    start = datetime.date(2019, 1, 1)
+    employee_rows = [{
+        'employee_id': i, 'name': f"Employee {i:06d}", 'department': rng.choice(DEPARTMENTS),
+        'position': rng.choice(POSITIONS), 'joining_date': (start + datetime.timedelta(days=rng.randrange(2000))).isoformat(),
+        'base_salary': float(rng.randrange(30000, 120000, 500)), 'user_id': i if i % 3 else None,
+        'employee_class': 'default', 'linked_username': f"user{i}" if i % 3 else None,
+    } for i in range(1, employees + 1)]
+    leave_rows = [{
+        'request_id': i, 'employee_id': rng.randrange(1, employees + 1), 'employee_name': f"Employee {i:06d}",
+        'start_date': '2025-03-10', 'end_date': '2025-03-12', 'reason': rng.choice(['Vacation', 'Sick leave', 'Family event']),
+        'status': rng.choice(['pending', 'approved', 'rejected']), 'requested_on': '2025-03-01 09:30:00',
+    } for i in range(1, employees // 2 + 1)]
+    salary_rows = [{
+        'salary_id': i, 'employee_id': 42, 'month': f"{2015 + i // 12}-{i % 12 + 1:02d}-01", 'overtime_hours': 6.0,
+        'overtime_pay': 2130.68, 'bonus': 0.0, 'deductions': 0.0, 'pf_amount': 6000.0, 'total_salary': 46130.68,
+        'rule_version': 1, 'base_salary': 50000.0,
+    } for i in range(120)]
+    return [('employees+linked users', employee_rows), ('leave requests', leave_rows), ('salary history (10y)', salary_rows)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=5000)
+    parser.add_argument('--link-mbit', type=float, default=2.0, help='link speed for the transfer estimate')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    settings = [('gzip', level) for level in (1, 6, 9)]
+    if compression.brotli is not None:
+        settings += [('br', quality) for quality in (1, 4, 8)]
+    else:
+        print("brotli not installed: gzip only (pip install brotli)\n")
+
+    bytes_per_second = args.link_mbit * 1_000_000 / 8
+    with Flask(__name__).app_context():
+        for label, rows in payloads(args.employees):
+            body = json.dumps(rows).encode()
+            print(f"{label}: {len(body) / 1024:,.1f} KiB, {body.count(b'{'):,} objects, "
+                  f"{len(body) / bytes_per_second * 1000:,.0f} ms at {args.link_mbit:g} Mbit/s uncompressed")
+            for encoding, level in settings:
+                kwargs = {'gzip_level': level} if encoding == 'gzip' else {'brotli_quality': level}
+                start = time.thread_time()
+                for _ in range(args.repeat):
+                    compressed = compression.compress_bytes(body, encoding, **kwargs)
+                cpu_ms = (time.thread_time() - start) / args.repeat * 1000
+                print(f"  {encoding:>4} {level}: {len(compressed) / 1024:9,.1f} KiB  ratio {len(compressed) / len(body):6.3f}  "
+                      f"cpu {cpu_ms:8.2f} ms  transfer {len(compressed) / bytes_per_second * 1000:8,.0f} ms")
+            print()
+
+
+if __name__ == '__main__':
+    main()
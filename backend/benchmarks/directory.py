@@ -0,0 +1,74 @@
+"""
+Memory and lookup cost of the in-process employee directory (directory.py).
+
+    cd backend
+    python benchmarks/directory.py
+    python benchmarks/directory.py --employees 1000000 --dicts
+
+No database is needed: the employees are synthetic, with names, departments
+and classes like the seed data. Prints the directory's memory (as reported by
+memory_bytes() and as measured with tracemalloc), the load and lookup times,
+and with --dicts the same figures for a plain dict of row dicts.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import directory  # noqa: E402
+
+DEPARTMENTS = ['Engineering', 'Sales', 'HR', 'Finance', 'Operations', 'Support']
+CLASSES = ['default', 'contractor', 'intern']
+FIRST_NAMES = ['Asha', 'Ravi', 'Maria', 'John', 'Wei', 'Fatima', 'Liam', 'Priya', 'Kenji', 'Sara']
+LAST_NAMES = ['Sharma', 'Smith', 'Garcia', 'Chen', 'Khan', 'Murphy', 'Iyer', 'Tanaka', 'Okafor', 'Novak']
+
+
+def rows(employees, seed=7):
+    rng = random.Random(seed)
+    for employee_id in range(1, employees + 1):
+        yield (employee_id, f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.choice(DEPARTMENTS),
+               float(rng.randrange(30000, 120000, 500)), employee_id if employee_id % 3 else None, rng.choice(CLASSES))
+
+
+def measure(label, build, get, employees, lookups):
+    tracemalloc.start()
+    start = time.perf_counter()
+    store = build()
+    load_seconds = time.perf_counter() - start
+    traced, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rng = random.Random(1)
+    ids = [rng.randrange(1, employees + 1) for _ in range(lookups)]
+    start = time.perf_counter()
+    for employee_id in ids:
+        get(store, employee_id)
+    lookup_us = (time.perf_counter() - start) / lookups * 1e6
+    print(f"{label:>10}: {traced / 1e6:8.1f} MB ({traced / employees:5.1f} B/employee)  "
+          f"load {load_seconds:6.2f} s  lookup {lookup_us:5.2f} us")
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--employees', type=int, default=1_000_000)
+    parser.add_argument('--lookups', type=int, default=200_000)
+    parser.add_argument('--dicts', action='store_true', help='also measure a dict of row dicts')
+    args = parser.parse_args()
+
+    print(f"{args.employees:,} employees, {args.lookups:,} random lookups")
+    store = measure('directory', lambda: directory.load_rows(rows(args.employees)),
+                    directory.Directory.get, args.employees, args.lookups)
+    print(f"{'':>10}  memory_bytes() {store.memory_bytes() / 1e6:.1f} MB")
+    del store
+    if args.dicts:
+        measure('dicts', lambda: {row[0]: dict(zip(directory.FIELDS, row)) for row in rows(args.employees)},
+                dict.get, args.employees, args.lookups)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Logins per second: inline hashing vs the bounded process pool (passwords.py).
+
+    cd backend
+    python benchmarks/login_throughput.py
+    python benchmarks/login_throughput.py --method pbkdf2:sha256:600000 --threads 32 --seconds 10
+
+No database is needed: each "login" is one verify_password() call, which is
+where a login spends its CPU. The pooled run also reports how many requests
+were shed with 429 and how long a cheap unrelated request (a dict lookup on a
+request thread) waited while the storm was running.
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+import passwords  # noqa: E402
+
+
+def storm(verify, threads, seconds):
+    """Runs `threads` login loops for `seconds`; returns (ok, shed, probe latencies)."""
+    stop = time.perf_counter() + seconds
+    counts = {'ok': 0, 'shed': 0}
+    lock = threading.Lock()
+    probe_ms = []
+
+    def login_loop():
+        while time.perf_counter() < stop:
+            try:
+                verify()
+                key = 'ok'
+            except passwords.PasswordHashingUnavailable as busy:
+                time.sleep(min(busy.retry_after, 0.05))
+                key = 'shed'
+            with lock:
+                counts[key] += 1
+
+    def probe_loop():
+        # Stands in for an unrelated cheap request sharing the process
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            {'user_id': 1}.get('user_id')
+            probe_ms.append((time.perf_counter() - t0) * 1000)
+            time.sleep(0.01)
+
+    workers = [threading.Thread(target=login_loop) for _ in range(threads)]
+    workers.append(threading.Thread(target=probe_loop))
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return counts['ok'], counts['shed'], probe_ms
+
+
+def report(label, ok, shed, probe_ms, seconds):
+    p99 = statistics.quantiles(probe_ms, n=100)[98] if len(probe_ms) >= 100 else max(probe_ms or [0])
+    print(f"{label:>24}: {ok / seconds:8.1f} logins/s   shed {shed:6d}   "
+          f"probe p99 {p99:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--method', default='scrypt')
+    parser.add_argument('--threads', type=int, default=16, help='concurrent login requests')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='hash processes')
+    parser.add_argument('--max-pending', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=5.0)
+    args = parser.parse_args()
+
+    stored = generate_password_hash('payday-password', args.method)
+
+    ok, shed, probe = storm(lambda: check_password_hash(stored, 'payday-password'), args.threads, args.seconds)
+    report('inline (threads)', ok, shed, probe, args.seconds)
+
+    passwords.init_password_hasher({
+        'PASSWORD_HASH_METHOD': args.method,
+        'PASSWORD_HASH_WORKERS': args.workers,
+        'PASSWORD_HASH_MAX_PENDING': args.max_pending,
+        'PASSWORD_HASH_TIMEOUT': 30.0,
+    })
+    passwords.verify_password(stored, 'payday-password')  # start the pool outside the timing
+    ok, shed, probe = storm(lambda: passwords.verify_password(stored, 'payday-password'), args.threads, args.seconds)
+    report(f'process pool ({args.workers} procs)', ok, shed, probe, args.seconds)
+    print(f"hasher: {passwords.hasher_stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Text protocol vs the per-connection prepared statement cache (db.py).
+
+    cd backend
+    python benchmarks/prepared_statements.py
+    python benchmarks/prepared_statements.py --iterations 5000 --employees 500
+
+Needs a MySQL with the app schema; connection settings are the usual DB_*
+environment variables. Two read patterns are replayed on one connection:
+
+  my-routes   what /api/my-salaries and /api/my-attendance run per request:
+              user -> employee lookup, salary history, attendance history
+  per-salary  what POST /api/salaries (and run_payroll before its batched
+              fetch) runs per employee: duplicate check, month's attendance
+
+For each pattern and mode it prints the time per iteration and the session's
+Com_select / Com_stmt_prepare / Com_stmt_execute deltas: in prepared mode
+every statement is prepared (parsed) once and then only executed.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mysql.connector  # noqa: E402
+
+import queries  # noqa: E402
+from config import load_config  # noqa: E402
+from db import StatementCache  # noqa: E402
+
+COUNTERS = ('Com_select', 'Com_stmt_prepare', 'Com_stmt_execute')
+
+
+def session_counters(cnx):
+    cursor = cnx.cursor()
+    cursor.execute("SHOW SESSION STATUS WHERE Variable_name IN ('Com_select', 'Com_stmt_prepare', 'Com_stmt_execute')")
+    values = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return values
+
+
+def text_runner(cnx):
+    cursor = cnx.cursor(dictionary=True, buffered=True)
+
+    def run(sql, params):
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    return run
+
+
+def prepared_runner(cnx):
+    return StatementCache(cnx, 32).fetch_all
+
+
+def my_routes(run, user_ids):
+    for user_id in user_ids:
+        employee = run(queries.EMPLOYEE_ID_FOR_USER, (user_id,))
+        if employee:
+            run(queries.MY_SALARIES, (employee[0]['employee_id'],))
+            run(queries.MY_ATTENDANCE, (employee[0]['employee_id'],))
+
+
+def per_salary(run, employee_ids, month):
+    for employee_id in employee_ids:
+        run(queries.SALARY_EXISTS, (employee_id, month))
+        run(queries.ATTENDANCE_FOR_SALARY, (employee_id, month))
+
+
+def measure(cnx, label, mode, workload, iterations):
+    run = (prepared_runner if mode == 'prepared' else text_runner)(cnx)
+    workload(run)  # warm-up, and the prepares for the cached mode
+    before = session_counters(cnx)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        workload(run)
+    elapsed = time.perf_counter() - start
+    after = session_counters(cnx)
+    deltas = "  ".join(f"{name} {after[name] - before[name]:7d}" for name in COUNTERS)
+    print(f"{label:>11} {mode:>8}: {elapsed / iterations * 1000:8.3f} ms/iteration   {deltas}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=20, help='linked users per my-routes iteration')
+    parser.add_argument('--employees', type=int, default=100, help='employees per per-salary iteration')
+    args = parser.parse_args()
+
+    config = load_config()
+    cnx = mysql.connector.connect(host=config['DB_HOST'], port=config['DB_PORT'], user=config['DB_USER'],
+                                  password=config['DB_PASSWORD'], database=config['DB_NAME'])
+    cursor = cnx.cursor()
+    cursor.execute("SELECT user_id FROM Employee WHERE user_id IS NOT NULL LIMIT %s", (args.users,))
+    user_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT employee_id FROM Employee LIMIT %s", (args.employees,))
+    employee_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute("SELECT MAX(month) FROM Attendance")
+    month = cursor.fetchone()[0]
+    cursor.close()
+    cnx.commit()
+    print(f"{len(user_ids)} linked users, {len(employee_ids)} employees, month {month}, {args.iterations} iterations\n")
+
+    for label, workload in (('my-routes', lambda run: my_routes(run, user_ids)),
+                            ('per-salary', lambda run: per_salary(run, employee_ids, month))):
+        text = measure(cnx, label, 'text', workload, args.iterations)
+        prepared = measure(cnx, label, 'prepared', workload, args.iterations)
+        print(f"{'':>11} speed-up: {text / prepared:5.2f}x\n")
+    cnx.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import threading
+import time
+import zlib
+
+from flask import request
+
+try:
+    import brotli  # optional: pip install brotli
+except ImportError:
+    brotli = None
+
+# --- RESPONSE COMPRESSION ---
+# Compresses responses in an after_request hook, choosing the encoding from
+# Accept-Encoding: br when the optional `brotli` package is installed, else
+# gzip. Only text-like types (JSON, HTML, JS, CSS, ...) are compressed, and
+# only bodies of at least COMPRESS_MIN_BYTES.
+#
+# Streamed responses (generator bodies) go through a streaming compressor and
+# each chunk is flushed on its own, so the client still sees every chunk as it
+# is produced. text/event-stream is never compressed: proxies and browsers
+# buffer compressed event streams.
+#
+# Per-process counters (compression_stats(), shown in /api/admin/runtime-stats)
+# record bytes in/out and CPU time per encoding, to weigh CPU against bytes
+# saved. benchmarks/compression.py compares levels offline.
+
+_COMPRESSIBLE = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+_NEVER = {'text/event-stream'}
+
+_settings = {'enabled': True, 'min_bytes': 1024, 'gzip_level': 6, 'brotli_quality': 4}
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def available_encodings():
+    """Server preference order."""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compressor(encoding, gzip_level=None, brotli_quality=None):
+    """
+    (compress(chunk) -> bytes, flush() -> bytes, finish() -> bytes) for a
+    streaming compressor. flush() makes everything so far decodable; finish()
+    ends the stream (gzip trailer / brotli last block) and must come last.
+    """
+    if encoding == 'br':
+        stream = brotli.Compressor(quality=_settings['brotli_quality'] if brotli_quality is None else brotli_quality)
+        return stream.process, stream.flush, stream.finish
+    # wbits 31 = gzip container
+    stream = zlib.compressobj(_settings['gzip_level'] if gzip_level is None else gzip_level, zlib.DEFLATED, 31)
+    return stream.compress, lambda: stream.flush(zlib.Z_SYNC_FLUSH), lambda: stream.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(data, encoding, gzip_level=None, brotli_quality=None):
+    if encoding == 'br':
+        return brotli.compress(data, quality=_settings['brotli_quality'] if brotli_quality is None else brotli_quality)
+    stream = zlib.compressobj(_settings['gzip_level'] if gzip_level is None else gzip_level, zlib.DEFLATED, 31)
+    return stream.compress(data) + stream.flush()
+
+
+def _record(encoding, bytes_in, bytes_out, cpu_seconds, responses=1):
+    with _stats_lock:
+        entry = _stats.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0})
+        entry['responses'] += responses
+        entry['bytes_in'] += bytes_in
+        entry['bytes_out'] += bytes_out
+        entry['cpu_ms'] += cpu_seconds * 1000
+
+
+def _compressed_stream(chunks, encoding):
+    compress, flush, finish = compressor(encoding)
+    bytes_in = bytes_out = 0
+    cpu = 0.0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            start = time.thread_time()
+            out = compress(chunk) + flush()
+            cpu += time.thread_time() - start
+            bytes_in += len(chunk)
+            bytes_out += len(out)
+            yield out
+        start = time.thread_time()
+        out = finish()
+        cpu += time.thread_time() - start
+        bytes_out += len(out)
+        yield out
+    finally:
+        _record(encoding, bytes_in, bytes_out, cpu)
+
+
+def _compressible(response):
+    mimetype = response.mimetype or ''
+    if mimetype in _NEVER:
+        return False
+    return mimetype.startswith('text/') or mimetype in _COMPRESSIBLE
+
+
+def init_compression(app):
+    """Registers the compression hook; settings come from the app config (config.py)."""
+    _settings.update(enabled=app.config['COMPRESS_ENABLED'], min_bytes=app.config['COMPRESS_MIN_BYTES'],
+                     gzip_level=app.config['COMPRESS_GZIP_LEVEL'], brotli_quality=app.config['COMPRESS_BROTLI_QUALITY'])
+
+    @app.after_request
+    def _compress(response):
+        if not _settings['enabled'] or request.method == 'HEAD' or not _compressible(response):
+            return response
+        if response.status_code < 200 or response.status_code in (204, 304) or response.direct_passthrough \
+                or 'Content-Encoding' in response.headers:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(available_encodings())
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = _compressed_stream(response.iter_encoded(), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < _settings['min_bytes']:
+                return response
+            start = time.thread_time()
+            compressed = compress_bytes(data, encoding)
+            _record(encoding, len(data), len(compressed), time.thread_time() - start)
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def compression_stats():
+    with _stats_lock:
+        stats = {encoding: dict(entry) for encoding, entry in _stats.items()}
+    for entry in stats.values():
+        entry['ratio'] = round(entry['bytes_out'] / entry['bytes_in'], 4) if entry['bytes_in'] else None
+        entry['cpu_ms'] = round(entry['cpu_ms'], 3)
+    return {'enabled': _settings['enabled'], 'encodings': list(available_encodings()),
+            'min_bytes': _settings['min_bytes'], 'by_encoding': stats}
@@ -0,0 +1,188 @@
+import logging
+import threading
+from functools import wraps
+
+from flask import jsonify
+
+# --- REQUEST COALESCING AND PER-ENDPOINT CONCURRENCY LIMITS ---
+# SingleFlight: identical in-flight reads share one execution and one result.
+# ConcurrencyLimiter: caps how many requests of one class (payroll, reports,
+# exports) run at once per worker process, queueing briefly and then shedding
+# load with 503 + Retry-After, so one class of work cannot drain the DB pool.
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    do(key, fn): the first caller for `key` runs fn(); callers arriving while it
+    runs wait and receive the same result (or exception). Nothing is cached
+    after the call finishes. Treat the shared result as read-only.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+class ConcurrencyLimiter:
+    """At most `limit` concurrent holders; others wait up to `queue_timeout` seconds."""
+
+    def __init__(self, name, limit, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+
+    def acquire(self):
+        acquired = False
+        with self._lock:
+            self.waiting += 1
+        try:
+            if self.queue_timeout > 0:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            else:
+                acquired = self._slots.acquire(blocking=False)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                if acquired:
+                    self.active += 1
+                else:
+                    self.shed += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def retry_after(self):
+        # Whole seconds; at least the time a request would have queued
+        return max(1, int(self.queue_timeout + 0.999))
+
+    def stats(self):
+        return {'limit': self.limit, 'queue_timeout': self.queue_timeout,
+                'active': self.active, 'waiting': self.waiting, 'shed': self.shed}
+
+
+log = logging.getLogger(__name__)
+
+_limiters = {}
+
+# Shared by the report routes
+report_flights = SingleFlight()
+
+
+def parse_limits(spec):
+    """
+    Parses CONCURRENCY_LIMITS, e.g. "payroll=1:0,reports=1:2,exports=2:5"
+    -> {'payroll': (1, 0.0), 'reports': (1, 2.0), 'exports': (2, 5.0)}
+    (name=max_concurrent:seconds_to_queue).
+    """
+    limits = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, value = item.partition('=')
+        limit, _, timeout = value.partition(':')
+        limits[name.strip()] = (int(limit), float(timeout or 0))
+    return limits
+
+
+# Classes whose requests hold a thread but no pooled DB connection
+CONNECTIONLESS = frozenset({'streams'})
+
+
+def init_limits(config):
+    limits = parse_limits(config['CONCURRENCY_LIMITS'])
+    # Fully used, the limited classes must still leave a connection for every other route
+    holding = sum(limit for name, (limit, _) in limits.items() if name not in CONNECTIONLESS)
+    if holding >= config['DB_POOL_SIZE']:
+        raise ValueError(f"CONCURRENCY_LIMITS allow {holding} concurrent requests holding a DB connection; "
+                         f"keep the total below DB_POOL_SIZE ({config['DB_POOL_SIZE']})")
+    _limiters.clear()
+    for name, (limit, queue_timeout) in limits.items():
+        _limiters[name] = ConcurrencyLimiter(name, limit, queue_timeout)
+
+
+def limiter_stats():
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+def get_limiter(name):
+    """The limiter for `name`, or None if CONCURRENCY_LIMITS does not limit it."""
+    return _limiters.get(name)
+
+
+def shed_response(limiter):
+    log.warning("Shedding %s request: %s already running", limiter.name, limiter.limit)
+    response = jsonify({"error": f"Too many {limiter.name} requests in progress. Please retry shortly."})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(limiter.retry_after())
+    return response
+
+
+# --- DECORATOR FOR CONCURRENCY-LIMITED ROUTES ---
+# Streaming routes hold their slot until the response is closed, so they
+# acquire it themselves (get_limiter) and release it from the generator.
+def limit_concurrency(name):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            limiter = _limiters.get(name)
+            if limiter is None:
+                return f(*args, **kwargs)
+            if not limiter.acquire():
+                return shed_response(limiter)
+            try:
+                return f(*args, **kwargs)
+            finally:
+                limiter.release()
+        return decorated_function
+    return decorator
@@ -0,0 +1,191 @@
+import os
+
+# --- ENVIRONMENT-DRIVEN CONFIGURATION ---
+# Every setting below can be overridden with an environment variable of the
+# same name. The defaults match the old hard-coded development values so that
+# `python app.py` works on a developer machine with only DB_PASSWORD set.
+# In production ALWAYS set SECRET_KEY and the DB_* variables: outside debug and
+# testing, create_app() refuses to start with the development SECRET_KEY.
+
+DEV_SECRET_KEY = 'your_permanent_secret_key_goes_here_39u2r90'
+
+
+def env_str(name, default=None):
+    value = os.environ.get(name)
+    return default if value is None or value == '' else value
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be an integer, got {value!r}")
+
+
+def env_float(name, default):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"Environment variable {name} must be a number, got {value!r}")
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name, default):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return list(default)
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def load_config():
+    """
+    Reads the configuration from the environment.
+    Called by create_app(), so environment changes are picked up per app instance.
+    """
+    return {
+        # Flask / HTTP
+        'SECRET_KEY': env_str('SECRET_KEY', DEV_SECRET_KEY),
+        'CORS_ORIGINS': env_list('CORS_ORIGINS', ['http://127.0.0.1:5500']),
+
+        # Primary MySQL database
+        'DB_HOST': env_str('DB_HOST', 'localhost'),
+        'DB_PORT': env_int('DB_PORT', 3306),
+        'DB_USER': env_str('DB_USER', 'root'),
+        # No default: required for MySQL (init_db), may be set to '' explicitly
+        'DB_PASSWORD': os.environ.get('DB_PASSWORD'),
+        'DB_NAME': env_str('DB_NAME', 'employee_salary_db'),
+
+        # 'mysql', or 'sqlite' for a SQLite database inside the process (db_sqlite.py)
+        # for tests and benchmarks. DB_SQLITE_PATH ':memory:' starts empty on every
+        # create_app(); a file path keeps the data. Not for gunicorn: one process only.
+        'DB_BACKEND': env_str('DB_BACKEND', 'mysql'),
+        'DB_SQLITE_PATH': env_str('DB_SQLITE_PATH', ':memory:'),
+
+        # Connection pool (one pool per worker process)
+        'DB_POOL_NAME': env_str('DB_POOL_NAME', 'esms_pool'),
+        'DB_POOL_SIZE': env_int('DB_POOL_SIZE', 5),
+        # Seconds a request waits for a free pooled connection before giving up
+        'DB_POOL_TIMEOUT': env_float('DB_POOL_TIMEOUT', 5.0),
+        # Open the pool when the app is created instead of on the first request.
+        # Leave this off when using gunicorn --preload: the gunicorn hooks warm
+        # the pool in each worker AFTER the fork instead.
+        'DB_WARM_UP': env_bool('DB_WARM_UP', False),
+
+        # Server-side prepared statements for the fixed reads of queries.py (db.py).
+        # Keeps the DB_STATEMENT_CACHE_SIZE most recently used statements per
+        # pooled connection; other SQL always runs as plain text.
+        'DB_PREPARED_STATEMENTS': env_bool('DB_PREPARED_STATEMENTS', False),
+        'DB_STATEMENT_CACHE_SIZE': env_int('DB_STATEMENT_CACHE_SIZE', 32),
+
+        # Optional read replica. When DB_REPLICA_HOST is empty every query uses
+        # the primary. User / password / database default to the primary's.
+        'DB_REPLICA_HOST': env_str('DB_REPLICA_HOST'),
+        'DB_REPLICA_PORT': env_int('DB_REPLICA_PORT', 3306),
+        'DB_REPLICA_USER': env_str('DB_REPLICA_USER'),
+        'DB_REPLICA_PASSWORD': env_str('DB_REPLICA_PASSWORD'),
+        'DB_REPLICA_NAME': env_str('DB_REPLICA_NAME'),
+        'DB_REPLICA_POOL_SIZE': env_int('DB_REPLICA_POOL_SIZE', 5),
+        # After a successful write, that session reads from the primary for this
+        # many seconds so it sees its own changes despite replication lag.
+        'DB_REPLICA_PIN_SECONDS': env_float('DB_REPLICA_PIN_SECONDS', 5.0),
+
+        # Optional horizontal sharding of the employee data (shards.py): a JSON
+        # shard map, inline or the path of a .json file. Empty = one database.
+        'DB_SHARDS': env_str('DB_SHARDS'),
+        # Connections per shard node (one pool per shard and worker process)
+        'DB_SHARD_POOL_SIZE': env_int('DB_SHARD_POOL_SIZE', 5),
+
+        # Password hashing (passwords.py). Hashes run on a process pool with at
+        # most PASSWORD_HASH_MAX_PENDING jobs queued or running per worker; more
+        # than that gets 429 + Retry-After. Logins with a hash made by another
+        # method/cost are transparently rehashed to PASSWORD_HASH_METHOD,
+        # e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'.
+        'PASSWORD_HASH_METHOD': env_str('PASSWORD_HASH_METHOD', 'scrypt'),
+        'PASSWORD_HASH_WORKERS': env_int('PASSWORD_HASH_WORKERS', 2),
+        'PASSWORD_HASH_MAX_PENDING': env_int('PASSWORD_HASH_MAX_PENDING', 32),
+        'PASSWORD_HASH_TIMEOUT': env_float('PASSWORD_HASH_TIMEOUT', 10.0),
+
+        # Per-worker concurrency limits, "name=max_concurrent:seconds_to_queue".
+        # Requests that cannot get a slot in time are shed with 503 + Retry-After;
+        # a queued request holds a gthread thread, so queue times stay short.
+        # The totals must stay below DB_POOL_SIZE so other routes always get a
+        # connection (checked at startup). 'streams' (server-sent events) hold a
+        # thread but no connection for up to LEAVE_FEED_STREAM_SECONDS and do not
+        # count; see the thread budget in gunicorn.conf.py.
+        'CONCURRENCY_LIMITS': env_str('CONCURRENCY_LIMITS', 'payroll=1:0,reports=1:2,exports=1:2,streams=1:0'),
+
+        # Response compression (compression.py): gzip, or brotli when the
+        # optional `brotli` package is installed and the client accepts it.
+        # Bodies smaller than COMPRESS_MIN_BYTES are sent as they are.
+        'COMPRESS_ENABLED': env_bool('COMPRESS_ENABLED', True),
+        'COMPRESS_MIN_BYTES': env_int('COMPRESS_MIN_BYTES', 1024),
+        'COMPRESS_GZIP_LEVEL': env_int('COMPRESS_GZIP_LEVEL', 6),
+        'COMPRESS_BROTLI_QUALITY': env_int('COMPRESS_BROTLI_QUALITY', 4),
+
+        # Logging (logging_setup.py). LOG_FORMAT is 'json' (one object per line)
+        # or 'text'. LOG_SAMPLE_RATES keeps only a fraction of high-volume
+        # messages, e.g. "access=0.1,auth.unauthorized=0.05".
+        'LOG_LEVEL': env_str('LOG_LEVEL', 'INFO'),
+        'LOG_FORMAT': env_str('LOG_FORMAT', 'json'),
+        'LOG_QUEUE_SIZE': env_int('LOG_QUEUE_SIZE', 10000),
+        'LOG_SAMPLE_RATES': env_str('LOG_SAMPLE_RATES', 'access=1.0,auth.unauthorized=1.0'),
+
+        # Cold archive (archive.py). Closed fiscal years of Salary and Attendance
+        # are moved to compressed files under ARCHIVE_DIR; every worker must see
+        # the same directory. Fiscal years start on the 1st of this month (4 = April).
+        'FISCAL_YEAR_START_MONTH': env_int('FISCAL_YEAR_START_MONTH', 4),
+        'ARCHIVE_DIR': env_str('ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'archive')),
+        # `archive.py partitions` keeps monthly partitions this many months ahead
+        'PARTITION_MONTHS_AHEAD': env_int('PARTITION_MONTHS_AHEAD', 3),
+
+        # Leave ledger (leave.py): LEAVE_DAYS_PER_YEAR is accrued in twelve monthly
+        # steps per leave (fiscal) year, caught up per employee on first use (see
+        # leave.py for the rollout order). With LEAVE_ENFORCE_BALANCE off, requests
+        # beyond the available balance are accepted and the balance goes negative.
+        'LEAVE_DAYS_PER_YEAR': env_float('LEAVE_DAYS_PER_YEAR', 24.0),
+        'LEAVE_ENFORCE_BALANCE': env_bool('LEAVE_ENFORCE_BALANCE', True),
+
+        # Analytics snapshots (snapshots.py): one memory-mapped columnar file per
+        # payroll month, written after each run and read by the report endpoints
+        'SNAPSHOT_DIR': env_str('SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'snapshots')),
+
+        # Transactional outbox (outbox.py): writes record ChangeEvent rows, a
+        # consumer thread per worker delivers them to the subscribers. A gap in
+        # the event ids is passed once no open transaction can fill it (this
+        # reads information_schema.innodb_trx: grant PROCESS to the app user).
+        # Without that privilege gaps are waited on for OUTBOX_GAP_TIMEOUT
+        # seconds, and events committed later than that are not delivered;
+        # keep it above the longest write transaction. `outbox.py prune` keeps
+        # OUTBOX_RETENTION_DAYS of events.
+        'OUTBOX_CONSUMER_ENABLED': env_bool('OUTBOX_CONSUMER_ENABLED', True),
+        'OUTBOX_POLL_SECONDS': env_float('OUTBOX_POLL_SECONDS', 0.5),
+        'OUTBOX_BATCH_SIZE': env_int('OUTBOX_BATCH_SIZE', 500),
+        'OUTBOX_GAP_TIMEOUT': env_float('OUTBOX_GAP_TIMEOUT', 60.0),
+        'OUTBOX_RETENTION_DAYS': env_int('OUTBOX_RETENTION_DAYS', 7),
+
+        # In-process employee directory (directory.py), kept fresh by the outbox
+        # consumer; has no effect while OUTBOX_CONSUMER_ENABLED is off
+        'DIRECTORY_ENABLED': env_bool('DIRECTORY_ENABLED', True),
+
+        # Leave request stream for the admin queue (leave_feed.py), also fed by
+        # the outbox consumer: changes kept per worker for reconnecting clients,
+        # and how long one stream stays open before the browser reconnects
+        'LEAVE_FEED_BUFFER': env_int('LEAVE_FEED_BUFFER', 1000),
+        'LEAVE_FEED_STREAM_SECONDS': env_float('LEAVE_FEED_STREAM_SECONDS', 300.0),
+
+        # Async read path (async_app.py): connections shared by all coroutines
+        # of one process. Requests beyond this wait without holding a thread.
+        'ASYNC_DB_POOL_SIZE': env_int('ASYNC_DB_POOL_SIZE', 20),
+    }
@@ -1,22 +1,393 @@
 import mysql.connector
+from mysql.connector import pooling
+from collections import OrderedDict
+from contextlib import contextmanager
+import contextvars
 import os
+import logging
+import threading
+import time
+import weakref
 
-# This function connects to the MySQL database and returns the connection object.
-def get_db_connection():
+import db_sqlite
+import queries
+
+# --- CONNECTION POOLS ---
+# Connection settings are supplied by create_app() through init_db().
+# Pools are created lazily and are tied to the process that created them,
+# so a pool opened in a gunicorn master (--preload) is never shared with the
+# forked workers: every worker opens its own pools on first use / warm-up.
+#
+# Two pools exist:
+#   'primary' - every write, and any read that must see the latest writes
+#   'replica' - read-only traffic (reports, self-service pages), only when
+#               DB_REPLICA_HOST is set. Falls back to the primary otherwise.
+#
+# Trying it locally with two MySQL instances (e.g. ports 3306 and 3307, the
+# second one a replica of the first or just a copy of the schema):
+#   DB_PORT=3306 DB_REPLICA_HOST=127.0.0.1 DB_REPLICA_PORT=3307 python app.py
+# Every response carries an X-DB-Route header saying which pool served it.
+#
+# With DB_SHARDS set (see shards.py) there is one more pool per shard node,
+# named 'shard:<name>'; use_shard() routes get_db_connection() to it.
+#
+# DB_BACKEND=sqlite swaps MySQL for an in-memory SQLite database in the same
+# process (db_sqlite.py): the 'primary' entry is then that database and every
+# connection is a SQLiteConnection. No replica and no shards in that mode.
+PRIMARY = 'primary'
+REPLICA = 'replica'
+SHARD_PREFIX = 'shard:'
+MYSQL = 'mysql'
+SQLITE = 'sqlite'
+
+log = logging.getLogger(__name__)
+
+_pool_settings = {}
+_pools = {}
+_backend = {'name': MYSQL, 'sqlite_path': ':memory:'}
+_pool_lock = threading.Lock()
+
+# Set by use_replica(); read by get_db_connection() in the same thread/task
+_read_only_scope = contextvars.ContextVar('read_only_scope', default=False)
+# Set by use_shard(); takes precedence over the replica scope
+_shard_scope = contextvars.ContextVar('shard_scope', default=None)
+
+
+def init_db(config):
+    """Stores the connection settings from the app config. Does not connect."""
+    backend = config.get('DB_BACKEND', MYSQL)
+    if backend not in (MYSQL, SQLITE):
+        raise ValueError(f"DB_BACKEND must be '{MYSQL}' or '{SQLITE}', got {backend!r}")
+    if backend == MYSQL and config.get('DB_PASSWORD') is None:
+        raise RuntimeError("DB_PASSWORD is not set. Set it in the environment (DB_PASSWORD='' for no password).")
+    with _pool_lock:
+        _close_sqlite()
+        _pool_settings.clear()
+        _pools.clear()
+        _backend.update(name=backend, sqlite_path=config.get('DB_SQLITE_PATH', ':memory:'))
+        _pool_settings[PRIMARY] = {
+            'host': config['DB_HOST'],
+            'port': config['DB_PORT'],
+            'user': config['DB_USER'],
+            'password': config['DB_PASSWORD'],
+            'database': config['DB_NAME'],
+            'pool_name': config['DB_POOL_NAME'],
+            'pool_size': config['DB_POOL_SIZE'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+        }
+        # Server-side prepared statements are a MySQL feature
+        _statement_settings['enabled'] = config.get('DB_PREPARED_STATEMENTS', False) and backend == MYSQL
+        _statement_settings['size'] = config.get('DB_STATEMENT_CACHE_SIZE', 32)
+        if config.get('DB_REPLICA_HOST') and backend == MYSQL:
+            _pool_settings[REPLICA] = {
+                'host': config['DB_REPLICA_HOST'],
+                'port': config['DB_REPLICA_PORT'],
+                'user': config['DB_REPLICA_USER'] or config['DB_USER'],
+                'password': config['DB_REPLICA_PASSWORD'] or config['DB_PASSWORD'],
+                'database': config['DB_REPLICA_NAME'] or config['DB_NAME'],
+                'pool_name': config['DB_POOL_NAME'] + '_replica',
+                'pool_size': config['DB_REPLICA_POOL_SIZE'],
+                'pool_timeout': config['DB_POOL_TIMEOUT'],
+            }
+
+
+def has_replica():
+    return REPLICA in _pool_settings
+
+
+def backend_name():
+    return _backend['name']
+
+
+def _close_sqlite():
+    entry = _pools.get(PRIMARY)
+    if _backend['name'] == SQLITE and entry is not None and entry[1] == os.getpid():
+        entry[0].close()
+
+
+def _get_sqlite():
+    """This process's SQLite database, opened on first use like a pool."""
+    if PRIMARY not in _pool_settings:
+        raise RuntimeError("Database is not configured. Call init_db() (create_app does this).")
+    pid = os.getpid()
+    entry = _pools.get(PRIMARY)
+    if entry is not None and entry[1] == pid:
+        return entry[0]
+    with _pool_lock:
+        entry = _pools.get(PRIMARY)
+        if entry is None or entry[1] != pid:
+            entry = (db_sqlite.open_database(_backend['sqlite_path']), pid)
+            _pools[PRIMARY] = entry
+    return entry[0]
+
+
+def configure_shard_pools(shard_settings):
+    """Registers one pool per shard: {name: settings like init_db's}. Called by shards.init_shards()."""
+    if shard_settings and _backend['name'] == SQLITE:
+        raise RuntimeError("DB_SHARDS needs DB_BACKEND=mysql: shards commit with XA transactions")
+    with _pool_lock:
+        for role in [role for role in _pool_settings if role.startswith(SHARD_PREFIX)]:
+            del _pool_settings[role]
+            _pools.pop(role, None)
+        for name, settings in shard_settings.items():
+            _pool_settings[SHARD_PREFIX + name] = dict(settings)
+
+
+def _get_pool(role):
+    if role not in _pool_settings:
+        raise RuntimeError("Database is not configured. Call init_db() (create_app does this).")
+    pid = os.getpid()
+    entry = _pools.get(role)
+    if entry is not None and entry[1] == pid:
+        return entry[0]
+    with _pool_lock:
+        entry = _pools.get(role)
+        if entry is None or entry[1] != pid:
+            settings = _pool_settings[role]
+            pool = pooling.MySQLConnectionPool(
+                pool_name=settings['pool_name'],
+                pool_size=settings['pool_size'],
+                # Resetting the session would deallocate the cached prepared statements
+                pool_reset_session=not _statement_settings['enabled'],
+                host=settings['host'],
+                port=settings['port'],
+                user=settings['user'],
+                password=settings['password'],
+                database=settings['database'],
+            )
+            entry = (pool, pid)
+            _pools[role] = entry
+    return entry[0]
+
+
+def warm_up_pool():
     """
-    Establishes a connection to the MySQL database.
-    You MUST update the user and password to match your MySQL setup.
+    Opens the pools (which connects all pool_size connections) and checks one
+    connection per pool with a ping. Called at worker start so the first
+    requests do not pay the connection cost. Returns True if the primary is reachable.
     """
+    ok = True
+    for role in list(_pool_settings):
+        start = time.perf_counter()
+        conn = _connect(role)
+        if conn is None:
+            ok = ok and role != PRIMARY
+            continue
+        try:
+            conn.ping(reconnect=True)
+        finally:
+            conn.close()
+        log.info("Connection pool '%s' warmed up in %.1f ms (pid %s)", role, (time.perf_counter() - start) * 1000, os.getpid())
+    return ok
+
+
+@contextmanager
+def use_replica(enabled=True):
+    """Within this block get_db_connection() hands out replica connections (if configured)."""
+    token = _read_only_scope.set(enabled)
+    try:
+        yield
+    finally:
+        _read_only_scope.reset(token)
+
+
+@contextmanager
+def use_shard(name):
+    """Within this block get_db_connection() hands out connections to shard `name` (None: the primary)."""
+    token = _shard_scope.set(name)
     try:
-        conn = mysql.connector.connect(
-            host='localhost',          # Your database server address (usually localhost)
-            user='root',               # Your MySQL username (often 'root')
-            password='Vinush@7022',  # !!! REPLACE WITH YOUR MYSQL PASSWORD !!!
-            database='employee_salary_db' # The name of the database we created
-        )
-        print("MySQL Database connection successful")
-        return conn
+        yield
+    finally:
+        _shard_scope.reset(token)
+
+
+def current_shard():
+    return _shard_scope.get()
+
+
+def get_shard_connection(name):
+    """A pooled connection to shard `name`, or None if that node is unavailable."""
+    return _connect(SHARD_PREFIX + name)
+
+
+def open_connection(role=PRIMARY):
+    """
+    A dedicated autocommit connection outside the pools, for background threads
+    that hold one for a long time (outbox.py). Returns None if unavailable.
+    """
+    settings = _pool_settings.get(role)
+    if settings is None:
+        raise RuntimeError("Database is not configured. Call init_db() (create_app does this).")
+    if _backend['name'] == SQLITE:
+        return _get_sqlite().connection(autocommit=True)
+    try:
+        return mysql.connector.connect(host=settings['host'], port=settings['port'], user=settings['user'],
+                                       password=settings['password'], database=settings['database'], autocommit=True)
+    except mysql.connector.Error as e:
+        log.error("Error connecting to MySQL Database (%s): %s", role, e)
+        return None
+
+
+def _connect(role):
+    if _backend['name'] == SQLITE:
+        return _get_sqlite().connection()
+    try:
+        pool = _get_pool(role)
     except mysql.connector.Error as e:
-        print(f"Error connecting to MySQL Database: {e}")
+        log.error("Error connecting to MySQL Database (%s): %s", role, e)
+        return None
+
+    deadline = time.monotonic() + _pool_settings[role]['pool_timeout']
+    delay = 0.005
+    while True:
+        try:
+            conn = pool.get_connection()
+            if _statement_settings['enabled']:
+                # Without the session reset a returned connection may still be
+                # inside the previous request's transaction (and its snapshot)
+                conn.rollback()
+            return conn
+        except mysql.connector.errors.PoolError as e:
+            # Pool exhausted: back off briefly and retry until the deadline
+            if time.monotonic() >= deadline:
+                log.warning("Timed out waiting for a pooled MySQL connection (%s): %s", role, e)
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        except mysql.connector.Error as e:
+            log.error("Error connecting to MySQL Database (%s): %s", role, e)
+            return None
+
+
+# This function gets a pooled connection to the MySQL database.
+# conn.close() returns the connection to the pool instead of disconnecting.
+def get_db_connection(read_only=None):
+    """
+    Returns a connection from the pool, or None if the database is unavailable.
+    Waits up to DB_POOL_TIMEOUT seconds when every pooled connection is in use.
+
+    read_only=True (or being inside use_replica()) selects the replica pool when
+    one is configured; if the replica is unreachable the primary is used.
+    Inside use_shard() the connection is to that shard's node instead.
+    """
+    shard = _shard_scope.get()
+    if shard is not None:
+        return get_shard_connection(shard)
+    if read_only is None:
+        read_only = _read_only_scope.get()
+    if read_only and has_replica():
+        conn = _connect(REPLICA)
+        if conn is not None:
+            return conn
+        log.warning("Replica unavailable, falling back to primary for read")
+    return _connect(PRIMARY)
+
+
+# --- PREPARED STATEMENT CACHE ---
+# With DB_PREPARED_STATEMENTS on, the fixed statements of queries.py that go
+# through fetch_one() / fetch_all() are prepared once per pooled connection
+# (COM_STMT_PREPARE) and afterwards only executed with new parameters, so the
+# server does not parse it again. Any other SQL (IN lists sized to their ids,
+# filters appended per request) runs as plain text: every shape would be a new
+# statement evicting the hot ones. Every connection keeps its
+# DB_STATEMENT_CACHE_SIZE most recently used statements; closing an evicted
+# one deallocates it on the server. Prepared statements belong to the server
+# session, so the pools stop resetting sessions on return while this is on and
+# _connect() rolls back instead. With the setting off both helpers just run
+# the query on a plain buffered cursor.
+_statement_settings = {'enabled': False, 'size': 32}
+_statement_caches = weakref.WeakKeyDictionary()  # raw connection -> StatementCache
+_statement_lock = threading.Lock()
+_statement_counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+# The module-level SQL strings of queries.py, the only statements worth preparing
+_PREPARABLE = frozenset(value for name, value in vars(queries).items() if name.isupper() and isinstance(value, str))
+
+
+def _count(name):
+    with _statement_lock:
+        _statement_counters[name] += 1
+
+
+class StatementCache:
+    """LRU of prepared dictionary cursors for one connection, one cursor per statement."""
+
+    def __init__(self, cnx, size):
+        self._cnx = cnx
+        self._size = size
+        self._connection_id = cnx.connection_id
+        self._cursors = OrderedDict()  # sql -> (the sql object first used, cursor)
+
+    def _cursor(self, sql):
+        if self._cnx.connection_id != self._connection_id:
+            # Reconnected: the server forgot every statement of the old session
+            self._cursors.clear()
+            self._connection_id = self._cnx.connection_id
+            _count('invalidations')
+        entry = self._cursors.get(sql)
+        if entry is not None:
+            self._cursors.move_to_end(sql)
+            _count('hits')
+            return entry
+        _count('misses')
+        entry = self._cursors[sql] = (sql, self._cnx.cursor(prepared=True, dictionary=True))
+        if len(self._cursors) > self._size:
+            _, (_, evicted) = self._cursors.popitem(last=False)
+            _count('evictions')
+            try:
+                evicted.close()
+            except mysql.connector.Error:
+                pass
+        return entry
+
+    def fetch_all(self, sql, params=()):
+        # The prepared cursor only reuses its statement when handed the very
+        # same string object, so always pass the one it was prepared with
+        prepared_sql, cursor = self._cursor(sql)
+        cursor.execute(prepared_sql, params)
+        return cursor.fetchall()
+
+
+def _raw_connection(conn):
+    return getattr(conn, '_cnx', conn)  # PooledMySQLConnection wraps the real one
+
+
+def statement_cache(conn):
+    """The connection's StatementCache, or None when prepared statements are off."""
+    if not _statement_settings['enabled']:
         return None
+    cnx = _raw_connection(conn)
+    cache = _statement_caches.get(cnx)
+    if cache is None:
+        cache = StatementCache(cnx, _statement_settings['size'])
+        with _statement_lock:
+            _statement_caches[cnx] = cache
+    return cache
+
+
+def fetch_all(conn, sql, params=()):
+    """All rows (dicts) of a read; a queries.py statement is prepared and cached per connection when enabled."""
+    cache = statement_cache(conn) if sql in _PREPARABLE else None
+    if cache is not None:
+        return cache.fetch_all(sql, params)
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def fetch_one(conn, sql, params=()):
+    """First row (dict) of a read or None; the rest is discarded."""
+    rows = fetch_all(conn, sql, params)
+    return rows[0] if rows else None
+
 
+def statement_cache_stats():
+    with _statement_lock:
+        stats = dict(_statement_counters)
+        connections = len(_statement_caches)
+    lookups = stats['hits'] + stats['misses']
+    stats.update(enabled=_statement_settings['enabled'], size=_statement_settings['size'], connections=connections,
+                 hit_rate=round(stats['hits'] / lookups, 4) if lookups else None)
+    return stats
@@ -0,0 +1,123 @@
+import asyncio
+import mysql.connector
+from mysql.connector import aio as mysql_aio
+
+# --- ASYNC CONNECTION POOL (mysql.connector.aio) ---
+# Used by the async read path (async_app.py). A request waiting on MySQL only
+# holds a coroutine, not a thread, so one process can keep thousands of
+# dashboard requests in flight while at most `size` queries hit the server.
+
+
+class AsyncConnectionPool:
+    """
+    Small asyncio pool on top of mysql.connector.aio.connect().
+    Callers wait (up to `timeout` seconds) for a free connection instead of
+    failing when all connections are busy.
+    """
+
+    def __init__(self, size, timeout, **connect_args):
+        self.size = size
+        self.timeout = timeout
+        # Every statement is its own transaction, so reads always see fresh data
+        self.connect_args = dict(connect_args, autocommit=True)
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+
+    async def open(self, warm=True):
+        """Opens all connections up front so the first requests do not pay for them."""
+        if not warm:
+            return
+        conns = []
+        for _ in range(self.size):
+            conns.append(await mysql_aio.connect(**self.connect_args))
+        self._idle.extend(conns)
+
+    async def close(self):
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for cnx in idle:
+            try:
+                await cnx.close()
+            except mysql.connector.Error:
+                pass
+
+    async def acquire(self):
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise mysql.connector.errors.PoolError("Timed out waiting for a pooled MySQL connection")
+        try:
+            if self._idle:
+                return self._idle.pop()
+            return await mysql_aio.connect(**self.connect_args)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, cnx, discard=False):
+        try:
+            if discard or self._closed:
+                try:
+                    await cnx.close()
+                except mysql.connector.Error:
+                    pass
+            else:
+                self._idle.append(cnx)
+        finally:
+            self._slots.release()
+
+    async def _run(self, query, params, fetch_one):
+        cnx = await self.acquire()
+        discard = False
+        try:
+            cursor = await cnx.cursor(dictionary=True)
+            try:
+                await cursor.execute(query, params or ())
+                # Always read the full result so the connection can be reused
+                rows = await cursor.fetchall()
+                if fetch_one:
+                    return rows[0] if rows else None
+                return rows
+            finally:
+                await cursor.close()
+        except (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError):
+            # Broken connection: do not hand it to the next request
+            discard = True
+            raise
+        finally:
+            await self.release(cnx, discard=discard)
+
+    async def fetch_all(self, query, params=None):
+        return await self._run(query, params, fetch_one=False)
+
+    async def fetch_one(self, query, params=None):
+        return await self._run(query, params, fetch_one=True)
+
+
+def create_async_pool(config):
+    """Builds the async primary pool from the same app config as the sync pool in db.py."""
+    return AsyncConnectionPool(
+        size=config['ASYNC_DB_POOL_SIZE'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        host=config['DB_HOST'],
+        port=config['DB_PORT'],
+        user=config['DB_USER'],
+        password=config['DB_PASSWORD'],
+        database=config['DB_NAME'],
+    )
+
+
+def create_async_replica_pool(config):
+    """Builds the async replica pool, or returns None when no replica is configured."""
+    if not config.get('DB_REPLICA_HOST'):
+        return None
+    return AsyncConnectionPool(
+        size=config['ASYNC_DB_POOL_SIZE'],
+        timeout=config['DB_POOL_TIMEOUT'],
+        host=config['DB_REPLICA_HOST'],
+        port=config['DB_REPLICA_PORT'],
+        user=config['DB_REPLICA_USER'] or config['DB_USER'],
+        password=config['DB_REPLICA_PASSWORD'] or config['DB_PASSWORD'],
+        database=config['DB_REPLICA_NAME'] or config['DB_NAME'],
+    )
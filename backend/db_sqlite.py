@@ -0,0 +1,391 @@
+"""
+In-memory SQLite backend for the data-access layer (db.py), for tests and
+benchmarks: DB_BACKEND=sqlite runs the app against one SQLite database in
+the same process instead of MySQL, with no server to set up.
+
+    DB_BACKEND=sqlite python app.py                       # empty database, schema applied
+    DB_BACKEND=sqlite DB_SQLITE_PATH=/tmp/esms.db python app.py
+
+Every create_app() (init_db) starts a fresh database from
+sql/sqlite_schema.sql unless DB_SQLITE_PATH names an existing file.
+
+The routes run unchanged: get_db_connection() and open_connection() return
+SQLiteConnection objects that behave like mysql-connector's for what the app
+uses (cursor(dictionary=True, buffered=True), commit, rollback, lastrowid,
+rowcount), raise mysql.connector errors with MySQL's errno (1062 duplicate
+key, 1452 foreign key, ...) and translate the app's MySQL statements:
+
+    %s placeholders                -> ?
+    ON DUPLICATE KEY UPDATE ...    -> ON CONFLICT DO UPDATE SET ..., VALUES(c) -> excluded.c
+    GREATEST / LEAST               -> MAX / MIN
+    FOR UPDATE, LOCK IN SHARE MODE -> dropped (see locking below)
+    NOW(), DATE_FORMAT(), GET_LOCK(), RELEASE_LOCK() -> Python functions
+
+All connections share one SQLite connection. A transaction takes a process
+wide lock at its first statement and keeps it until commit / rollback /
+close, so transactions run one at a time: that serialisation is what row
+locks give the app on MySQL. A second connection opened by the same thread
+while the first is in a transaction nests in it as a savepoint.
+
+Not supported: DB_SHARDS (XA transactions), a replica, the async app
+(db_async.py) and the MySQL-only maintenance CLIs (migrate.py, archive.py
+partitions, outbox.py prune). rowcount counts matched rows where MySQL
+counts changed ones, and an upsert reports 1 whether it inserted or updated.
+"""
+import datetime
+import decimal
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from mysql.connector import errors
+
+log = logging.getLogger(__name__)
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'sqlite_schema.sql')
+
+# Seconds a transaction waits for the one before it, like innodb_lock_wait_timeout
+LOCK_WAIT_TIMEOUT = 10.0
+
+_DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}(\.\d{1,6})?$')
+
+
+# --- TYPES ---
+
+def _to_date(value):
+    try:
+        return datetime.date.fromisoformat(value.decode()[:10])
+    except ValueError:
+        return value.decode()
+
+
+def _to_datetime(value):
+    try:
+        return datetime.datetime.fromisoformat(value.decode())
+    except ValueError:
+        return value.decode()
+
+
+def _to_decimal(value):
+    try:
+        return decimal.Decimal(value.decode())
+    except decimal.InvalidOperation:
+        return value.decode()
+
+
+sqlite3.register_adapter(datetime.date, lambda value: value.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda value: value.isoformat(sep=' '))
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter('DATE', _to_date)
+sqlite3.register_converter('DATETIME', _to_datetime)
+sqlite3.register_converter('TIMESTAMP', _to_datetime)
+sqlite3.register_converter('DECIMAL', _to_decimal)
+
+
+def _value(value):
+    # Expressions have no declared type; NOW(3) - created_at needs a datetime
+    if isinstance(value, str) and _DATETIME_RE.match(value):
+        return datetime.datetime.fromisoformat(value)
+    return value
+
+
+# --- MYSQL FUNCTIONS ---
+
+_DATE_FORMATS = {'Y': '%Y', 'y': '%y', 'm': '%m', 'c': '{month}', 'd': '%d', 'e': '{day}', 'M': '%B', 'b': '%b',
+                 'H': '%H', 'h': '%I', 'i': '%M', 's': '%S', 'S': '%S', 'p': '%p', 'j': '%j', 'W': '%A', 'a': '%a',
+                 'f': '%f', 'T': '%H:%M:%S'}
+
+
+def _now(precision=0):
+    now = datetime.datetime.now()
+    if not precision:
+        return now.strftime('%Y-%m-%d %H:%M:%S')
+    return now.strftime('%Y-%m-%d %H:%M:%S.%f')[:20 + min(int(precision), 6)]
+
+
+def _date_format(value, fmt):
+    """MySQL's DATE_FORMAT: %i is minutes, %% a literal %, unknown %x is x."""
+    if value is None or fmt is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value if len(value) > 10 else value + ' 00:00:00')
+    out = []
+    chars = iter(fmt)
+    for char in chars:
+        if char != '%':
+            out.append(char)
+            continue
+        spec = next(chars, '')
+        pattern = _DATE_FORMATS.get(spec)
+        if pattern is None:
+            out.append(spec)
+        else:
+            out.append(value.strftime(pattern.format(month=value.month, day=value.day)))
+    return ''.join(out)
+
+
+def _create_functions(raw):
+    raw.create_function('NOW', -1, _now)
+    raw.create_function('DATE_FORMAT', 2, _date_format, deterministic=True)
+    # One process owns the database, so named locks are always free
+    raw.create_function('GET_LOCK', 2, lambda name, timeout: 1)
+    raw.create_function('RELEASE_LOCK', 1, lambda name: 1)
+
+
+# --- SQL TRANSLATION ---
+
+_LOCKING_READ_RE = re.compile(r'\s+(FOR\s+UPDATE|FOR\s+SHARE|LOCK\s+IN\s+SHARE\s+MODE)\s*$', re.IGNORECASE)
+_ON_DUPLICATE_RE = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+_VALUES_FUNCTION_RE = re.compile(r'\bVALUES\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+_FUNCTION_RENAMES = [(re.compile(r'\bGREATEST\s*\(', re.IGNORECASE), 'MAX('),
+                     (re.compile(r'\bLEAST\s*\(', re.IGNORECASE), 'MIN('),
+                     (re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE), 'INSERT OR IGNORE'),
+                     (re.compile(r'@@auto_increment_increment\b', re.IGNORECASE), '1')]
+_UNSUPPORTED_RE = re.compile(r'^\s*(XA\s|SET\s+@|ALTER\s+TABLE\s+\w+\s+(PARTITION|REORGANIZE|EXCHANGE))', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def translate(sql, with_params=True):
+    """The SQLite form of one of the app's MySQL statements."""
+    if _UNSUPPORTED_RE.match(sql):
+        raise errors.NotSupportedError(msg=f"Not supported by the SQLite backend: {sql.strip()[:60]}")
+    if with_params:
+        # Like mysql-connector, only substitute when there are parameters; %% is left alone
+        sql = sql.replace('%s', '?')
+    sql = _LOCKING_READ_RE.sub('', sql)
+    for pattern, replacement in _FUNCTION_RENAMES:
+        sql = pattern.sub(replacement, sql)
+    match = _ON_DUPLICATE_RE.search(sql)
+    if match:
+        tail = _VALUES_FUNCTION_RE.sub(r'excluded.\1', sql[match.end():])
+        sql = sql[:match.start()] + 'ON CONFLICT DO UPDATE SET' + tail
+    return sql
+
+
+# --- ERRORS ---
+
+_INTEGRITY_ERRNOS = [('UNIQUE', 1062, '23000'), ('PRIMARY KEY', 1062, '23000'), ('FOREIGN KEY', 1452, '23000'),
+                     ('NOT NULL', 1048, '23000'), ('CHECK', 3819, 'HY000')]
+
+
+def _mysql_error(e):
+    """The mysql.connector error the same failure raises on MySQL."""
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        for marker, errno, sqlstate in _INTEGRITY_ERRNOS:
+            if marker in message:
+                return errors.IntegrityError(msg=message, errno=errno, sqlstate=sqlstate)
+        return errors.IntegrityError(msg=message)
+    if isinstance(e, sqlite3.OperationalError):
+        if message.startswith('no such table'):
+            return errors.ProgrammingError(msg=message, errno=1146, sqlstate='42S02')
+        if message.startswith('no such column'):
+            return errors.ProgrammingError(msg=message, errno=1054, sqlstate='42S22')
+        if 'syntax error' in message:
+            return errors.ProgrammingError(msg=message, errno=1064, sqlstate='42000')
+        return errors.OperationalError(msg=message)
+    if isinstance(e, (sqlite3.ProgrammingError, sqlite3.InterfaceError)):
+        return errors.ProgrammingError(msg=message)
+    return errors.DatabaseError(msg=message)
+
+
+# --- DATABASE ---
+
+class SQLiteDatabase:
+    """One SQLite connection shared by every SQLiteConnection, and the lock that serialises transactions."""
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        fresh = path == ':memory:' or not os.path.exists(path)
+        self.raw = sqlite3.connect(path, check_same_thread=False, isolation_level=None,
+                                   detect_types=sqlite3.PARSE_DECLTYPES)
+        self.raw.execute('PRAGMA foreign_keys = ON')
+        _create_functions(self.raw)
+        self.lock = threading.RLock()
+        self._local = threading.local()
+        if fresh:
+            with open(SCHEMA_FILE, encoding='utf-8') as f:
+                self.raw.executescript(f.read())
+            log.info("SQLite database %s created from %s", path, os.path.basename(SCHEMA_FILE))
+
+    def connection(self, autocommit=False):
+        return SQLiteConnection(self, autocommit)
+
+    def acquire(self):
+        if not self.lock.acquire(timeout=LOCK_WAIT_TIMEOUT):
+            raise errors.DatabaseError(msg="Lock wait timeout exceeded; try restarting transaction",
+                                       errno=1205, sqlstate='HY000')
+
+    def depth(self):
+        """Transactions this thread has open (the first is a BEGIN, the others savepoints)."""
+        return getattr(self._local, 'depth', 0)
+
+    def set_depth(self, depth):
+        self._local.depth = depth
+
+    def execute(self, sql, params):
+        try:
+            return self.raw.execute(sql, params)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def executemany(self, sql, seq_of_params):
+        try:
+            return self.raw.executemany(sql, seq_of_params)
+        except sqlite3.Error as e:
+            raise _mysql_error(e) from e
+
+    def close(self):
+        self.raw.close()
+
+
+class SQLiteConnection:
+    """A mysql-connector-like connection on the shared SQLiteDatabase."""
+
+    def __init__(self, database, autocommit=False):
+        self._db = database
+        self.autocommit = autocommit
+        self._savepoint = None  # None: no transaction; '': the outermost one; else a savepoint name
+        self._closed = False
+
+    @property
+    def in_transaction(self):
+        return self._savepoint is not None
+
+    def cursor(self, dictionary=False, buffered=None, prepared=None):
+        if self._closed:
+            raise errors.OperationalError(msg="MySQL Connection not available")
+        return SQLiteCursor(self, dictionary)
+
+    def start_transaction(self):
+        if self._savepoint is not None:
+            raise errors.ProgrammingError(msg="Transaction already in progress")
+        self._db.acquire()
+        depth = self._db.depth()
+        try:
+            if depth:
+                self._savepoint = f'sp_{depth}'
+                self._db.execute(f'SAVEPOINT {self._savepoint}', ())
+            else:
+                self._savepoint = ''
+                self._db.execute('BEGIN', ())
+        except Exception:
+            self._savepoint = None
+            self._db.lock.release()
+            raise
+        self._db.set_depth(depth + 1)
+
+    def _finish(self, outer, nested):
+        if self._savepoint is None:
+            return
+        try:
+            for statement in (outer if self._savepoint == '' else nested):
+                self._db.execute(statement.format(name=self._savepoint), ())
+        finally:
+            self._savepoint = None
+            self._db.set_depth(self._db.depth() - 1)
+            self._db.lock.release()
+
+    def commit(self):
+        self._finish(['COMMIT'], ['RELEASE SAVEPOINT {name}'])
+
+    def rollback(self):
+        self._finish(['ROLLBACK'], ['ROLLBACK TO SAVEPOINT {name}', 'RELEASE SAVEPOINT {name}'])
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if self._closed:
+            raise errors.InterfaceError(msg="Connection is closed")
+
+    def is_connected(self):
+        return not self._closed
+
+    def close(self):
+        # Like a pooled MySQL connection going back to the pool: uncommitted work is rolled back
+        if not self._closed:
+            self.rollback()
+            self._closed = True
+
+    def run(self, method, sql, params):
+        """Runs one statement inside this connection's transaction (or alone when autocommit)."""
+        if self.autocommit:
+            self._db.acquire()
+            try:
+                return method(sql, params)
+            finally:
+                self._db.lock.release()
+        if self._savepoint is None:
+            self.start_transaction()
+        return method(sql, params)
+
+
+class SQLiteCursor:
+    """Buffered cursor: the rows are fetched while the statement holds the database."""
+
+    def __init__(self, connection, dictionary=False):
+        self._connection = connection
+        self._dictionary = dictionary
+        self._rows = []
+        self._position = 0
+        self.description = None
+        self.column_names = ()
+        self.rowcount = -1
+        self.lastrowid = None
+        self.statement = None
+
+    def _execute(self, method, sql, params):
+        self.statement = sql
+        raw = self._connection.run(method, translate(sql, bool(params)), params or ())
+        self.lastrowid = raw.lastrowid
+        self.description = raw.description
+        if raw.description is None:
+            self._rows = []
+            self.column_names = ()
+            self.rowcount = raw.rowcount
+        else:
+            self.column_names = tuple(column[0] for column in raw.description)
+            rows = [tuple(_value(value) for value in row) for row in raw.fetchall()]
+            self._rows = [dict(zip(self.column_names, row)) for row in rows] if self._dictionary else rows
+            self.rowcount = len(self._rows)
+        self._position = 0
+        raw.close()
+
+    def execute(self, sql, params=None):
+        self._execute(self._connection._db.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        if not seq_of_params:
+            return
+        self._execute(self._connection._db.executemany, sql, seq_of_params)
+
+    def fetchone(self):
+        if self._position >= len(self._rows):
+            return None
+        row = self._rows[self._position]
+        self._position += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._position:]
+        self._position = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._rows = []
+        return True
+
+
+def open_database(path=':memory:'):
+    """A new SQLiteDatabase; ':memory:' (and a path that does not exist yet) starts from the schema file."""
+    return SQLiteDatabase(path)
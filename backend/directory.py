@@ -0,0 +1,303 @@
+"""
+In-process employee directory: id, name, department, base_salary, user_id and
+employee_class of every employee, for the routes that read Employee only for
+an existence check, a name or the base salary. Permission checks and deletes
+read the row from the database instead (see Freshness).
+
+Columns are typed arrays sorted by employee_id (lookup is a binary search);
+department and class are indexes into one table of distinct labels and names
+live in one UTF-8 buffer. That is 25 bytes per employee plus the name, so
+1M employees take about 40 MB per worker process instead of the ~430 MB of a
+dict of row dicts (`python benchmarks/directory.py --dicts` measures both).
+
+Freshness:
+  * Each worker loads the directory in a background thread after its outbox
+    consumer (outbox.py) is in place; until then every lookup is a miss.
+  * Employee change events from the outbox drop the entry in every worker;
+    the write routes also drop it in their own worker right after the commit.
+    Other workers serve the old values until their consumer delivers the
+    event: about OUTBOX_POLL_SECONDS, but longer while a gap in the event ids
+    is held by an open transaction, or up to OUTBOX_GAP_TIMEOUT when the
+    consumer cannot see the transactions (outbox.py).
+  * A miss reads the row through the route's connection and stores it, unless
+    an invalidation happened meanwhile (the generation check) or the read
+    came from the replica, which may lag.
+Without the outbox consumer (OUTBOX_CONSUMER_ENABLED off) other workers'
+writes would go unnoticed, so the directory stays off too.
+"""
+import array
+import bisect
+import heapq
+import logging
+import os
+import threading
+import time
+
+import outbox
+import queries
+import shards
+from db import fetch_one
+
+log = logging.getLogger(__name__)
+
+FIELDS = ('employee_id', 'name', 'department', 'base_salary', 'user_id', 'employee_class')
+
+# users.id starts at 1, so 0 marks an employee without a linked account
+_NO_USER = 0
+_LOAD_RETRY_SECONDS = 30
+
+
+class Directory:
+    """The arrays. Not thread-safe on its own; the module functions lock around it."""
+
+    def __init__(self):
+        self.ids = array.array('i')
+        self.base_salaries = array.array('d')
+        self.user_ids = array.array('i')
+        self.departments = array.array('H')
+        self.classes = array.array('H')
+        self.name_offsets = array.array('I')
+        self.name_lengths = array.array('H')
+        self.names = bytearray()
+        self.stale_name_bytes = 0
+        self.labels = []
+        self._label_index = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _label(self, value):
+        index = self._label_index.get(value)
+        if index is None:
+            index = self._label_index[value] = len(self.labels)
+            self.labels.append(value)
+        return index
+
+    def _index(self, employee_id):
+        i = bisect.bisect_left(self.ids, employee_id)
+        return i if i < len(self.ids) and self.ids[i] == employee_id else -1
+
+    def get(self, employee_id):
+        i = self._index(employee_id)
+        if i < 0:
+            return None
+        offset = self.name_offsets[i]
+        user_id = self.user_ids[i]
+        return {'employee_id': employee_id, 'name': self.names[offset:offset + self.name_lengths[i]].decode(),
+                'department': self.labels[self.departments[i]], 'base_salary': self.base_salaries[i],
+                'user_id': None if user_id == _NO_USER else user_id, 'employee_class': self.labels[self.classes[i]]}
+
+    def append(self, employee_id, name, department, base_salary, user_id, employee_class):
+        """Adds an employee with a higher id than every stored one (loading)."""
+        encoded = name.encode()
+        self.ids.append(employee_id)
+        self.base_salaries.append(float(base_salary or 0.0))
+        self.user_ids.append(user_id or _NO_USER)
+        self.departments.append(self._label(department))
+        self.classes.append(self._label(employee_class))
+        self.name_offsets.append(len(self.names))
+        self.name_lengths.append(len(encoded))
+        self.names += encoded
+
+    def put(self, row):
+        """Adds or replaces one employee (a dict with FIELDS)."""
+        employee_id = row['employee_id']
+        if not self.ids or employee_id > self.ids[-1]:
+            self.append(*(row[field] for field in FIELDS))
+            return
+        i = bisect.bisect_left(self.ids, employee_id)
+        encoded = row['name'].encode()
+        if i < len(self.ids) and self.ids[i] == employee_id:
+            self.stale_name_bytes += self.name_lengths[i]
+            self.base_salaries[i] = float(row['base_salary'] or 0.0)
+            self.user_ids[i] = row['user_id'] or _NO_USER
+            self.departments[i] = self._label(row['department'])
+            self.classes[i] = self._label(row['employee_class'])
+            self.name_offsets[i] = len(self.names)
+            self.name_lengths[i] = len(encoded)
+        else:
+            self.ids.insert(i, employee_id)
+            self.base_salaries.insert(i, float(row['base_salary'] or 0.0))
+            self.user_ids.insert(i, row['user_id'] or _NO_USER)
+            self.departments.insert(i, self._label(row['department']))
+            self.classes.insert(i, self._label(row['employee_class']))
+            self.name_offsets.insert(i, len(self.names))
+            self.name_lengths.insert(i, len(encoded))
+        self.names += encoded
+        if self.stale_name_bytes > len(self.names) // 2:
+            self._compact_names()
+
+    def remove(self, employee_id):
+        i = self._index(employee_id)
+        if i < 0:
+            return False
+        self.stale_name_bytes += self.name_lengths[i]
+        for column in (self.ids, self.base_salaries, self.user_ids, self.departments, self.classes, self.name_offsets, self.name_lengths):
+            del column[i]
+        return True
+
+    def _compact_names(self):
+        names = bytearray()
+        for i in range(len(self.ids)):
+            offset = self.name_offsets[i]
+            self.name_offsets[i] = len(names)
+            names += self.names[offset:offset + self.name_lengths[i]]
+        self.names = names
+        self.stale_name_bytes = 0
+
+    def memory_bytes(self):
+        arrays = (self.ids, self.base_salaries, self.user_ids, self.departments, self.classes, self.name_offsets, self.name_lengths)
+        return sum(column.itemsize * len(column) for column in arrays) + len(self.names) + sum(len(label) for label in self.labels)
+
+    @classmethod
+    def merged(cls, parts):
+        """One directory from several (one per shard), sorted by employee_id."""
+        parts = [part for part in parts if len(part)]
+        if len(parts) == 1:
+            return parts[0]
+        result = cls()
+        # Each part is sorted already (EMPLOYEE_DIRECTORY orders by id)
+        entries = heapq.merge(*(zip(part.ids, [n] * len(part), range(len(part))) for n, part in enumerate(parts)))
+        for employee_id, n, i in entries:
+            part = parts[n]
+            offset = part.name_offsets[i]
+            user_id = part.user_ids[i]
+            result.append(employee_id, part.names[offset:offset + part.name_lengths[i]].decode(),
+                          part.labels[part.departments[i]], part.base_salaries[i],
+                          None if user_id == _NO_USER else user_id, part.labels[part.classes[i]])
+        return result
+
+
+def load_rows(rows):
+    """A Directory from (FIELDS...) tuples sorted by employee_id."""
+    directory = Directory()
+    for row in rows:
+        directory.append(*row)
+    return directory
+
+
+# --- PROCESS STATE ---
+_settings = {'enabled': False}
+_lock = threading.Lock()
+_directory = None
+_generation = 0
+_invalidated_while_loading = None
+_loader_pid = None
+_counters = {'hits': 0, 'misses': 0, 'fills': 0, 'invalidations': 0, 'loads': 0, 'load_failures': 0}
+_last_load = {'seconds': None, 'at': None}
+
+
+def init_directory(config):
+    _settings['enabled'] = config['DIRECTORY_ENABLED'] and config['OUTBOX_CONSUMER_ENABLED']
+    if config['DIRECTORY_ENABLED'] and not config['OUTBOX_CONSUMER_ENABLED']:
+        log.warning("Employee directory disabled: it needs the outbox consumer (OUTBOX_CONSUMER_ENABLED)")
+    if _settings['enabled']:
+        outbox.subscribe('directory', _on_events, entities=[outbox.EMPLOYEE])
+
+
+def enabled():
+    return _settings['enabled']
+
+
+def _on_events(events):
+    for event in events:
+        invalidate(event.entity_id)
+
+
+def invalidate(employee_id):
+    global _generation
+    with _lock:
+        _generation += 1
+        _counters['invalidations'] += 1
+        if _directory is not None:
+            _directory.remove(employee_id)
+        if _invalidated_while_loading is not None:
+            _invalidated_while_loading.add(employee_id)
+
+
+def lookup(conn, employee_id, fill=True):
+    """
+    The employee's FIELDS as a dict, or None if there is no such employee. A
+    miss reads the row through `conn`; `fill=False` when `conn` may be stale
+    (a replica), so the row is not kept.
+    """
+    if _settings['enabled']:
+        with _lock:
+            entry = _directory.get(employee_id) if _directory is not None else None
+            _counters['hits' if entry is not None else 'misses'] += 1
+            generation = _generation
+        if entry is not None:
+            return entry
+    row = fetch_one(conn, queries.EMPLOYEE_DIRECTORY_ROW, (employee_id,))
+    if row is not None and fill and _settings['enabled']:
+        with _lock:
+            # Skipped if the row may already be outdated by a concurrent write
+            if generation == _generation and _directory is not None:
+                _directory.put(row)
+                _counters['fills'] += 1
+    return row
+
+
+# --- LOADING ---
+
+def ensure_loaded():
+    """Starts this process's load unless it is running or done. Cheap to call per request."""
+    global _loader_pid
+    pid = os.getpid()
+    if not _settings['enabled'] or _loader_pid == pid:
+        return
+    with _lock:
+        if _loader_pid == pid:
+            return
+        _loader_pid = pid
+    threading.Thread(target=_load_loop, name='directory-loader', daemon=True).start()
+
+
+def _load_part(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute(queries.EMPLOYEE_DIRECTORY)
+        return load_rows(cursor)
+    finally:
+        cursor.close()
+
+
+def _load_loop():
+    global _directory, _invalidated_while_loading
+    # Changes after this point reach _on_events, so the load can miss nothing
+    outbox.ensure_consumer()
+    while not outbox.delivering('directory'):
+        time.sleep(0.1)
+    while True:
+        start = time.perf_counter()
+        with _lock:
+            _invalidated_while_loading = set()
+        try:
+            loaded = Directory.merged(shards.scatter(_load_part).values())
+        except Exception as e:
+            with _lock:
+                _invalidated_while_loading = None
+                _counters['load_failures'] += 1
+            log.warning("Employee directory load failed, retrying in %ss: %s", _LOAD_RETRY_SECONDS, e)
+            time.sleep(_LOAD_RETRY_SECONDS)
+            continue
+        with _lock:
+            for employee_id in _invalidated_while_loading:
+                loaded.remove(employee_id)
+            _invalidated_while_loading = None
+            _directory = loaded
+            _counters['loads'] += 1
+            _last_load.update(seconds=round(time.perf_counter() - start, 3), at=time.time())
+        log.info("Employee directory loaded: %s employees, %.1f MB in %.2fs", len(loaded),
+                 loaded.memory_bytes() / 1e6, _last_load['seconds'])
+        return
+
+
+def directory_stats():
+    with _lock:
+        lookups = _counters['hits'] + _counters['misses']
+        return dict(_counters, enabled=_settings['enabled'], loaded=_directory is not None,
+                    employees=len(_directory) if _directory is not None else 0,
+                    memory_bytes=_directory.memory_bytes() if _directory is not None else 0,
+                    hit_rate=round(_counters['hits'] / lookups, 4) if lookups else None,
+                    load_seconds=_last_load['seconds'], loaded_at=_last_load['at'])
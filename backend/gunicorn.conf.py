@@ -0,0 +1,71 @@
+"""
+Production serving mode (gunicorn, pre-fork workers + threads).
+
+Usage (from the backend/ directory):
+
+    pip install gunicorn
+    export SECRET_KEY='<long random string>'
+    export DB_HOST=... DB_USER=... DB_PASSWORD=... DB_NAME=employee_salary_db
+    export CORS_ORIGINS='https://hr.example.com'
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+How it scales:
+  * GUNICORN_WORKERS processes (default: 2 x CPU cores + 1) spread the work
+    across cores; there is no debug reloader and no Werkzeug dev server.
+  * Each worker runs GUNICORN_THREADS threads (gthread worker), so a request
+    that waits on MySQL does not block the rest of its worker.
+  * The app is imported once in the master (preload_app) and forked, which
+    keeps worker cold start low. The DB pool is NOT opened in the master:
+    every worker opens and warms its own pool in post_worker_init.
+  * Keep DB_POOL_SIZE >= GUNICORN_THREADS so threads do not wait for a
+    connection, and keep workers x DB_POOL_SIZE below MySQL max_connections.
+
+Thread budget per worker: an admin's live leave queue (server-sent events,
+leave_feed.py) holds one thread for the whole stream, up to
+LEAVE_FEED_STREAM_SECONDS, and reconnects right away. The 'streams' entry of
+CONCURRENCY_LIMITS (default 1) caps that per worker, so with the default 4
+threads at least 3 stay free for API requests. A stream beyond that gets
+503 and the admin page falls back to refreshing after each action, trying
+live updates again 30 s later. To keep more admin pages live, add workers,
+or raise GUNICORN_THREADS together with the 'streams' limit, keeping streams
+at no more than a quarter of the threads.
+
+All settings are environment variables so containers can tune them without
+editing this file.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+# Import the app once in the master, then fork (fast worker start, shared pages)
+preload_app = True
+
+# Recycle workers now and then so slow leaks cannot build up
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '500'))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# The app writes its own structured access records (logging_setup.py, sampled
+# by LOG_SAMPLE_RATES) to stderr, so gunicorn's access log is off unless
+# GUNICORN_ACCESSLOG names a file or '-' (stdout)
+accesslog = os.environ.get('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # Runs in each worker after the fork: open this worker's own DB pool now
+    # instead of on the first request.
+    from db import warm_up_pool
+    if not warm_up_pool():
+        worker.log.warning("DB pool warm-up failed; connections will be retried per request.")
+    # The outbox consumer thread is per worker too (threads do not survive the fork)
+    from outbox import ensure_consumer
+    ensure_consumer()
@@ -0,0 +1,308 @@
+"""
+Leave ledger and balances (LeaveLedger / LeaveBalance, migration 0007).
+
+    cd backend
+    python leave.py accrue                          # this month's accrual for every employee
+    python leave.py accrue --month 2025-04-01
+    python leave.py accrue --fiscal-year 2025       # every month of FY2025 up to this month
+    python leave.py rebuild                         # recompute LeaveBalance from the ledger
+
+Every change to an employee's leave is a LeaveLedger entry: the monthly
+accrual (LEAVE_DAYS_PER_YEAR / 12, run `accrue` from cron on the 1st), an
+approved request (its working days, negative) or an admin adjustment. The
+LeaveBalance row of the employee and leave year is updated in the same
+transaction, so checking a request is one primary-key read. Leave years are
+the fiscal years (FISCAL_YEAR_START_MONTH); unused days do not carry over.
+
+Accruals of the current leave year that are due but not credited yet (a new
+hire, the months since the migration, a late cron run) are caught up for one
+employee by the writes: creating it, submitting or approving a request and
+adjusting a balance; `accrue` then skips them. Balance reads do not write:
+they count those days as `unbooked_accrual`. Rollout: apply migration 0007,
+deploy, then schedule the monthly `accrue`; `accrue --fiscal-year <current>`
+credits everyone at once instead of on first use.
+
+A submitted request reserves its working days in `pending` until it is
+approved (moved to `taken`) or denied (released). available = accrued +
+adjusted - taken - pending. With DB_SHARDS the tables live next to the
+employee on its shard; the CLI runs on every shard.
+"""
+import argparse
+import datetime
+import sys
+
+import archive
+import outbox
+import queries
+
+ACCRUAL = 'accrual'
+APPROVAL = 'approval'
+ADJUSTMENT = 'adjustment'
+
+BALANCE_FIELDS = ('accrued', 'adjusted', 'taken', 'pending')
+
+_settings = {'days_per_year': 24.0, 'enforce': True}
+
+
+def init_leave(config):
+    _settings['days_per_year'] = float(config['LEAVE_DAYS_PER_YEAR'])
+    _settings['enforce'] = config['LEAVE_ENFORCE_BALANCE']
+
+
+def enforced():
+    return _settings['enforce']
+
+
+def leave_year_of(day):
+    return archive.fiscal_year_of(day)
+
+
+def monthly_accrual():
+    return round(_settings['days_per_year'] / 12, 2)
+
+
+def available(row):
+    """Days left to request in a LeaveBalance row (None = no row yet)."""
+    if row is None:
+        return 0.0
+    return round(float(row['accrued']) + float(row['adjusted']) - float(row['taken']) - float(row['pending']), 2)
+
+
+def amounts(row):
+    """The balance fields of a LeaveBalance row (None = all zero) plus `available`."""
+    result = {field: float(row[field]) if row else 0.0 for field in BALANCE_FIELDS}
+    result['available'] = available(row)
+    return result
+
+
+def balance(row, employee_id, leave_year, unbooked=0.0):
+    """
+    A LeaveBalance row (or None) as returned by the API. `unbooked` accrual
+    (see unbooked_accrual) is counted in `accrued` and `available`.
+    """
+    start, end = archive.fiscal_year_bounds(leave_year)
+    result = {'employee_id': employee_id, 'leave_year': leave_year, 'period_start': start.isoformat(),
+              'period_end': (end - datetime.timedelta(days=1)).isoformat()}
+    result.update(amounts(row))
+    result['accrued'] = round(result['accrued'] + unbooked, 2)
+    result['available'] = round(result['available'] + unbooked, 2)
+    result['unbooked_accrual'] = unbooked
+    return result
+
+
+def _entry(cursor, employee_id, leave_year, kind, days, request_id=None, accrual_month=None, note=None, user_id=None):
+    cursor.execute(queries.INSERT_LEAVE_LEDGER, (employee_id, leave_year, kind, days, request_id, accrual_month, note, user_id))
+
+
+def _shift(cursor, employee_id, leave_year, accrued=0.0, adjusted=0.0, taken=0.0, pending=0.0):
+    cursor.execute(queries.UPSERT_LEAVE_BALANCE, (employee_id, leave_year, accrued, adjusted, taken, pending))
+
+
+# --- REQUESTS (called by the leave routes, inside their transaction) ---
+
+def balance_for_update(cursor, employee_id, leave_year):
+    """
+    The LeaveBalance row with the accruals due caught up, locked until the
+    caller commits (None if there is none yet).
+    """
+    catch_up(cursor, employee_id, leave_year)
+    cursor.execute(queries.LEAVE_BALANCE_FOR_UPDATE, (employee_id, leave_year))
+    return cursor.fetchone()
+
+
+def reserve(cursor, employee_id, leave_year, days):
+    _shift(cursor, employee_id, leave_year, pending=days)
+
+
+def release(cursor, employee_id, leave_year, days):
+    _shift(cursor, employee_id, leave_year, pending=-days)
+
+
+def approve(cursor, employee_id, leave_year, days, request_id, user_id, reserved=True):
+    """Books an approved request. `reserved` is False for requests from before the ledger."""
+    _entry(cursor, employee_id, leave_year, APPROVAL, -days, request_id=request_id, user_id=user_id)
+    _shift(cursor, employee_id, leave_year, taken=days, pending=-days if reserved else 0.0)
+
+
+def adjust(cursor, employee_id, leave_year, days, note, user_id):
+    _entry(cursor, employee_id, leave_year, ADJUSTMENT, days, note=note, user_id=user_id)
+    _shift(cursor, employee_id, leave_year, adjusted=days)
+    outbox.record(cursor, outbox.LEAVE_BALANCE, ADJUSTMENT, None, employee_id, {'leave_year': leave_year, 'days': days})
+
+
+# --- ACCRUAL ---
+
+def _month_end(month):
+    following = month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+    return following - datetime.timedelta(days=1)
+
+
+def _year_months(leave_year, until):
+    """First days of the months of `leave_year` up to `until`."""
+    month, end = archive.fiscal_year_bounds(leave_year)
+    months = []
+    while month < end and month <= until:
+        months.append(month)
+        month = _month_end(month) + datetime.timedelta(days=1)
+    return months
+
+
+def due_months(joining_date, leave_year, today=None):
+    """
+    The accrual months of `leave_year` due by `today` to an employee who joined
+    on `joining_date`. None for closed leave years: those are `accrue --fiscal-year`'s.
+    """
+    today = today or datetime.date.today()
+    if leave_year < leave_year_of(today):
+        return []
+    months = _year_months(leave_year, today)
+    return [month for month in months if joining_date is None or joining_date <= _month_end(month)]
+
+
+def unbooked_accrual(row, joining_date, leave_year):
+    """Days of `leave_year` due by today that a LeaveBalance row (or None) does not have yet; catch_up() books them."""
+    due = round(len(due_months(joining_date, leave_year)) * monthly_accrual(), 2)
+    missing = due - (float(row['accrued']) if row else 0.0)
+    return round(missing, 2) if missing > 0.005 else 0.0
+
+
+def _column(row, name):
+    return row[name] if isinstance(row, dict) else row[0]
+
+
+def catch_up(cursor, employee_id, leave_year):
+    """
+    Credits the accruals of `leave_year` that are due to one employee and not
+    booked yet, inside the caller's transaction; safe to run again. Returns
+    the days credited.
+    """
+    cursor.execute(queries.EMPLOYEE_JOINING_DATE, (employee_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return 0.0
+    months = due_months(_column(row, 'joining_date'), leave_year)
+    if not months:
+        return 0.0
+    # Locks the employee's accrual slots, so a concurrent catch-up waits and then skips them
+    cursor.execute(queries.LEAVE_ACCRUALS_FOR_UPDATE, (employee_id, leave_year))
+    done = {_column(entry, 'accrual_month') for entry in cursor.fetchall()}
+    missing = [month for month in months if month not in done]
+    if not missing:
+        return 0.0
+    days = monthly_accrual()
+    cursor.executemany(queries.INSERT_LEAVE_LEDGER, [(employee_id, leave_year, ACCRUAL, days, None, month, None, None)
+                                                     for month in missing])
+    credited = round(days * len(missing), 2)
+    _shift(cursor, employee_id, leave_year, accrued=credited)
+    outbox.record(cursor, outbox.LEAVE_BALANCE, ACCRUAL, None, employee_id, {'months': missing, 'days': days})
+    return credited
+
+
+def accrue_month(conn, month):
+    """
+    Credits `month`'s accrual to every employee who joined by its end and does
+    not have it yet; safe to run again. Commits per chunk of employees and
+    returns how many were credited.
+    """
+    month = month.replace(day=1)
+    leave_year = leave_year_of(month)
+    days = monthly_accrual()
+    cursor = conn.cursor(buffered=True)
+    try:
+        cursor.execute("SELECT employee_id FROM Employee WHERE joining_date IS NULL OR joining_date <= %s ORDER BY employee_id",
+                       (_month_end(month),))
+        employee_ids = [row[0] for row in cursor.fetchall()]
+        credited = 0
+        for chunk in queries.chunks(employee_ids):
+            # Locks the chunk's accrual slots, so a concurrent run waits and then skips them
+            cursor.execute(f"SELECT employee_id FROM LeaveLedger WHERE accrual_month = %s AND employee_id IN ({queries.placeholders(len(chunk))}) FOR UPDATE",
+                           (month, *chunk))
+            done = {row[0] for row in cursor.fetchall()}
+            new_ids = [employee_id for employee_id in chunk if employee_id not in done]
+            if new_ids:
+                cursor.executemany(queries.INSERT_LEAVE_LEDGER, [(employee_id, leave_year, ACCRUAL, days, None, month, None, None)
+                                                                 for employee_id in new_ids])
+                cursor.executemany(queries.UPSERT_LEAVE_BALANCE, [(employee_id, leave_year, days, 0.0, 0.0, 0.0) for employee_id in new_ids])
+                outbox.record(cursor, outbox.LEAVE_BALANCE, ACCRUAL, payload={'month': month, 'days': days, 'employee_ids': new_ids})
+            conn.commit()
+            credited += len(new_ids)
+        return credited
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def rebuild(conn):
+    """Recomputes every LeaveBalance row from the ledger and the pending requests."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM LeaveBalance")
+        cursor.execute("""
+            INSERT INTO LeaveBalance (employee_id, leave_year, accrued, adjusted, taken, pending)
+            SELECT employee_id, leave_year,
+                   SUM(CASE WHEN kind = %s THEN days ELSE 0 END),
+                   SUM(CASE WHEN kind = %s THEN days ELSE 0 END),
+                   -SUM(CASE WHEN kind = %s THEN days ELSE 0 END),
+                   0
+            FROM LeaveLedger
+            GROUP BY employee_id, leave_year
+        """, (ACCRUAL, ADJUSTMENT, APPROVAL))
+        cursor.execute("SELECT employee_id, start_date, leave_days FROM LeaveRequest WHERE status = 'pending' AND leave_days IS NOT NULL")
+        for employee_id, start_date, days in cursor.fetchall():
+            reserve(cursor, employee_id, leave_year_of(start_date), float(days))
+        cursor.execute("SELECT COUNT(*) FROM LeaveBalance")
+        rows = cursor.fetchone()[0]
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['accrue', 'rebuild'])
+    parser.add_argument('--month', help="accrue: this month (YYYY-MM-01) instead of the current one")
+    parser.add_argument('--fiscal-year', type=int, help="accrue: every month of this fiscal year up to the current month")
+    args = parser.parse_args()
+
+    import mysql.connector
+    import shards
+    from config import load_config
+    from db import init_db
+
+    config = load_config()
+    archive.init_archive(config)
+    init_leave(config)
+    init_db(config)
+    shards.init_shards(config)
+
+    today = datetime.date.today().replace(day=1)
+    if args.fiscal_year is not None:
+        months = _year_months(args.fiscal_year, today)
+    else:
+        try:
+            months = [datetime.date.fromisoformat(args.month).replace(day=1) if args.month else today]
+        except ValueError:
+            sys.exit("--month must be YYYY-MM-DD")
+
+    try:
+        if args.command == 'accrue':
+            for month in months:
+                credited = shards.scatter(lambda conn: accrue_month(conn, month))
+                print(f"{month:%Y-%m}: {sum(credited.values())} employee(s) credited {monthly_accrual()} day(s)")
+        else:
+            rows = shards.scatter(rebuild)
+            print(f"{sum(rows.values())} balance row(s) rebuilt")
+    except shards.ShardUnavailable as e:
+        sys.exit(str(e))
+    except mysql.connector.Error as e:
+        sys.exit(f"Database error: {e.msg}")
+
+
+if __name__ == '__main__':
+    main()
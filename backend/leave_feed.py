@@ -0,0 +1,199 @@
+"""
+Live leave request changes for the admin queue: GET /api/leave-requests/stream
+(server-sent events), fed by the outbox (outbox.py).
+
+Every worker keeps the last LEAVE_FEED_BUFFER LeaveRequest events it received
+from its outbox consumer. A stream sends one SSE event per change:
+
+    id: home:1042
+    event: created | approved | denied
+    data: {"request_id": 7, "employee_id": 3, "status": "pending", ...}
+
+The id is the stream's position on every database node ("home:1042", with
+DB_SHARDS "home:1042,a:311,b:95"). Outbox event ids are the same in every
+worker, so a client reconnecting to another worker resumes with Last-Event-ID
+(EventSource sends it; `?last_event_id=` works too). If the position is older
+than what the worker still has, or missing, the stream starts with `reset`
+(refetch the list, then apply what follows); a fresh stream starts with
+`ready`. Deltas are idempotent, so one arriving twice, or after the list
+already shows it, changes nothing.
+
+A stream holds a gthread thread (not a DB connection) for at most
+LEAVE_FEED_STREAM_SECONDS; the browser then reconnects and resumes. The
+number of streams per worker is capped by the 'streams' entry of
+CONCURRENCY_LIMITS (1 by default; see the thread budget in gunicorn.conf.py).
+"""
+import collections
+import datetime
+import json
+import threading
+import time
+
+import outbox
+
+NAME = 'leave-feed'
+
+_Delta = collections.namedtuple('_Delta', 'seq node event_id action data')
+
+_settings = {'enabled': False, 'buffer': 1000, 'stream_seconds': 300.0}
+_changed = threading.Condition()
+_buffer = collections.deque()
+_seq = 0
+_covered = None  # {node: event_id}: every later LeaveRequest event is in _buffer
+_latest = {}     # {node: event_id} of the newest buffered event
+_counters = {'received': 0, 'streams': 0, 'resumed': 0, 'resets': 0, 'sent': 0}
+
+_HEARTBEAT_SECONDS = 15
+_START_TIMEOUT = 5.0
+_RETRY_MS = 3000
+
+
+def init_leave_feed(config):
+    _settings.update(enabled=config['OUTBOX_CONSUMER_ENABLED'], buffer=config['LEAVE_FEED_BUFFER'],
+                     stream_seconds=config['LEAVE_FEED_STREAM_SECONDS'])
+    if _settings['enabled']:
+        outbox.subscribe(NAME, _on_events, entities=[outbox.LEAVE_REQUEST])
+
+
+def enabled():
+    return _settings['enabled']
+
+
+def _delta(event):
+    data = dict(event.payload or {})
+    data.update(request_id=event.entity_id, employee_id=event.employee_id, status=data.get('status', event.action),
+                changed_at=event.created_at.isoformat(sep=' ') if isinstance(event.created_at, datetime.datetime) else event.created_at)
+    return data
+
+
+def _on_events(events):
+    global _seq
+    with _changed:
+        for event in events:
+            if event.event_id <= _latest.get(event.node, 0):
+                continue  # redelivered
+            _seq += 1
+            _buffer.append(_Delta(_seq, event.node, event.event_id, event.action, _delta(event)))
+            _latest[event.node] = event.event_id
+            _counters['received'] += 1
+            while len(_buffer) > _settings['buffer']:
+                dropped = _buffer.popleft()
+                if _covered is not None:
+                    _covered[dropped.node] = max(_covered.get(dropped.node, 0), dropped.event_id)
+        _changed.notify_all()
+
+
+def _ensure_covered():
+    """True once this worker's consumer delivers LeaveRequest events on every node."""
+    global _covered
+    if _covered is not None:
+        return True
+    outbox.ensure_consumer()
+    deadline = time.monotonic() + _START_TIMEOUT
+    while time.monotonic() < deadline:
+        positions = outbox.subscriber_positions(NAME)
+        if positions is not None:
+            with _changed:
+                if _covered is None:
+                    # Everything delivered after these positions is (or will be) buffered
+                    _covered = dict(positions)
+            return True
+        time.sleep(0.1)
+    return False
+
+
+# --- STREAM IDS ---
+
+def format_position(position):
+    return ','.join(f"{node or 'home'}:{event_id}" for node, event_id in sorted(position.items(), key=lambda item: item[0] or ''))
+
+
+def parse_position(value):
+    """{node: event_id} from an SSE id; None without one, {} (resume nothing) if it is malformed."""
+    if not value:
+        return None
+    position = {}
+    try:
+        for item in value.split(','):
+            node, _, event_id = item.strip().rpartition(':')
+            position[None if node == 'home' else node] = int(event_id)
+    except ValueError:
+        return {}
+    return position
+
+
+def _message(event, data, position=None):
+    lines = []
+    if position is not None:
+        lines.append(f"id: {format_position(position)}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+# --- STREAMS ---
+
+def open_stream(last_event_id=None):
+    """
+    The SSE messages of one connection (a generator), or None while this
+    worker's outbox consumer is not delivering yet.
+    """
+    if not _settings['enabled'] or not _ensure_covered():
+        return None
+    return _stream(parse_position(last_event_id))
+
+
+def _stream(resume_from):
+    with _changed:
+        current = {node: max(event_id, _latest.get(node, 0)) for node, event_id in _covered.items()}
+        if resume_from is not None and all(resume_from.get(node, -1) >= event_id for node, event_id in _covered.items()):
+            position = dict(resume_from)
+            backlog = [delta for delta in _buffer if delta.event_id > position.get(delta.node, 0)]
+            opening = None
+            _counters['resumed'] += 1
+        else:
+            position = current
+            backlog = []
+            opening = 'ready' if resume_from is None else 'reset'
+            if opening == 'reset':
+                _counters['resets'] += 1
+        sent_seq = _seq
+        _counters['streams'] += 1
+        _counters['sent'] += len(backlog)
+
+    yield f"retry: {_RETRY_MS}\n\n"
+    if opening:
+        yield _message(opening, {}, position)
+    for delta in backlog:
+        position[delta.node] = delta.event_id
+        yield _message(delta.action, delta.data, position)
+
+    deadline = time.monotonic() + _settings['stream_seconds']
+    while time.monotonic() < deadline:
+        with _changed:
+            if _seq == sent_seq:
+                _changed.wait(min(_HEARTBEAT_SECONDS, max(0.0, deadline - time.monotonic())))
+            if _buffer and _buffer[0].seq > sent_seq + 1:
+                # Fell behind by more than the buffer holds
+                fresh = None
+                position = {node: max(event_id, _latest.get(node, 0)) for node, event_id in _covered.items()}
+                _counters['resets'] += 1
+            else:
+                # A resumed position can be ahead of this worker on some node
+                fresh = [delta for delta in _buffer if delta.seq > sent_seq and delta.event_id > position.get(delta.node, 0)]
+                _counters['sent'] += len(fresh)
+            sent_seq = _seq
+        if fresh is None:
+            yield _message('reset', {}, position)
+        elif fresh:
+            for delta in fresh:
+                position[delta.node] = delta.event_id
+                yield _message(delta.action, delta.data, position)
+        else:
+            yield ": keep-alive\n\n"
+
+
+def feed_stats():
+    with _changed:
+        return dict(_counters, enabled=_settings['enabled'], buffered=len(_buffer),
+                    covered_from=format_position(_covered) if _covered is not None else None)
@@ -0,0 +1,220 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request, session
+
+# --- NON-BLOCKING STRUCTURED LOGGING ---
+# Request threads only capture the record and drop it on a bounded in-memory
+# queue: they interpolate the message and render any traceback to text (the
+# args and frames belong to the request) and add the request id, route and
+# user. A background listener thread does the JSON / text formatting and
+# writes to stderr (stdout stays free for program output such as the
+# benchmarks' results). If the queue is full the record is dropped and counted
+# (logging_stats(), in /api/admin/runtime-stats), so logging can never stall a
+# request.
+#
+# Use the standard logging API everywhere:
+#     log = logging.getLogger(__name__)
+#     log.error("Error getting employee %s: %s", employee_id, e)
+# High-volume messages can be sampled by tagging them with a sample key that is
+# listed in LOG_SAMPLE_RATES, e.g. "access=0.1,auth.unauthorized=0.05":
+#     log.info("Login required: No user_id in session", extra=sample('auth.unauthorized'))
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+_queue = None
+_sample_rates = {}
+dropped_records = 0
+_dropped_lock = threading.Lock()
+
+access_log = logging.getLogger('access')
+
+
+def sample(key):
+    """`extra` for a log call whose volume is controlled by LOG_SAMPLE_RATES[key]."""
+    return {'sample_key': key}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, request context and extras."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and value is not None and key != 'sample_key':
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        elif record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines for local development (LOG_FORMAT=text)."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)-7s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        request_id = getattr(record, 'request_id', None)
+        return f"{line} [{request_id}]" if request_id else line
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a record tagged with sample_key with probability LOG_SAMPLE_RATES[key]."""
+
+    def filter(self, record):
+        key = getattr(record, 'sample_key', None)
+        if key is None:
+            return True
+        rate = _sample_rates.get(key, 1.0)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    Captures the record on the calling thread and enqueues it without blocking:
+    the message is interpolated and a traceback rendered to text here, and the
+    Flask request context (thread-local) is copied. Building the output line
+    and writing it happen on the listener thread.
+    """
+
+    def prepare(self, record):
+        # Freeze the message now: args may be mutable objects owned by the request
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks hold frames; render them here and drop the references
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if has_request_context():
+            if getattr(record, 'request_id', None) is None:
+                record.request_id = g.get('request_id')
+            if getattr(record, 'route', None) is None:
+                record.route = request.endpoint
+            if getattr(record, 'user', None) is None:
+                record.user = session.get('user_id')
+        return record
+
+    def enqueue(self, record):
+        global dropped_records
+        _ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _dropped_lock:
+                dropped_records += 1
+
+
+def _ensure_listener():
+    """(Re)starts the listener thread in this process; threads do not survive a fork."""
+    global _listener, _listener_pid
+    pid = os.getpid()
+    if _listener is not None and _listener_pid == pid:
+        return
+    with _listener_lock:
+        if _listener is not None and _listener_pid == pid:
+            return
+        _listener = QueueListener(_queue, *_output_handlers, respect_handler_level=False)
+        _listener.start()
+        _listener_pid = pid
+
+
+def _stop_listener():
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+
+
+_output_handlers = []
+
+
+def parse_sample_rates(spec):
+    rates = {}
+    for item in spec.split(','):
+        name, _, value = item.strip().partition('=')
+        if name:
+            rates[name.strip()] = float(value or 1.0)
+    return rates
+
+
+def configure_logging(config):
+    """Routes the root logger through the queue handler. Safe to call more than once."""
+    global _queue, _listener
+    _sample_rates.clear()
+    _sample_rates.update(parse_sample_rates(config['LOG_SAMPLE_RATES']))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, ContextQueueHandler):
+            root.removeHandler(handler)
+    _stop_listener()
+
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if config['LOG_FORMAT'] == 'json' else TextFormatter())
+    _output_handlers[:] = [stream]
+
+    _queue = queue.Queue(maxsize=config['LOG_QUEUE_SIZE'])
+    handler = ContextQueueHandler(_queue)
+    handler.addFilter(SamplingFilter())
+    root.addHandler(handler)
+    root.setLevel(config['LOG_LEVEL'].upper())
+
+    _listener = None
+    _ensure_listener()
+
+
+def logging_stats():
+    """This process's log queue: records waiting for the listener and records dropped because it was full."""
+    return {
+        'queued': _queue.qsize() if _queue is not None else 0,
+        'queue_size': _queue.maxsize if _queue is not None else 0,
+        'dropped_records': dropped_records,
+    }
+
+
+def init_request_logging(app):
+    """Request ids, X-Request-ID header and one (sampleable) access record per request."""
+
+    @app.before_request
+    def _start_request():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def _finish_request(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        start = g.get('request_start')
+        duration_ms = round((time.perf_counter() - start) * 1000, 2) if start else None
+        access_log.info("%s %s %s", request.method, request.path, response.status_code,
+                        extra=dict(sample('access'), status=response.status_code, duration_ms=duration_ms))
+        return response
+
+
+atexit.register(_stop_listener)
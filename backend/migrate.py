@@ -0,0 +1,252 @@
+"""
+Versioned schema migrations.
+
+    cd backend
+    python migrate.py status            # current version and pending migrations
+    python migrate.py up                # apply every pending migration
+    python migrate.py up --to 2         # apply up to version 2
+    python migrate.py down --to 0       # roll back to version 0
+    python migrate.py verify            # EXPLAIN the hot queries, check their indexes
+    python migrate.py up --shard a      # the same on shard node 'a' (DB_SHARDS, shards.py)
+
+Migrations live in sql/migrations as NNNN_name.up.sql and NNNN_name.down.sql
+and apply on top of the schema from sql/employee_salary_db.sql. The applied
+version is recorded in the SchemaVersion table. Connection settings are the
+same DB_* environment variables the app uses (config.py).
+
+MySQL DDL is not transactional: if a statement fails half way through a
+migration, the version is not recorded and the error names the statement, so
+it can be fixed by hand and re-run.
+"""
+import argparse
+import os
+import re
+import sys
+
+import mysql.connector
+
+from config import load_config
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sql', 'migrations')
+_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.(up|down)\.sql$')
+
+# verify: (description, query, table or alias in the plan, index the plan must use).
+# {hint} marks the table reference that gets FORCE INDEX (index), see verify().
+EXPLAIN_CHECKS = [
+    ("Salary duplicate check",
+     "SELECT salary_id FROM Salary{hint} WHERE employee_id = 1 AND month = '2025-01-01'",
+     'Salary', 'uk_salary_employee_month'),
+    ("Leave queue by status",
+     "SELECT lr.*, e.name FROM LeaveRequest lr{hint} JOIN Employee e ON lr.employee_id = e.employee_id "
+     "WHERE lr.status = 'pending' ORDER BY lr.requested_on DESC",
+     'lr', 'idx_leave_status_requested'),
+    ("My leave requests",
+     "SELECT * FROM LeaveRequest{hint} WHERE employee_id = 1 ORDER BY requested_on DESC",
+     'LeaveRequest', 'idx_leave_employee_requested'),
+    ("Employee list department filter",
+     "SELECT e.* FROM Employee e{hint} WHERE e.name LIKE '%a%' AND e.department = 'Sales' ORDER BY e.employee_id DESC",
+     'e', 'idx_employee_department'),
+    ("New hires report",
+     "SELECT DATE_FORMAT(joining_date, '%Y-%m-01') AS hire_month, COUNT(employee_id) FROM Employee{hint} "
+     "WHERE joining_date IS NOT NULL GROUP BY hire_month",
+     'Employee', 'idx_employee_joining_date'),
+]
+
+
+def discover_migrations():
+    """Returns {version: {'name': ..., 'up': path, 'down': path}} from MIGRATIONS_DIR."""
+    migrations = {}
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        match = _FILE_RE.match(filename)
+        if not match:
+            continue
+        version, name, direction = int(match.group(1)), match.group(2), match.group(3)
+        entry = migrations.setdefault(version, {'name': name})
+        entry[direction] = os.path.join(MIGRATIONS_DIR, filename)
+    for version, entry in migrations.items():
+        if 'up' not in entry or 'down' not in entry:
+            raise SystemExit(f"Migration {version:04d}_{entry['name']} needs both .up.sql and .down.sql")
+    return migrations
+
+
+def split_statements(sql):
+    """
+    Splits a script on ';' at end of line. Supports DELIMITER lines (for
+    triggers and procedures), like the mysql client does.
+    """
+    statements, current, delimiter = [], [], ';'
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split(None, 1)[1]
+            continue
+        if not current and (not stripped or stripped.startswith('--')):
+            continue
+        current.append(line)
+        if stripped.endswith(delimiter):
+            statement = '\n'.join(current).rstrip()
+            statements.append(statement[:-len(delimiter)].strip())
+            current = []
+    if current and '\n'.join(current).strip():
+        statements.append('\n'.join(current).strip())
+    return statements
+
+
+def connect(shard=None):
+    config = load_config()
+    if config['DB_PASSWORD'] is None:
+        sys.exit("DB_PASSWORD is not set (DB_PASSWORD='' for no password)")
+    if shard is not None:
+        from shards import shard_map_from_config
+        shard_map = shard_map_from_config(config)
+        nodes = {node.name: node.connection for node in shard_map.shards} if shard_map else {}
+        if shard not in nodes:
+            sys.exit(f"Unknown shard {shard!r}; DB_SHARDS defines: {', '.join(nodes) or 'none'}")
+        settings = nodes[shard]
+        return mysql.connector.connect(host=settings['host'], port=settings['port'], user=settings['user'],
+                                       password=settings['password'], database=settings['database'])
+    return mysql.connector.connect(host=config['DB_HOST'], port=config['DB_PORT'], user=config['DB_USER'],
+                                   password=config['DB_PASSWORD'], database=config['DB_NAME'])
+
+
+def ensure_version_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SchemaVersion (
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def applied_versions(cursor):
+    cursor.execute("SELECT version FROM SchemaVersion ORDER BY version")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def run_script(conn, path):
+    cursor = conn.cursor()
+    try:
+        with open(path) as f:
+            for statement in split_statements(f.read()):
+                try:
+                    cursor.execute(statement)
+                    if cursor.with_rows:
+                        cursor.fetchall()
+                except mysql.connector.Error as e:
+                    raise SystemExit(f"{os.path.basename(path)} failed: {e.msg}\nStatement:\n{statement}")
+        conn.commit()
+    finally:
+        cursor.close()
+
+
+def migrate_up(conn, target=None):
+    migrations = discover_migrations()
+    cursor = conn.cursor()
+    applied = set(applied_versions(cursor))
+    for version in sorted(migrations):
+        if version in applied or (target is not None and version > target):
+            continue
+        entry = migrations[version]
+        print(f"Applying {version:04d}_{entry['name']} ...")
+        run_script(conn, entry['up'])
+        cursor.execute("INSERT INTO SchemaVersion (version, name) VALUES (%s, %s)", (version, entry['name']))
+        conn.commit()
+    cursor.close()
+
+
+def migrate_down(conn, target):
+    migrations = discover_migrations()
+    cursor = conn.cursor()
+    for version in sorted(applied_versions(cursor), reverse=True):
+        if version <= target:
+            break
+        entry = migrations.get(version)
+        if entry is None:
+            raise SystemExit(f"Version {version} is applied but its migration files are missing")
+        print(f"Reverting {version:04d}_{entry['name']} ...")
+        run_script(conn, entry['down'])
+        cursor.execute("DELETE FROM SchemaVersion WHERE version = %s", (version,))
+        conn.commit()
+    cursor.close()
+
+
+def status(conn):
+    migrations = discover_migrations()
+    cursor = conn.cursor()
+    applied = set(applied_versions(cursor))
+    cursor.close()
+    current = max(applied) if applied else 0
+    print(f"Current schema version: {current}")
+    for version in sorted(migrations):
+        state = 'applied' if version in applied else 'pending'
+        print(f"  {version:04d}_{migrations[version]['name']}: {state}")
+
+
+def verify(conn):
+    """
+    EXPLAINs each hot query and checks the plan uses its index. Returns the
+    number of failures.
+
+    On a small or empty database the optimizer prefers a scan whatever the
+    indexes are, so each query is explained with FORCE INDEX on its index: the
+    plan is the same on any data, and it still falls back to a scan (key NULL)
+    when the query can no longer use the index, or fails when the index is gone.
+    """
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    for table in ('Employee', 'Salary', 'LeaveRequest'):
+        cursor.execute(f"ANALYZE TABLE {table}")
+        cursor.fetchall()
+    failures = 0
+    for description, query, table, index in EXPLAIN_CHECKS:
+        try:
+            cursor.execute("EXPLAIN " + query.format(hint=f" FORCE INDEX ({index})"))
+            plan = [row for row in cursor.fetchall() if row.get('table') == table]
+        except mysql.connector.Error as e:
+            plan, error = [], e.msg
+        else:
+            error = None
+        chosen = plan[0].get('key') if plan else None
+        if chosen == index:
+            result = f"OK ({plan[0].get('type')})"
+        else:
+            result = f"FAIL ({error or f'key={chosen}'})"
+            failures += 1
+        print(f"  {description:<34} {index:<30} {result}")
+    cursor.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'up', 'down', 'verify'])
+    parser.add_argument('--to', type=int, help="target version (default: latest for up; required for down)")
+    parser.add_argument('--shard', help="run against this shard node instead of the home database")
+    args = parser.parse_args()
+
+    if args.command == 'down' and args.to is None:
+        parser.error("down needs --to VERSION (use --to 0 to revert everything)")
+
+    conn = connect(args.shard)
+    try:
+        cursor = conn.cursor()
+        ensure_version_table(cursor)
+        cursor.close()
+        if args.command == 'status':
+            status(conn)
+        elif args.command == 'up':
+            migrate_up(conn, args.to)
+            status(conn)
+        elif args.command == 'down':
+            migrate_down(conn, args.to)
+            status(conn)
+        else:
+            failures = verify(conn)
+            if failures:
+                sys.exit(f"{failures} hot query check(s) failed")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,438 @@
+"""
+Transactional outbox: change events for employees, salaries, attendance and leave.
+
+    cd backend
+    python outbox.py status             # latest event and checkpoints per node
+    python outbox.py prune              # delete delivered events older than OUTBOX_RETENTION_DAYS
+    python outbox.py prune --days 1
+
+Connection settings are the usual DB_* (and DB_SHARDS) environment variables.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+
+import mysql.connector
+
+import queries
+import shards
+from db import PRIMARY, SHARD_PREFIX, SQLITE, backend_name, open_connection
+
+# --- TRANSACTIONAL OUTBOX ---
+# Every write route calls record() with its own cursor, so the ChangeEvent row
+# (migration 0005) commits or rolls back together with the change. Bulk writes
+# (payroll run, salary adjustments) record one event listing the employees.
+#
+# A consumer thread per worker process tails ChangeEvent in batches of
+# OUTBOX_BATCH_SIZE and hands the events to the subscribers registered with
+# subscribe(): handler(events) with a list of ChangeEvent tuples. A handler
+# that raises gets the same batch again on the next poll, so delivery is
+# at-least-once and handlers must be idempotent.
+#
+#   durable=False  for in-process state (caches): every worker gets every
+#                  event from the moment it started; the position is kept in
+#                  memory.
+#   durable=True   for shared state (rollups, external indexes): one worker
+#                  per node holds GET_LOCK('outbox:<name>') and delivers; its
+#                  position is checkpointed in OutboxCheckpoint after each
+#                  batch, so a restart resumes where it stopped.
+#
+# Event ids are allocated at insert but become visible at commit, so a lower
+# id can still appear after a higher one, and a rolled-back transaction leaves
+# a gap for good. The consumer stops at a gap while a write transaction that
+# could hold the missing id is still open (information_schema.innodb_trx: one
+# that has modified rows and started before the event after the gap), and
+# passes it as soon as none is. record() goes last, just before the commit, so
+# the owner of an open id has always modified rows already and a failing
+# statement rarely rolls back a recorded event. With DB_SHARDS every node has
+# its own events and positions; an XA rollback leaves gaps on the shards that
+# had recorded, passed once the rollback is done.
+#
+# What can be lost: nothing while innodb_trx is readable. Without the PROCESS
+# privilege the consumer falls back to waiting OUTBOX_GAP_TIMEOUT seconds per
+# gap, and the events of a transaction that commits later than that after a
+# higher id (a write transaction open longer than the timeout) are never
+# delivered to the subscribers running at the time; they stay in ChangeEvent.
+# An open transaction older than OUTBOX_GAP_TIMEOUT holds delivery on its node
+# (logged) until it ends. The SQLite backend runs one transaction at a time,
+# so its gaps are passed at once.
+EMPLOYEE = 'Employee'
+SALARY = 'Salary'
+ATTENDANCE = 'Attendance'
+LEAVE_REQUEST = 'LeaveRequest'
+LEAVE_BALANCE = 'LeaveBalance'
+
+ChangeEvent = collections.namedtuple('ChangeEvent', 'node event_id entity entity_id employee_id action payload created_at')
+
+log = logging.getLogger(__name__)
+
+_settings = {'enabled': True, 'poll_seconds': 0.5, 'batch_size': 500, 'gap_timeout': 60.0}
+_subscribers = {}
+_lock = threading.Lock()
+_consumer_entry = None  # (consumer, pid)
+
+# Missing PROCESS privilege (1227) or no access to the table (1142, 1044)
+_ACCESS_DENIED = (1227, 1142, 1044)
+
+
+def record(cursor, entity, action, entity_id=None, employee_id=None, payload=None):
+    """Adds a change event through the route's cursor; the caller's commit publishes it."""
+    cursor.execute(queries.INSERT_CHANGE_EVENT, (entity, entity_id, employee_id, action,
+                                                 None if payload is None else json.dumps(payload, default=str)))
+
+
+class Subscriber:
+    __slots__ = ('name', 'handler', 'entities', 'durable', 'delivered', 'batches', 'failures', 'last_error')
+
+    def __init__(self, name, handler, entities, durable):
+        self.name = name
+        self.handler = handler
+        self.entities = frozenset(entities) if entities else None
+        self.durable = durable
+        self.delivered = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+
+
+def subscribe(name, handler, entities=None, durable=False):
+    """
+    Registers handler(events) for the change events of `entities` (all when
+    None). `name` identifies the checkpoint of a durable subscriber, so keep it
+    stable. Subscribers registered after the consumer started begin at the
+    latest event (durable ones at their checkpoint).
+    """
+    if len(name) > 64:
+        raise ValueError("Subscriber names are at most 64 characters")
+    with _lock:
+        _subscribers[name] = Subscriber(name, handler, entities, durable)
+
+
+def unsubscribe(name):
+    with _lock:
+        _subscribers.pop(name, None)
+
+
+def init_outbox(config):
+    _settings.update(enabled=config['OUTBOX_CONSUMER_ENABLED'], poll_seconds=config['OUTBOX_POLL_SECONDS'],
+                     batch_size=config['OUTBOX_BATCH_SIZE'], gap_timeout=config['OUTBOX_GAP_TIMEOUT'])
+
+
+def _decode(node, row):
+    payload = row['payload']
+    if isinstance(payload, (bytes, bytearray)):
+        payload = payload.decode()
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return ChangeEvent(node, row['event_id'], row['entity'], row['entity_id'], row['employee_id'],
+                       row['action'], payload, row['created_at'])
+
+
+def settled(node, rows, position, step, now, gap_timeout, writers_before=None):
+    """
+    The events of `rows` that can be delivered: up to the first gap that an
+    open transaction may still fill. writers_before(created_at) tells whether
+    one can (None: unknown, then the gap is waited on for gap_timeout seconds).
+    """
+    events = []
+    previous = position
+    for row in rows:
+        if previous and row['event_id'] - previous > step:
+            open_writers = writers_before(row['created_at']) if writers_before else None
+            if open_writers is None:
+                open_writers = (now - row['created_at']).total_seconds() < gap_timeout
+            if open_writers:
+                break  # a lower id may still be inside an open transaction
+        events.append(_decode(node, row))
+        previous = row['event_id']
+    return events
+
+
+class _Node:
+    """Consumer state for one database node (None = the home database)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.role = PRIMARY if name is None else SHARD_PREFIX + name
+        self.conn = None
+        self.step = 1
+        self.positions = {}  # subscriber name -> last delivered event_id
+        self.locked = set()  # durable subscribers this process delivers on this node
+        self.sees_transactions = None  # innodb_trx readable; False: gaps wait for the timeout
+        self.held_at = None  # event_id of the event held back by an old open transaction
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except mysql.connector.Error:
+                pass
+        self.conn = None
+        # Locks die with the session; durable positions are re-read from the checkpoint
+        for name in self.locked:
+            self.positions.pop(name, None)
+        self.locked.clear()
+
+
+class OutboxConsumer(threading.Thread):
+    """Polls every node's ChangeEvent table and dispatches to the subscribers."""
+
+    def __init__(self):
+        super().__init__(name='outbox-consumer', daemon=True)
+        self._stop_event = threading.Event()
+        self._nodes = [_Node(None)] + [_Node(name) for name in shards.names()]
+        self.polls = 0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _open(self, node):
+        node.conn = open_connection(node.role)
+        if node.conn is None:
+            return False
+        cursor = node.conn.cursor()
+        try:
+            cursor.execute("SELECT @@auto_increment_increment")
+            node.step = int(cursor.fetchone()[0])
+        finally:
+            cursor.close()
+        return True
+
+    def _writers_before(self, node, cursor):
+        """writers_before for settled() on `node`, remembering the answers of this poll."""
+        if backend_name() == SQLITE:
+            return lambda created_at: False  # transactions run one at a time
+        answers = {}
+
+        def writers_before(created_at):
+            if node.sees_transactions is False:
+                return None
+            if created_at not in answers:
+                try:
+                    cursor.execute(queries.OPEN_WRITERS_BEFORE, (created_at,))
+                except mysql.connector.Error as e:
+                    if e.errno not in _ACCESS_DENIED:
+                        raise
+                    log.warning("Outbox consumer cannot read information_schema.innodb_trx on node %s (%s); "
+                                "gaps in the event ids wait OUTBOX_GAP_TIMEOUT instead", node.name or 'home', e.msg)
+                    node.sees_transactions = False
+                    return None
+                node.sees_transactions = True
+                answers[created_at] = cursor.fetchone()['writers'] > 0
+            return answers[created_at]
+        return writers_before
+
+    def _start_position(self, node, cursor, subscriber):
+        """Where `subscriber` starts on `node`, or None if another process delivers it there."""
+        if not subscriber.durable:
+            cursor.execute(queries.LATEST_CHANGE_EVENT)
+            return cursor.fetchone()['event_id']
+        cursor.execute("SELECT GET_LOCK(%s, 0) AS locked", (f'outbox:{subscriber.name}',))
+        if not cursor.fetchone()['locked']:
+            return None
+        node.locked.add(subscriber.name)
+        cursor.execute(queries.OUTBOX_CHECKPOINT, (subscriber.name,))
+        row = cursor.fetchone()
+        return row['last_event_id'] if row else 0
+
+    def _poll_node(self, node, subscribers):
+        """Delivers one batch per subscriber; True if any subscriber has more waiting."""
+        more = False
+        cursor = node.conn.cursor(dictionary=True, buffered=True)
+        try:
+            cursor.execute("SELECT NOW(3) AS now")
+            now = cursor.fetchone()['now']
+            writers_before = self._writers_before(node, cursor)
+            for subscriber in subscribers:
+                position = node.positions.get(subscriber.name)
+                if position is None:
+                    position = self._start_position(node, cursor, subscriber)
+                    if position is None:
+                        continue
+                    node.positions[subscriber.name] = position
+                cursor.execute(queries.CHANGE_EVENTS_AFTER, (position, _settings['batch_size']))
+                rows = cursor.fetchall()
+                events = settled(node.name, rows, position, node.step, now, _settings['gap_timeout'], writers_before)
+                if len(events) < len(rows):
+                    self._note_held(node, rows[len(events)], now)
+                if not events:
+                    continue
+                wanted = [event for event in events if subscriber.entities is None or event.entity in subscriber.entities]
+                try:
+                    if wanted:
+                        subscriber.handler(wanted)
+                except Exception as e:
+                    # Not acknowledged: the same events come again on the next poll
+                    subscriber.failures += 1
+                    subscriber.last_error = f"{type(e).__name__}: {e}"
+                    log.exception("Outbox subscriber %s failed on events %s-%s", subscriber.name,
+                                  events[0].event_id, events[-1].event_id)
+                    continue
+                if subscriber.durable:
+                    cursor.execute(queries.SAVE_OUTBOX_CHECKPOINT, (subscriber.name, events[-1].event_id))
+                node.positions[subscriber.name] = events[-1].event_id
+                subscriber.delivered += len(wanted)
+                subscriber.batches += 1
+                more = more or len(events) == _settings['batch_size']
+        finally:
+            cursor.close()
+        return more
+
+    def _note_held(self, node, row, now):
+        """Logs a gap held longer than OUTBOX_GAP_TIMEOUT, once per gap."""
+        if node.held_at != row['event_id'] and (now - row['created_at']).total_seconds() >= _settings['gap_timeout']:
+            node.held_at = row['event_id']
+            log.warning("Outbox delivery on node %s waits before event %s: a transaction open since before %s has not ended",
+                        node.name or 'home', row['event_id'], row['created_at'])
+
+    def run(self):
+        log.info("Outbox consumer started (pid %s, %s node(s))", os.getpid(), len(self._nodes))
+        while not self._stop_event.is_set():
+            with _lock:
+                subscribers = list(_subscribers.values())
+            more = False
+            for node in self._nodes:
+                try:
+                    if node.conn is None and not self._open(node):
+                        continue
+                    more = self._poll_node(node, subscribers) or more
+                except mysql.connector.Error as e:
+                    log.warning("Outbox consumer lost node %s: %s", node.name or 'home', e)
+                    node.close()
+            self.polls += 1
+            if not more:
+                self._stop_event.wait(_settings['poll_seconds'])
+        for node in self._nodes:
+            node.close()
+
+    def positions(self):
+        return {node.name or 'home': dict(node.positions) for node in self._nodes}
+
+
+def ensure_consumer():
+    """Starts this process's consumer if it is enabled and has subscribers. Cheap to call per request."""
+    global _consumer_entry
+    pid = os.getpid()
+    entry = _consumer_entry
+    if (entry is not None and entry[1] == pid) or not _settings['enabled'] or not _subscribers:
+        return
+    with _lock:
+        entry = _consumer_entry
+        if entry is None or entry[1] != pid:
+            # A consumer inherited through fork has no thread in this process
+            consumer = OutboxConsumer()
+            consumer.start()
+            _consumer_entry = (consumer, pid)
+
+
+def delivering(name):
+    """True once this process's consumer has a position for subscriber `name` on every node."""
+    return subscriber_positions(name) is not None
+
+
+def subscriber_positions(name):
+    """
+    {node: last event_id delivered to `name`} (node None = the home database),
+    or None until this process's consumer has a position on every node. Every
+    later event reaches the subscriber.
+    """
+    entry = _consumer_entry
+    if entry is None or entry[1] != os.getpid():
+        return None
+    positions = {node.name: node.positions.get(name) for node in entry[0]._nodes}
+    return None if None in positions.values() else positions
+
+
+def stop_consumer():
+    global _consumer_entry
+    entry = _consumer_entry
+    if entry is not None and entry[1] == os.getpid():
+        entry[0].stop()
+        entry[0].join(timeout=5)
+    _consumer_entry = None
+
+
+def outbox_stats():
+    entry = _consumer_entry
+    consumer = entry[0] if entry is not None and entry[1] == os.getpid() else None
+    with _lock:
+        subscribers = {subscriber.name: {'durable': subscriber.durable, 'entities': sorted(subscriber.entities or ()) or None,
+                                         'delivered': subscriber.delivered, 'batches': subscriber.batches,
+                                         'failures': subscriber.failures, 'last_error': subscriber.last_error}
+                       for subscriber in _subscribers.values()}
+    return {'enabled': _settings['enabled'], 'running': consumer is not None and consumer.is_alive(),
+            'polls': consumer.polls if consumer else 0, 'positions': consumer.positions() if consumer else {},
+            'subscribers': subscribers}
+
+
+# --- MAINTENANCE ---
+
+def _node_connections(config):
+    from db import init_db
+    init_db(config)
+    shards.init_shards(config)
+    for name in [None] + shards.names():
+        conn = open_connection(PRIMARY if name is None else SHARD_PREFIX + name)
+        if conn is None:
+            sys.exit(f"Database connection failed ({name or 'home'})")
+        yield name or 'home', conn
+
+
+def status(config):
+    for name, conn in _node_connections(config):
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute("SELECT COUNT(*) AS events, COALESCE(MAX(event_id), 0) AS latest, MIN(created_at) AS oldest FROM ChangeEvent")
+        totals = cursor.fetchone()
+        print(f"{name}: {totals['events']} events, latest {totals['latest']}, oldest {totals['oldest']}")
+        cursor.execute("SELECT consumer, last_event_id, updated_at FROM OutboxCheckpoint ORDER BY consumer")
+        for row in cursor.fetchall():
+            print(f"  {row['consumer']}: at {row['last_event_id']} ({totals['latest'] - row['last_event_id']} behind), {row['updated_at']}")
+        cursor.close()
+        conn.close()
+
+
+def prune(config, days):
+    """Deletes events older than `days` that every durable checkpoint has passed."""
+    for name, conn in _node_connections(config):
+        cursor = conn.cursor()
+        cursor.execute("SELECT MIN(last_event_id) FROM OutboxCheckpoint")
+        below = cursor.fetchone()[0]
+        deleted = 0
+        while True:
+            # Small batches keep the row locks short on a live table
+            if below is None:
+                cursor.execute("DELETE FROM ChangeEvent WHERE created_at < NOW(3) - INTERVAL %s DAY LIMIT 10000", (days,))
+            else:
+                cursor.execute("DELETE FROM ChangeEvent WHERE created_at < NOW(3) - INTERVAL %s DAY AND event_id <= %s LIMIT 10000",
+                               (days, below))
+            deleted += cursor.rowcount
+            if cursor.rowcount < 10000:
+                break
+        print(f"{name}: {deleted} events deleted")
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'prune'])
+    parser.add_argument('--days', type=int, help="prune: keep this many days (default OUTBOX_RETENTION_DAYS)")
+    args = parser.parse_args()
+
+    from config import load_config
+    config = load_config()
+    try:
+        if args.command == 'status':
+            status(config)
+        else:
+            prune(config, config['OUTBOX_RETENTION_DAYS'] if args.days is None else args.days)
+    except mysql.connector.Error as e:
+        sys.exit(f"Database error: {e.msg}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# --- PASSWORD HASHING OFF THE REQUEST THREADS ---
+# Password hashes are deliberately expensive. Running them inline lets a login
+# storm (payday!) eat every CPU and request thread, so they run on a small
+# process pool instead. Admission control caps how many hash jobs may be queued
+# or running per process; beyond that callers get PasswordHashingBusy and the
+# route answers 429 with a Retry-After estimate. A job that does not finish
+# within PASSWORD_HASH_TIMEOUT raises PasswordHashingTimeout (503); it keeps
+# counting as pending until the pool has really finished it.
+
+_settings = {
+    'method': 'scrypt',
+    'workers': 2,
+    'max_pending': 32,
+    'timeout': 10.0,
+}
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+_pending = 0
+# Moving average of how long one hash job takes, used for Retry-After
+_avg_job_seconds = 0.1
+_method_prefix = None
+
+
+class PasswordHashingUnavailable(Exception):
+    """A hash could not be computed now. retry_after is in whole seconds; status_code is the HTTP answer."""
+    status_code = 503
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PasswordHashingBusy(PasswordHashingUnavailable):
+    """Raised when the hash queue is full."""
+    status_code = 429
+
+    def __init__(self, retry_after):
+        super().__init__(f"Password hashing queue is full, retry after {retry_after}s", retry_after)
+
+
+class PasswordHashingTimeout(PasswordHashingUnavailable):
+    """Raised when a hash job did not finish within PASSWORD_HASH_TIMEOUT."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Password hashing timed out, retry after {retry_after}s", retry_after)
+
+
+def init_password_hasher(config):
+    """Applies the PASSWORD_HASH_* settings. The process pool starts on first use."""
+    global _executor, _executor_pid, _method_prefix
+    with _lock:
+        _settings['method'] = config['PASSWORD_HASH_METHOD']
+        _settings['workers'] = config['PASSWORD_HASH_WORKERS']
+        _settings['max_pending'] = config['PASSWORD_HASH_MAX_PENDING']
+        _settings['timeout'] = config['PASSWORD_HASH_TIMEOUT']
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False)
+        _executor = None
+        _executor_pid = None
+        _method_prefix = None
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        # 'spawn' so the children never inherit locks from a threaded parent
+        _executor = ProcessPoolExecutor(max_workers=_settings['workers'],
+                                        mp_context=multiprocessing.get_context('spawn'))
+        _executor_pid = pid
+    return _executor
+
+
+def _retry_after():
+    workers = max(_settings['workers'], 1)
+    return max(1, math.ceil(_pending * _avg_job_seconds / workers))
+
+
+def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= _settings['max_pending']:
+            raise PasswordHashingBusy(_retry_after())
+        _pending += 1
+        executor = _get_executor() if _settings['workers'] > 0 else None
+
+    start = time.perf_counter()
+    if executor is None:
+        # PASSWORD_HASH_WORKERS=0: hash inline, still admission-controlled
+        try:
+            return fn(*args)
+        finally:
+            _job_done(start)
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        _job_done(start)
+        raise
+    # cancel() cannot stop a job a pool process already runs, so the job stays
+    # pending until the pool reports it done (or cancelled before it started)
+    future.add_done_callback(lambda _: _job_done(start))
+    try:
+        return future.result(timeout=_settings['timeout'])
+    except FutureTimeoutError:
+        future.cancel()
+        raise PasswordHashingTimeout(_retry_after())
+
+
+def _job_done(start):
+    global _pending, _avg_job_seconds
+    elapsed = time.perf_counter() - start
+    with _lock:
+        _pending -= 1
+        _avg_job_seconds = 0.9 * _avg_job_seconds + 0.1 * elapsed
+
+
+def hash_password(password):
+    """Hashes with the configured PASSWORD_HASH_METHOD. May raise PasswordHashingUnavailable."""
+    return _run(generate_password_hash, password, _settings['method'])
+
+
+def verify_password(password_hash, password):
+    """Checks a password against a stored hash. May raise PasswordHashingUnavailable."""
+    return _run(check_password_hash, password_hash, password)
+
+
+def _configured_prefix():
+    global _method_prefix
+    if _method_prefix is None:
+        # Werkzeug stores "<method>:<params>$salt$hash" and fills in default
+        # parameters (e.g. "scrypt" -> "scrypt:32768:8:1"), so derive the
+        # canonical prefix from a real hash once.
+        _method_prefix = generate_password_hash('x', _settings['method']).split('$', 1)[0]
+    return _method_prefix
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with a different method or cost than configured."""
+    return password_hash.split('$', 1)[0] != _configured_prefix()
+
+
+def hasher_stats():
+    return {
+        'pending': _pending,
+        'max_pending': _settings['max_pending'],
+        'workers': _settings['workers'],
+        'avg_job_ms': round(_avg_job_seconds * 1000, 2),
+    }
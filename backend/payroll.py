@@ -0,0 +1,113 @@
+import datetime
+
+import queries
+
+# --- PAYROLL FORMULA ---
+# The one place the monthly salary is computed. Used by the payroll routes in
+# app.py (one employee at a time) and by the what-if simulator (simulator.py).
+#
+#   hourly rate   = base / working days / hours per day
+#   overtime pay  = hourly rate * overtime hours * OT multiplier
+#   PF            = base * PF rate
+#   total salary  = base + overtime pay + bonus - deductions - PF
+#
+# The constants come from versioned rule sets in the database (see RULE SETS).
+
+
+class PayrollRules:
+    """The constants of the formula. Treat as read-only; replace() makes a variation."""
+
+    __slots__ = ('pf_rate', 'ot_multiplier', 'working_days', 'hours_per_day', 'version')
+
+    def __init__(self, pf_rate=0.12, ot_multiplier=1.5, working_days=22, hours_per_day=8, version=None):
+        self.pf_rate = float(pf_rate)
+        self.ot_multiplier = float(ot_multiplier)
+        self.working_days = int(working_days)
+        self.hours_per_day = int(hours_per_day)
+        self.version = version  # PayrollRuleSet.version, None if not from the database
+
+    def validate(self):
+        """Raises ValueError if a constant is out of range."""
+        if not 0 <= self.pf_rate <= 1:
+            raise ValueError("pf_rate must be between 0 and 1")
+        if not 0 <= self.ot_multiplier <= 10:
+            raise ValueError("ot_multiplier must be between 0 and 10")
+        if not 1 <= self.working_days <= 31:
+            raise ValueError("working_days must be between 1 and 31")
+        if not 1 <= self.hours_per_day <= 24:
+            raise ValueError("hours_per_day must be between 1 and 24")
+        return self
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return PayrollRules(**values)
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+DEFAULT_RULES = PayrollRules()
+
+
+def calculate_salary(base_salary, overtime_hours, bonus=0.0, deductions=0.0, rules=DEFAULT_RULES):
+    """Returns (overtime_pay, pf_amount, total_salary) for one month."""
+    base_salary = float(base_salary or 0.0)
+
+    pf_amount = round(base_salary * rules.pf_rate, 2)
+
+    hourly_rate = 0.0
+    if base_salary > 0 and rules.working_days > 0 and rules.hours_per_day > 0:
+        hourly_rate = (base_salary / rules.working_days) / rules.hours_per_day
+    overtime_pay = round(hourly_rate * float(overtime_hours or 0.0) * rules.ot_multiplier, 2)
+
+    total_salary = base_salary + overtime_pay + float(bonus or 0.0) - float(deductions or 0.0) - pf_amount
+    return overtime_pay, pf_amount, total_salary
+
+
+# --- RULE SETS ---
+# PayrollRuleSet (migration 0003) holds immutable, effective-dated versions of
+# the constants per employee class. A payroll run calls compile_rules() once for
+# its month; from then on choosing an employee's rules is one dict lookup, with
+# no per-row queries or parsing.
+
+DEFAULT_CLASS = 'default'
+
+
+class CompiledRules:
+    """The rules in force for one month, by employee class."""
+
+    def __init__(self, month, by_class):
+        self.month = month
+        self._by_class = by_class
+        self._default = by_class.get(DEFAULT_CLASS)
+
+    def for_class(self, employee_class):
+        """Rules for the class, falling back to 'default'. LookupError if neither exists."""
+        rules = self._by_class.get(employee_class or DEFAULT_CLASS, self._default)
+        if rules is None:
+            raise LookupError(f"No payroll rule set in force for class '{employee_class}' on {self.month}")
+        return rules
+
+    def as_dict(self):
+        return {employee_class: rules.as_dict() for employee_class, rules in sorted(self._by_class.items())}
+
+
+def _first_of_month(month):
+    if not isinstance(month, datetime.date):
+        month = datetime.date.fromisoformat(str(month)[:10])
+    return month.replace(day=1)
+
+
+def compile_rules(cursor, month):
+    """Loads every class's rule set in force on `month`. Assumes cursor is dictionary=True."""
+    month = _first_of_month(month)
+    cursor.execute(queries.PAYROLL_RULES_IN_FORCE, (month,))
+    by_class = {}
+    for row in cursor.fetchall():  # ordered oldest first, so the latest version wins
+        by_class[row['employee_class']] = rule_set_from_row(row)
+    return CompiledRules(month, by_class)
+
+
+def rule_set_from_row(row):
+    return PayrollRules(row['pf_rate'], row['ot_multiplier'], row['working_days'], row['hours_per_day'], row['version'])
@@ -0,0 +1,101 @@
+import contextlib
+import datetime
+import json
+import time
+
+import queries
+
+# --- PAYROLL RUN LEDGER ---
+# Every /api/payroll/run leaves a PayrollRun row (migration 0004): who started
+# it, when, how long each phase took, row counts and why it failed or rolled
+# back. The row is committed before the run does any work and updated at the
+# end, so it survives the run's own rollback.
+#
+# Phases of a run:
+#   fetch    employees, existing salaries, attendance and rule sets for the month
+#   compute  the formula for every employee (no database access)
+#   write    batched Salary inserts
+#   commit   commit or rollback
+
+PHASES = ('fetch', 'compute', 'write', 'commit')
+MAX_STORED_FAILURES = 1000
+
+COMMITTED = 'committed'
+ROLLED_BACK = 'rolled_back'
+FAILED = 'failed'
+
+
+class PhaseTimer:
+    """Wall-clock milliseconds per phase; `with timer.phase('write'): ...`."""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.ms = dict.fromkeys(PHASES, 0.0)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ms[name] += (time.perf_counter() - start) * 1000
+
+    def add_parallel(self, timers):
+        """Adds phases that ran concurrently (one timer per shard): the slowest one's time per phase."""
+        timers = list(timers)
+        for name in PHASES:
+            self.ms[name] += max((timer.ms[name] for timer in timers), default=0.0)
+
+    def total_ms(self):
+        return (time.perf_counter() - self._started) * 1000
+
+
+def start_run(cursor, month, user_id, default_bonus):
+    """Inserts the 'running' row and returns its run_id. The caller commits."""
+    cursor.execute(queries.INSERT_PAYROLL_RUN, (month, user_id, default_bonus, datetime.datetime.now()))
+    return cursor.lastrowid
+
+
+def finish_run(cursor, run_id, status, timer, employee_count, success_count, failed_details, rows_written, error=None):
+    """Records the outcome of a run. The caller commits."""
+    failures = json.dumps(failed_details[:MAX_STORED_FAILURES]) if failed_details else None
+    cursor.execute(queries.FINISH_PAYROLL_RUN, (
+        status, datetime.datetime.now(), employee_count, success_count, len(failed_details), rows_written,
+        *(round(timer.ms[name], 3) for name in PHASES), round(timer.total_ms(), 3),
+        failures, error, run_id))
+
+
+def run_from_row(row):
+    """JSON-ready run: dates as ISO strings, phases grouped, ms per written row."""
+    run = dict(row)
+    for key in ('month', 'started_at', 'finished_at'):
+        if run.get(key) is not None:
+            run[key] = run[key].isoformat()
+    run['default_bonus'] = float(run['default_bonus'] or 0.0)
+    run['phases_ms'] = {name: run.pop(f'{name}_ms') for name in PHASES}
+    rows_written = run.get('rows_written')
+    run['ms_per_row'] = round(run['total_ms'] / rows_written, 4) if rows_written and run.get('total_ms') else None
+    if isinstance(run.get('failure_details'), (str, bytes)):
+        run['failure_details'] = json.loads(run['failure_details'])
+    return run
+
+
+def _change(a, b):
+    if a is None or b is None:
+        return {'a': a, 'b': b, 'change': None, 'change_pct': None}
+    return {'a': a, 'b': b, 'change': round(b - a, 3),
+            'change_pct': round((b - a) / a * 100, 1) if a else None}
+
+
+def compare(a, b):
+    """Metric by metric change from run a to run b (both from run_from_row)."""
+    metrics = {'total_ms': _change(a['total_ms'], b['total_ms']),
+               'ms_per_row': _change(a['ms_per_row'], b['ms_per_row']),
+               'employee_count': _change(a['employee_count'], b['employee_count']),
+               'rows_written': _change(a['rows_written'], b['rows_written']),
+               'failed_count': _change(a['failed_count'], b['failed_count'])}
+    for name in PHASES:
+        metrics[f'{name}_ms'] = _change(a['phases_ms'][name], b['phases_ms'][name])
+    for run in (a, b):
+        run.pop('failure_details', None)
+    return {'a': a, 'b': b, 'metrics': metrics}
@@ -0,0 +1,338 @@
+# --- SHARED READ QUERIES ---
+# SQL for the hot read endpoints. Used by the Flask routes in app.py and by the
+# async read path in async_app.py, so both serving modes return the same data.
+
+EMPLOYEE_ID_FOR_USER = "SELECT employee_id FROM Employee WHERE user_id = %s"
+
+MY_PROFILE = "SELECT * FROM Employee WHERE user_id = %s"
+
+MY_SALARIES = "SELECT salary_id, month, total_salary FROM Salary WHERE employee_id = %s ORDER BY month DESC"
+MY_SALARIES_COLUMNS = ('salary_id', 'month', 'total_salary')  # same columns from the cold archive
+
+MY_ATTENDANCE = "SELECT month, days_present, leaves_taken, overtime_hours FROM Attendance WHERE employee_id = %s ORDER BY month DESC"
+MY_ATTENDANCE_COLUMNS = ('month', 'days_present', 'leaves_taken', 'overtime_hours')
+
+# Per-employee history pages (GET /api/employees/<id>/salaries and /attendance)
+EMPLOYEE_SALARY_HISTORY = """
+    SELECT s.*, e.base_salary
+    FROM Salary s
+    JOIN Employee e ON s.employee_id = e.employee_id
+    WHERE s.employee_id = %s
+    ORDER BY s.month DESC
+"""
+EMPLOYEE_ATTENDANCE_HISTORY = "SELECT * FROM Attendance WHERE employee_id = %s ORDER BY month DESC"
+
+# In-process employee directory (directory.py): one row on a miss, every row when loading
+EMPLOYEE_DIRECTORY_COLUMNS = "employee_id, name, department, base_salary, user_id, employee_class"
+EMPLOYEE_DIRECTORY_ROW = f"SELECT {EMPLOYEE_DIRECTORY_COLUMNS} FROM Employee WHERE employee_id = %s"
+EMPLOYEE_DIRECTORY = f"SELECT {EMPLOYEE_DIRECTORY_COLUMNS} FROM Employee ORDER BY employee_id"
+
+# Single salary insert (POST /api/salaries): duplicate check and the month's attendance
+SALARY_EXISTS = "SELECT salary_id FROM Salary WHERE employee_id = %s AND month = %s"
+ATTENDANCE_FOR_SALARY = "SELECT overtime_hours, leaves_taken FROM Attendance WHERE employee_id = %s AND month = %s"
+
+MY_LEAVE_REQUESTS = "SELECT * FROM LeaveRequest WHERE employee_id = %s ORDER BY requested_on DESC"
+
+DEPARTMENT_LIST = "SELECT DISTINCT department FROM Employee ORDER BY department"
+
+# Sum and count instead of AVG so archived salaries can be added in
+# (archive.merge_department_salaries computes average_salary)
+DEPARTMENT_SALARIES_REPORT = """
+    SELECT
+        e.department,
+        COALESCE(SUM(s.total_salary), 0) AS salary_total,
+        COUNT(s.salary_id) AS salary_count,
+        COUNT(DISTINCT e.employee_id) AS employee_count
+    FROM Employee e
+    LEFT JOIN Salary s ON e.employee_id = s.employee_id
+    GROUP BY e.department;
+"""
+
+EMPLOYEE_DEPARTMENTS = "SELECT employee_id, department FROM Employee"
+
+# Whole workforce for the what-if simulator (simulator.py); read with a tuple cursor
+WORKFORCE = "SELECT employee_id, department, position, employee_class, base_salary FROM Employee"
+
+# Payroll rule sets (payroll.py). In force on a month: oldest first, so the
+# last row per class is the one that applies.
+PAYROLL_RULES_IN_FORCE = """
+    SELECT version, employee_class, effective_from, pf_rate, ot_multiplier, working_days, hours_per_day
+    FROM PayrollRuleSet
+    WHERE effective_from <= %s
+    ORDER BY effective_from, version
+"""
+
+PAYROLL_RULE_SETS = """
+    SELECT version, employee_class, effective_from, pf_rate, ot_multiplier, working_days, hours_per_day,
+           created_by, created_at
+    FROM PayrollRuleSet
+    ORDER BY employee_class, effective_from DESC, version DESC
+"""
+
+INSERT_PAYROLL_RULE_SET = """
+    INSERT INTO PayrollRuleSet (employee_class, effective_from, pf_rate, ot_multiplier, working_days, hours_per_day, created_by)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Salary row with the app-computed total and the rule set version that produced it
+INSERT_SALARY = """
+    INSERT INTO Salary (employee_id, month, overtime_hours, overtime_pay, bonus, deductions, pf_amount, total_salary, rule_version)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Batched salary adjustments (POST /api/salaries/adjustments). New rows are
+# inserted; for an existing (employee_id, month) only bonus and deductions
+# change and total_salary is shifted by the difference, so it keeps the base,
+# overtime and PF the row was computed with. total_salary is assigned first
+# because MySQL evaluates the assignments left to right.
+UPSERT_SALARY_ADJUSTMENT = """
+    INSERT INTO Salary (employee_id, month, overtime_hours, overtime_pay, bonus, deductions, pf_amount, total_salary, rule_version)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        total_salary = total_salary - bonus + deductions + VALUES(bonus) - VALUES(deductions),
+        bonus = VALUES(bonus),
+        deductions = VALUES(deductions)
+"""
+
+# Bulk payroll run (app.py run_payroll): the whole month in three reads
+PAYROLL_EMPLOYEES = "SELECT employee_id, base_salary, employee_class FROM Employee"
+SALARIED_EMPLOYEES_FOR_MONTH = "SELECT employee_id FROM Salary WHERE month = %s"
+OVERTIME_FOR_MONTH = "SELECT employee_id, overtime_hours FROM Attendance WHERE month = %s"
+
+# Payroll run ledger (payroll_runs.py)
+INSERT_PAYROLL_RUN = """
+    INSERT INTO PayrollRun (month, status, triggered_by, default_bonus, started_at)
+    VALUES (%s, 'running', %s, %s, %s)
+"""
+
+FINISH_PAYROLL_RUN = """
+    UPDATE PayrollRun SET
+        status = %s, finished_at = %s, employee_count = %s, success_count = %s, failed_count = %s,
+        rows_written = %s, fetch_ms = %s, compute_ms = %s, write_ms = %s, commit_ms = %s, total_ms = %s,
+        failure_details = %s, error = %s
+    WHERE run_id = %s
+"""
+
+PAYROLL_RUN_COLUMNS = """
+    r.run_id, r.month, r.status, r.triggered_by, u.username AS triggered_by_username, r.default_bonus,
+    r.started_at, r.finished_at, r.employee_count, r.success_count, r.failed_count, r.rows_written,
+    r.fetch_ms, r.compute_ms, r.write_ms, r.commit_ms, r.total_ms
+"""
+
+PAYROLL_RUN = f"""
+    SELECT {PAYROLL_RUN_COLUMNS}, r.failure_details, r.error
+    FROM PayrollRun r LEFT JOIN users u ON u.id = r.triggered_by
+    WHERE r.run_id = %s
+"""
+
+# Transactional outbox (outbox.py)
+INSERT_CHANGE_EVENT = """
+    INSERT INTO ChangeEvent (entity, entity_id, employee_id, action, payload)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+CHANGE_EVENTS_AFTER = """
+    SELECT event_id, entity, entity_id, employee_id, action, payload, created_at
+    FROM ChangeEvent
+    WHERE event_id > %s
+    ORDER BY event_id
+    LIMIT %s
+"""
+
+LATEST_CHANGE_EVENT = "SELECT COALESCE(MAX(event_id), 0) AS event_id FROM ChangeEvent"
+
+# Write transactions that may still hold an event id taken before the event
+# created at %s (trx_started has whole seconds; the second covers the time
+# between NOW(3) and the id allocation). Needs the PROCESS privilege.
+OPEN_WRITERS_BEFORE = """
+    SELECT COUNT(*) AS writers
+    FROM information_schema.innodb_trx
+    WHERE trx_rows_modified > 0
+      AND trx_started <= %s + INTERVAL 1 SECOND
+      AND trx_mysql_thread_id <> CONNECTION_ID()
+"""
+
+OUTBOX_CHECKPOINT = "SELECT last_event_id FROM OutboxCheckpoint WHERE consumer = %s"
+
+SAVE_OUTBOX_CHECKPOINT = """
+    INSERT INTO OutboxCheckpoint (consumer, last_event_id) VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE last_event_id = VALUES(last_event_id)
+"""
+
+# Year-to-date totals (ytd.py, migration 0006). The values are deltas, so the
+# same statement adds new Salary rows and shifts adjusted ones.
+UPSERT_SALARY_YTD = """
+    INSERT INTO SalaryYTD (employee_id, fiscal_year, months, overtime_hours, gross, overtime_pay, bonus, deductions, pf_amount, net, last_month)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        months = months + VALUES(months),
+        overtime_hours = overtime_hours + VALUES(overtime_hours),
+        gross = gross + VALUES(gross),
+        overtime_pay = overtime_pay + VALUES(overtime_pay),
+        bonus = bonus + VALUES(bonus),
+        deductions = deductions + VALUES(deductions),
+        pf_amount = pf_amount + VALUES(pf_amount),
+        net = net + VALUES(net),
+        last_month = GREATEST(last_month, VALUES(last_month))
+"""
+
+YTD_COLUMNS = "fiscal_year, months, overtime_hours, gross, overtime_pay, bonus, deductions, pf_amount, net, last_month"
+
+EMPLOYEE_YTD = f"SELECT employee_id, {YTD_COLUMNS} FROM SalaryYTD WHERE employee_id = %s ORDER BY fiscal_year DESC"
+
+COMPANY_YTD = f"""
+    SELECT y.employee_id, e.name, e.department, {', '.join('y.' + column for column in YTD_COLUMNS.split(', '))}
+    FROM SalaryYTD y
+    JOIN Employee e ON e.employee_id = y.employee_id
+    WHERE y.fiscal_year = %s
+    ORDER BY y.employee_id
+"""
+
+SALARY_FOR_YTD = """
+    SELECT employee_id, month, overtime_hours, overtime_pay, bonus, deductions, pf_amount, total_salary
+    FROM Salary
+    WHERE month >= %s AND month < %s
+    LOCK IN SHARE MODE
+"""
+
+# Leave ledger and balances (leave.py, migration 0007). Balance values are
+# deltas, like UPSERT_SALARY_YTD.
+INSERT_LEAVE_LEDGER = """
+    INSERT INTO LeaveLedger (employee_id, leave_year, kind, days, request_id, accrual_month, note, created_by)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+UPSERT_LEAVE_BALANCE = """
+    INSERT INTO LeaveBalance (employee_id, leave_year, accrued, adjusted, taken, pending)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        accrued = accrued + VALUES(accrued),
+        adjusted = adjusted + VALUES(adjusted),
+        taken = taken + VALUES(taken),
+        pending = pending + VALUES(pending)
+"""
+
+LEAVE_BALANCE = "SELECT leave_year, accrued, adjusted, taken, pending FROM LeaveBalance WHERE employee_id = %s AND leave_year = %s"
+
+LEAVE_BALANCE_FOR_UPDATE = LEAVE_BALANCE + " FOR UPDATE"
+
+EMPLOYEE_JOINING_DATE = "SELECT joining_date FROM Employee WHERE employee_id = %s"
+
+# Locks the employee's accrual slots of the year (leave.catch_up)
+LEAVE_ACCRUALS_FOR_UPDATE = """
+    SELECT accrual_month FROM LeaveLedger
+    WHERE employee_id = %s AND leave_year = %s AND accrual_month IS NOT NULL
+    FOR UPDATE
+"""
+
+LEAVE_LEDGER_ENTRIES = """
+    SELECT entry_id, kind, days, request_id, accrual_month, note, created_at
+    FROM LeaveLedger
+    WHERE employee_id = %s AND leave_year = %s
+    ORDER BY entry_id
+"""
+
+LEAVE_BALANCES_REPORT = """
+    SELECT e.employee_id, e.name, e.department,
+           COALESCE(b.accrued, 0) AS accrued, COALESCE(b.adjusted, 0) AS adjusted,
+           COALESCE(b.taken, 0) AS taken, COALESCE(b.pending, 0) AS pending
+    FROM Employee e
+    LEFT JOIN LeaveBalance b ON b.employee_id = e.employee_id AND b.leave_year = %s
+    ORDER BY e.employee_id
+"""
+
+
+# One month of payroll joined with the employee and attendance, for the
+# analytics snapshots (snapshots.py)
+SNAPSHOT_MONTH = """
+    SELECT
+        e.employee_id, e.name, e.department, e.position, e.joining_date, e.base_salary,
+        s.overtime_hours, s.overtime_pay, s.bonus, s.deductions, s.pf_amount, s.total_salary,
+        a.days_present, a.leaves_taken
+    FROM Salary s
+    JOIN Employee e ON e.employee_id = s.employee_id
+    LEFT JOIN Attendance a ON a.employee_id = s.employee_id AND a.month = s.month
+    WHERE s.month = %s
+"""
+
+# Months the snapshots have to cover, and the ones to rebuild after deleting an employee
+SALARY_MONTHS = "SELECT DISTINCT month FROM Salary"
+EMPLOYEE_SALARY_MONTHS = "SELECT DISTINCT month FROM Salary WHERE employee_id = %s"
+
+# Group by the first of the month for clean time-series data
+NEW_HIRES_REPORT = """
+    SELECT
+        DATE_FORMAT(joining_date, '%%Y-%%m-01') AS hire_month,
+        COUNT(employee_id) AS hire_count
+    FROM Employee
+    WHERE joining_date IS NOT NULL
+    GROUP BY hire_month
+    ORDER BY hire_month ASC;
+"""
+
+
+def employee_list_query(search_term, department, include_linked_user):
+    """Returns (query, params) for the admin employee list."""
+    # --- MODIFICATION: Join with users table if requested ---
+    if include_linked_user:
+        query = """
+            SELECT e.*, u.username as linked_username
+            FROM Employee e
+            LEFT JOIN users u ON e.user_id = u.id
+            WHERE e.name LIKE %s
+        """
+    else:
+        query = "SELECT e.* FROM Employee e WHERE e.name LIKE %s"
+
+    params = [f"%{search_term}%"]
+
+    if department:
+        query += " AND e.department = %s"
+        params.append(department)
+
+    query += " ORDER BY e.employee_id DESC"
+    return query, tuple(params)
+
+
+def payroll_runs_query(month, limit):
+    """Returns (query, params) for the payroll run list, newest first."""
+    query = f"SELECT {PAYROLL_RUN_COLUMNS} FROM PayrollRun r LEFT JOIN users u ON u.id = r.triggered_by"
+    params = []
+    if month:
+        query += " WHERE r.month = %s"
+        params.append(month)
+    query += " ORDER BY r.started_at DESC LIMIT %s"
+    params.append(limit)
+    return query, tuple(params)
+
+
+def leave_requests_query(status_filter):
+    """Returns (query, params) for the admin leave request list."""
+    query = """
+        SELECT lr.*, e.name as employee_name
+        FROM LeaveRequest lr
+        JOIN Employee e ON lr.employee_id = e.employee_id
+    """
+    params = []
+    if status_filter:
+        query += " WHERE lr.status = %s"
+        params.append(status_filter)
+
+    query += " ORDER BY lr.requested_on DESC"
+    return query, tuple(params)
+
+
+# --- IN (...) LISTS ---
+# Largest number of ids bound into one IN list; longer lists are queried in chunks
+IN_CHUNK_SIZE = 1000
+
+
+def placeholders(count):
+    """'%s, %s, ...' for an IN list of `count` values."""
+    return ", ".join(["%s"] * count)
+
+
+def chunks(values, size=IN_CHUNK_SIZE):
+    """Splits a list into consecutive slices of at most `size` items."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
@@ -0,0 +1,435 @@
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from db import configure_shard_pools, fetch_one, get_db_connection, get_shard_connection
+
+# --- HORIZONTAL SHARDING ---
+# Optional. With DB_SHARDS set, the employee data (Employee, Salary, Attendance,
+# LeaveRequest) is split across several MySQL nodes. The DB_* primary stays
+# the home of the global tables (users, PayrollRuleSet, PayrollRun,
+# SchemaVersion). DB_SHARDS is JSON, inline or the path of a .json file:
+#
+#   {"key": "employee_id",
+#    "shards": [{"name": "a", "port": 3307, "min_id": 1, "max_id": 999999},
+#               {"name": "b", "port": 3308, "min_id": 1000000}]}
+#
+#   {"key": "department",
+#    "shards": [{"name": "a", "port": 3307, "departments": ["Engineering", "Support"]},
+#               {"name": "b", "port": 3308, "default": true}]}
+#
+# host / user / password / database default to the primary's.
+#
+# An employee_id alone names its shard, so single-employee routes go straight
+# to one node:
+#   key=employee_id  each shard owns [min_id, max_id]; the last range may be
+#                    open and takes new employees (or the one marked
+#                    "new_employees": true). Start each node's counter at its
+#                    min_id: ALTER TABLE Employee AUTO_INCREMENT = <min_id>.
+#   key=department   new employees go to their department's shard (unlisted
+#                    departments to the "default" one) and the employee_id is
+#                    interleaved like the row ids below. Moving an employee to
+#                    a department on another shard is refused.
+#
+# Every shard node runs with auto_increment_increment = n and
+# auto_increment_offset = i + 1 (my.cnf; i = its position in DB_SHARDS, n =
+# the number of shards), so Salary and LeaveRequest ids are unique across the
+# shards and name their shard too: (id - 1) % n.
+#
+# Lists and reports scatter the query to every shard in parallel and merge the
+# rows in the app (scatter()). Writes that span shards (the payroll run, salary
+# adjustments) use XA two-phase commit (ShardTransaction).
+#
+# Trying it locally with three MySQL instances (home on 3306, shards on 3307
+# and 3308): load sql/employee_salary_db.sql and run `migrate.py up` on every
+# node (migrate.py --shard a|b), then run sql/shard_node.sql on each shard:
+#   DB_SHARDS='{"key": "employee_id", "shards": [{"name": "a", "port": 3307, "min_id": 1, "max_id": 999999},
+#               {"name": "b", "port": 3308, "min_id": 1000000}]}' python app.py
+# Without DB_SHARDS every helper here runs on the ordinary connection, so the
+# routes behave exactly as on a single database.
+EMPLOYEE_ID = 'employee_id'
+DEPARTMENT = 'department'
+
+log = logging.getLogger(__name__)
+
+_map = None
+_executor_entry = None  # (executor, pid)
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'scatters': 0, 'xa_commits': 0, 'xa_rollbacks': 0}
+
+
+class ShardUnavailable(RuntimeError):
+    """A database node could not be reached (no pooled connection)."""
+
+    def __init__(self, name):
+        super().__init__(f"Database node '{name}' is unavailable")
+        self.name = name
+
+
+class Shard:
+    __slots__ = ('name', 'index', 'connection', 'min_id', 'max_id', 'departments', 'default', 'new_employees')
+
+    def __init__(self, name, index, connection, min_id=None, max_id=None, departments=(), default=False, new_employees=False):
+        self.name = name
+        self.index = index
+        self.connection = connection
+        self.min_id = min_id
+        self.max_id = max_id
+        self.departments = tuple(departments)
+        self.default = default
+        self.new_employees = new_employees
+
+    def describe(self):
+        info = {'name': self.name, 'host': self.connection['host'], 'port': self.connection['port']}
+        if self.min_id is not None:
+            info.update(min_id=self.min_id, max_id=self.max_id)
+        else:
+            info.update(departments=list(self.departments), default=self.default)
+        return info
+
+
+class ShardMap:
+    """Which shard holds an employee. Raises ValueError for an inconsistent map."""
+
+    def __init__(self, key, shards):
+        if key not in (EMPLOYEE_ID, DEPARTMENT):
+            raise ValueError(f"DB_SHARDS key must be '{EMPLOYEE_ID}' or '{DEPARTMENT}', got {key!r}")
+        if not shards:
+            raise ValueError("DB_SHARDS needs at least one shard")
+        names = [shard.name for shard in shards]
+        if len(set(names)) != len(names):
+            raise ValueError("DB_SHARDS shard names must be unique")
+        self.key = key
+        self.shards = list(shards)
+        if key == EMPLOYEE_ID:
+            self._ranges = sorted(shards, key=lambda shard: shard.min_id)
+            for shard, following in zip(self._ranges, self._ranges[1:]):
+                if shard.max_id is None or shard.max_id >= following.min_id:
+                    raise ValueError(f"DB_SHARDS ranges of '{shard.name}' and '{following.name}' overlap")
+            marked = [shard for shard in shards if shard.new_employees]
+            if len(marked) > 1:
+                raise ValueError("Only one shard can take new employees")
+            self._new_employees = marked[0] if marked else self._ranges[-1]
+        else:
+            self._departments = {}
+            for shard in shards:
+                for department in shard.departments:
+                    if department in self._departments:
+                        raise ValueError(f"Department {department!r} is on two shards")
+                    self._departments[department] = shard
+            defaults = [shard for shard in shards if shard.default]
+            if len(defaults) > 1:
+                raise ValueError("Only one shard can be the default")
+            self._default = defaults[0] if defaults else None
+
+    def names(self):
+        return [shard.name for shard in self.shards]
+
+    def for_employee(self, employee_id):
+        employee_id = int(employee_id)
+        if self.key == DEPARTMENT:
+            return self.for_row_id(employee_id)
+        for shard in self._ranges:
+            if employee_id >= shard.min_id and (shard.max_id is None or employee_id <= shard.max_id):
+                return shard
+        raise LookupError(f"No shard holds employee {employee_id}")
+
+    def for_row_id(self, row_id):
+        """The shard of an interleaved auto-increment id (Salary, LeaveRequest)."""
+        row_id = int(row_id)
+        if row_id < 1:
+            raise LookupError(f"No shard holds id {row_id}")
+        return self.shards[(row_id - 1) % len(self.shards)]
+
+    def for_department(self, department):
+        """The shard new employees of `department` go to (only for key=department)."""
+        shard = self._departments.get(department, self._default)
+        if shard is None:
+            raise LookupError(f"No shard takes department {department!r}")
+        return shard
+
+    def for_new_employee(self, department):
+        return self.for_department(department) if self.key == DEPARTMENT else self._new_employees
+
+
+def _load_spec(value):
+    if not value.lstrip().startswith('{') and os.path.exists(value):
+        with open(value) as f:
+            return json.load(f)
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"DB_SHARDS must be JSON or the path of a JSON file: {e}")
+
+
+def shard_map_from_config(config):
+    """Parses DB_SHARDS into a ShardMap, or None when sharding is off."""
+    if not config.get('DB_SHARDS'):
+        return None
+    spec = _load_spec(config['DB_SHARDS'])
+    key = spec.get('key', EMPLOYEE_ID)
+    shards = []
+    for index, entry in enumerate(spec.get('shards') or []):
+        name = entry.get('name')
+        if not name:
+            raise ValueError("Every DB_SHARDS shard needs a name")
+        connection = {
+            'host': entry.get('host') or config['DB_HOST'],
+            'port': int(entry.get('port') or config['DB_PORT']),
+            'user': entry.get('user') or config['DB_USER'],
+            'password': entry.get('password') or config['DB_PASSWORD'],
+            'database': entry.get('database') or config['DB_NAME'],
+            'pool_name': f"{config['DB_POOL_NAME']}_{name}",
+            'pool_size': config['DB_SHARD_POOL_SIZE'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+        }
+        if key == EMPLOYEE_ID:
+            if entry.get('min_id') is None:
+                raise ValueError(f"DB_SHARDS shard '{name}' needs min_id")
+            max_id = entry.get('max_id')
+            shards.append(Shard(name, index, connection, min_id=int(entry['min_id']),
+                                max_id=None if max_id is None else int(max_id),
+                                new_employees=bool(entry.get('new_employees'))))
+        else:
+            shards.append(Shard(name, index, connection, departments=entry.get('departments') or (),
+                                default=bool(entry.get('default'))))
+    return ShardMap(key, shards)
+
+
+def init_shards(config):
+    """Reads DB_SHARDS and registers one connection pool per shard. Call after init_db()."""
+    global _map
+    _map = shard_map_from_config(config)
+    configure_shard_pools({shard.name: shard.connection for shard in _map.shards} if _map else {})
+    if _map:
+        log.info("Sharding by %s across %s", _map.key, ", ".join(_map.names()))
+
+
+def enabled():
+    return _map is not None
+
+
+def shard_map():
+    return _map
+
+
+def names():
+    return _map.names() if _map else []
+
+
+def shard_for_employee(employee_id):
+    """Name of the shard holding `employee_id`. Raises LookupError."""
+    return _map.for_employee(employee_id).name
+
+
+def shard_for_row(row_id):
+    """Name of the shard a Salary or LeaveRequest id belongs to. Raises LookupError."""
+    return _map.for_row_id(row_id).name
+
+
+def shard_for_new_employee(department):
+    return _map.for_new_employee(department).name
+
+
+def group_by_shard(employee_ids):
+    """{shard name: [ids]} in request order, plus the ids no shard holds. Unsharded: {None: ids}."""
+    if _map is None:
+        return {None: list(employee_ids)}, []
+    groups = {}; unknown = []
+    for employee_id in employee_ids:
+        try:
+            groups.setdefault(shard_for_employee(employee_id), []).append(employee_id)
+        except LookupError:
+            unknown.append(employee_id)
+    return groups, unknown
+
+
+def _executor():
+    # Created lazily and per process, like the connection pools (gunicorn --preload forks)
+    global _executor_entry
+    pid = os.getpid()
+    entry = _executor_entry
+    if entry is None or entry[1] != pid:
+        with _executor_lock:
+            entry = _executor_entry
+            if entry is None or entry[1] != pid:
+                workers = max(4, sum(shard.connection['pool_size'] for shard in _map.shards))
+                entry = _executor_entry = (ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard'), pid)
+    return entry[0]
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _on_shard(name, fn):
+    conn = get_shard_connection(name)
+    if conn is None:
+        raise ShardUnavailable(name)
+    try:
+        return fn(conn)
+    finally:
+        conn.close()
+
+
+def scatter(fn, shard_names=None):
+    """
+    Runs fn(conn) on every shard (or on `shard_names`) in parallel and returns
+    {shard name: result}. Without sharding fn runs once, on get_db_connection(),
+    under the key None. Raises ShardUnavailable if a node cannot be reached;
+    exceptions from fn propagate.
+    """
+    if _map is None:
+        conn = get_db_connection()
+        if conn is None:
+            raise ShardUnavailable('primary')
+        try:
+            return {None: fn(conn)}
+        finally:
+            conn.close()
+    _count('scatters')
+    shard_names = _map.names() if shard_names is None else list(shard_names)
+    if len(shard_names) == 1:
+        return {shard_names[0]: _on_shard(shard_names[0], fn)}
+    futures = {name: _executor().submit(_on_shard, name, fn) for name in shard_names}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def scatter_groups(groups, fn):
+    """Like scatter(), but runs fn(conn, items) with each shard's own items ({shard name: items})."""
+    if _map is None:
+        return scatter(lambda conn: fn(conn, groups[None])) if None in groups else {}
+    _count('scatters')
+    futures = {name: _executor().submit(_on_shard, name, lambda conn, items=items: fn(conn, items))
+               for name, items in groups.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def locate(sql, params=()):
+    """(shard name, first row) of the first shard where `sql` finds a row, else (None, None)."""
+    for name, row in scatter(lambda conn: fetch_one(conn, sql, params)).items():
+        if row is not None:
+            return name, row
+    return None, None
+
+
+# --- CROSS-SHARD WRITES ---
+class ShardTransaction:
+    """
+    One transaction over several shards with XA two-phase commit:
+
+        tx = ShardTransaction('payroll-42')
+        results, ok = tx.prepare({name: work, ...})   # work(conn) -> (result, ok)
+        tx.commit() if ok else tx.rollback()
+
+    Each work function runs between XA START and XA END on its shard, all in
+    parallel, and must not commit. Shards whose work returned ok are PREPAREd,
+    the others rolled back straight away. If commit() fails half way the
+    remaining branches stay prepared on their nodes (XA RECOVER lists them)
+    and are logged for an operator to finish.
+    """
+
+    def __init__(self, xid):
+        self.xid = xid
+        self._prepared = {}  # shard name -> connection holding the prepared branch
+        self._lock = threading.Lock()
+
+    def _prepare_one(self, name, work):
+        conn = get_shard_connection(name)
+        if conn is None:
+            raise ShardUnavailable(name)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("XA START %s", (self.xid,))
+            result, ok = work(conn)
+            cursor.execute("XA END %s", (self.xid,))
+            cursor.execute("XA PREPARE %s" if ok else "XA ROLLBACK %s", (self.xid,))
+        except Exception:
+            _abort_branch(cursor, self.xid)
+            cursor.close()
+            conn.close()
+            raise
+        cursor.close()
+        if not ok:
+            conn.close()
+            return result, False
+        with self._lock:
+            self._prepared[name] = conn
+        return result, True
+
+    def prepare(self, work):
+        """Runs {shard name: work(conn) -> (result, ok)}; returns ({name: result}, every shard ok)."""
+        futures = {name: _executor().submit(self._prepare_one, name, fn) for name, fn in work.items()}
+        results = {}; all_ok = True; error = None
+        for name, future in futures.items():
+            try:
+                results[name], ok = future.result()
+                all_ok = all_ok and ok
+            except Exception as e:
+                log.error("XA %s: shard '%s' failed: %s", self.xid, name, e)
+                error = error or e
+        if error is not None:
+            self.rollback()
+            raise error
+        return results, all_ok
+
+    def _finish(self, statement):
+        failed = []
+        for name, conn in self._prepared.items():
+            try:
+                cursor = conn.cursor()
+                cursor.execute(statement, (self.xid,))
+                cursor.close()
+            except Exception as e:
+                failed.append(name)
+                log.critical("XA %s: '%s' failed on shard '%s' (%s); the branch is still prepared there",
+                             self.xid, statement.split(' %')[0], name, e)
+            finally:
+                conn.close()
+        self._prepared = {}
+        return failed
+
+    def commit(self):
+        """Commits every prepared branch; returns the shards where that failed."""
+        failed = self._finish("XA COMMIT %s")
+        _count('xa_commits')
+        return failed
+
+    def rollback(self):
+        failed = self._finish("XA ROLLBACK %s")
+        _count('xa_rollbacks')
+        return failed
+
+
+def _abort_branch(cursor, xid):
+    for statement in ("XA END %s", "XA ROLLBACK %s"):
+        try:
+            cursor.execute(statement, (xid,))
+        except Exception:
+            pass
+
+
+def merge_counts(parts, key, fields):
+    """Adds up GROUP BY `key` rows from several shards: one row per key, `fields` summed."""
+    merged = {}
+    for rows in parts:
+        for row in rows:
+            total = merged.get(row[key])
+            if total is None:
+                merged[row[key]] = dict(row)
+            else:
+                for field in fields:
+                    total[field] = (total[field] or 0) + (row[field] or 0)
+    return list(merged.values())
+
+
+def shard_stats():
+    if _map is None:
+        return {'enabled': False}
+    with _stats_lock:
+        stats = dict(_stats)
+    return dict(stats, enabled=True, key=_map.key, shards=[shard.describe() for shard in _map.shards])
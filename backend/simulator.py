@@ -0,0 +1,274 @@
+import datetime
+import math
+
+import payroll
+from archive import fiscal_year_of
+
+# --- WHAT-IF PAYROLL SIMULATOR ---
+# Projects the monthly cost per department of a scenario (raises, bonus pools,
+# PF / OT changes) over N months. Nothing is written.
+#
+# Scenario rules only depend on department, position and the employee's payroll
+# rule set class, so the workforce is first reduced to one segment per
+# (department, position, class): headcount, sum of base salaries and sum of
+# base * overtime hours. The payroll formula is linear
+# in those sums, so payroll.calculate_salary() applied to a segment (base = the
+# sum, overtime hours = the base-weighted average) gives the segment's total
+# directly, up to per-employee rounding. Building the segments is one pass over
+# the employees; every projected month then costs O(segments).
+#
+# Scenario JSON (every key optional):
+#   {
+#     "months": 12,                          # 1-60
+#     "start_month": "2026-01-01",           # default: next month
+#     "raises": [{"department": "Sales", "position": "Sales Manager",
+#                 "percent": 5, "from_month": 4}],   # compounding; no dept/position = everyone
+#     "bonus_pools": [{"department": "Engineering", "amount": 500000, "month": 12}],
+#                                            # split by base salary; no department = company-wide
+#     "pf_rate": 0.12, "ot_multiplier": 1.5,   # override every class's rule set
+#     "overtime_scale": 1.0                  # multiplies the baseline overtime hours
+#   }
+
+MAX_MONTHS = 60
+
+
+class Segment:
+    __slots__ = ('department', 'position', 'employee_class', 'headcount', 'base_total', 'base_hours_total')
+
+    def __init__(self, department, position, employee_class):
+        self.department = department
+        self.position = position
+        self.employee_class = employee_class
+        self.headcount = 0
+        self.base_total = 0.0
+        self.base_hours_total = 0.0
+
+
+class Raise:
+    __slots__ = ('department', 'position', 'percent', 'from_month')
+
+    def __init__(self, department, position, percent, from_month):
+        self.department = department
+        self.position = position
+        self.percent = percent
+        self.from_month = from_month
+
+    def applies_to(self, segment):
+        return (self.department is None or self.department == segment.department) and \
+               (self.position is None or self.position == segment.position)
+
+
+class BonusPool:
+    __slots__ = ('department', 'amount', 'month')
+
+    def __init__(self, department, amount, month):
+        self.department = department
+        self.amount = amount
+        self.month = month
+
+
+class Scenario:
+    def __init__(self, months, start_month, raises=(), bonus_pools=(), overrides=None, overtime_scale=1.0):
+        self.months = months
+        self.start_month = start_month
+        self.raises = list(raises)
+        self.bonus_pools = list(bonus_pools)
+        self.overrides = overrides or {}  # PayrollRules fields replaced in every class's rules
+        self.overtime_scale = overtime_scale
+
+    def baseline(self):
+        """Same period, rule sets in force, no changes."""
+        return Scenario(self.months, self.start_month)
+
+
+def build_segments(rows, overtime_hours):
+    """
+    rows: (employee_id, department, position, employee_class, base_salary) tuples.
+    overtime_hours: {employee_id: monthly overtime hours}; missing means 0.
+    """
+    segments = {}
+    for employee_id, department, position, employee_class, base_salary in rows:
+        key = (department, position, employee_class)
+        segment = segments.get(key)
+        if segment is None:
+            segment = segments[key] = Segment(department, position, employee_class)
+        base = float(base_salary or 0.0)
+        segment.headcount += 1
+        segment.base_total += base
+        segment.base_hours_total += base * overtime_hours.get(employee_id, 0.0)
+    return list(segments.values())
+
+
+def _number(data, key, default, low, high):
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{key} must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"{key} must be between {low} and {high}")
+    return value
+
+
+def _month_number(data, key, default, months):
+    value = _number(data, key, default, 1, months)
+    if int(value) != value:
+        raise ValueError(f"{key} must be a whole month number (1-{months})")
+    return int(value)
+
+
+def _optional_str(data, key):
+    value = data.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value or None
+
+
+def parse_scenario(data, default_start):
+    """Validates scenario JSON; raises ValueError with a message for the client."""
+    if not isinstance(data, dict):
+        raise ValueError("Scenario must be a JSON object")
+    months = _month_number(data, 'months', 12, MAX_MONTHS)
+    start_month = default_start
+    if data.get('start_month'):
+        try:
+            start_month = datetime.date.fromisoformat(str(data['start_month'])[:10]).replace(day=1)
+        except ValueError:
+            raise ValueError("start_month must be YYYY-MM-DD")
+
+    raises = []
+    for item in data.get('raises') or []:
+        if not isinstance(item, dict):
+            raise ValueError("Each raise must be an object")
+        raises.append(Raise(_optional_str(item, 'department'), _optional_str(item, 'position'),
+                            _number(item, 'percent', None, -100, 1000),
+                            _month_number(item, 'from_month', 1, months)))
+
+    bonus_pools = []
+    for item in data.get('bonus_pools') or []:
+        if not isinstance(item, dict):
+            raise ValueError("Each bonus pool must be an object")
+        bonus_pools.append(BonusPool(_optional_str(item, 'department'),
+                                     _number(item, 'amount', None, 0, 1e12),
+                                     _month_number(item, 'month', 1, months)))
+
+    overrides = {}
+    if data.get('pf_rate') is not None:
+        overrides['pf_rate'] = _number(data, 'pf_rate', None, 0, 1)
+    if data.get('ot_multiplier') is not None:
+        overrides['ot_multiplier'] = _number(data, 'ot_multiplier', None, 0, 10)
+    return Scenario(months, start_month, raises, bonus_pools, overrides,
+                    _number(data, 'overtime_scale', 1.0, 0, 100))
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _project(segments, scenario, compiled_rules):
+    """{department: [per-month dict]} for the scenario."""
+    rules = [compiled_rules.for_class(segment.employee_class).replace(**scenario.overrides) for segment in segments]
+    factors = [1.0] * len(segments)
+    raises_by_month = {}
+    for rule in scenario.raises:
+        raises_by_month.setdefault(rule.from_month, []).append(rule)
+
+    projection = {segment.department: [] for segment in segments}
+    for month_number in range(1, scenario.months + 1):
+        for rule in raises_by_month.get(month_number, ()):
+            for i, segment in enumerate(segments):
+                if rule.applies_to(segment):
+                    factors[i] *= 1 + rule.percent / 100.0
+
+        bases = [segment.base_total * factor for segment, factor in zip(segments, factors)]
+        bonuses = [0.0] * len(segments)
+        for pool in scenario.bonus_pools:
+            if pool.month != month_number:
+                continue
+            members = [i for i, segment in enumerate(segments) if pool.department in (None, segment.department)]
+            pool_base = sum(bases[i] for i in members)
+            for i in members:
+                bonuses[i] += pool.amount * (bases[i] / pool_base if pool_base else 1.0 / len(members))
+
+        totals = {department: {'base': 0.0, 'overtime_pay': 0.0, 'bonus': 0.0, 'pf_amount': 0.0, 'net_pay': 0.0}
+                  for department in projection}
+        for segment, segment_rules, base, bonus in zip(segments, rules, bases, bonuses):
+            hours = segment.base_hours_total / segment.base_total * scenario.overtime_scale if segment.base_total else 0.0
+            overtime_pay, pf_amount, net_pay = payroll.calculate_salary(base, hours, bonus, 0.0, segment_rules)
+            entry = totals[segment.department]
+            entry['base'] += base
+            entry['overtime_pay'] += overtime_pay
+            entry['bonus'] += bonus
+            entry['pf_amount'] += pf_amount
+            entry['net_pay'] += net_pay
+        month = _add_months(scenario.start_month, month_number - 1)
+        for department, entry in totals.items():
+            entry['gross_cost'] = entry['base'] + entry['overtime_pay'] + entry['bonus']
+            projection[department].append(dict(month=month, **entry))
+    return projection
+
+
+_AMOUNTS = ('base', 'overtime_pay', 'bonus', 'gross_cost', 'pf_amount', 'net_pay')
+
+
+def _sum(entries):
+    return {key: round(math.fsum(entry[key] for entry in entries), 2) for key in _AMOUNTS}
+
+
+def simulate(segments, scenario, compiled_rules):
+    """
+    Projection per department and company-wide, with the baseline (no changes)
+    for comparison. compiled_rules: payroll.compile_rules() for the start month.
+    """
+    departments = {segment.department for segment in segments}
+    positions = {segment.position for segment in segments}
+    for rule in scenario.raises:
+        if rule.department is not None and rule.department not in departments:
+            raise ValueError(f"Unknown department '{rule.department}'")
+        if rule.position is not None and rule.position not in positions:
+            raise ValueError(f"Unknown position '{rule.position}'")
+    for pool in scenario.bonus_pools:
+        if pool.department is not None and pool.department not in departments:
+            raise ValueError(f"Unknown department '{pool.department}'")
+
+    try:
+        projection = _project(segments, scenario, compiled_rules)
+        baseline = _project(segments, scenario.baseline(), compiled_rules)
+    except LookupError as e:
+        raise ValueError(str(e))
+    headcount = {}
+    for segment in segments:
+        headcount[segment.department] = headcount.get(segment.department, 0) + segment.headcount
+
+    result_departments = []
+    for department in sorted(projection, key=lambda d: (d is None, d or '')):
+        months = projection[department]
+        by_fiscal_year = {}
+        for entry in months:
+            by_fiscal_year.setdefault(fiscal_year_of(entry['month']), []).append(entry)
+        total, baseline_total = _sum(months), _sum(baseline[department])
+        result_departments.append({
+            'department': department,
+            'headcount': headcount[department],
+            'monthly': [dict({key: round(entry[key], 2) for key in _AMOUNTS}, month=entry['month'].isoformat())
+                        for entry in months],
+            'by_fiscal_year': [dict(_sum(entries), fiscal_year=year, months=len(entries))
+                               for year, entries in sorted(by_fiscal_year.items())],
+            'total': total,
+            'baseline_total': baseline_total,
+            'delta_gross_cost': round(total['gross_cost'] - baseline_total['gross_cost'], 2),
+        })
+
+    all_months = [entry for months in projection.values() for entry in months]
+    all_baseline = [entry for months in baseline.values() for entry in months]
+    company_total, company_baseline = _sum(all_months), _sum(all_baseline)
+    return {
+        'start_month': scenario.start_month.isoformat(),
+        'months': scenario.months,
+        'rules': compiled_rules.as_dict(),
+        'overrides': scenario.overrides,
+        'headcount': sum(headcount.values()),
+        'departments': result_departments,
+        'total': company_total,
+        'baseline_total': company_baseline,
+        'delta_gross_cost': round(company_total['gross_cost'] - company_baseline['gross_cost'], 2),
+    }
@@ -0,0 +1,604 @@
+"""
+Columnar analytics snapshots for the report endpoints.
+
+    cd backend
+    python snapshots.py build --all                  # backfill every month in Salary
+    python snapshots.py build --month 2025-01-01     # rebuild one month
+    python snapshots.py list
+
+After every successful payroll run (and single salary insert) the month's
+joined Employee + Salary + Attendance rows are written to
+SNAPSHOT_DIR/<YYYY-MM>.snap. The report endpoints memory-map these files and
+aggregate straight from the column buffers, so analytics never query MySQL.
+Snapshots record department, position and pay as of the payroll run.
+
+Run `build --all` once after deploying so months paid before snapshots
+existed are included; the department report stays on the live query until
+the snapshots cover every month in Salary. Deleting an employee rebuilds the
+months they were paid in, and a month left without rows loses its snapshot.
+"""
+import argparse
+import array
+import bisect
+import datetime
+import functools
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import statistics
+import struct
+import sys
+import threading
+
+import outbox
+import queries
+
+# --- FILE FORMAT ---
+# MAGIC, uint32 header length, JSON header, then one buffer per column at the
+# 8-byte aligned offset given in the header, so each column maps directly onto
+# a typed memoryview without copying:
+#   f8    float64, NULL stored as NaN
+#   i8    int64
+#   date  int32 days since 1970-01-01
+#   dict  int32 codes into the header's `dictionary` list (name, department, position)
+# Rows are sorted by (department, employee_id) and the header records each
+# department's [start, end) row range, so per-department work is a slice.
+# Files are written in native byte order; a snapshot from a machine with the
+# other byte order is rejected and has to be rebuilt.
+MAGIC = b'ESMSNAP2'
+_CODES = {'f8': 'd', 'i8': 'q', 'date': 'i', 'dict': 'i'}
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_FILE_RE = re.compile(r'^(\d{4})-(\d{2})\.snap$')
+
+# Column name -> type, in file order. Names match queries.SNAPSHOT_MONTH.
+COLUMNS = (
+    ('employee_id', 'i8'), ('name', 'dict'), ('department', 'dict'), ('position', 'dict'), ('joining_date', 'date'),
+    ('base_salary', 'f8'), ('overtime_hours', 'f8'), ('overtime_pay', 'f8'), ('bonus', 'f8'),
+    ('deductions', 'f8'), ('pf_amount', 'f8'), ('total_salary', 'f8'),
+    ('days_present', 'f8'), ('leaves_taken', 'f8'),
+)
+
+BAND_PERCENTILES = (10, 25, 50, 75, 90)
+OVERTIME_BINS = (0, 1, 5, 10, 20, 40)  # hours; the last bin is open-ended
+
+_settings = {'dir': None}
+_lock = threading.Lock()
+_salary_months = {'months': None, 'generation': 0}
+
+
+def init_snapshots(config):
+    _settings['dir'] = config['SNAPSHOT_DIR']
+    if config['OUTBOX_CONSUMER_ENABLED']:
+        outbox.subscribe('snapshots', _on_events, entities=[outbox.SALARY, outbox.EMPLOYEE])
+
+
+def _on_events(events):
+    with _lock:
+        _salary_months['months'] = None
+        _salary_months['generation'] += 1
+
+
+def salary_months(read):
+    """
+    The months that have salaries, from read() (month values), kept by this
+    worker until a salary or employee change event arrives (outbox.py); read
+    every time while the outbox consumer is not delivering.
+    """
+    with _lock:
+        months, generation = _salary_months['months'], _salary_months['generation']
+    if months is not None:
+        return months
+    # Checked before the read: only events after the consumer's position reach _on_events
+    keep = outbox.delivering('snapshots')
+    months = frozenset(snapshot_month(month) for month in read())
+    if keep:
+        with _lock:
+            if generation == _salary_months['generation']:
+                _salary_months['months'] = months
+    return months
+
+
+def covers(months):
+    """True if there is a snapshot for every one of `months`."""
+    return bool(months) and set(months) <= set(available_months())
+
+
+def snapshot_path(month):
+    return os.path.join(_settings['dir'], f'{month:%Y-%m}.snap')
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def _encode(values, column_type, dictionary):
+    if column_type == 'f8':
+        return array.array('d', (math.nan if v is None else float(v) for v in values))
+    if column_type == 'i8':
+        return array.array('q', (int(v or 0) for v in values))
+    if column_type == 'date':
+        return array.array('i', (0 if v is None else v.toordinal() - _EPOCH_ORDINAL for v in values))
+    codes = {}
+    for value in values:
+        if value not in codes:
+            codes[value] = len(dictionary)
+            dictionary.append(value)
+    return array.array('i', (codes[v] for v in values))
+
+
+def write_snapshot(path, month, rows):
+    """Writes `rows` (dicts with the COLUMNS keys) to `path` atomically. Returns the size in bytes."""
+    rows = sorted(rows, key=lambda row: (row.get('department') or '', row.get('employee_id') or 0))
+    department_ranges, start = [], 0
+    for i in range(1, len(rows) + 1):
+        if i == len(rows) or rows[i].get('department') != rows[start].get('department'):
+            department_ranges.append([start, i])
+            start = i
+    buffers, meta = [], []
+    for name, column_type in COLUMNS:
+        dictionary = []
+        data = _encode([row.get(name) for row in rows], column_type, dictionary).tobytes()
+        entry = {'name': name, 'type': column_type, 'length': len(data)}
+        if column_type == 'dict':
+            entry['dictionary'] = dictionary
+        meta.append(entry)
+        buffers.append(data)
+
+    def header_bytes():
+        return json.dumps({'month': month.isoformat(), 'rows': len(rows), 'byteorder': sys.byteorder,
+                           'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                           'department_ranges': department_ranges, 'columns': meta}).encode('utf-8')
+
+    # Offsets depend on the header length and the header holds the offsets:
+    # lay out with placeholders, then repeat until the header stops growing
+    for entry in meta:
+        entry['offset'] = 0
+    while True:
+        header = header_bytes()
+        offset = _align(len(MAGIC) + 4 + len(header))
+        changed = False
+        for entry in meta:
+            if entry['offset'] != offset:
+                entry['offset'], changed = offset, True
+            offset = _align(offset + entry['length'])
+        if not changed:
+            break
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for entry, data in zip(meta, buffers):
+            f.write(b'\0' * (entry['offset'] - f.tell()))
+            f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)  # readers keep their mapping of the old file
+    return os.path.getsize(path)
+
+
+class Snapshot:
+    """A memory-mapped snapshot. column() returns zero-copy typed views."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a snapshot in the current format; rebuild it with snapshots.py build")
+        (header_length,) = struct.unpack_from('<I', self._map, len(MAGIC))
+        header = json.loads(bytes(view[len(MAGIC) + 4:len(MAGIC) + 4 + header_length]))
+        if header['byteorder'] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine; rebuild it")
+        self.month = datetime.date.fromisoformat(header['month'])
+        self.rows = header['rows']
+        # Parallel to dictionary('department')
+        self.department_ranges = [tuple(bounds) for bounds in header['department_ranges']]
+        self._columns = {}
+        self._dictionaries = {}
+        for entry in header['columns']:
+            buffer = view[entry['offset']:entry['offset'] + entry['length']]
+            self._columns[entry['name']] = buffer.cast(_CODES[entry['type']])
+            if entry['type'] == 'dict':
+                self._dictionaries[entry['name']] = entry['dictionary']
+
+    def column(self, name):
+        return self._columns[name]
+
+    def dictionary(self, name):
+        return self._dictionaries[name]
+
+
+@functools.lru_cache(maxsize=128)
+def _load(path, mtime_ns, size):
+    return Snapshot(path)
+
+
+def _snapshot_files():
+    """[(month, DirEntry)], oldest first."""
+    if not _settings['dir']:
+        return []
+    try:
+        entries = list(os.scandir(_settings['dir']))
+    except FileNotFoundError:
+        return []
+    files = [(datetime.date(int(m.group(1)), int(m.group(2)), 1), entry)
+             for entry in entries if (m := _FILE_RE.match(entry.name))]
+    return sorted(files, key=lambda item: item[0])
+
+
+def available_months():
+    return [month for month, _ in _snapshot_files()]
+
+
+def load_snapshots(months=None):
+    """Mapped snapshots, oldest first; only `months` (dates) if given."""
+    snapshots = []
+    for month, entry in _snapshot_files():
+        if months is not None and month not in months:
+            continue
+        stat = entry.stat()
+        snapshots.append(_load(entry.path, stat.st_mtime_ns, stat.st_size))
+    return snapshots
+
+
+def latest_values(column):
+    """({employee_id: value} from the newest snapshot, its month); NULLs are left out. ({}, None) without snapshots."""
+    months = available_months()
+    if not months:
+        return {}, None
+    snapshot = load_snapshots([months[-1]])[0]
+    values = snapshot.column(column)
+    return {employee_id: value for employee_id, value in zip(snapshot.column('employee_id'), values)
+            if not math.isnan(value)}, snapshot.month
+
+
+def snapshot_month(month):
+    if not isinstance(month, datetime.date):
+        month = datetime.date.fromisoformat(str(month)[:10])
+    return month.replace(day=1)
+
+
+def write_month(month, rows):
+    """
+    Writes the snapshot of `month` from queries.SNAPSHOT_MONTH rows (e.g.
+    gathered from every shard); without rows the month's snapshot is removed.
+    """
+    month = snapshot_month(month)
+    if not rows:
+        try:
+            os.remove(snapshot_path(month))
+        except FileNotFoundError:
+            pass
+        return 0
+    write_snapshot(snapshot_path(month), month, rows)
+    return len(rows)
+
+
+def build_snapshot(cursor, month):
+    """Reads one month through `cursor` (dictionary=True) and writes its snapshot. Returns the row count."""
+    month = snapshot_month(month)
+    cursor.execute(queries.SNAPSHOT_MONTH, (month,))
+    return write_month(month, cursor.fetchall())
+
+
+# --- ANALYTICS ---
+# Each aggregation is a single pass over the column buffers, grouping on the
+# int32 dictionary codes; NaN (NULL) values are skipped.
+
+def _grouped(snapshot, value_column, group_column='department'):
+    """{group label: array('d') of non-NULL values}"""
+    labels = snapshot.dictionary(group_column)
+    groups = [array.array('d') for _ in labels]
+    for code, value in zip(snapshot.column(group_column), snapshot.column(value_column)):
+        if value == value:
+            groups[code].append(value)
+    return dict(zip(labels, groups))
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if len(values) == 1:
+        return {f'p{p}': values[0] for p in BAND_PERCENTILES}
+    cuts = statistics.quantiles(values, n=100, method='inclusive')
+    return {f'p{p}': round(cuts[p - 1], 2) for p in BAND_PERCENTILES}
+
+
+def department_salaries(snapshots):
+    """
+    Same rows as /api/reports/department-salaries: average total_salary per
+    department over every snapshot, and the department's headcount in the latest one.
+    """
+    totals = {}
+    for snapshot in snapshots:
+        for department, values in _grouped(snapshot, 'total_salary').items():
+            entry = totals.setdefault(department, [0.0, 0])
+            entry[0] += math.fsum(values)
+            entry[1] += len(values)
+    latest = snapshots[-1]
+    labels = latest.dictionary('department')
+    headcount = {}
+    for code in latest.column('department'):
+        headcount[labels[code]] = headcount.get(labels[code], 0) + 1
+    report = [{'department': department, 'average_salary': total / count if count else 0.0,
+               'employee_count': headcount.get(department, 0)}
+              for department, (total, count) in totals.items()]
+    report.sort(key=lambda row: row['average_salary'], reverse=True)
+    return report
+
+
+def salary_bands(snapshot):
+    """Percentile bands of total_salary per department and overall for one month."""
+    departments = []
+    for department, values in sorted(_grouped(snapshot, 'total_salary').items()):
+        if values:
+            departments.append(dict(department=department, count=len(values), **_percentiles(values)))
+    overall = array.array('d', (v for v in snapshot.column('total_salary') if v == v))
+    return {'month': snapshot.month.isoformat(), 'percentiles': list(BAND_PERCENTILES),
+            'overall': dict(count=len(overall), **_percentiles(overall)) if overall else None,
+            'departments': departments}
+
+
+def overtime_distribution(snapshot):
+    """Employees per overtime-hours bin, per department and overall, for one month."""
+    labels = [f'{low}-{high}' for low, high in zip(OVERTIME_BINS, OVERTIME_BINS[1:])] + [f'{OVERTIME_BINS[-1]}+']
+
+    def histogram(values):
+        counts = [0] * len(labels)
+        for hours in values:
+            counts[max(bisect.bisect_right(OVERTIME_BINS, hours) - 1, 0)] += 1
+        return counts
+
+    hours = _grouped(snapshot, 'overtime_hours')
+    pay = _grouped(snapshot, 'overtime_pay')
+    departments = [{'department': department, 'counts': histogram(values),
+                    'total_hours': round(math.fsum(values), 2),
+                    'total_overtime_pay': round(math.fsum(pay[department]), 2)}
+                   for department, values in sorted(hours.items()) if values]
+    overall = [v for v in snapshot.column('overtime_hours') if v == v]
+    return {'month': snapshot.month.isoformat(), 'bins': labels, 'overall': histogram(overall),
+            'departments': departments}
+
+
+def headcount_trend(snapshots):
+    """Per month: paid headcount, payroll total and average, and headcount per department."""
+    trend = []
+    for snapshot in snapshots:
+        totals = _grouped(snapshot, 'total_salary')
+        amount = math.fsum(math.fsum(values) for values in totals.values())
+        paid = sum(len(values) for values in totals.values())
+        labels = snapshot.dictionary('department')
+        by_department = dict.fromkeys(labels, 0)
+        for code in snapshot.column('department'):
+            by_department[labels[code]] += 1
+        trend.append({'month': snapshot.month.isoformat(), 'headcount': snapshot.rows,
+                      'total_payroll': round(amount, 2), 'average_salary': round(amount / paid, 2) if paid else 0.0,
+                      'departments': by_department})
+    return trend
+
+
+# --- RANKINGS ---
+# A ranking works on one department at a time: parallel sequences of employee
+# ids (ascending), names and amounts. For a single month these are zero-copy
+# slices of the snapshot; for a range of months the per-employee totals are
+# rolled up once and cached. Top/bottom N use a bounded heap (O(m log N)), and
+# one employee's rank is a single counting pass; nothing sorts a department.
+
+class _DepartmentRanking:
+    __slots__ = ('department', 'ids', 'names', 'amounts', 'months')
+
+    def __init__(self, department, ids, names, amounts, months):
+        self.department = department
+        self.ids = ids
+        self.names = names
+        self.amounts = amounts
+        self.months = months  # months paid per employee, or None for a single month
+
+
+class _LazyNames:
+    """Decodes dictionary codes only for the rows a ranking actually returns."""
+    __slots__ = ('codes', 'labels')
+
+    def __init__(self, codes, labels):
+        self.codes = codes
+        self.labels = labels
+
+    def __getitem__(self, i):
+        return self.labels[self.codes[i]]
+
+
+def _month_rankings(snapshot):
+    ids, amounts = snapshot.column('employee_id'), snapshot.column('total_salary')
+    name_codes, labels = snapshot.column('name'), snapshot.dictionary('name')
+    return [_DepartmentRanking(department, ids[start:end], _LazyNames(name_codes[start:end], labels),
+                               amounts[start:end], None)
+            for department, (start, end) in zip(snapshot.dictionary('department'), snapshot.department_ranges)]
+
+
+@functools.lru_cache(maxsize=16)
+def _range_rollup(snapshot_keys):
+    """Per-employee totals over several snapshots, grouped by each employee's latest department."""
+    totals = {}  # employee_id -> [amount, months, department, name]
+    for key in snapshot_keys:
+        snapshot = _load(*key)
+        names, departments = snapshot.dictionary('name'), snapshot.dictionary('department')
+        for employee_id, name_code, department_code, amount in zip(
+                snapshot.column('employee_id'), snapshot.column('name'),
+                snapshot.column('department'), snapshot.column('total_salary')):
+            if amount != amount:
+                continue
+            entry = totals.get(employee_id)
+            if entry is None:
+                totals[employee_id] = [amount, 1, departments[department_code], names[name_code]]
+            else:
+                entry[0] += amount
+                entry[1] += 1
+                entry[2], entry[3] = departments[department_code], names[name_code]
+    grouped = {}
+    for employee_id in sorted(totals):
+        amount, months, department, name = totals[employee_id]
+        group = grouped.setdefault(department, (array.array('q'), [], array.array('d'), array.array('i')))
+        group[0].append(employee_id)
+        group[1].append(name)
+        group[2].append(amount)
+        group[3].append(months)
+    return [_DepartmentRanking(department, *grouped[department]) for department in sorted(grouped)]
+
+
+def _top_rows(ranking, top, m):
+    """`top` holds the N largest, best first, so RANK() is the position of the first tie."""
+    rows, previous, rank = [], None, 0
+    for position, i in enumerate(top):
+        amount = ranking.amounts[i]
+        if amount != previous:
+            rank, previous = position + 1, amount
+        rows.append(_ranking_row(ranking, i, rank, m))
+    return rows
+
+
+def _bottom_rows(ranking, bottom, m):
+    """`bottom` holds the N smallest; rank = 1 + number earning more = m - number at or below + 1."""
+    if not bottom:
+        return []
+    amounts = ranking.amounts
+    edge = amounts[bottom[-1]]
+    # Ties with the largest bottom value may lie outside the heap result: one counting pass
+    ties_outside = sum(1 for value in amounts if value == edge) - sum(1 for i in bottom if amounts[i] == edge)
+    rows = []
+    for i in bottom:
+        amount = amounts[i]
+        at_or_below = sum(1 for j in bottom if amounts[j] <= amount) + (ties_outside if amount == edge else 0)
+        rows.append(_ranking_row(ranking, i, m - at_or_below + 1, m))
+    return rows
+
+
+def _ranking_row(ranking, i, rank, m):
+    row = {'employee_id': ranking.ids[i], 'name': ranking.names[i], 'total_salary': round(ranking.amounts[i], 2),
+           'rank': rank, 'percentile': round(100.0 * (m - rank) / (m - 1), 2) if m > 1 else 100.0}
+    if ranking.months is not None:
+        row['months_paid'] = ranking.months[i]
+        row['average_salary'] = round(ranking.amounts[i] / ranking.months[i], 2)
+    return row
+
+
+def _employee_rank(ranking, employee_id):
+    """(index, rank, ranked employees) of one employee within the department, or None."""
+    i = bisect.bisect_left(ranking.ids, employee_id)
+    if i == len(ranking.ids) or ranking.ids[i] != employee_id:
+        return None
+    amount = ranking.amounts[i]
+    greater = sum(1 for value in ranking.amounts if value > amount)
+    m = sum(1 for value in ranking.amounts if value == value)
+    return i, greater + 1, m
+
+
+def rankings(snapshots, n, department=None, employee_id=None):
+    """
+    Top-N and bottom-N earners per department over `snapshots` (one month, or
+    the sum over a range), plus one employee's rank and percentile if asked.
+    Percentile is the share of the department earning less (100 = top).
+    """
+    if len(snapshots) == 1:
+        departments = _month_rankings(snapshots[0])
+    else:
+        departments = _range_rollup(tuple(_snapshot_keys(snapshots)))
+    if department:
+        departments = [ranking for ranking in departments if ranking.department == department]
+
+    result = {'months': [snapshot.month.isoformat() for snapshot in snapshots], 'n': n, 'departments': []}
+    for ranking in departments:
+        valid = [i for i in range(len(ranking.amounts)) if ranking.amounts[i] == ranking.amounts[i]]
+        m = len(valid)
+        if not m:
+            continue
+        top = heapq.nlargest(n, valid, key=ranking.amounts.__getitem__)
+        bottom = heapq.nsmallest(n, valid, key=ranking.amounts.__getitem__)
+        result['departments'].append({'department': ranking.department, 'employees': m,
+                                      'top': _top_rows(ranking, top, m), 'bottom': _bottom_rows(ranking, bottom, m)})
+
+    if employee_id is not None:
+        result['employee'] = None
+        for ranking in departments:
+            found = _employee_rank(ranking, employee_id)
+            if found:
+                i, rank, m = found
+                result['employee'] = dict(_ranking_row(ranking, i, rank, m), department=ranking.department)
+                break
+    return result
+
+
+def _snapshot_keys(snapshots):
+    wanted = {snapshot.month for snapshot in snapshots}
+    keys = []
+    for month, entry in _snapshot_files():
+        if month in wanted:
+            stat = entry.stat()
+            keys.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    return keys
+
+
+def snapshot_stats():
+    cache = _load.cache_info()
+    months = available_months()
+    return {'months': len(months), 'latest': months[-1].isoformat() if months else None,
+            'cache': {'hits': cache.hits, 'misses': cache.misses, 'mapped': cache.currsize}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['build', 'list'])
+    parser.add_argument('--month', help="YYYY-MM-01 (build one month)")
+    parser.add_argument('--all', action='store_true', help="build every month that has salaries")
+    args = parser.parse_args()
+
+    from config import load_config
+    config = load_config()
+    init_snapshots(config)
+
+    if args.command == 'list':
+        for month, entry in _snapshot_files():
+            print(f"{month:%Y-%m}: {_load(entry.path, entry.stat().st_mtime_ns, entry.stat().st_size).rows} rows")
+        return
+    if not args.month and not args.all:
+        parser.error("build needs --month or --all")
+
+    import shards
+    from db import fetch_all, get_db_connection, init_db
+    init_db(config)
+    shards.init_shards(config)
+    if shards.enabled():
+        # The month's rows are spread over the shards
+        if args.all:
+            parts = shards.scatter(lambda conn: fetch_all(conn, "SELECT DISTINCT month FROM Salary"))
+            months = sorted({row['month'] for rows in parts.values() for row in rows})
+        else:
+            months = [args.month]
+        for month in months:
+            first = snapshot_month(month)
+            parts = shards.scatter(lambda conn: fetch_all(conn, queries.SNAPSHOT_MONTH, (first,)))
+            print(f"{month}: {write_month(first, [row for rows in parts.values() for row in rows])} rows")
+        return
+    conn = get_db_connection()
+    if conn is None:
+        sys.exit("Database connection failed")
+    cursor = conn.cursor(dictionary=True, buffered=True)
+    try:
+        if args.all:
+            cursor.execute("SELECT DISTINCT month FROM Salary ORDER BY month")
+            months = [row['month'] for row in cursor.fetchall()]
+        else:
+            months = [args.month]
+        for month in months:
+            print(f"{month}: {build_snapshot(cursor, month)} rows")
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+"""
+WSGI entry point for production servers.
+
+    cd backend
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+See gunicorn.conf.py for the production serving mode and its settings.
+"""
+from app import create_app
+
+app = create_app()
@@ -0,0 +1,189 @@
+"""
+Year-to-date salary totals per employee and fiscal year (SalaryYTD, migration 0006).
+
+    cd backend
+    python ytd.py status                        # employees and totals per fiscal year
+    python ytd.py rebuild                       # recompute every year from Salary and the archive
+    python ytd.py rebuild --fiscal-year 2024
+    python ytd.py rebuild --shard a             # on shard node 'a' (DB_SHARDS, shards.py)
+
+The app keeps SalaryYTD current: every Salary insert (add salary, payroll run)
+and every adjustment adds its amounts through add() in the same transaction.
+`rebuild` is for filling the table after the migration and after changing
+FISCAL_YEAR_START_MONTH. It share-locks the fiscal year's Salary rows while it
+runs, so writes to that year wait for it.
+"""
+import argparse
+import datetime
+import sys
+
+import archive
+import queries
+
+# Totals kept per (employee, fiscal year), in SalaryYTD column order
+FIELDS = ('months', 'overtime_hours', 'gross', 'overtime_pay', 'bonus', 'deductions', 'pf_amount', 'net')
+
+
+def _month(value):
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(str(value)[:10])
+
+
+def salary_delta(employee_id, month, overtime_hours, overtime_pay, bonus, deductions, pf_amount, total_salary, months=1):
+    """
+    One change to an employee's totals: a whole Salary row (months=1) or the
+    difference an adjustment made to one (months=0). Gross is what the row paid
+    before deductions and PF, i.e. base + overtime pay + bonus.
+    """
+    month = _month(month)
+    values = [float(value or 0.0) for value in (overtime_hours, overtime_pay, bonus, deductions, pf_amount, total_salary)]
+    overtime_hours, overtime_pay, bonus, deductions, pf_amount, net = values
+    return (employee_id, archive.fiscal_year_of(month), months, overtime_hours, net + deductions + pf_amount,
+            overtime_pay, bonus, deductions, pf_amount, net, month)
+
+
+def for_inserts(rows):
+    """Deltas for rows in queries.INSERT_SALARY order."""
+    return [salary_delta(*row[:8]) for row in rows]
+
+
+def add(cursor, deltas):
+    """Adds the deltas to SalaryYTD through the caller's cursor (and transaction)."""
+    merged = {}
+    for delta in deltas:
+        key = delta[:2]
+        current = merged.get(key)
+        if current is None:
+            merged[key] = list(delta)
+        else:
+            for i in range(2, 10):
+                current[i] += delta[i]
+            current[10] = max(current[10], delta[10])
+    # Key order, so concurrent writers lock the rows in the same order
+    rows = [tuple(round(value, 2) if isinstance(value, float) else value for value in merged[key]) for key in sorted(merged)]
+    for chunk in queries.chunks(rows):
+        cursor.executemany(queries.UPSERT_SALARY_YTD, chunk)
+
+
+def statement(row, current_fiscal_year=None):
+    """A SalaryYTD row as an API statement: the totals plus the fiscal year's period."""
+    if current_fiscal_year is None:
+        current_fiscal_year = archive.fiscal_year_of(datetime.date.today())
+    start, end = archive.fiscal_year_bounds(row['fiscal_year'])
+    result = {key: row[key] for key in row if key not in FIELDS and key != 'last_month'}
+    result.update({
+        'period_start': start.isoformat(),
+        'period_end': (end - datetime.timedelta(days=1)).isoformat(),
+        # The current year is year-to-date; earlier years are annual statements
+        'year_to_date': row['fiscal_year'] >= current_fiscal_year,
+        'last_month': row['last_month'].isoformat() if row['last_month'] else None,
+    })
+    result.update((field, int(row[field]) if field == 'months' else float(row[field])) for field in FIELDS)
+    return result
+
+
+def totals(statements):
+    """Sums FIELDS over statements (the company total of one fiscal year)."""
+    summed = {field: 0 if field == 'months' else 0.0 for field in FIELDS}
+    for item in statements:
+        for field in FIELDS:
+            summed[field] += item[field]
+    return {field: value if field == 'months' else round(value, 2) for field, value in summed.items()}
+
+
+# --- REBUILD ---
+
+def rebuild(conn, fiscal_year):
+    """Recomputes one fiscal year from the live Salary rows and its archive file (live rows win)."""
+    start, end = archive.fiscal_year_bounds(fiscal_year)
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("DELETE FROM SalaryYTD WHERE fiscal_year = %s", (fiscal_year,))
+        cursor.execute(queries.SALARY_FOR_YTD, (start, end))
+        deltas = []; live = set()
+        for row in cursor:
+            live.add((row['employee_id'], row['month']))
+            deltas.append(salary_delta(row['employee_id'], row['month'], row['overtime_hours'], row['overtime_pay'],
+                                       row['bonus'], row['deductions'], row['pf_amount'], row['total_salary']))
+        for row in archive.fiscal_year_rows('Salary', fiscal_year):
+            if row['employee_id'] is None or (row['employee_id'], row['month']) in live:
+                continue
+            deltas.append(salary_delta(row['employee_id'], row['month'], row.get('overtime_hours'), row.get('overtime_pay'),
+                                       row.get('bonus'), row.get('deductions'), row.get('pf_amount'), row.get('total_salary')))
+        add(cursor, deltas)
+        conn.commit()
+        return len({delta[0] for delta in deltas}), len(deltas)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def fiscal_years(conn):
+    """Every fiscal year with salaries (live or archived) or with SalaryYTD rows, oldest first."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT DISTINCT fiscal_year FROM SalaryYTD")
+        years = {row[0] for row in cursor.fetchall()}
+        cursor.execute("SELECT DISTINCT month FROM Salary")
+        years.update(archive.fiscal_year_of(row[0]) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+    years.update(archive.archived_fiscal_years('Salary'))
+    return sorted(years)
+
+
+def status(conn):
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT fiscal_year, COUNT(*) AS employees, SUM(months) AS months, SUM(net) AS net "
+                       "FROM SalaryYTD GROUP BY fiscal_year ORDER BY fiscal_year")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    if not rows:
+        print("SalaryYTD is empty; run `python ytd.py rebuild`")
+    for row in rows:
+        start, end = archive.fiscal_year_bounds(row['fiscal_year'])
+        print(f"FY{row['fiscal_year']} ({start} .. {end - datetime.timedelta(days=1)}): {row['employees']} employees, "
+              f"{row['months']} salary months, net {row['net']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['status', 'rebuild'])
+    parser.add_argument('--fiscal-year', type=int, help="rebuild only this fiscal year")
+    parser.add_argument('--shard', help="run on this shard node (DB_SHARDS) instead of the home database")
+    args = parser.parse_args()
+
+    import mysql.connector
+    import shards
+    from config import load_config
+    from db import get_db_connection, init_db, use_shard
+
+    config = load_config()
+    archive.init_archive(config)
+    init_db(config)
+    shards.init_shards(config)
+    if args.shard is not None and args.shard not in shards.names():
+        sys.exit(f"Unknown shard {args.shard!r}; DB_SHARDS defines: {', '.join(shards.names()) or 'none'}")
+    with use_shard(args.shard):
+        conn = get_db_connection()
+    if conn is None:
+        sys.exit("Database connection failed")
+    try:
+        if args.command == 'status':
+            status(conn)
+        else:
+            years = [args.fiscal_year] if args.fiscal_year is not None else fiscal_years(conn)
+            for fiscal_year in years:
+                employees, months = rebuild(conn, fiscal_year)
+                print(f"FY{fiscal_year}: {employees} employees, {months} salary months")
+    except mysql.connector.Error as e:
+        sys.exit(f"Database error: {e.msg}")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
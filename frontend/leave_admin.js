@@ -16,6 +16,15 @@ function runPageLogic() {
     const API_BASE_URL = 'http://127.0.0.1:5000/api';
     let currentFilter = 'pending'; // Default to pending
 
+    // --- LIVE UPDATES (GET /api/leave-requests/stream) ---
+    // The list is fetched once per filter; after that the server pushes each
+    // new / approved / denied request and the table is patched in place.
+    let currentRequests = [];   // Rows shown for currentFilter
+    let listLoaded = false;     // Deltas arriving while the list loads wait here
+    let queuedDeltas = [];
+    let liveUpdates = false;    // False: refetch after every action as before
+    let lastEventId = '';       // Where a new connection resumes
+
     // --- HELPER FUNCTIONS ---
     // --- FIX: Added setUsername function (similar to other pages) ---
     async function setUsername() {
@@ -92,6 +101,8 @@ function runPageLogic() {
         }
 
         leaveTableBody.innerHTML = ''; // Clear previous results
+        listLoaded = false;
+        queuedDeltas = [];
         tableMessage.textContent = 'Loading requests...';
         tableMessage.className = 'text-center py-4 text-gray-500'; // Reset message style
 
@@ -114,12 +125,13 @@ function runPageLogic() {
             const requests = await response.json();
             console.log("leave_admin.js: Leave requests received:", requests);
 
-            if (!requests || requests.length === 0) {
-                tableMessage.textContent = 'No requests found for this filter.';
-            } else {
-                tableMessage.textContent = ''; // Clear loading/error message
-                renderLeaveTable(requests);
-            }
+            if (status !== currentFilter) return; // The filter changed while this loaded
+            currentRequests = requests || [];
+            listLoaded = true;
+            // Deltas received during the fetch may or may not be in it; applying is idempotent
+            queuedDeltas.forEach(applyDelta);
+            queuedDeltas = [];
+            showRequests();
         } catch (error) {
             console.error('leave_admin.js: Error fetching leave requests:', error);
             tableMessage.textContent = `Error loading requests: ${error.message}`;
@@ -127,6 +139,78 @@ function runPageLogic() {
         }
     }
 
+    function showRequests() {
+        if (currentRequests.length === 0) {
+            leaveTableBody.innerHTML = '';
+            tableMessage.textContent = 'No requests found for this filter.';
+            tableMessage.className = 'text-center py-4 text-gray-500';
+        } else {
+            tableMessage.textContent = ''; // Clear loading/error message
+            renderLeaveTable(currentRequests);
+        }
+    }
+
+    // Applies one pushed change to currentRequests. Safe to apply twice: a
+    // decided request never goes back to pending.
+    function applyDelta(delta) {
+        const index = currentRequests.findIndex(req => String(req.request_id) === String(delta.request_id));
+        if (index >= 0) {
+            const existing = currentRequests[index];
+            if (existing.status === 'pending' || existing.status === delta.status) {
+                currentRequests[index] = { ...existing, ...delta };
+            }
+            if (currentFilter && currentRequests[index].status !== currentFilter) {
+                currentRequests.splice(index, 1); // No longer matches the filter
+            }
+        } else if (!currentFilter || delta.status === currentFilter) {
+            const row = { ...delta };
+            if (!row.requested_on) row.requested_on = delta.changed_at;
+            currentRequests.unshift(row); // Newest first, like the list
+        }
+    }
+
+    function connectLiveUpdates(retried = false) {
+        if (typeof EventSource === 'undefined') return;
+        const resume = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+        const source = new EventSource(`${API_BASE_URL}/leave-requests/stream${resume}`, { withCredentials: true });
+
+        const onDelta = (event) => {
+            if (event.lastEventId) lastEventId = event.lastEventId;
+            let delta;
+            try { delta = JSON.parse(event.data); } catch (e) { return; }
+            if (!listLoaded) {
+                queuedDeltas.push(delta);
+                return;
+            }
+            applyDelta(delta);
+            showRequests();
+        };
+        ['created', 'approved', 'denied'].forEach(name => source.addEventListener(name, onDelta));
+
+        source.addEventListener('ready', (event) => {
+            // Without a position to resume from, changes made while disconnected are not replayed
+            if (lastEventId === '' && retried) fetchLeaveRequests(currentFilter);
+            lastEventId = event.lastEventId;
+            liveUpdates = true;
+            console.log("leave_admin.js: Live updates connected.");
+        });
+        // The server could not resume from our last event: reload the list once
+        source.addEventListener('reset', (event) => {
+            lastEventId = event.lastEventId;
+            liveUpdates = true;
+            console.log("leave_admin.js: Live updates reset, reloading the list.");
+            fetchLeaveRequests(currentFilter);
+        });
+        source.onerror = () => {
+            // EventSource retries by itself; CLOSED means the server refused (e.g. 503)
+            if (source.readyState === EventSource.CLOSED) {
+                liveUpdates = false;
+                console.warn("leave_admin.js: Live updates unavailable, refreshing after actions instead.");
+                setTimeout(() => connectLiveUpdates(true), 30000);
+            }
+        };
+    }
+
     function renderLeaveTable(requests) {
         if (!leaveTableBody) return;
         leaveTableBody.innerHTML = ''; // Clear previous content
@@ -223,7 +307,13 @@ function runPageLogic() {
                 }
 
                 showNotification(`Request ${action}. Attendance table updated if approved.`);
-                fetchLeaveRequests(currentFilter); // Refresh the list with the current filter
+                if (liveUpdates) {
+                    // The stream confirms it shortly; update the row right away
+                    applyDelta({ request_id: Number(id), status: action });
+                    showRequests();
+                } else {
+                    fetchLeaveRequests(currentFilter); // Refresh the list with the current filter
+                }
 
             } catch (error) {
                 console.error(`leave_admin.js: Error ${action}ing request:`, error);
@@ -261,6 +351,7 @@ function runPageLogic() {
     // --- INITIAL DATA LOAD ---
     console.log("leave_admin.js: Setting username and fetching initial data.");
     setUsername(); // --- FIX: Call setUsername ---
+    connectLiveUpdates();
     fetchLeaveRequests(currentFilter); // Load pending requests by default
 
 } // --- End of runPageLogic ---
@@ -28,6 +28,7 @@ function runPageLogic() {
     const leaveRequestForm = document.getElementById('leave-request-form');
     const leaveFormMessage = document.getElementById('leave-form-message');
     const leaveHistoryBody = document.getElementById('leave-history-body');
+    const leaveBalanceEl = document.getElementById('leave-balance');
 
 
     const API_BASE_URL = 'http://127.0.0.1:5000/api';
@@ -283,6 +284,34 @@ function runPageLogic() {
     }
 
 
+    // --- Fetch Leave Balance (current leave year) ---
+    async function fetchMyLeaveBalance() {
+        if (!leaveBalanceEl) return;
+        try {
+            const response = await fetch(`${API_BASE_URL}/my-leave-balance`, { credentials: 'include' });
+            if (!response.ok) {
+                if (response.status === 401) return; // Handled by auth.js
+                let errorMsg = `Failed to fetch leave balance (${response.status})`;
+                try {
+                    const errorData = await response.json();
+                    errorMsg = errorData.error || errorMsg;
+                } catch (e) { /* Ignore */ }
+                throw new Error(errorMsg);
+            }
+            const balance = await response.json();
+            leaveBalanceEl.innerHTML = `
+                <p class="text-lg font-semibold text-gray-800">${balance.available} day(s) available</p>
+                <p>Leave year ${balance.period_start} to ${balance.period_end}:
+                   accrued ${balance.accrued}, adjusted ${balance.adjusted}, taken ${balance.taken}, pending ${balance.pending}</p>
+            `;
+        } catch (error) {
+            console.error('Error fetching leave balance:', error);
+            leaveBalanceEl.textContent = error.message;
+            leaveBalanceEl.className = 'mb-6 p-4 bg-red-50 rounded-md text-sm text-red-600';
+        }
+    }
+
+
     // --- EVENT LISTENERS ---
 
     // Logout Button
@@ -351,6 +380,7 @@ function runPageLogic() {
                 leaveFormMessage.className = 'mt-2 text-center text-sm text-green-600';
                 leaveRequestForm.reset();
                 fetchMyLeaveRequests(); // Refresh history
+                fetchMyLeaveBalance(); // The request reserved its days
 
             } catch (error) {
                  console.error("Leave request error:", error);
@@ -369,6 +399,7 @@ function runPageLogic() {
     fetchMySalaries();
     fetchMyAttendance();
     fetchMyLeaveRequests(); // --- NEW ---
+    fetchMyLeaveBalance();
 
 } // --- End of runPageLogic ---
 
@@ -0,0 +1,15 @@
+-- 0001 down: drop the hot-path indexes.
+
+ALTER TABLE Employee DROP INDEX idx_employee_joining_date;
+
+ALTER TABLE Employee DROP INDEX idx_employee_department;
+
+-- The foreign keys need an index on employee_id; MySQL may have dropped the
+-- implicit ones when the composite keys were added, so recreate them first.
+ALTER TABLE LeaveRequest ADD INDEX idx_leave_employee (employee_id);
+ALTER TABLE LeaveRequest DROP INDEX idx_leave_employee_requested;
+
+ALTER TABLE LeaveRequest DROP INDEX idx_leave_status_requested;
+
+ALTER TABLE Salary ADD INDEX idx_salary_employee (employee_id);
+ALTER TABLE Salary DROP INDEX uk_salary_employee_month;
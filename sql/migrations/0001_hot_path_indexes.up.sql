@@ -0,0 +1,22 @@
+-- 0001: indexes for the hot lookups.
+-- Applies on top of the schema built by sql/employee_salary_db.sql.
+--
+-- NOTE: the UNIQUE key fails if Salary already holds two rows for the same
+-- employee and month. Find them first with:
+--   SELECT employee_id, month, COUNT(*) FROM Salary GROUP BY employee_id, month HAVING COUNT(*) > 1;
+
+-- Payroll / add-salary duplicate check: WHERE employee_id = ? AND month = ?
+-- UNIQUE also stops two concurrent payroll runs from writing the same month twice.
+ALTER TABLE Salary ADD UNIQUE KEY uk_salary_employee_month (employee_id, month);
+
+-- Admin leave queue: WHERE status = ? ORDER BY requested_on DESC
+ALTER TABLE LeaveRequest ADD INDEX idx_leave_status_requested (status, requested_on);
+
+-- Employee self-service leave history: WHERE employee_id = ? ORDER BY requested_on DESC
+ALTER TABLE LeaveRequest ADD INDEX idx_leave_employee_requested (employee_id, requested_on);
+
+-- Employee list department filter and the DISTINCT department list
+ALTER TABLE Employee ADD INDEX idx_employee_department (department);
+
+-- New-hires report and joining date filters
+ALTER TABLE Employee ADD INDEX idx_employee_joining_date (joining_date);
@@ -0,0 +1,18 @@
+-- 0002 down: back to unpartitioned tables with cascading foreign keys.
+-- Rows already moved to the cold archive (archive.py) stay in the archive.
+-- Adding the foreign keys fails if a Salary or Attendance row points to a
+-- deleted employee; remove those rows first.
+
+ALTER TABLE Attendance REMOVE PARTITIONING;
+
+ALTER TABLE Salary REMOVE PARTITIONING;
+
+ALTER TABLE Attendance DROP PRIMARY KEY, ADD PRIMARY KEY (attendance_id);
+
+ALTER TABLE Salary DROP PRIMARY KEY, ADD PRIMARY KEY (salary_id);
+
+ALTER TABLE Attendance ADD CONSTRAINT fk_attendance_employee
+    FOREIGN KEY (employee_id) REFERENCES Employee(employee_id) ON DELETE CASCADE;
+
+ALTER TABLE Salary ADD CONSTRAINT fk_salary_employee
+    FOREIGN KEY (employee_id) REFERENCES Employee(employee_id) ON DELETE CASCADE;
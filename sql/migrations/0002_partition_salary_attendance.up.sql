@@ -0,0 +1,39 @@
+-- 0002: range-partition Salary and Attendance by month.
+--
+-- MySQL requirements for partitioned tables:
+--   * every unique key must contain the partitioning column, so the primary
+--     keys become (salary_id, month) and (attendance_id, month); the
+--     (employee_id, month) unique keys already qualify;
+--   * no foreign keys. The ON DELETE CASCADE from Employee goes away and
+--     delete_employee removes an employee's Salary and Attendance rows itself.
+--
+-- The tables start with one catch-all partition. `python archive.py partitions`
+-- splits it into monthly partitions (from the oldest row to a few months ahead)
+-- and must run monthly, e.g. from cron, to keep adding the coming months.
+
+-- Foreign keys were created unnamed, so look their names up
+SET @fk = (SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+           WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'Salary' AND REFERENCED_TABLE_NAME = 'Employee' LIMIT 1);
+SET @sql = IF(@fk IS NULL, 'DO 0', CONCAT('ALTER TABLE Salary DROP FOREIGN KEY `', @fk, '`'));
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @fk = (SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+           WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'Attendance' AND REFERENCED_TABLE_NAME = 'Employee' LIMIT 1);
+SET @sql = IF(@fk IS NULL, 'DO 0', CONCAT('ALTER TABLE Attendance DROP FOREIGN KEY `', @fk, '`'));
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+ALTER TABLE Salary DROP PRIMARY KEY, ADD PRIMARY KEY (salary_id, month);
+
+ALTER TABLE Attendance DROP PRIMARY KEY, ADD PRIMARY KEY (attendance_id, month);
+
+ALTER TABLE Salary PARTITION BY RANGE COLUMNS (month) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
+
+ALTER TABLE Attendance PARTITION BY RANGE COLUMNS (month) (
+    PARTITION p_future VALUES LESS THAN (MAXVALUE)
+);
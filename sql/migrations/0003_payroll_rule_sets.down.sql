@@ -0,0 +1,24 @@
+-- 0003 down: back to the hard-coded rules and the total_salary trigger.
+-- Rule sets and the rule version of each Salary row are lost.
+
+DELIMITER $$
+
+CREATE TRIGGER before_salary_insert
+BEFORE INSERT ON Salary FOR EACH ROW
+BEGIN
+    DECLARE emp_base_salary FLOAT;
+
+    SELECT base_salary INTO emp_base_salary
+    FROM Employee
+    WHERE employee_id = NEW.employee_id;
+
+    SET NEW.total_salary = emp_base_salary + NEW.overtime_pay + NEW.bonus - NEW.deductions - NEW.pf_amount;
+END$$
+
+DELIMITER ;
+
+ALTER TABLE Salary DROP COLUMN rule_version;
+
+ALTER TABLE Employee DROP COLUMN employee_class;
+
+DROP TABLE PayrollRuleSet;
@@ -0,0 +1,35 @@
+-- 0003: versioned, effective-dated payroll rule sets.
+--
+-- Each PayrollRuleSet row is one immutable version of the formula constants
+-- (payroll.py) for an employee class. The version in force for a month is the
+-- latest one with effective_from <= month; classes without their own rule set
+-- use 'default'. Change the rules by inserting a new version
+-- (POST /api/payroll/rules), never by updating an old one: Salary.rule_version
+-- records which version produced each row.
+--
+-- total_salary is now computed by the app with the same rules, so the
+-- before_salary_insert trigger (which hard-coded the formula) is dropped.
+
+CREATE TABLE PayrollRuleSet (
+    version INT PRIMARY KEY AUTO_INCREMENT,
+    employee_class VARCHAR(30) NOT NULL,
+    effective_from DATE NOT NULL,
+    pf_rate DECIMAL(6,4) NOT NULL,
+    ot_multiplier DECIMAL(6,3) NOT NULL,
+    working_days INT NOT NULL,
+    hours_per_day INT NOT NULL,
+    created_by INT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_rule_class_effective (employee_class, effective_from)
+);
+
+-- Version 1: the constants that were hard-coded until now
+INSERT INTO PayrollRuleSet (employee_class, effective_from, pf_rate, ot_multiplier, working_days, hours_per_day)
+VALUES ('default', '1900-01-01', 0.12, 1.5, 22, 8);
+
+ALTER TABLE Employee ADD COLUMN employee_class VARCHAR(30) NOT NULL DEFAULT 'default';
+
+-- NULL for rows written before rule sets existed (computed with version 1's constants)
+ALTER TABLE Salary ADD COLUMN rule_version INT NULL;
+
+DROP TRIGGER IF EXISTS before_salary_insert;
@@ -0,0 +1,3 @@
+-- 0004 down: drop the payroll run ledger.
+
+DROP TABLE PayrollRun;
@@ -0,0 +1,28 @@
+-- 0004: PayrollRun ledger, one row per /api/payroll/run (payroll_runs.py).
+--
+-- The row is committed before the run starts and updated when it ends, so it
+-- survives the run's own rollback; a row left in 'running' means the worker
+-- died mid-run. Phase timings are in milliseconds.
+
+CREATE TABLE PayrollRun (
+    run_id INT PRIMARY KEY AUTO_INCREMENT,
+    month DATE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running', -- running, committed, rolled_back, failed
+    triggered_by INT NULL,                         -- users.id
+    default_bonus DECIMAL(12,2) NOT NULL DEFAULT 0,
+    started_at DATETIME(3) NOT NULL,
+    finished_at DATETIME(3) NULL,
+    employee_count INT NULL,
+    success_count INT NULL,
+    failed_count INT NULL,
+    rows_written INT NULL,
+    fetch_ms DOUBLE NULL,
+    compute_ms DOUBLE NULL,
+    write_ms DOUBLE NULL,
+    commit_ms DOUBLE NULL,
+    total_ms DOUBLE NULL,
+    failure_details JSON NULL,                     -- at most the first 1000 failures
+    error TEXT NULL,
+    INDEX idx_payroll_run_month (month, started_at),
+    INDEX idx_payroll_run_started (started_at)
+);
@@ -0,0 +1,4 @@
+-- 0005 down: drop the outbox tables. Undelivered events are lost.
+
+DROP TABLE OutboxCheckpoint;
+DROP TABLE ChangeEvent;
@@ -0,0 +1,23 @@
+-- 0005: transactional outbox (outbox.py).
+--
+-- Write routes insert a ChangeEvent row in the same transaction as the change
+-- itself, so an event exists exactly when the change committed. The outbox
+-- consumer tails the table by event_id; durable subscribers keep their
+-- position in OutboxCheckpoint. With DB_SHARDS every node has its own events.
+
+CREATE TABLE ChangeEvent (
+    event_id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    entity VARCHAR(32) NOT NULL,          -- Employee, Salary, Attendance, LeaveRequest
+    entity_id INT NULL,                   -- the row's id; NULL for bulk changes (payload lists the employees)
+    employee_id INT NULL,
+    action VARCHAR(32) NOT NULL,          -- created, updated, deleted, approved, ...
+    payload JSON NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    INDEX idx_change_event_created (created_at)
+);
+
+CREATE TABLE OutboxCheckpoint (
+    consumer VARCHAR(64) PRIMARY KEY,
+    last_event_id BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
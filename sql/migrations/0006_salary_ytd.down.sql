@@ -0,0 +1,3 @@
+-- 0006 down: drop the year-to-date totals (rebuildable from Salary and the archive).
+
+DROP TABLE SalaryYTD;
@@ -0,0 +1,26 @@
+-- 0006: SalaryYTD, running salary totals per employee and fiscal year (ytd.py).
+--
+-- Every Salary insert and adjustment adds its amounts here in the same
+-- transaction, so a year-to-date or annual statement is one primary-key read
+-- per employee, and archived years (archive.py) keep their totals. Fiscal
+-- years follow FISCAL_YEAR_START_MONTH and are named by the year they start in.
+--
+-- Fill it from the existing salaries after migrating, and again after changing
+-- FISCAL_YEAR_START_MONTH:  python ytd.py rebuild
+
+CREATE TABLE SalaryYTD (
+    employee_id INT NOT NULL,
+    fiscal_year SMALLINT NOT NULL,
+    months INT NOT NULL DEFAULT 0,
+    overtime_hours DECIMAL(12,2) NOT NULL DEFAULT 0,
+    gross DECIMAL(14,2) NOT NULL DEFAULT 0,             -- base + overtime pay + bonus
+    overtime_pay DECIMAL(14,2) NOT NULL DEFAULT 0,
+    bonus DECIMAL(14,2) NOT NULL DEFAULT 0,
+    deductions DECIMAL(14,2) NOT NULL DEFAULT 0,
+    pf_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    net DECIMAL(14,2) NOT NULL DEFAULT 0,               -- sum of Salary.total_salary
+    last_month DATE NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (employee_id, fiscal_year),
+    INDEX idx_salary_ytd_year (fiscal_year, employee_id)
+);
@@ -0,0 +1,5 @@
+-- 0007 down: drop the leave ledger and balances.
+
+ALTER TABLE LeaveRequest DROP COLUMN leave_days;
+DROP TABLE LeaveBalance;
+DROP TABLE LeaveLedger;
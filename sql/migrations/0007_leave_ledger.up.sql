@@ -0,0 +1,41 @@
+-- 0007: leave ledger and balances (leave.py).
+--
+-- LeaveLedger is the history: monthly accruals (+), approved requests (-) and
+-- admin adjustments (+/-). LeaveBalance holds the running totals per employee
+-- and leave year (fiscal years, FISCAL_YEAR_START_MONTH) and is updated in the
+-- same transaction as each entry, so a balance check is one primary-key read.
+-- Pending requests reserve their working days in LeaveBalance.pending.
+--
+-- Requests submitted before this migration have no leave_days and reserved
+-- nothing. Balances of the current leave year are caught up per employee on
+-- first use; `python leave.py accrue --fiscal-year <year>` starts them all at
+-- once. Then run `python leave.py accrue` monthly (see leave.py).
+
+CREATE TABLE LeaveLedger (
+    entry_id BIGINT PRIMARY KEY AUTO_INCREMENT,
+    employee_id INT NOT NULL,
+    leave_year SMALLINT NOT NULL,
+    kind VARCHAR(20) NOT NULL,              -- accrual, approval, adjustment
+    days DECIMAL(6,2) NOT NULL,             -- negative for approvals
+    request_id INT NULL,                    -- approval: the LeaveRequest
+    accrual_month DATE NULL,                -- accrual: the month it is for
+    note VARCHAR(255) NULL,
+    created_by INT NULL,                    -- users.id; NULL for accruals
+    created_at DATETIME(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3),
+    UNIQUE KEY uk_leave_accrual (employee_id, accrual_month),   -- one accrual per month (NULLs do not clash)
+    INDEX idx_leave_ledger_employee (employee_id, leave_year, entry_id)
+);
+
+CREATE TABLE LeaveBalance (
+    employee_id INT NOT NULL,
+    leave_year SMALLINT NOT NULL,
+    accrued DECIMAL(7,2) NOT NULL DEFAULT 0,
+    adjusted DECIMAL(7,2) NOT NULL DEFAULT 0,
+    taken DECIMAL(7,2) NOT NULL DEFAULT 0,
+    pending DECIMAL(7,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (employee_id, leave_year)
+);
+
+-- Working days a request reserves (and takes when approved)
+ALTER TABLE LeaveRequest ADD COLUMN leave_days DECIMAL(6,2) NULL;
@@ -0,0 +1,14 @@
+-- Run once on every SHARD node (not the home database) after the schema and
+-- `migrate.py --shard <name> up`. See backend/shards.py.
+--
+-- users lives on the home database only, so the shard's Employee.user_id cannot
+-- reference it; the app checks the account on the home database when linking.
+
+ALTER TABLE Employee DROP FOREIGN KEY fk_user_id;
+
+-- key=employee_id: start this node's ids at its min_id, e.g. for shard "b":
+-- ALTER TABLE Employee AUTO_INCREMENT = 1000000;
+--
+-- key=department: interleave the ids instead, in my.cnf of shard i (0-based) of n:
+-- auto_increment_increment = n
+-- auto_increment_offset    = i + 1
@@ -0,0 +1,177 @@
+-- Schema for the in-memory SQLite backend (DB_BACKEND=sqlite, db_sqlite.py).
+--
+-- The same tables as sql/employee_salary_db.sql with every migration in
+-- sql/migrations applied, written in SQLite's dialect. Keep it in step when
+-- adding a migration. Differences from MySQL:
+--   * no partitions: Salary and Attendance have a plain primary key and, as
+--     after migration 0002, no foreign keys;
+--   * ON UPDATE CURRENT_TIMESTAMP columns only get their value on insert;
+--   * timestamps are local time, like MySQL's CURRENT_TIMESTAMP.
+-- The declared types DATE, DATETIME, TIMESTAMP and DECIMAL pick the
+-- converters db_sqlite.py reads those columns back with.
+
+PRAGMA foreign_keys = ON;
+
+CREATE TABLE users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    password_hash VARCHAR(255) NOT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    role VARCHAR(20) NOT NULL DEFAULT 'employee'
+);
+
+CREATE TABLE Employee (
+    employee_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(50) NOT NULL,
+    department VARCHAR(50) NOT NULL,
+    position VARCHAR(50) NOT NULL,
+    joining_date DATE NOT NULL,
+    base_salary FLOAT NOT NULL CHECK (base_salary >= 0),
+    user_id INT NULL UNIQUE REFERENCES users(id) ON DELETE SET NULL,
+    employee_class VARCHAR(30) NOT NULL DEFAULT 'default'
+);
+
+CREATE INDEX idx_employee_department ON Employee (department);
+CREATE INDEX idx_employee_joining_date ON Employee (joining_date);
+
+CREATE TABLE Salary (
+    salary_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INT,
+    month DATE NOT NULL,
+    overtime_hours FLOAT DEFAULT 0,
+    overtime_pay FLOAT DEFAULT 0,
+    bonus FLOAT DEFAULT 0,
+    deductions FLOAT DEFAULT 0,
+    pf_amount FLOAT DEFAULT 0,
+    total_salary FLOAT NOT NULL,
+    rule_version INT NULL,
+    CONSTRAINT uk_salary_employee_month UNIQUE (employee_id, month)
+);
+
+CREATE TABLE Attendance (
+    attendance_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INT,
+    month DATE NOT NULL,
+    days_present INT DEFAULT 0,
+    leaves_taken INT DEFAULT 0,
+    overtime_hours FLOAT DEFAULT 0,
+    CONSTRAINT uk_employee_month UNIQUE (employee_id, month)
+);
+
+CREATE TABLE LeaveRequest (
+    request_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INT NOT NULL REFERENCES Employee(employee_id) ON DELETE CASCADE,
+    start_date DATE NOT NULL,
+    end_date DATE NOT NULL,
+    reason VARCHAR(255),
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    requested_on TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    leave_days DECIMAL(6,2) NULL
+);
+
+CREATE INDEX idx_leave_status_requested ON LeaveRequest (status, requested_on);
+CREATE INDEX idx_leave_employee_requested ON LeaveRequest (employee_id, requested_on);
+
+CREATE TABLE PayrollRuleSet (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_class VARCHAR(30) NOT NULL,
+    effective_from DATE NOT NULL,
+    pf_rate DECIMAL(6,4) NOT NULL,
+    ot_multiplier DECIMAL(6,3) NOT NULL,
+    working_days INT NOT NULL,
+    hours_per_day INT NOT NULL,
+    created_by INT NULL,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX idx_rule_class_effective ON PayrollRuleSet (employee_class, effective_from);
+
+INSERT INTO PayrollRuleSet (employee_class, effective_from, pf_rate, ot_multiplier, working_days, hours_per_day)
+VALUES ('default', '1900-01-01', 0.12, 1.5, 22, 8);
+
+CREATE TABLE PayrollRun (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    month DATE NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'running',
+    triggered_by INT NULL,
+    default_bonus DECIMAL(12,2) NOT NULL DEFAULT 0,
+    started_at DATETIME(3) NOT NULL,
+    finished_at DATETIME(3) NULL,
+    employee_count INT NULL,
+    success_count INT NULL,
+    failed_count INT NULL,
+    rows_written INT NULL,
+    fetch_ms DOUBLE NULL,
+    compute_ms DOUBLE NULL,
+    write_ms DOUBLE NULL,
+    commit_ms DOUBLE NULL,
+    total_ms DOUBLE NULL,
+    failure_details JSON NULL,
+    error TEXT NULL
+);
+
+CREATE INDEX idx_payroll_run_month ON PayrollRun (month, started_at);
+CREATE INDEX idx_payroll_run_started ON PayrollRun (started_at);
+
+CREATE TABLE ChangeEvent (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    entity VARCHAR(32) NOT NULL,
+    entity_id INT NULL,
+    employee_id INT NULL,
+    action VARCHAR(32) NOT NULL,
+    payload JSON NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+);
+
+CREATE INDEX idx_change_event_created ON ChangeEvent (created_at);
+
+CREATE TABLE OutboxCheckpoint (
+    consumer VARCHAR(64) PRIMARY KEY,
+    last_event_id BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE SalaryYTD (
+    employee_id INT NOT NULL,
+    fiscal_year SMALLINT NOT NULL,
+    months INT NOT NULL DEFAULT 0,
+    overtime_hours DECIMAL(12,2) NOT NULL DEFAULT 0,
+    gross DECIMAL(14,2) NOT NULL DEFAULT 0,
+    overtime_pay DECIMAL(14,2) NOT NULL DEFAULT 0,
+    bonus DECIMAL(14,2) NOT NULL DEFAULT 0,
+    deductions DECIMAL(14,2) NOT NULL DEFAULT 0,
+    pf_amount DECIMAL(14,2) NOT NULL DEFAULT 0,
+    net DECIMAL(14,2) NOT NULL DEFAULT 0,
+    last_month DATE NULL,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (employee_id, fiscal_year)
+);
+
+CREATE INDEX idx_salary_ytd_year ON SalaryYTD (fiscal_year, employee_id);
+
+CREATE TABLE LeaveLedger (
+    entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    employee_id INT NOT NULL,
+    leave_year SMALLINT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    days DECIMAL(6,2) NOT NULL,
+    request_id INT NULL,
+    accrual_month DATE NULL,
+    note VARCHAR(255) NULL,
+    created_by INT NULL,
+    created_at DATETIME(3) NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')),
+    CONSTRAINT uk_leave_accrual UNIQUE (employee_id, accrual_month)
+);
+
+CREATE INDEX idx_leave_ledger_employee ON LeaveLedger (employee_id, leave_year, entry_id);
+
+CREATE TABLE LeaveBalance (
+    employee_id INT NOT NULL,
+    leave_year SMALLINT NOT NULL,
+    accrued DECIMAL(7,2) NOT NULL DEFAULT 0,
+    adjusted DECIMAL(7,2) NOT NULL DEFAULT 0,
+    taken DECIMAL(7,2) NOT NULL DEFAULT 0,
+    pending DECIMAL(7,2) NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (employee_id, leave_year)
+);